@@ -1,20 +1,40 @@
 """
 Aplicação principal do chatbot do SENAI São Carlos
 """
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.utils import secure_filename
 import os
+import json
+import threading
 import time
+from collections import OrderedDict
 from datetime import datetime
 
-from config import FLASK_SECRET_KEY, SQLALCHEMY_DATABASE_URI
-from utils.chat_manager import process_message
+from config import (
+    FLASK_SECRET_KEY, SQLALCHEMY_DATABASE_URI, INFERENCE_RETRY_AFTER,
+    CHAT_LIST_PAGE_SIZE, CHAT_LIST_MAX_PAGE_SIZE, CHAT_HISTORY_PAGE_SIZE, CHAT_HISTORY_MAX_PAGE_SIZE,
+    EVENTS_STREAM_TTL, EVENTS_HEARTBEAT, EVENTS_SYNC_INTERVAL
+)
+from utils.chat_manager import process_message, processar_mensagem_stream
 from utils.session_manager import SessionManager
+from utils.inference_executor import inference_executor, InferenceBusyError
+from utils.inference_scheduler import inference_scheduler, cliente_inferencia
+from utils.resposta_http import comprimir, etag_para, nao_modificado
+from utils.event_bus import event_bus, canal_dono, notificar
+from utils.lm_client import lm_client
+from utils.singleflight import lm_singleflight
+from utils.prompt_builder import prompt_builder
+from utils.prefix_cache import monitor_prefixo
+from utils.response_cache import response_cache
+from utils.chat_summarizer import resumidor_chats
 from utils.suggestions_manager import save_suggestion
 from models.sqlalchemy_models import db, Usuario, Chat, Mensagem
+from models.migrations import aplicar_migracoes
 from info import RESPOSTAS_PADRAO
+from info.info_manager import info_manager
+from info.horarios import estatisticas_horarios
 
 app = Flask(__name__)
 CORS(app)
@@ -22,10 +42,11 @@ app.secret_key = FLASK_SECRET_KEY
 app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
+resumidor_chats.init_app(app)
 
-# Criar tabelas do banco se não existirem
+# Criar tabelas/índices que faltam e aplicar migrações pendentes (models/migrations.py)
 with app.app_context():
-    db.create_all()
+    aplicar_migracoes()
     
     # Criar usuários padrão para login social se não existirem
     usuarios_padrao = [
@@ -188,6 +209,20 @@ def info_page():
     return render_template('info.html')
 
 
+def _cliente_inferencia(user_id, session_id):
+    """Chave do cliente no agendador: usuário, sessão anônima ou, sem sessão, o IP.
+
+    O IP fica por último porque os alunos acessam de trás do mesmo NAT da escola.
+    """
+    return canal_dono(user_id, session_id) or f"ip:{request.remote_addr}"
+
+def _resposta_ocupado():
+    """Resposta rápida quando o executor de inferência está saturado."""
+    resposta = jsonify({"reply": RESPOSTAS_PADRAO["ocupado"], "resposta": RESPOSTAS_PADRAO["ocupado"], "busy": True})
+    resposta.status_code = 503
+    resposta.headers['Retry-After'] = str(INFERENCE_RETRY_AFTER)
+    return resposta
+
 @app.route('/api/chat', methods=['POST'])
 @app.route('/chat', methods=['POST'])
 def chat_api():
@@ -207,18 +242,28 @@ def chat_api():
         if not chat_id:
             return jsonify({"error": "Chat ID não fornecido"}), 400
         
-        # Adicionar mensagem do usuário ao histórico (por usuário ou sessão anônima)
+        # Resolver o chat e carregar o histórico recente uma vez (por usuário ou sessão anônima)
         user_id = session.get('user_id')
         session_id = session.get('session_id')
         user_nome = session.get('user_nome') or session.get('username') or 'Visitante'
-        session_manager.add_message(chat_id, user_message, "user", user_id=user_id, session_id=session_id, nome_usuario=user_nome)
+        turno = session_manager.iniciar_turno(chat_id, user_message, user_id=user_id, session_id=session_id, nome_usuario=user_nome)
         
-        # Processar a mensagem e gerar resposta
-        chat_history = session_manager.get_chat_history(chat_id, user_id=user_id, session_id=session_id)
-        ai_response = process_message(user_message, chat_history)
-        
-        # Adicionar resposta do AI ao histórico
-        session_manager.add_message(chat_id, ai_response, "ai", user_id=user_id, session_id=session_id)
+        # Processar a mensagem e gerar resposta (no executor de inferência, com limite de fila).
+        # A pergunta é gravada sempre, com a resposta que o usuário recebeu (uma transação);
+        # ocupado (503) grava só a pergunta
+        ai_response = None
+        try:
+            with cliente_inferencia(_cliente_inferencia(user_id, session_id)):
+                ai_response = inference_executor.executar(
+                    process_message, user_message, turno.historico, resumo=turno.resumo
+                )
+        except InferenceBusyError:
+            return _resposta_ocupado()
+        except Exception:
+            ai_response = RESPOSTAS_PADRAO["erro_geral"]
+            raise
+        finally:
+            session_manager.registrar_turno(turno, ai_response)
         
         # Responde com ambas as chaves para compatibilidade com diferentes frontends
         return jsonify({"reply": ai_response, "resposta": ai_response})
@@ -229,10 +274,91 @@ def chat_api():
         traceback.print_exc()  # Para debug
         return jsonify({"reply": RESPOSTAS_PADRAO["erro_geral"], "resposta": RESPOSTAS_PADRAO["erro_geral"]})
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream_api():
+    """Endpoint de chat em streaming (Server-Sent Events).
+
+    Envia eventos 'delta' com trechos da resposta à medida que o LM Studio gera
+    os tokens e um evento 'done' com a resposta final, já salva no histórico.
+    """
+    if not request.is_json:
+        return jsonify({"reply": "Erro: Content-Type deve ser application/json"}), 415
+
+    data = request.get_json()
+    user_message = (data.get('message') or data.get('mensagem') or '').strip()
+    chat_id = data.get('chat_id')
+
+    if not user_message:
+        return jsonify({"reply": "Por favor, digite uma mensagem."}), 400
+
+    if not chat_id:
+        return jsonify({"error": "Chat ID não fornecido"}), 400
+
+    user_id = session.get('user_id')
+    session_id = session.get('session_id')
+    user_nome = session.get('user_nome') or session.get('username') or 'Visitante'
+
+    turno = session_manager.iniciar_turno(chat_id, user_message, user_id=user_id, session_id=session_id, nome_usuario=user_nome)
+    try:
+        # Reserva a vaga antes de abrir o stream, para poder responder 503 normalmente
+        with cliente_inferencia(_cliente_inferencia(user_id, session_id)):
+            eventos = inference_executor.iterar(
+                processar_mensagem_stream, user_message, turno.historico, resumo=turno.resumo
+            )
+    except InferenceBusyError:
+        session_manager.registrar_turno(turno, None)
+        return _resposta_ocupado()
+
+    def evento(nome, dados):
+        return f"event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+    def gerar():
+        enviados = []
+        registrado = False
+        try:
+            ai_response = RESPOSTAS_PADRAO["erro_geral"]
+            for item in eventos:
+                if item['tipo'] == 'delta':
+                    enviados.append(item['texto'])
+                    yield evento('delta', {"text": item['texto']})
+                else:
+                    ai_response = item['resposta']
+
+            registrado = True
+            session_manager.registrar_turno(turno, ai_response)
+            yield evento('done', {"reply": ai_response, "resposta": ai_response})
+        except Exception as e:
+            print(f"Erro no processamento da mensagem (stream): {str(e)}")
+            import traceback
+            traceback.print_exc()  # Para debug
+            registrado = True
+            session_manager.registrar_turno(turno, RESPOSTAS_PADRAO["erro_geral"])
+            yield evento('done', {"reply": RESPOSTAS_PADRAO["erro_geral"], "resposta": RESPOSTAS_PADRAO["erro_geral"], "error": True})
+        finally:
+            if not registrado:
+                # Cliente desconectou no meio do stream (GeneratorExit): grava a pergunta e o que já foi enviado
+                eventos.close()
+                parcial = ''.join(enviados).strip()
+                session_manager.registrar_turno(
+                    turno, f"{parcial}\n\n{RESPOSTAS_PADRAO['resposta_interrompida']}" if parcial else None
+                )
+
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Evita que proxies (nginx) segurem os eventos em buffer
+    }
+    return Response(stream_with_context(gerar()), mimetype='text/event-stream', headers=headers)
+
 @app.route('/api/chat/history', methods=['GET'])
 @app.route('/chat/history', methods=['GET'])
+@comprimir
 def get_chat_history():
-    """Endpoint para recuperar o histórico do chat"""
+    """Endpoint para recuperar o histórico do chat.
+
+    Paginado (?limit=N&before=<next_cursor>, também aceito como cursor). Com
+    ?keys=en ou ?keys=pt devolve só 'history' ou só 'historico'. Responde 304
+    quando o If-None-Match do cliente já corresponde à versão atual.
+    """
     try:
         chat_id = request.args.get('chat_id')
         if not chat_id:
@@ -240,16 +366,37 @@ def get_chat_history():
             
         user_id = session.get('user_id')
         session_id = session.get('session_id')
-        chat_history = session_manager.get_chat_history(chat_id, user_id=user_id, session_id=session_id)
-        # Mapear também para formato PT (texto/remetente) para compatibilidade
-        historico_pt = []
-        for msg in chat_history:
-            historico_pt.append({
+        limit = request.args.get('limit', CHAT_HISTORY_PAGE_SIZE, type=int) or CHAT_HISTORY_PAGE_SIZE
+        limit = max(1, min(limit, CHAT_HISTORY_MAX_PAGE_SIZE))
+        cursor = request.args.get('before') or request.args.get('cursor') or None
+        keys = request.args.get('keys', 'both')
+
+        # Versão do histórico em uma consulta; se o cliente já tem, 304 sem carregar mensagens
+        assinatura = session_manager.history_signature(chat_id, user_id=user_id, session_id=session_id)
+        etag = etag_para(chat_id, user_id or session_id, assinatura, limit, cursor, keys)
+        resposta_304 = nao_modificado(etag)
+        if resposta_304 is not None:
+            return resposta_304
+
+        chat_history, next_cursor, first_seq = [], None, 0
+        if assinatura is not None:
+            chat_history, next_cursor, first_seq = session_manager.get_chat_history_page(
+                chat_id, limit, cursor=cursor, user_id=user_id, session_id=session_id, signature=assinatura
+            )
+        dados = {"next_cursor": next_cursor, "first_seq": first_seq}
+        if keys != 'pt':
+            dados["history"] = chat_history
+        if keys != 'en':
+            # Formato PT (texto/remetente) para compatibilidade
+            dados["historico"] = [{
                 'texto': msg.get('text') if 'text' in msg else msg.get('texto'),
                 'remetente': msg.get('sender') if 'sender' in msg else msg.get('remetente'),
                 'timestamp': msg.get('timestamp')
-            })
-        return jsonify({"history": chat_history, "historico": historico_pt})
+            } for msg in chat_history]
+        resposta = jsonify(dados)
+        resposta.set_etag(etag, weak=True)
+        resposta.headers['Cache-Control'] = 'private, no-cache'
+        return resposta
     except Exception as e:
         print(f"Erro ao recuperar histórico: {str(e)}")
         return jsonify({"error": "Erro ao recuperar histórico"}), 500
@@ -275,16 +422,18 @@ def save_chat():
                 text_val = m.get('text') if 'text' in m else m.get('texto')
                 sender_val = m.get('sender') if 'sender' in m else m.get('remetente')
                 normalized_messages.append({
+                    'seq': m.get('seq'),
                     'text': text_val,
                     'sender': sender_val,
                     'timestamp': m.get('timestamp')
                 })
 
-        # Se houver mensagens normalizadas, salva tudo; se não, apenas atualiza o título (evita apagar histórico)
+        # Se houver mensagens, grava só as novas (por seq); se não, apenas atualiza o título
         if normalized_messages:
             user_id = session.get('user_id')
             session_id = session.get('session_id')
-            session_manager.save_chat(chat_id, title, normalized_messages, user_id=user_id, session_id=session_id)
+            next_seq = session_manager.save_chat(chat_id, title, normalized_messages, user_id=user_id, session_id=session_id)
+            return jsonify({"status": "success", "next_seq": next_seq})
         else:
             if title:
                 user_id = session.get('user_id')
@@ -298,11 +447,16 @@ def save_chat():
 @app.route('/api/chat/list', methods=['GET'])
 @app.route('/chat/list', methods=['GET'])
 def list_chats():
-    """Endpoint para listar todos os chats"""
+    """Endpoint para listar os chats (paginado: ?limit=N&cursor=<next_cursor>)"""
     try:
         user_id = session.get('user_id')
         session_id = session.get('session_id')
-        chats = session_manager.list_chats(user_id=user_id, session_id=session_id)
+        limit = request.args.get('limit', CHAT_LIST_PAGE_SIZE, type=int) or CHAT_LIST_PAGE_SIZE
+        limit = max(1, min(limit, CHAT_LIST_MAX_PAGE_SIZE))
+        cursor = request.args.get('cursor') or None
+        chats, next_cursor = session_manager.list_chats_page(
+            user_id=user_id, session_id=session_id, limit=limit, cursor=cursor
+        )
         # Adicionar aliases em PT para compatibilidade no mesmo objeto
         chats_with_aliases = []
         for c in chats:
@@ -310,7 +464,7 @@ def list_chats():
             aliased['titulo'] = c.get('title') or c.get('titulo') or 'Conversa'
             aliased['ultimaMensagem'] = c.get('lastMessage') or c.get('ultimaMensagem') or ''
             chats_with_aliases.append(aliased)
-        return jsonify({"chats": chats_with_aliases})
+        return jsonify({"chats": chats_with_aliases, "next_cursor": next_cursor})
     except Exception as e:
         print(f"Erro ao listar chats: {str(e)}")
         return jsonify({"error": "Erro ao listar chats"}), 500
@@ -449,6 +603,8 @@ def update_profile():
             usuario.bio = data['bio']
         
         db.session.commit()
+        notificar(session['user_id'], None, 'perfil', updated_at=usuario.updated_at.isoformat() if usuario.updated_at else None,
+                  avatar_path=usuario.avatar_path)
         
         # Atualizar sessão
         session['user_nome'] = usuario.nome
@@ -494,6 +650,8 @@ def upload_avatar():
                 usuario.avatar_path = f"/{filepath.replace(os.sep, '/')}"
                 usuario.updated_at = datetime.utcnow()
                 db.session.commit()
+                notificar(session['user_id'], None, 'perfil', updated_at=usuario.updated_at.isoformat(),
+                          avatar_path=usuario.avatar_path)
                 
                 return jsonify({
                     'success': True, 
@@ -510,35 +668,223 @@ def upload_avatar():
         print(f"Erro no upload do avatar: {e}")
         return jsonify({'success': False, 'error': 'Erro interno do servidor'})
 
+# Estado de atualizações por canal: (versão do barramento, instante, dados), na
+# ordem em que foram lidos do banco; limitado em tamanho e idade, para que
+# sessões anônimas que não voltam não fiquem na memória do processo
+_estado_atualizacoes_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_estado_atualizacoes_lock = threading.Lock()
+# Com a versão do barramento igual, o estado é reaproveitado por até este tempo (s);
+# depois disso relê o banco. O barramento é por processo: mudanças feitas por
+# outro worker do gunicorn só aparecem nessa releitura
+_ESTADO_ATUALIZACOES_MAX_IDADE = EVENTS_SYNC_INTERVAL
+_ESTADO_ATUALIZACOES_MAX_CANAIS = 10000
+
+
+def _guardar_estado_atualizacoes(canal, versao, estado):
+    """Guarda o estado lido do banco e descarta os vencidos e os mais antigos além do limite."""
+    agora = time.time()
+    with _estado_atualizacoes_lock:
+        _estado_atualizacoes_cache[canal] = (versao, agora, estado)
+        _estado_atualizacoes_cache.move_to_end(canal)
+        while _estado_atualizacoes_cache:
+            _, (_, lido_em, _) = next(iter(_estado_atualizacoes_cache.items()))
+            if (len(_estado_atualizacoes_cache) <= _ESTADO_ATUALIZACOES_MAX_CANAIS
+                    and agora - lido_em < _ESTADO_ATUALIZACOES_MAX_IDADE):
+                break
+            _estado_atualizacoes_cache.popitem(last=False)
+
+
+def _estado_atualizacoes(user_id, session_id):
+    """Datas do perfil e do último chat alterado do dono (usuário ou sessão anônima).
+
+    Lê o banco só quando o canal recebeu eventos desde a última leitura ou o
+    valor guardado ficou velho; abas ociosas reaproveitam o estado em memória.
+    """
+    canal = canal_dono(user_id, session_id)
+    versao = event_bus.versao(canal)
+    guardado = _estado_atualizacoes_cache.get(canal)
+    if guardado and guardado[0] == versao and time.time() - guardado[1] < _ESTADO_ATUALIZACOES_MAX_IDADE:
+        return guardado[2]
+    estado = _ler_estado_atualizacoes(user_id, session_id)
+    _guardar_estado_atualizacoes(canal, versao, estado)
+    return estado
+
+
+def _ler_estado_atualizacoes(user_id, session_id):
+    """Lê do banco as datas do perfil e do último chat alterado (sem o cache do processo)."""
+    estado = {'profile_updated_at': None, 'avatar_path': None, 'last_chat_updated_at': None}
+    if user_id:
+        usuario = Usuario.query.get(user_id)
+        if usuario:
+            estado['profile_updated_at'] = usuario.updated_at.isoformat() if usuario.updated_at else None
+            estado['avatar_path'] = usuario.avatar_path
+        ultimo = db.session.query(db.func.max(Chat.updated_at)).filter(Chat.user_id == user_id).scalar()
+    else:
+        ultimo = db.session.query(db.func.max(Chat.updated_at)).filter(Chat.session_id == session_id).scalar()
+    estado['last_chat_updated_at'] = ultimo.isoformat() if ultimo else None
+    # Devolve a conexão ao pool (a rota de eventos mantém o request aberto)
+    db.session.close()
+    return estado
+
+
 @app.route('/api/check-updates', methods=['GET'])
+@comprimir
 def check_updates():
-    """Verifica se há atualizações no perfil ou histórico do usuário"""
+    """Verifica se há atualizações no perfil ou histórico do usuário.
+
+    Alternativa ao /api/events para quem não tem streaming: responde com ETag
+    (304 quando nada mudou) e só consulta o banco quando há eventos novos.
+    """
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Usuário não logado'})
     
     try:
-        user_id = session['user_id']
-        usuario = Usuario.query.get(user_id)
-        
-        if not usuario:
-            return jsonify({'success': False, 'error': 'Usuário não encontrado'})
-        
-        # Buscar último chat atualizado
-        from models.sqlalchemy_models import Chat
-        last_chat = Chat.query.filter_by(user_id=user_id).order_by(Chat.updated_at.desc()).first()
-        
-        return jsonify({
-            'success': True,
-            'profile_updated_at': usuario.updated_at.isoformat() if usuario.updated_at else None,
-            'avatar_path': usuario.avatar_path,
-            'last_chat_updated_at': last_chat.updated_at.isoformat() if last_chat and last_chat.updated_at else None
-        })
+        estado = _estado_atualizacoes(session['user_id'], None)
+        etag = etag_para(session['user_id'], estado['profile_updated_at'], estado['avatar_path'], estado['last_chat_updated_at'])
+        resposta_304 = nao_modificado(etag)
+        if resposta_304 is not None:
+            return resposta_304
+        resposta = jsonify(dict(estado, success=True))
+        resposta.set_etag(etag, weak=True)
+        resposta.headers['Cache-Control'] = 'private, no-cache'
+        return resposta
     except Exception as e:
         print(f"Erro ao verificar atualizações: {e}")
         return jsonify({'success': False, 'error': 'Erro interno do servidor'})
 
 
+@app.route('/api/events', methods=['GET'])
+def events_stream():
+    """Notificações de mudança por Server-Sent Events.
+
+    Envia 'hello' com o estado atual ao conectar e depois 'chats' (lista de
+    chats mudou) e 'perfil' (perfil/avatar mudou) conforme as escritas
+    publicam no barramento. O barramento é do processo: a cada
+    EVENTS_SYNC_INTERVAL o stream também relê o estado no banco (uma ou duas
+    consultas por índice) e avisa das mudanças feitas por outro worker.
+
+    Cada stream ocupa uma thread do worker enquanto estiver aberto. O stream
+    encerra após EVENTS_STREAM_TTL e o navegador reconecta sozinho (com
+    Last-Event-ID). Se o limite de streams do processo (EVENTS_MAX_STREAMS)
+    foi atingido, responde 503 e o cliente passa a consultar /api/check-updates
+    no mesmo intervalo.
+    """
+    user_id = session.get('user_id')
+    session_id = session.get('session_id')
+    canal = canal_dono(user_id, session_id)
+    if not canal:
+        return Response(status=204)
+    if not event_bus.reservar_stream():
+        resposta = Response(status=503)
+        resposta.headers['Retry-After'] = str(int(EVENTS_STREAM_TTL))
+        return resposta
+
+    try:
+        estado = _estado_atualizacoes(user_id, session_id)
+        versao_atual = event_bus.versao(canal)
+        try:
+            desde = int(request.headers.get('Last-Event-ID') or versao_atual)
+        except ValueError:
+            desde = versao_atual
+        # Reconexão em outro processo (ou após reinício): a numeração não vale aqui
+        if desde > versao_atual:
+            desde = versao_atual
+    except Exception:
+        event_bus.liberar_stream()
+        raise
+
+    def evento(nome, dados, versao=None):
+        linha_id = f"id: {versao}\n" if versao is not None else ''
+        return f"{linha_id}event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+    def gerar():
+        ultima_versao = desde
+        conhecido = estado
+        # Tipos de evento já entregues pelo barramento desde a última leitura do banco
+        entregues = set()
+        yield "retry: 5000\n"
+        yield evento('hello', estado, ultima_versao)
+        agora = time.monotonic()
+        prazo = agora + EVENTS_STREAM_TTL
+        proximo_ping = agora + EVENTS_HEARTBEAT
+        releitura = max(1.0, EVENTS_SYNC_INTERVAL)
+        proxima_leitura = agora + releitura
+        while True:
+            agora = time.monotonic()
+            if agora >= prazo:
+                break
+            espera = min(prazo, proximo_ping, proxima_leitura) - agora
+            for item in event_bus.aguardar(canal, ultima_versao, max(0.0, espera)):
+                ultima_versao = item['versao']
+                entregues.add(item['tipo'])
+                proximo_ping = time.monotonic() + EVENTS_HEARTBEAT
+                yield evento(item['tipo'], item['dados'], ultima_versao)
+
+            agora = time.monotonic()
+            if agora >= proxima_leitura:
+                proxima_leitura = agora + releitura
+                try:
+                    with app.app_context():
+                        atual = _ler_estado_atualizacoes(user_id, session_id)
+                except Exception as e:
+                    print(f"Erro ao reler atualizações do stream de eventos: {e}")
+                    atual = conhecido
+                # Mudanças que não passaram pelo barramento deste processo (outro worker)
+                if atual['last_chat_updated_at'] != conhecido['last_chat_updated_at'] and 'chats' not in entregues:
+                    proximo_ping = agora + EVENTS_HEARTBEAT
+                    yield evento('chats', {'acao': 'sincronizado'})
+                if atual['profile_updated_at'] != conhecido['profile_updated_at'] and 'perfil' not in entregues:
+                    proximo_ping = agora + EVENTS_HEARTBEAT
+                    yield evento('perfil', {'updated_at': atual['profile_updated_at'],
+                                            'avatar_path': atual['avatar_path']})
+                conhecido = atual
+                entregues.clear()
+            if agora >= proximo_ping:
+                proximo_ping = agora + EVENTS_HEARTBEAT
+                yield ": ping\n\n"
+
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Evita que proxies (nginx) segurem os eventos em buffer
+    }
+    resposta = Response(gerar(), mimetype='text/event-stream', headers=headers)
+    # Libera a vaga quando o servidor fecha a resposta (fim do TTL ou cliente desconectou)
+    resposta.call_on_close(event_bus.liberar_stream)
+    return resposta
+
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """Estado do processo: servidores de inferência (disjuntores) e contadores de uso.
+
+    'degradado' quando algum servidor está com o disjuntor aberto ou meio-aberto;
+    'indisponivel' quando nenhum está fechado: o chat continua respondendo,
+    mas pelo fallback (sem o modelo).
+    """
+    servidores = lm_client.estatisticas()
+    if servidores['disponiveis'] == servidores['total']:
+        status = 'ok'
+    elif servidores['disponiveis']:
+        status = 'degradado'
+    else:
+        status = 'indisponivel'
+    resposta = jsonify({
+        'status': status,
+        'lm_studio': servidores,
+        'inferencia': inference_executor.estatisticas(),
+        'agendador': inference_scheduler.estatisticas(),
+        'singleflight': lm_singleflight.estatisticas(),
+        'cache': response_cache.stats(),
+        'eventos': event_bus.estatisticas(),
+        'base_info': info_manager.estatisticas(),
+        'prompt': prompt_builder.estatisticas(),
+        'prefixo': monitor_prefixo.estatisticas(),
+        'resumos': resumidor_chats.estatisticas(),
+        'horarios': estatisticas_horarios(),
+    })
+    resposta.headers['Cache-Control'] = 'no-store'
+    return resposta
+
+
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
     app.run(debug=True, host='0.0.0.0', port=5000)
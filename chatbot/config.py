@@ -29,11 +29,42 @@ FLASK_PORT = int(os.getenv('FLASK_PORT', 5000))
 
 # Configurações do LM Studio
 LM_STUDIO_URL = os.getenv('LM_STUDIO_URL', 'http://localhost:1234/v1/completions')
+# Vários servidores de inferência (separados por vírgula); sem isso, usa só LM_STUDIO_URL
+LM_STUDIO_URLS = [url.strip() for url in os.getenv('LM_STUDIO_URLS', LM_STUDIO_URL).split(',') if url.strip()]
 MODEL_NAME = os.getenv('MODEL_NAME', 'llama-3.2-3b-instruct')
 REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', 60))
 MAX_RETRIES = int(os.getenv('MAX_RETRIES', 3))
 RETRY_DELAY = int(os.getenv('RETRY_DELAY', 1))
 
+# Cliente de inferência (conexões persistentes com o LM Studio)
+LM_CONNECT_TIMEOUT = float(os.getenv('LM_CONNECT_TIMEOUT', 3))  # segundos para abrir a conexão
+LM_LATENCY_BUDGET = float(os.getenv('LM_LATENCY_BUDGET', 90))  # tempo total (s) por requisição, somando retentativas
+LM_POOL_CONNECTIONS = int(os.getenv('LM_POOL_CONNECTIONS', 4))
+LM_POOL_MAXSIZE = int(os.getenv('LM_POOL_MAXSIZE', 16))
+LM_BACKEND_SLOTS = int(os.getenv('LM_BACKEND_SLOTS', 4))  # requisições simultâneas por servidor de inferência
+LM_CACHE_PROMPT = os.getenv('LM_CACHE_PROMPT', 'True').lower() == 'true'  # pede reuso do cache KV do prefixo (llama.cpp)
+
+# Disjuntor (circuit breaker) do LM Studio: com o servidor fora, responde pelo fallback sem esperar timeout
+LM_BREAKER_WINDOW = float(os.getenv('LM_BREAKER_WINDOW', 60))  # janela (s) de resultados considerada
+LM_BREAKER_MIN_CALLS = int(os.getenv('LM_BREAKER_MIN_CALLS', 3))  # chamadas mínimas na janela antes de abrir
+LM_BREAKER_ERROR_RATE = float(os.getenv('LM_BREAKER_ERROR_RATE', 0.5))  # fração de falhas que abre o disjuntor
+LM_BREAKER_SLOW_CALL = float(os.getenv('LM_BREAKER_SLOW_CALL', 45))  # chamadas mais lentas (s) contam como falha; 0 desliga
+LM_BREAKER_PROBE_INTERVAL = float(os.getenv('LM_BREAKER_PROBE_INTERVAL', 5))  # intervalo (s) da sonda com o disjuntor aberto
+
+# Agendador das chamadas ao modelo: limite global, fichas por cliente e fila justa
+LM_MAX_IN_FLIGHT = int(os.getenv('LM_MAX_IN_FLIGHT', LM_BACKEND_SLOTS * len(LM_STUDIO_URLS)))  # chamadas simultâneas ao modelo
+LM_SESSION_BURST = int(os.getenv('LM_SESSION_BURST', 4))  # chamadas seguidas por cliente; 0 desliga o limite
+LM_SESSION_RATE = float(os.getenv('LM_SESSION_RATE', 10))  # fichas repostas por minuto, por cliente
+LM_QUEUE_DEADLINE = float(os.getenv('LM_QUEUE_DEADLINE', 20))  # espera máxima (s) na fila antes do fallback
+
+# Executor de inferência (processamento das mensagens fora das threads do Flask)
+# Mensagens processadas em paralelo; por padrão o dobro das vagas do modelo, para
+# que as mensagens esperem na fila justa do agendador e as rotas rápidas não fiquem presas
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', 2 * LM_MAX_IN_FLIGHT))
+INFERENCE_QUEUE_MAX = int(os.getenv('INFERENCE_QUEUE_MAX', 8))  # mensagens aguardando; acima disso responde 503
+INFERENCE_WAIT_TIMEOUT = float(os.getenv('INFERENCE_WAIT_TIMEOUT', LM_LATENCY_BUDGET + 30))
+INFERENCE_RETRY_AFTER = int(os.getenv('INFERENCE_RETRY_AFTER', 5))  # segundos sugeridos ao cliente no 503
+
 # Alias para compatibilidade com o código existente
 URL_LM_STUDIO = LM_STUDIO_URL
 NOME_MODELO = MODEL_NAME
@@ -51,7 +82,50 @@ SESSION_PERMANENT = False
 PERMANENT_SESSION_LIFETIME = 1800  # 30 minutos
 
 # Configurações de cache
-CACHE_TIMEOUT = 300  # 5 minutos
+CACHE_TIMEOUT = int(os.getenv('CACHE_TIMEOUT', 300))  # 5 minutos (TTL de cada resposta)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'sqlite')  # 'sqlite' (compartilhado entre workers) ou 'memory'
+CACHE_FILE = os.getenv('CACHE_FILE', 'sistema_de_cache.db')
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 2000))
+# Busca aproximada no cache (paráfrases): similaridade mínima de tokens (0 a 1)
+CACHE_FUZZY_ENABLED = os.getenv('CACHE_FUZZY_ENABLED', 'False').lower() == 'true'
+CACHE_FUZZY_THRESHOLD = float(os.getenv('CACHE_FUZZY_THRESHOLD', 0.8))
+
+# Lista de chats (sidebar): tamanho padrão e máximo de cada página
+CHAT_LIST_PAGE_SIZE = int(os.getenv('CHAT_LIST_PAGE_SIZE', 30))
+CHAT_LIST_MAX_PAGE_SIZE = int(os.getenv('CHAT_LIST_MAX_PAGE_SIZE', 100))
+
+# Mensagens recentes do chat carregadas por turno para montar a resposta
+# (o prompt usa as últimas 8; a desambiguação olha as últimas 5)
+CHAT_HISTORY_WINDOW = int(os.getenv('CHAT_HISTORY_WINDOW', 8))
+# Histórico exibido no chat (/api/chat/history): tamanho padrão e máximo da página
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 50))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_MAX_PAGE_SIZE', 200))
+
+# Resumo contínuo das conversas longas (utils/chat_summarizer.py): desligado por padrão
+CHAT_SUMMARY_ENABLED = os.getenv('CHAT_SUMMARY_ENABLED', 'False').lower() == 'true'
+CHAT_SUMMARY_EVERY = int(os.getenv('CHAT_SUMMARY_EVERY', 4))  # turnos não resumidos que disparam um novo resumo
+CHAT_SUMMARY_KEEP = int(os.getenv('CHAT_SUMMARY_KEEP', 4))  # mensagens mais recentes que ficam sempre inteiras
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv('CHAT_SUMMARY_MAX_TOKENS', 200))  # tamanho máximo do resumo
+
+# Notificações em tempo real (/api/events, Server-Sent Events)
+EVENTS_MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', 8))  # streams abertos por processo (cada um ocupa uma thread do gthread enquanto aberto)
+EVENTS_STREAM_TTL = float(os.getenv('EVENTS_STREAM_TTL', 120))  # s até o stream encerrar e o navegador reconectar
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', 25))  # s entre pings (mantém proxies com a conexão aberta)
+EVENTS_SYNC_INTERVAL = float(os.getenv('EVENTS_SYNC_INTERVAL', 5))  # s entre releituras do banco (mudanças de outro worker) e entre consultas do /api/check-updates
+
+# Contexto do prompt: trechos da base info/ escolhidos por busca (BM25) para cada pergunta
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', 6))  # máximo de trechos por pergunta
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', 700))  # tokens (estimados) para os trechos
+
+# Montagem do prompt: janela de contexto do modelo e divisão do orçamento de tokens
+LM_CONTEXT_WINDOW = int(os.getenv('LM_CONTEXT_WINDOW', 4096))  # tokens de contexto do modelo carregado no LM Studio
+LM_MAX_RESPONSE_TOKENS = int(os.getenv('LM_MAX_RESPONSE_TOKENS', 500))  # tokens reservados para a resposta
+PROMPT_SAFETY_MARGIN = float(os.getenv('PROMPT_SAFETY_MARGIN', 0.1))  # folga (fração da janela) para o erro da estimativa
+PROMPT_HISTORY_SHARE = float(os.getenv('PROMPT_HISTORY_SHARE', 0.3))  # parte máxima do espaço livre para o histórico
+PROMPT_QUESTION_SHARE = float(os.getenv('PROMPT_QUESTION_SHARE', 0.25))  # parte máxima do prompt para a pergunta
+
+# Horários (info/horarios/*.json): intervalo mínimo (s) entre verificações de arquivos alterados
+HORARIOS_RELOAD_INTERVAL = float(os.getenv('HORARIOS_RELOAD_INTERVAL', 5))
 
 # Configurações de logging
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
\ No newline at end of file
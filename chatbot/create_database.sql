@@ -34,11 +34,15 @@ CREATE TABLE IF NOT EXISTS `chats` (
     `title` VARCHAR(255) NOT NULL DEFAULT 'Nova Conversa',
     `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
     `updated_at` DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    `resumo` TEXT NULL,  -- Resumo das mensagens antigas (CHAT_SUMMARY_ENABLED)
+    `resumo_ate` INT NULL,  -- id da última mensagem incluída no resumo
     FOREIGN KEY (`user_id`) REFERENCES `usuarios`(`id`) ON DELETE CASCADE,
     INDEX `idx_chat_id` (`chat_id`),
     INDEX `idx_user_id` (`user_id`),
     INDEX `idx_session_id` (`session_id`),  -- Índice para busca por session_id
-    INDEX `idx_updated_at` (`updated_at`)
+    INDEX `idx_updated_at` (`updated_at`),
+    INDEX `idx_chats_user_updated` (`user_id`, `updated_at`),  -- Lista de chats do usuário (mais recentes primeiro)
+    INDEX `idx_chats_session_updated` (`session_id`, `updated_at`)  -- Lista de chats da sessão anônima
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Tabela de mensagens
@@ -52,9 +56,13 @@ CREATE TABLE IF NOT EXISTS `mensagens` (
     FOREIGN KEY (`chat_id`) REFERENCES `chats`(`id`) ON DELETE CASCADE,
     INDEX `idx_chat_id` (`chat_id`),
     INDEX `idx_created_at` (`created_at`),
-    INDEX `idx_sender` (`sender`)
+    INDEX `idx_sender` (`sender`),
+    INDEX `idx_mensagens_chat_created` (`chat_id`, `created_at`)  -- Histórico e última mensagem do chat
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Bancos já existentes não precisam deste script: ao iniciar, o app aplica as
+-- migrações pendentes (models/migrations.py) e registra a versão em schema_version.
+
 -- Criar usuário MySQL para a aplicação (opcional, ajuste conforme necessário)
 -- CREATE USER IF NOT EXISTS 'app_user'@'localhost' IDENTIFIED BY 'aluno';
 -- GRANT ALL PRIVILEGES ON senAI.* TO 'app_user'@'localhost';
@@ -0,0 +1,21 @@
+"""
+Configuração do gunicorn para produção
+
+Uso: gunicorn -c gunicorn.conf.py app:app
+
+Workers 'gthread' atendem várias requisições por processo com threads leves.
+As mensagens do chat são processadas no executor de inferência
+(utils/inference_executor.py), que limita quantas chamadas ao LM Studio rodam
+ao mesmo tempo; as demais threads ficam livres para rotas rápidas
+(/api/chat/list, /api/chat/history, ...).
+"""
+import os
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', 5000)}"
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+# Respostas em streaming e a espera pelo LM Studio podem passar do timeout padrão (30s)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 180))
+graceful_timeout = 30
+keepalive = 5
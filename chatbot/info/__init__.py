@@ -32,7 +32,8 @@ from .horarios import (
     buscar_horario_turma,
     carregar_horarios_salas,
     carregar_horarios_professores,
-    carregar_horarios_turmas
+    carregar_horarios_turmas,
+    obter_indice_horarios
 )
 
 def formatar_info_sao_carlos() -> str:
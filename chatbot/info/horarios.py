@@ -4,21 +4,44 @@
 Módulo para gerenciar informações de horários de salas, professores e turmas
 """
 
+import hashlib
 import json
 import os
-from typing import Dict, List, Optional
+import re
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
 from pathlib import Path
 
+from config import HORARIOS_RELOAD_INTERVAL
+
 # Caminho base para os arquivos de horários
 HORARIOS_BASE_PATH = Path(__file__).parent / "horarios"
 
-# Cache para os dados carregados
+# Cache para os dados carregados (cada dict é trocado por inteiro a cada recarga)
 _horarios_cache = {
     'professores': {},
     'salas': {},
     'turmas': {}
 }
 
+# Pasta e forma da chave (a partir do nome do arquivo) de cada tipo de horário
+_PASTAS = {
+    'professores': ('horarios_professores', lambda stem: stem.replace('_', ' ').title()),
+    'salas': ('horarios_salas', lambda stem: stem),
+    'turmas': ('horarios_turmas', lambda stem: stem.replace('_', ' ').upper()),
+}
+
+# Por tipo: caminho -> ((mtime_ns, tamanho), dados) dos arquivos já lidos
+_arquivos: Dict[str, Dict[str, tuple]] = {tipo: {} for tipo in _PASTAS}
+# Última verificação de alterações por tipo (0 = ainda não carregado)
+_verificado_em: Dict[str, float] = {tipo: 0.0 for tipo in _PASTAS}
+_recarga_lock = threading.Lock()
+_estatisticas = {'recargas': 0, 'arquivos_lidos': 0, 'ultima_carga': None, 'versao': ''}
+_ao_recarregar: List[Callable[[str, str], None]] = []
+
 
 def _carregar_json(caminho: Path) -> Optional[Dict]:
     """Carrega um arquivo JSON"""
@@ -31,64 +54,320 @@ def _carregar_json(caminho: Path) -> Optional[Dict]:
     return None
 
 
+def _assinaturas(pasta: Path) -> Dict[str, tuple]:
+    """(mtime_ns, tamanho) de cada .json da pasta (uma chamada de stat por arquivo)."""
+    assinaturas = {}
+    try:
+        with os.scandir(pasta) as entradas:
+            for entrada in entradas:
+                if entrada.name.endswith('.json') and entrada.is_file():
+                    info = entrada.stat()
+                    assinaturas[entrada.path] = (info.st_mtime_ns, info.st_size)
+    except OSError:
+        pass
+    return assinaturas
+
+
+def _atualizar_versao():
+    """Versão derivada das assinaturas dos arquivos (igual em todos os workers)."""
+    assinaturas = sorted(
+        (os.path.basename(caminho), assinatura)
+        for arquivos in _arquivos.values()
+        for caminho, (assinatura, _) in arquivos.items()
+    )
+    _estatisticas['versao'] = hashlib.sha1(repr(assinaturas).encode('utf-8')).hexdigest()[:12]
+
+
+def _carregar_tipo(tipo: str) -> Dict[str, Dict]:
+    """Retorna os horários do tipo, relendo apenas os arquivos alterados desde a última verificação.
+
+    A verificação (stat da pasta) acontece no máximo a cada HORARIOS_RELOAD_INTERVAL segundos.
+    O dict publicado nunca é alterado: uma recarga monta outro e troca a referência.
+    """
+    verificado_em = _verificado_em[tipo]
+    if verificado_em and time.monotonic() - verificado_em < HORARIOS_RELOAD_INTERVAL:
+        return _horarios_cache[tipo]
+
+    with _recarga_lock:
+        verificado_em = _verificado_em[tipo]
+        if verificado_em and time.monotonic() - verificado_em < HORARIOS_RELOAD_INTERVAL:
+            return _horarios_cache[tipo]
+        primeira_carga = not verificado_em
+        pasta, nome_chave = _PASTAS[tipo]
+        atuais = _assinaturas(HORARIOS_BASE_PATH / pasta)
+        anteriores = _arquivos[tipo]
+        _verificado_em[tipo] = time.monotonic()
+        if not primeira_carga and atuais.keys() == anteriores.keys() and all(
+                anteriores[caminho][0] == assinatura for caminho, assinatura in atuais.items()):
+            return _horarios_cache[tipo]
+
+        arquivos = {}
+        lidos = 0
+        mudou = primeira_carga or any(caminho not in atuais for caminho in anteriores)
+        for caminho, assinatura in atuais.items():
+            anterior = anteriores.get(caminho)
+            if anterior is not None and anterior[0] == assinatura:
+                arquivos[caminho] = anterior
+                continue
+            dados = _carregar_json(Path(caminho))
+            lidos += 1
+            if dados is None and anterior is not None:
+                # Arquivo sendo gravado (JSON incompleto): mantém a versão anterior e tenta de novo depois
+                arquivos[caminho] = anterior
+                continue
+            arquivos[caminho] = (assinatura, dados)
+            mudou = True
+        _estatisticas['arquivos_lidos'] += lidos
+        if not mudou:
+            _arquivos[tipo] = arquivos
+            return _horarios_cache[tipo]
+
+        horarios = {}
+        for caminho in sorted(arquivos):
+            dados = arquivos[caminho][1]
+            if dados:
+                horarios[nome_chave(Path(caminho).stem)] = dados
+
+        _arquivos[tipo] = arquivos
+        _horarios_cache[tipo] = horarios
+        _atualizar_versao()
+        versao = _estatisticas['versao']
+        _estatisticas['ultima_carga'] = time.time()
+        if not primeira_carga:
+            _estatisticas['recargas'] += 1
+            print(f"Horários recarregados ({tipo}): {lidos} arquivo(s) relido(s), {len(horarios)} no total")
+
+    if not primeira_carga:
+        for callback in list(_ao_recarregar):
+            try:
+                callback(tipo, versao)
+            except Exception as e:
+                print(f"Erro ao notificar recarga de horários: {e}")
+    return horarios
+
+
+def registrar_ao_recarregar(callback: Callable[[str, str], None]):
+    """Registra uma função chamada após cada recarga, com o tipo ('salas', 'professores',
+    'turmas') e a nova versão dos horários."""
+    if callback not in _ao_recarregar:
+        _ao_recarregar.append(callback)
+
+
+def versao_horarios() -> str:
+    """Identificador dos arquivos de horário atualmente carregados."""
+    for tipo in _PASTAS:
+        _carregar_tipo(tipo)
+    return _estatisticas['versao']
+
+
+def estatisticas_horarios() -> Dict:
+    """Contadores da carga de horários (para monitoramento)."""
+    return {
+        'recargas': _estatisticas['recargas'],
+        'arquivos_lidos': _estatisticas['arquivos_lidos'],
+        'ultima_carga': _estatisticas['ultima_carga'],
+        'versao': _estatisticas['versao'],
+        'professores': len(_horarios_cache['professores']),
+        'salas': len(_horarios_cache['salas']),
+        'turmas': len(_horarios_cache['turmas']),
+    }
+
+
 def carregar_horarios_professores() -> Dict[str, Dict]:
     """Carrega todos os horários de professores"""
-    if _horarios_cache['professores']:
-        return _horarios_cache['professores']
-    
-    professores_path = HORARIOS_BASE_PATH / "horarios_professores"
-    if not professores_path.exists():
-        return {}
-    
-    horarios = {}
-    for arquivo in professores_path.glob("*.json"):
-        nome_professor = arquivo.stem.replace('_', ' ').title()
-        dados = _carregar_json(arquivo)
-        if dados:
-            horarios[nome_professor] = dados
-    
-    _horarios_cache['professores'] = horarios
-    return horarios
+    return _carregar_tipo('professores')
 
 
 def carregar_horarios_salas() -> Dict[str, Dict]:
     """Carrega todos os horários de salas"""
-    if _horarios_cache['salas']:
-        return _horarios_cache['salas']
-    
-    salas_path = HORARIOS_BASE_PATH / "horarios_salas"
-    if not salas_path.exists():
-        return {}
-    
-    horarios = {}
-    for arquivo in salas_path.glob("*.json"):
-        numero_sala = arquivo.stem
-        dados = _carregar_json(arquivo)
-        if dados:
-            horarios[numero_sala] = dados
-    
-    _horarios_cache['salas'] = horarios
-    return horarios
+    return _carregar_tipo('salas')
 
 
 def carregar_horarios_turmas() -> Dict[str, Dict]:
     """Carrega todos os horários de turmas"""
-    if _horarios_cache['turmas']:
-        return _horarios_cache['turmas']
-    
-    turmas_path = HORARIOS_BASE_PATH / "horarios_turmas"
-    if not turmas_path.exists():
-        return {}
-    
-    horarios = {}
-    for arquivo in turmas_path.glob("*.json"):
-        nome_turma = arquivo.stem.replace('_', ' ').upper()
-        dados = _carregar_json(arquivo)
-        if dados:
-            horarios[nome_turma] = dados
-    
-    _horarios_cache['turmas'] = horarios
-    return horarios
+    return _carregar_tipo('turmas')
+
+# === Índice de horários ===
+
+PERIODOS = ['manhã', 'tarde', 'noite']
+DIAS_SEMANA = ['segunda', 'terça', 'quarta', 'quinta', 'sexta', 'sábado']
+
+
+def _normalizar_nome(nome: str) -> str:
+    """Nome em minúsculas, sem acentos e com espaços compactados (professores)."""
+    sem_acentos = ''.join(c for c in unicodedata.normalize('NFD', nome or '') if unicodedata.category(c) != 'Mn')
+    return ' '.join(sem_acentos.lower().split())
+
+
+def _normalizar_turma(nome: str) -> str:
+    """Código da turma sem separadores: '2IDS-SC_A', '2ids sc a' -> '2idssca'."""
+    return re.sub(r'[\s_\-/]', '', _normalizar_nome(nome))
+
+
+class Aula:
+    """Uma aula (slot) do horário: período, dia, sala, professor, turma e disciplina."""
+
+    __slots__ = ('periodo', 'dia', 'sala', 'professor', 'turma', 'disciplina')
+
+    def __init__(self, periodo: str, dia: str, sala: str, professor: str, turma: str, disciplina: str):
+        self.periodo = periodo
+        self.dia = dia
+        self.sala = sala
+        self.professor = professor
+        self.turma = turma
+        self.disciplina = disciplina
+
+    def chave(self) -> tuple:
+        return (self.periodo, self.dia, self.sala, _normalizar_nome(self.professor),
+                _normalizar_turma(self.turma), self.disciplina)
+
+    def __repr__(self) -> str:
+        return (f"Aula({self.dia}/{self.periodo}, sala={self.sala!r}, "
+                f"professor={self.professor!r}, turma={self.turma!r}, disciplina={self.disciplina!r})")
+
+
+class IndiceHorarios:
+    """Mapas invertidos dos horários, montados uma vez a partir dos JSON carregados.
+
+    - por_sala: sala -> aulas
+    - por_professor: nome normalizado -> aulas
+    - por_turma: código normalizado da turma -> aulas
+    - ocupacao: (dia, período) -> {sala: aulas}
+    """
+
+    def __init__(self, salas: Dict[str, Dict], professores: Dict[str, Dict], turmas: Dict[str, Dict]):
+        self.por_sala: Dict[str, List[Aula]] = {}
+        self.por_professor: Dict[str, List[Aula]] = {}
+        self.por_turma: Dict[str, List[Aula]] = {}
+        self.ocupacao: Dict[tuple, Dict[str, List[Aula]]] = {}
+        # Nome normalizado/apelido -> chave do arquivo JSON (ex.: 'paulo car' -> 'Paulo')
+        self.arquivo_professor: Dict[str, str] = {}
+        self.arquivo_turma: Dict[str, str] = {}
+        # Apelido do arquivo -> nome usado nas aulas (ex.: 'paulo' -> 'paulo car')
+        self._apelidos_professor: Dict[str, str] = {}
+        # Salas com arquivo próprio (horário completo); as demais só aparecem nas aulas
+        self.salas = set(salas.keys())
+        vistas = set()
+
+        for chave_arquivo, dados in professores.items():
+            apelido = _normalizar_nome(chave_arquivo)
+            nome_completo = _normalizar_nome((dados.get('_metadata') or {}).get('professor', '')) or apelido
+            self.arquivo_professor[apelido] = chave_arquivo
+            self.arquivo_professor[nome_completo] = chave_arquivo
+            self._apelidos_professor[apelido] = nome_completo
+        for chave_arquivo in turmas.keys():
+            self.arquivo_turma[_normalizar_turma(chave_arquivo)] = chave_arquivo
+
+        fontes = [(dados, {'sala': sala}) for sala, dados in salas.items()]
+        fontes += [(dados, {'professor': prof}) for prof, dados in professores.items()]
+        fontes += [(dados, {'turma': turma}) for turma, dados in turmas.items()]
+        for dados, padrao in fontes:
+            for aula in self._aulas_do_arquivo(dados, padrao):
+                chave = aula.chave()
+                if chave in vistas:
+                    continue
+                vistas.add(chave)
+                self._indexar(aula)
+
+    @staticmethod
+    def _aulas_do_arquivo(dados: Dict, padrao: Dict[str, str]):
+        metadata = dados.get('_metadata') or {}
+        for periodo in PERIODOS:
+            por_dia = dados.get(periodo) or {}
+            for dia in DIAS_SEMANA:
+                for item in por_dia.get(dia) or []:
+                    if not isinstance(item, dict):
+                        continue
+                    # Campos ausentes na aula vêm do próprio arquivo (sala/professor/turma dono do horário)
+                    yield Aula(
+                        periodo, dia,
+                        str(item.get('sala') or padrao.get('sala') or ''),
+                        item.get('professor') or metadata.get('professor') or padrao.get('professor', ''),
+                        item.get('turma') or padrao.get('turma', ''),
+                        item.get('disciplina', '')
+                    )
+
+    def _indexar(self, aula: Aula):
+        if aula.sala:
+            self.por_sala.setdefault(aula.sala, []).append(aula)
+            self.ocupacao.setdefault((aula.dia, aula.periodo), {}).setdefault(aula.sala, []).append(aula)
+        if aula.professor:
+            self.por_professor.setdefault(_normalizar_nome(aula.professor), []).append(aula)
+        if aula.turma:
+            # Aulas compartilhadas ("3TADM-A/3TADM-B") entram em todas as turmas citadas
+            for turma in aula.turma.split('/'):
+                self.por_turma.setdefault(_normalizar_turma(turma), []).append(aula)
+
+    @staticmethod
+    def _filtrar(aulas: List[Aula], dia: Optional[str], periodo: Optional[str]) -> List[Aula]:
+        return [a for a in aulas if (dia is None or a.dia == dia) and (periodo is None or a.periodo == periodo)]
+
+    def resolver_professor(self, nome: str) -> Optional[str]:
+        """Nome normalizado do professor nas aulas (exato, apelido, prefixo ou aproximado)."""
+        alvo = _normalizar_nome(nome)
+        if not alvo:
+            return None
+        if alvo in self.por_professor:
+            return alvo
+        if alvo in self._apelidos_professor:
+            return self._apelidos_professor[alvo]
+        candidatos = [n for n in self.por_professor if n.split()[0] == alvo or n.startswith(alvo + ' ')]
+        if len(candidatos) == 1:
+            return candidatos[0]
+        return None
+
+    def aulas_sala(self, sala: str, dia: Optional[str] = None, periodo: Optional[str] = None) -> List[Aula]:
+        """Quem está na sala (no dia/período, se informados)."""
+        if dia is not None and periodo is not None:
+            return list(self.ocupacao.get((dia, periodo), {}).get(str(sala), []))
+        return self._filtrar(self.por_sala.get(str(sala), []), dia, periodo)
+
+    def aulas_professor(self, nome: str, dia: Optional[str] = None, periodo: Optional[str] = None) -> List[Aula]:
+        """Onde está o professor (no dia/período, se informados)."""
+        chave = self.resolver_professor(nome)
+        return self._filtrar(self.por_professor.get(chave, []), dia, periodo) if chave else []
+
+    def aulas_turma(self, nome: str, dia: Optional[str] = None, periodo: Optional[str] = None) -> List[Aula]:
+        """Aulas da turma (no dia/período, se informados)."""
+        return self._filtrar(self.por_turma.get(_normalizar_turma(nome), []), dia, periodo)
+
+    def salas_ocupadas(self, dia: str, periodo: str) -> Dict[str, List[Aula]]:
+        return dict(self.ocupacao.get((dia, periodo), {}))
+
+    def salas_livres(self, dia: str, periodo: str) -> List[str]:
+        """Salas com horário completo (arquivo próprio) sem aula no dia/período."""
+        ocupadas = self.ocupacao.get((dia, periodo), {})
+        return sorted(sala for sala in self.salas if sala not in ocupadas)
+
+
+_indice_estado = {'indice': None, 'fontes': None}
+
+
+def obter_indice_horarios() -> IndiceHorarios:
+    """Índice dos horários atuais; remontado quando os dados carregados mudam."""
+    salas, professores, turmas = carregar_horarios_salas(), carregar_horarios_professores(), carregar_horarios_turmas()
+    fontes = _indice_estado['fontes']
+    if (_indice_estado['indice'] is None or fontes is None or fontes[0] is not salas
+            or fontes[1] is not professores or fontes[2] is not turmas):
+        _indice_estado['indice'] = IndiceHorarios(salas, professores, turmas)
+        _indice_estado['fontes'] = (salas, professores, turmas)
+    return _indice_estado['indice']
+
+
+def dia_periodo_atual(momento: Optional[datetime] = None) -> tuple:
+    """(dia, período) do horário escolar para o momento informado (ou agora).
+
+    Domingo retorna dia None. Manhã até 12h, tarde até 18h, noite depois.
+    """
+    momento = momento or datetime.now()
+    dia = DIAS_SEMANA[momento.weekday()] if momento.weekday() < 6 else None
+    if momento.hour < 12:
+        periodo = 'manhã'
+    elif momento.hour < 18:
+        periodo = 'tarde'
+    else:
+        periodo = 'noite'
+    return dia, periodo
 
 
 def formatar_horarios_para_prompt() -> str:
@@ -177,49 +456,46 @@ def buscar_horario_sala(numero_sala: str) -> Optional[Dict]:
     return horarios.get(numero_sala)
 
 
+def _sem_metadata(horarios: Dict) -> Dict:
+    """Mantém apenas os períodos (remove campos de metadata)."""
+    horarios_limpos = {periodo: horarios[periodo] for periodo in PERIODOS if periodo in horarios}
+    return horarios_limpos if horarios_limpos else horarios
+
+
 def buscar_horario_professor(nome_professor: str) -> Optional[Dict]:
     """Busca horário de um professor específico"""
     horarios = carregar_horarios_professores()
     # Tentar busca exata primeiro
     if nome_professor in horarios:
-        prof_horarios = horarios[nome_professor]
-        # Remover campos de metadata
-        horarios_limpos = {}
-        for periodo in ['manhã', 'tarde', 'noite']:
-            if periodo in prof_horarios:
-                horarios_limpos[periodo] = prof_horarios[periodo]
-        return horarios_limpos if horarios_limpos else prof_horarios
-    
-    # Busca por similaridade (case-insensitive)
-    nome_lower = nome_professor.lower()
-    for prof_nome, prof_horarios in horarios.items():
-        if prof_nome.lower() == nome_lower or nome_lower in prof_nome.lower():
-            # Remover campos de metadata
-            horarios_limpos = {}
-            for periodo in ['manhã', 'tarde', 'noite']:
-                if periodo in prof_horarios:
-                    horarios_limpos[periodo] = prof_horarios[periodo]
-            return horarios_limpos if horarios_limpos else prof_horarios
-    
-    # Busca por fuzzy matching (para erros de digitação)
+        return _sem_metadata(horarios[nome_professor])
+    
+    # Busca pelo nome normalizado/apelido no índice (O(1))
+    indice = obter_indice_horarios()
+    nome_normalizado = _normalizar_nome(nome_professor)
+    chave = indice.arquivo_professor.get(nome_normalizado)
+    if chave is None and nome_normalizado:
+        # Nome parcial (ex.: "fab" -> "Fabiana")
+        for prof_nome in horarios:
+            if nome_normalizado in _normalizar_nome(prof_nome):
+                chave = prof_nome
+                break
+    if chave is not None:
+        return _sem_metadata(horarios[chave])
+    
+    # Busca por fuzzy matching (para erros de digitação) - só quando nada acima encontrou
     try:
         from fuzzywuzzy import fuzz
         melhor_match = None
         melhor_score = 0
-        for prof_nome, prof_horarios in horarios.items():
+        nome_lower = nome_professor.lower()
+        for prof_nome in horarios:
             score = fuzz.ratio(nome_lower, prof_nome.lower())
             if score > melhor_score and score >= 75:  # Threshold de 75% de similaridade
                 melhor_score = score
                 melhor_match = prof_nome
         
         if melhor_match:
-            prof_horarios = horarios[melhor_match]
-            # Remover campos de metadata
-            horarios_limpos = {}
-            for periodo in ['manhã', 'tarde', 'noite']:
-                if periodo in prof_horarios:
-                    horarios_limpos[periodo] = prof_horarios[periodo]
-            return horarios_limpos if horarios_limpos else prof_horarios
+            return _sem_metadata(horarios[melhor_match])
     except ImportError:
         pass  # Se fuzzywuzzy não estiver disponível, continuar sem fuzzy matching
     
@@ -231,24 +507,18 @@ def buscar_horario_turma(nome_turma: str) -> Optional[Dict]:
     horarios = carregar_horarios_turmas()
     # Tentar busca exata primeiro
     if nome_turma in horarios:
-        turma_horarios = horarios[nome_turma]
-        # Remover campos de metadata
-        horarios_limpos = {}
-        for periodo in ['manhã', 'tarde', 'noite']:
-            if periodo in turma_horarios:
-                horarios_limpos[periodo] = turma_horarios[periodo]
-        return horarios_limpos if horarios_limpos else turma_horarios
+        return _sem_metadata(horarios[nome_turma])
+    
+    # Busca pelo código normalizado no índice ('2ids_sc_a', '2IDS-SC-A' -> '2IDS SC A')
+    chave = obter_indice_horarios().arquivo_turma.get(_normalizar_turma(nome_turma))
+    if chave is not None:
+        return _sem_metadata(horarios[chave])
     
     # Busca por similaridade (case-insensitive)
     turma_lower = nome_turma.lower().replace('_', ' ')
     for turma_nome, turma_horarios in horarios.items():
-        if turma_nome.lower() == turma_lower or turma_lower in turma_nome.lower():
-            # Remover campos de metadata
-            horarios_limpos = {}
-            for periodo in ['manhã', 'tarde', 'noite']:
-                if periodo in turma_horarios:
-                    horarios_limpos[periodo] = turma_horarios[periodo]
-            return horarios_limpos if horarios_limpos else turma_horarios
+        if turma_lower in turma_nome.lower():
+            return _sem_metadata(turma_horarios)
     
     return None
 
@@ -449,11 +719,10 @@ def formatar_horario_turma_para_resposta(nome_turma: str, horarios: Dict) -> str
     return texto
 
 def limpar_cache():
-    """Limpa o cache de horários"""
-    global _horarios_cache
-    _horarios_cache = {
-        'professores': {},
-        'salas': {},
-        'turmas': {}
-    }
+    """Limpa o cache de horários (a próxima consulta relê todos os arquivos)"""
+    with _recarga_lock:
+        for tipo in _PASTAS:
+            _arquivos[tipo] = {}
+            _verificado_em[tipo] = 0.0
+            _horarios_cache[tipo] = {}
 
@@ -2,7 +2,10 @@
 Gerenciador de informações do SENAI São Carlos
 Consolida e formata informações para uso no LM Studio
 """
-from typing import Dict, List, Optional
+import hashlib
+import threading
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
 from .base_info import INFO_SENAI_SAO_CARLOS, CONTATOS
 from .cursos import CURSOS
 from .salas import SALAS
@@ -15,9 +18,32 @@ from .informacoes_adicionais import (
     SERVICOS_EMPRESAS, REDES_SOCIAIS, BOLSAS_GRATUIDADE, 
     PROCESSO_SELETIVO, DURACAO_CURSOS
 )
+from .retrieval import IndiceBM25, dividir_em_trechos, formatar_trechos, estimar_tokens
 # Nota: formatar_horarios_para_prompt não é mais usado aqui - horários são tratados pelo fallback
 
 
+class BlocoInfo:
+    """Bloco de informações já formatado (imutável até a próxima invalidação)."""
+
+    __slots__ = ('nome', 'texto', 'caracteres', 'tokens')
+
+    def __init__(self, nome: str, texto: str):
+        self.nome = nome
+        self.texto = texto
+        self.caracteres = len(texto)
+        self.tokens = estimar_tokens(texto)
+
+
+def _bloco_memorizado(nome: str):
+    """Decorator: o bloco é formatado uma vez e reutilizado até os dados mudarem."""
+    def decorador(metodo: Callable[['InfoManager'], str]):
+        @wraps(metodo)
+        def wrapper(self: 'InfoManager') -> str:
+            return self.bloco(nome, lambda: metodo(self)).texto
+        return wrapper
+    return decorador
+
+
 class InfoManager:
     """Gerenciador centralizado de informações do SENAI São Carlos"""
     
@@ -41,7 +67,69 @@ class InfoManager:
         self.bolsas_gratuidade = BOLSAS_GRATUIDADE
         self.processo_seletivo = PROCESSO_SELETIVO
         self.duracao_cursos = DURACAO_CURSOS
+        # Blocos formatados e índice de busca (montados no primeiro uso)
+        self._blocos_prontos: Dict[str, BlocoInfo] = {}
+        self._indice: Optional[IndiceBM25] = None
+        self._lock_indice = threading.RLock()
+        self._assinatura_fontes = self._fontes_assinatura()
+        self.versao = 1
+
+    def _fontes(self) -> List:
+        return [
+            self.info_base, self.contatos, self.cursos, self.salas, self.processos,
+            self.perguntas_frequentes, self.empresas_parceiras, self.eventos, self.diferenciais,
+            self.areas_atuacao, self.cursos_livres_especificos, self.informacoes_alunos,
+            self.servicos_empresas, self.redes_sociais, self.bolsas_gratuidade,
+            self.processo_seletivo, self.duracao_cursos,
+        ]
+
+    def _fontes_assinatura(self) -> Tuple:
+        """Assinatura barata das fontes (identidade e tamanho de cada coleção).
+
+        Pega dados trocados ou itens incluídos/removidos; alterações dentro de um
+        item já existente precisam de invalidar().
+        """
+        return tuple((id(fonte), len(fonte)) for fonte in self._fontes())
+
+    def invalidar(self) -> None:
+        """Descarta os blocos formatados e o índice (os dados da base mudaram)."""
+        with self._lock_indice:
+            self._blocos_prontos = {}
+            self._indice = None
+            self._assinatura_fontes = self._fontes_assinatura()
+            self.versao += 1
+
+    def _verificar_fontes(self) -> None:
+        if self._fontes_assinatura() != self._assinatura_fontes:
+            print("InfoManager: dados da base mudaram, formatando os blocos novamente")
+            self.invalidar()
+
+    def bloco(self, nome: str, renderizar: Callable[[], str]) -> BlocoInfo:
+        """Bloco memorizado pelo nome; formatado com renderizar() na primeira vez."""
+        self._verificar_fontes()
+        bloco = self._blocos_prontos.get(nome)
+        if bloco is None:
+            with self._lock_indice:
+                bloco = self._blocos_prontos.get(nome)
+                if bloco is None:
+                    bloco = BlocoInfo(nome, renderizar())
+                    self._blocos_prontos[nome] = bloco
+        return bloco
+
+    def assinatura(self) -> str:
+        """Identificador do conteúdo atual da base (muda quando algum bloco muda)."""
+        return hashlib.sha1(self.get_complete_info().encode('utf-8')).hexdigest()[:16]
+
+    def estatisticas(self) -> Dict:
+        """Blocos já formatados, com tamanho em caracteres e tokens estimados."""
+        blocos = dict(self._blocos_prontos)
+        return {
+            'versao': self.versao,
+            'blocos': {nome: {'caracteres': b.caracteres, 'tokens': b.tokens} for nome, b in blocos.items()},
+            'trechos_indexados': len(self._indice.trechos) if self._indice is not None else 0,
+        }
     
+    @_bloco_memorizado('basico')
     def get_basic_info(self) -> str:
         """Retorna informações básicas da unidade"""
         return f"""
@@ -61,6 +149,7 @@ class InfoManager:
 {self.info_base['sobre'].strip()}
 """
     
+    @_bloco_memorizado('cursos')
     def get_courses_info(self) -> str:
         """Retorna informações detalhadas sobre cursos"""
         info = "\n🎓 **CURSOS OFERECIDOS:**\n"
@@ -128,6 +217,7 @@ class InfoManager:
         
         return info
     
+    @_bloco_memorizado('infraestrutura')
     def get_infrastructure_info(self) -> str:
         """Retorna informações sobre infraestrutura e instalações"""
         info = "\n**INFRAESTRUTURA E INSTALAÇÕES:**\n"
@@ -185,6 +275,7 @@ class InfoManager:
         
         return info
     
+    @_bloco_memorizado('parcerias')
     def get_partnerships_info(self) -> str:
         """Retorna informações sobre parcerias e empresas"""
         info = "\n🤝 **EMPRESAS PARCEIRAS:**\n"
@@ -196,6 +287,7 @@ class InfoManager:
         
         return info
     
+    @_bloco_memorizado('eventos')
     def get_events_info(self) -> str:
         """Retorna informações sobre eventos"""
         from .institucional import INFO_ACOMPANHAR_EVENTOS
@@ -219,6 +311,7 @@ class InfoManager:
         
         return info
     
+    @_bloco_memorizado('diferenciais')
     def get_differentials_info(self) -> str:
         """Retorna informações sobre diferenciais da unidade"""
         info = "\n⭐ **DIFERENCIAIS DA UNIDADE:**\n"
@@ -230,6 +323,7 @@ class InfoManager:
         
         return info
     
+    @_bloco_memorizado('inscricao')
     def get_enrollment_process(self) -> str:
         """Retorna informações sobre processos de inscrição"""
         info = "\n**PROCESSOS DE INSCRIÇÃO:**\n"
@@ -240,6 +334,7 @@ class InfoManager:
         
         return info
     
+    @_bloco_memorizado('faq')
     def get_faq_info(self) -> str:
         """Retorna perguntas frequentes"""
         info = "\n❓ **PERGUNTAS FREQUENTES:**\n"
@@ -250,6 +345,7 @@ class InfoManager:
         
         return info
     
+    @_bloco_memorizado('contatos')
     def get_contacts_info(self) -> str:
         """Retorna informações de contato detalhadas"""
         info = "\n**CONTATOS E ATENDIMENTO:**\n"
@@ -267,10 +363,12 @@ class InfoManager:
         
         return info
     
+    @_bloco_memorizado('funcionarios')
     def get_staff_info(self) -> str:
         """Retorna informações sobre funcionários"""
         return obter_info_funcionarios_para_lm()
     
+    @_bloco_memorizado('completo')
     def get_complete_info(self) -> str:
         """Retorna todas as informações consolidadas com priorização"""
         info = ""
@@ -297,6 +395,7 @@ class InfoManager:
         
         return info
     
+    @_bloco_memorizado('adicionais')
     def get_additional_info(self) -> str:
         """Retorna informações adicionais importantes que podem estar faltando"""
         info = "\n**INFORMAÇÕES ADICIONAIS IMPORTANTES:**\n"
@@ -372,95 +471,43 @@ class InfoManager:
         
         return info
     
+    def _blocos(self) -> List[Tuple[str, str]]:
+        """Blocos da base indexados para a busca: (nome, texto formatado)."""
+        return [
+            ('basico', self.get_basic_info()),
+            ('funcionarios', self.get_staff_info()),
+            ('cursos', self.get_courses_info()),
+            ('infraestrutura', self.get_infrastructure_info()),
+            ('parcerias', self.get_partnerships_info()),
+            ('eventos', self.get_events_info()),
+            ('diferenciais', self.get_differentials_info()),
+            ('inscricao', self.get_enrollment_process()),
+            ('faq', self.get_faq_info()),
+            ('contatos', self.get_contacts_info()),
+            ('adicionais', self.get_additional_info()),
+        ]
+
+    def indice(self) -> IndiceBM25:
+        """Índice BM25 dos trechos da base (montado uma vez, refeito se os dados mudarem)."""
+        self._verificar_fontes()
+        indice = self._indice
+        if indice is None:
+            with self._lock_indice:
+                indice = self._indice
+                if indice is None:
+                    indice = self._indice = IndiceBM25(dividir_em_trechos(self._blocos()))
+        return indice
+
     def get_contextual_info(self, query: str) -> str:
-        """Retorna informações relevantes baseadas na consulta"""
-        query_lower = query.lower()
-        
-        # Determinar contexto da consulta
-        if any(word in query_lower for word in ['curso', 'cursos', 'técnico', 'superior', 'aprendizagem', 'qualificação']):
-            return self.get_courses_info()
-        
-        elif any(word in query_lower for word in ['laboratório', 'laboratorio', 'sala', 'biblioteca', 'refeitório', 'refeitorio', 'banheiro', 'banheiros', 'sanitário', 'sanitario', 'infraestrutura']):
-            # Verificar se é pergunta de localização específica (onde fica, como chegar) ou pergunta geral sobre infraestrutura
-            palavras_localizacao = ['onde fica', 'onde está', 'onde esta', 'como chegar', 'localização', 'localizacao', 'onde encontro']
-            eh_localizacao = any(palavra in query_lower for palavra in palavras_localizacao)
-            
-            if eh_localizacao:
-                # Perguntas de localização específica são tratadas pelo sistema de fallback
-                return self.get_basic_info()
-            else:
-                # Perguntas gerais sobre infraestrutura (ex: "quais laboratórios existem?", "que infraestrutura vocês têm?")
-                # devem incluir informações de infraestrutura para o LM Studio responder
-                return self.get_basic_info() + self.get_infrastructure_info()
-        
-        elif any(word in query_lower for word in ['parceria', 'empresa', 'estágio', 'estagio', 'oportunidade']):
-            return self.get_partnerships_info()
-        
-        elif any(word in query_lower for word in ['evento', 'eventos', 'feira', 'feiras', 'hackathon', 'semana', 'atividade', 'atividades', 'fórum', 'forum', 'palestra', 'palestras', 'workshop', 'workshops', 'exposição', 'exposicao', 'exposições', 'exposicoes']):
-            return self.get_events_info()
-        
-        elif any(word in query_lower for word in ['inscrição', 'inscricao', 'matrícula', 'matricula', 'processo']):
-            return self.get_enrollment_process()
-        
-        elif any(word in query_lower for word in ['contato', 'telefone', 'email', 'atendimento']):
-            return self.get_contacts_info()
-        
-        elif any(word in query_lower for word in ['diferencial', 'vantagem', 'benefício', 'beneficio', 'por que']):
-            return self.get_differentials_info()
-        
-        elif any(word in query_lower for word in ['pergunta', 'dúvida', 'duvida', 'faq', 'frequente']):
-            return self.get_faq_info()
-        
-        elif any(word in query_lower for word in ['funcionário', 'funcionario', 'funcionários', 'funcionarios', 'professor', 'coordenador', 'diretor', 'analista', 'orientador', 'fernanda', 'carla', 'marcio', 'julio', 'rainer']):
-            return self.get_staff_info()
-        
-        elif any(word in query_lower for word in ['bolsa', 'bolsas', 'financiamento', 'desconto', 'gratuidade', 'psg', 'pagamento']):
-            return self.get_basic_info() + self.get_enrollment_process() + self.get_faq_info()
-        
-        elif any(word in query_lower for word in ['certificado', 'certificados', 'diploma', 'reconhecimento', 'mec']):
-            return self.get_courses_info() + self.get_faq_info()
-        
-        elif any(word in query_lower for word in ['estágio', 'estagio', 'emprego', 'trabalho', 'oportunidade', 'mural']):
-            return self.get_partnerships_info() + self.get_faq_info()
-        
-        elif any(word in query_lower for word in ['inovação', 'inovacao', 'pesquisa', 'projeto', 'fablab', 'competição']):
-            return self.get_differentials_info() + self.get_events_info()
-        
-        elif any(word in query_lower for word in ['senai online', 'ead', 'online', 'distância', 'distancia']):
-            return self.get_basic_info() + self.get_courses_info()
-        
-        elif any(word in query_lower for word in ['área', 'area', 'atuacao', 'atuação', 'alimentos', 'automotiva', 'construção', 'construcao', 'eletroeletrônica', 'eletroeletronica', 'energia', 'gestão', 'gestao', 'logística', 'logistica', 'metalmecânica', 'metalmecanica', 'tecnologia informação']):
-            return self.get_basic_info() + self.get_additional_info()
-        
-        elif any(word in query_lower for word in ['curso livre', 'cursos livres', 'qualificação', 'qualificacao', 'aperfeiçoamento', 'aperfeicoamento', 'energia solar', 'arduino', 'circuitos elétricos', 'circuitos eletricos']):
-            return self.get_courses_info() + self.get_additional_info()
-        
-        elif any(word in query_lower for word in ['aluno', 'alunos', 'matriculado', 'matriculados', 'portal', 'calendário', 'calendario', 'horário escolar', 'horario escolar', 'manual aluno', 'regimento']):
-            return self.get_additional_info() + self.get_contacts_info()
-        
-        elif any(word in query_lower for word in ['horário', 'horario', 'horarios', 'horários', 'qual professor', 'qual turma', 'qual sala', 'onde está o professor', 'onde esta o professor', 'professor está', 'professor esta', 'turma está', 'turma esta', 'sala está', 'sala esta', 'que dia', 'que período', 'que periodo']):
-            # Perguntas sobre horários são tratadas pelo sistema de fallback, não pelo LM Studio
-            return self.get_staff_info()
-        
-        elif any(word in query_lower for word in ['empresa', 'empresas', 'parceria', 'parcerias', 'núcleo', 'nucleo', 'tecnologia', 'automação', 'automacao', 'assistência técnica', 'assistencia tecnica', 'consultoria']):
-            return self.get_additional_info() + self.get_partnerships_info()
-        
-        elif any(word in query_lower for word in ['instagram', 'facebook', 'rede social', 'redes sociais', 'site oficial', 'canais comunicação']):
-            return self.get_additional_info()
-        
-        elif any(word in query_lower for word in ['duração', 'duracao', 'horas', 'período', 'periodo', 'anos', 'meses']):
-            return self.get_additional_info() + self.get_courses_info()
-        
-        elif any(word in query_lower for word in ['inscrição', 'inscricao', 'seleção', 'selecao', 'prova', 'documentos', 'requisitos']):
-            return self.get_additional_info() + self.get_enrollment_process()
-        
-        else:
-            # Para consultas gerais, retornar informações mais completas
-            return (self.get_basic_info() + 
-                   self.get_courses_info() + 
-                   self.get_differentials_info() + 
-                   self.get_partnerships_info() +
-                   self.get_additional_info())
+        """Retorna os trechos da base mais relevantes para a consulta (busca BM25).
+
+        Sem nenhum trecho relacionado (ex.: saudações), retorna as informações
+        básicas da unidade.
+        """
+        trechos = self.indice().buscar(query)
+        if not trechos:
+            return self.get_basic_info()
+        return formatar_trechos(trechos)
 
 
 # Instância global do gerenciador
@@ -482,25 +529,49 @@ def get_complete_senai_info() -> str:
     return info_manager.get_complete_info()
 
 
-def format_senai_info_for_prompt(query: str, include_all: bool = False) -> str:
+# Regras fixas do assistente (iguais em todo prompt; o chat as coloca no prefixo de sistema)
+REGRAS_PROMPT = """[REGRAS IMPORTANTES PARA O ASSISTENTE]
+- Use EXCLUSIVAMENTE as informações oficiais fornecidas para responder
+- Não invente informações que não estão listadas
+- Mantenha o tom profissional mas amigável
+- Sempre inclua informações de contato quando relevante
+- Se não souber algo específico, oriente a entrar em contato
+- Mantenha continuidade com a conversa anterior
+- Seja detalhado e informativo nas respostas
+- Use as informações estruturadas do módulo info/ como base principal
+- Se a pergunta não estiver nas informações fornecidas, diga que não tem essa informação específica e oriente a entrar em contato
+- NUNCA invente dados como valores, datas ou informações não fornecidas
+
+[DIRECIONAMENTO PARA SETORES - IMPORTANTE]
+- Para perguntas sobre MATRÍCULA, INSCRIÇÃO, CURSOS, VALORES, PROCESSOS SELETIVOS: 
+  → Direcione para a SECRETARIA (Sala A-01, térreo)
+  → Telefone: (16) 2106-8700 | Email: saocarlos@sp.senai.br
+  
+- Para perguntas sobre INFORMAÇÕES GERAIS DA ESCOLA, SOBRE O SENAI, DIFERENCIAIS, INFRAESTRUTURA:
+  → Pode responder com as informações disponíveis, mas também pode orientar ao SETOR DE APOIO (Sala 204)
+  → O Setor de Apoio fica no refeitório, última sala à direita
+  → Contato geral: (16) 2106-8700"""
+
+
+def format_senai_info_for_prompt(query: str, include_all: bool = False, incluir_regras: bool = True) -> str:
     """
     Formata informações do SENAI para inclusão no prompt do LM Studio
     
     Args:
         query: Consulta do usuário
         include_all: Se True, inclui todas as informações. Se False, apenas as relevantes
+        incluir_regras: Se False, omite REGRAS_PROMPT (quando já vão no prefixo de sistema)
     """
     if include_all:
         info = get_complete_senai_info()
+        # Limitar o tamanho das informações para evitar timeout
+        max_info_length = 6000  # Reduzido para evitar timeout do LM Studio
+        if len(info) > max_info_length:
+            info = info[:max_info_length] + "..."
     else:
+        # Trechos relevantes, já limitados pelo orçamento de tokens da busca
         info = get_senai_context_for_lm(query)
     
-    # Limitar o tamanho das informações para evitar timeout
-    max_info_length = 6000  # Reduzido para evitar timeout do LM Studio
-    
-    if len(info) > max_info_length:
-        info = info[:max_info_length] + "..."
-    
     # Verificar se a consulta é sobre eventos para adicionar instruções específicas
     query_lower = query.lower()
     e_pergunta_eventos = any(word in query_lower for word in [
@@ -565,31 +636,17 @@ def format_senai_info_for_prompt(query: str, include_all: bool = False) -> str:
 - Contato geral: Telefone (16) 2106-8700 ou Email: saocarlos@sp.senai.br
 """
     
-    return f"""
+    if not incluir_regras:
+        return f"""
 [INFORMAÇÕES OFICIAIS DO SENAI SÃO CARLOS - ESCOLA "ANTONIO A. LOBBE"]
 {info}
+{instrucoes_especificas}"""
 
-[REGRAS IMPORTANTES PARA O ASSISTENTE]
-- Use EXCLUSIVAMENTE as informações acima para responder
-- Não invente informações que não estão listadas
-- Mantenha o tom profissional mas amigável
-- Sempre inclua informações de contato quando relevante
-- Se não souber algo específico, oriente a entrar em contato
-- Mantenha continuidade com a conversa anterior
-- Seja detalhado e informativo nas respostas
-- Use as informações estruturadas do módulo info/ como base principal
-- Se a pergunta não estiver nas informações acima, diga que não tem essa informação específica e oriente a entrar em contato
-- NUNCA invente dados como valores, datas ou informações não fornecidas
+    return f"""
+[INFORMAÇÕES OFICIAIS DO SENAI SÃO CARLOS - ESCOLA "ANTONIO A. LOBBE"]
+{info}
 
-[DIRECIONAMENTO PARA SETORES - IMPORTANTE]
-- Para perguntas sobre MATRÍCULA, INSCRIÇÃO, CURSOS, VALORES, PROCESSOS SELETIVOS: 
-  → Direcione para a SECRETARIA (Sala A-01, térreo)
-  → Telefone: (16) 2106-8700 | Email: saocarlos@sp.senai.br
-  
-- Para perguntas sobre INFORMAÇÕES GERAIS DA ESCOLA, SOBRE O SENAI, DIFERENCIAIS, INFRAESTRUTURA:
-  → Pode responder com as informações disponíveis, mas também pode orientar ao SETOR DE APOIO (Sala 204)
-  → O Setor de Apoio fica no refeitório, última sala à direita
-  → Contato geral: (16) 2106-8700
+{REGRAS_PROMPT}
 
 {instrucoes_especificas}
 """
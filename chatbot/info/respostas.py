@@ -31,6 +31,16 @@ RESPOSTAS_PADRAO = {
         "Se for algo sobre nossa unidade, tente novamente em instantes ou inclua mais detalhes (curso, horário, local)."
     ),
     
+    "ocupado": (
+        "Estou atendendo muitas perguntas neste momento. "
+        "Sou o Cadu, assistente virtual do SenAI, ferramenta de auxilio para o SENAI São Carlos. "
+        "Por favor, aguarde alguns segundos e envie sua mensagem novamente."
+    ),
+
+    "resposta_interrompida": (
+        "(A resposta foi interrompida antes do fim. Se precisar do restante, envie a pergunta novamente.)"
+    ),
+    
     "erro_geral": (
         "Desculpe, ocorreu um erro ao processar sua mensagem. "
         "Sou o Cadu, assistente virtual do SenAI, ferramenta de auxilio para o SENAI São Carlos. "
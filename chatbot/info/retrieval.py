@@ -0,0 +1,229 @@
+"""
+Índice de busca (BM25) sobre a base de informações do módulo info/
+
+Os blocos formatados pelo InfoManager (cursos, salas, eventos, perguntas
+frequentes, funcionários, informações adicionais...) são divididos em
+trechos (parágrafos, cada um com o título da seção a que pertence) e
+indexados com BM25. Para cada pergunta, buscar() devolve os trechos mais
+relevantes que cabem no orçamento de tokens, em vez de mandar blocos inteiros
+ao modelo: o prompt fica menor e o prefill no LM Studio (CPU) mais rápido.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import RETRIEVAL_TOP_K, RETRIEVAL_TOKEN_BUDGET
+
+# Parâmetros usuais do BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Trechos com pontuação abaixo desta fração da melhor não entram (evita enchimento)
+PONTUACAO_MINIMA_RELATIVA = 0.25
+
+STOPWORDS = frozenset("""
+a ao aos as ate com como da das de do dos e ela ele em entre essa esse esta este eu foi
+ha isso la lhe mais mas me meu minha na nas no nos o os ou para pela pelo por pra qual
+quais quando que quem se sem ser seu sua tem ter to tu um uma voce voces vou sobre ja
+oi ola bom boa dia tarde noite favor gostaria saber queria pode poderia fala tudo bem
+vc vcs algum alguma aqui ai
+""".split())
+
+_RE_PALAVRA = re.compile(r'\w+')
+# Linha só com título: "**CURSOS TÉCNICOS:**", "📅 **EVENTOS...:**", "SETOR: ..." não conta
+_RE_TITULO = re.compile(r'^\W{0,3}\s*\*\*([^*]+)\*\*:?\s*$|^([A-ZÀ-Ú0-9 ,\-–"]+):\s*$')
+
+
+# Pedaços em que o tokenizador do modelo (BPE da família Llama 3) divide o texto
+# antes de aplicar o vocabulário: palavras, grupos de até 3 dígitos, pontuação e espaços
+_RE_PEDACO = re.compile(r'[^\W\d_]+|\d{1,3}|[^\w\s]+|\s+')
+
+
+def _tokens_pedaco(pedaco: str) -> int:
+    if pedaco[0].isalpha():
+        # Palavras comuns são um token só; longas se dividem a cada ~6 letras, e
+        # acentos costumam quebrar a palavra em mais um pedaço
+        return 1 + len(pedaco) // 6 + (0 if pedaco.isascii() else 1)
+    if pedaco[0].isdigit():
+        return 1
+    if pedaco.isspace():
+        # Um espaço antes da palavra vai junto com ela; quebras de linha e recuos custam um token
+        return 0 if pedaco == ' ' else 1
+    # Pontuação e símbolos: ~2 caracteres por token; emojis e símbolos gráficos ~2 tokens cada
+    return sum(2 if ord(c) >= 0x2000 else 0 for c in pedaco) + (sum(1 for c in pedaco if ord(c) < 0x2000) + 1) // 2
+
+
+@lru_cache(maxsize=2048)
+def estimar_tokens(texto: str) -> int:
+    """Estimativa de tokens do texto para o modelo (tokenizador BPE da família Llama 3).
+
+    Conta pedaços como o pré-tokenizador do modelo (palavras, números, pontuação),
+    sem carregar o vocabulário; erra por alguns pontos percentuais em português,
+    por isso o orçamento do prompt guarda uma folga (PROMPT_SAFETY_MARGIN).
+    Memorizada: instruções, mensagens do histórico e trechos se repetem a cada turno.
+    """
+    if not texto:
+        return 0
+    return sum(_tokens_pedaco(pedaco) for pedaco in _RE_PEDACO.findall(texto))
+
+
+def _remover_acentos(texto: str) -> str:
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+
+
+def _radical(palavra: str) -> str:
+    """Redução leve de plural/flexão ('inscrições' -> 'inscricao', 'cursos' -> 'curso')."""
+    if len(palavra) <= 3:
+        return palavra
+    if palavra.endswith('coes'):
+        return palavra[:-4] + 'cao'
+    if palavra.endswith('oes') or palavra.endswith('aes'):
+        return palavra[:-3] + 'ao'
+    if palavra.endswith('ais'):
+        return palavra[:-3] + 'al'
+    if palavra.endswith('res') or palavra.endswith('zes'):
+        return palavra[:-2]
+    if palavra.endswith('s') and not palavra.endswith('ss'):
+        return palavra[:-1]
+    return palavra
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Termos do texto para o índice: minúsculas, sem acentos, sem stopwords, radicalizados."""
+    palavras = _RE_PALAVRA.findall(_remover_acentos((texto or '').lower()))
+    return [_radical(p) for p in palavras if p not in STOPWORDS and (len(p) > 1 or p.isdigit())]
+
+
+class Trecho:
+    """Um parágrafo da base, com o bloco e a seção de onde veio."""
+
+    __slots__ = ('bloco', 'secao', 'texto', 'ordem', 'tokens')
+
+    def __init__(self, bloco: str, secao: str, texto: str, ordem: int):
+        self.bloco = bloco
+        self.secao = secao
+        self.texto = texto
+        self.ordem = ordem
+        self.tokens = estimar_tokens(texto)
+
+    def __repr__(self) -> str:
+        return f"Trecho({self.bloco!r}, {self.secao!r}, {self.texto[:40]!r})"
+
+
+def _titulo(linha: str) -> Optional[str]:
+    correspondencia = _RE_TITULO.match(linha.strip())
+    if not correspondencia:
+        return None
+    titulo = (correspondencia.group(1) or correspondencia.group(2) or '').strip().rstrip(':')
+    # "**P: ...**" é a pergunta de um item do FAQ, não um título de seção
+    return None if titulo.startswith('P:') else titulo
+
+
+def dividir_em_trechos(blocos: Sequence[Tuple[str, str]]) -> List[Trecho]:
+    """Divide cada bloco (nome, texto) em parágrafos, guardando o título da seção.
+
+    Parágrafos que são só títulos mudam a seção atual; o primeiro título do
+    bloco é o título do bloco. Parágrafos recuados continuam o trecho
+    anterior (ex.: a lista de documentos de um processo de inscrição).
+    """
+    trechos: List[Trecho] = []
+    for nome, texto in blocos:
+        titulo_bloco, secao = '', ''
+        for paragrafo in re.split(r'\n\s*\n', texto or ''):
+            linhas = [linha.rstrip() for linha in paragrafo.strip('\n').split('\n') if linha.strip()]
+            if not linhas:
+                continue
+            if linhas[0][:1].isspace() and trechos and trechos[-1].bloco == nome:
+                anterior = trechos[-1]
+                trechos[-1] = Trecho(nome, anterior.secao, anterior.texto + '\n' + '\n'.join(linhas), anterior.ordem)
+                continue
+            # Títulos no início do parágrafo (ex.: "**CURSOS TÉCNICOS:**" antes dos itens)
+            while linhas and _titulo(linhas[0]) is not None:
+                titulo = _titulo(linhas.pop(0))
+                if not titulo_bloco:
+                    titulo_bloco = titulo
+                else:
+                    secao = titulo
+            if not linhas:
+                continue
+            trechos.append(Trecho(nome, secao or titulo_bloco, '\n'.join(linhas), len(trechos)))
+    return trechos
+
+
+class IndiceBM25:
+    """Índice invertido BM25 dos trechos da base de informações."""
+
+    def __init__(self, trechos: List[Trecho], k1: float = BM25_K1, b: float = BM25_B):
+        self.trechos = trechos
+        self.k1 = k1
+        self.b = b
+        self._frequencias: List[Counter] = []
+        self._tamanhos: List[int] = []
+        documentos_com_termo: Counter = Counter()
+        for trecho in trechos:
+            # O título da seção entra no texto indexado ("eventos" acha todos os eventos)
+            termos = tokenizar(f"{trecho.bloco} {trecho.secao} {trecho.texto}")
+            frequencia = Counter(termos)
+            self._frequencias.append(frequencia)
+            self._tamanhos.append(len(termos))
+            documentos_com_termo.update(frequencia.keys())
+        total = len(trechos)
+        self._media_tamanho = (sum(self._tamanhos) / total) if total else 0.0
+        self._idf: Dict[str, float] = {
+            termo: math.log(1 + (total - n + 0.5) / (n + 0.5)) for termo, n in documentos_com_termo.items()
+        }
+        # Lista invertida: termo -> índices dos trechos que o contêm
+        self._postings: Dict[str, List[int]] = {}
+        for i, frequencia in enumerate(self._frequencias):
+            for termo in frequencia:
+                self._postings.setdefault(termo, []).append(i)
+
+    def pontuar(self, consulta: str) -> Dict[int, float]:
+        """Pontuação BM25 de cada trecho que contém algum termo da consulta."""
+        pontos: Dict[int, float] = {}
+        for termo in set(tokenizar(consulta)):
+            idf = self._idf.get(termo)
+            if idf is None:
+                continue
+            for i in self._postings[termo]:
+                tf = self._frequencias[i][termo]
+                norma = self.k1 * (1 - self.b + self.b * self._tamanhos[i] / (self._media_tamanho or 1))
+                pontos[i] = pontos.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norma)
+        return pontos
+
+    def buscar(self, consulta: str, top_k: int = RETRIEVAL_TOP_K,
+               orcamento_tokens: int = RETRIEVAL_TOKEN_BUDGET) -> List[Trecho]:
+        """Trechos mais relevantes (até top_k) que cabem no orçamento, na ordem original da base."""
+        pontos = self.pontuar(consulta)
+        if not pontos:
+            return []
+        melhor = max(pontos.values())
+        ranking = sorted(pontos.items(), key=lambda item: -item[1])
+        escolhidos: List[Trecho] = []
+        usados = 0
+        for i, ponto in ranking:
+            if len(escolhidos) >= top_k or ponto < melhor * PONTUACAO_MINIMA_RELATIVA:
+                break
+            trecho = self.trechos[i]
+            if usados + trecho.tokens > orcamento_tokens:
+                # Um trecho maior que o orçamento não impede os menores seguintes
+                continue
+            escolhidos.append(trecho)
+            usados += trecho.tokens
+        escolhidos.sort(key=lambda t: t.ordem)
+        return escolhidos
+
+
+def formatar_trechos(trechos: List[Trecho]) -> str:
+    """Texto dos trechos agrupados pela seção, no formato dos blocos do InfoManager."""
+    partes: List[str] = []
+    secao_atual = None
+    for trecho in trechos:
+        if trecho.secao != secao_atual:
+            secao_atual = trecho.secao
+            partes.append(f"\n**{secao_atual}:**")
+        partes.append(trecho.texto)
+    return '\n'.join(partes).strip()
@@ -22,14 +22,18 @@ from .funcionarios import buscar_funcionario
 def _remover_acentos(texto: str) -> str:
     return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
 
-def obter_informacao_especifica(consulta: str) -> Optional[str]:
-    """Tenta buscar informações específicas com base na consulta do usuário"""
+def obter_informacao_especifica(consulta: str, contexto=None) -> Optional[str]:
+    """Tenta buscar informações específicas com base na consulta do usuário
+
+    contexto: ContextoMensagem (utils/contexto_mensagem.py) já calculado para a
+    consulta; quando informado, reaproveita as formas normalizadas da mensagem.
+    """
     # Tratamento de consultas vazias ou apenas espaços
     if not consulta or not consulta.strip():
         return "Olá! Sou o Cadu, assistente virtual do SenAI, ferramenta de auxilio para o SENAI São Carlos. Como posso te ajudar hoje? Você pode me perguntar sobre salas, laboratórios, banheiros, cursos, matrícula ou qualquer informação sobre nossa unidade."
     
     # PRIORIDADE MÁXIMA: Tratamento de consultas com apenas números (busca direta de sala/banheiro)
-    consulta_limpa = consulta.strip()
+    consulta_limpa = contexto.limpa if contexto is not None else consulta.strip()
     if consulta_limpa.isdigit():
         # Buscar diretamente a sala/banheiro pelo número
         numero_sala = consulta_limpa
@@ -92,10 +96,14 @@ def obter_informacao_especifica(consulta: str) -> Optional[str]:
     ]
     
     # Se for uma pergunta específica ou um padrão que deve ir para LM Studio, deixar para o LM Studio responder
-    consulta_lower = consulta.lower().strip()
-    consulta_normalizada = _remover_acentos(consulta_lower)
-    consulta_normalizada = re.sub(r'\s+', ' ', consulta_normalizada)
-    consulta_lower = re.sub(r'\s+', ' ', consulta_lower)
+    if contexto is not None:
+        consulta_lower = contexto.lower
+        consulta_normalizada = contexto.normalizada
+    else:
+        consulta_lower = consulta.lower().strip()
+        consulta_normalizada = _remover_acentos(consulta_lower)
+        consulta_normalizada = re.sub(r'\s+', ' ', consulta_normalizada)
+        consulta_lower = re.sub(r'\s+', ' ', consulta_lower)
     
     # PRIORIDADE MÁXIMA: Verificar se é pergunta sobre horários ANTES de qualquer outra verificação
     perguntas_horario_prioridade = [
@@ -1111,8 +1119,6 @@ def obter_informacao_especifica(consulta: str) -> Optional[str]:
         r"\bola\b", r"\bolá\b", r"\boi\b", r"\bbom dia\b", r"\bboa tarde\b",
         r"\bboa noite\b", r"\bquem e vc\b", r"\bquem e voce\b", r"\bquem é vc\b", r"\bquem é você\b"
     ]
-    consulta_sem_acentos = _remover_acentos(consulta_lower)
-    consulta_normalizada = re.sub(r"\s+", " ", consulta_sem_acentos)
     for padrao in saudacoes_regex:
         if re.search(padrao, consulta_normalizada):
             return RESPOSTAS_PADRAO["saudacao"]
@@ -0,0 +1,104 @@
+"""
+Migrações versionadas do banco de dados
+
+Substitui o db.create_all() solto do app.py: cria as tabelas que faltam e
+aplica, em ordem, as migrações ainda não registradas na tabela schema_version.
+Cada migração verifica o que já existe antes de alterar, então bancos criados
+pelo create_database.sql ou por versões anteriores do app são atualizados no
+lugar, sem perder dados.
+
+Para adicionar uma migração, crie a função e acrescente (versao, descricao,
+funcao) ao final de MIGRACOES; nunca altere uma migração já publicada.
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection
+
+from models.sqlalchemy_models import db, Chat, Mensagem
+
+# Controle de versão fica fora do db.metadata (não é um modelo da aplicação)
+_metadata = MetaData()
+schema_version = Table(
+    'schema_version', _metadata,
+    Column('versao', Integer, primary_key=True, autoincrement=False),
+    Column('descricao', String(255), nullable=False),
+    Column('aplicada_em', DateTime, nullable=False),
+)
+
+# Nome do lock do MySQL que impede dois workers de migrarem ao mesmo tempo
+_LOCK_MIGRACAO = 'senai_schema_migracao'
+
+
+def _criar_indices_faltantes(conexao: Connection, tabela: Table):
+    """Cria os índices declarados no modelo que ainda não existem no banco."""
+    existentes = {indice['name'] for indice in inspect(conexao).get_indexes(tabela.name)}
+    for indice in tabela.indexes:
+        if indice.name not in existentes:
+            indice.create(conexao)
+            print(f"Índice criado: {tabela.name}.{indice.name}")
+
+
+def _tabelas_iniciais(conexao: Connection):
+    """Cria as tabelas do modelo que ainda não existem (usuarios, chats, mensagens)."""
+    db.metadata.create_all(conexao)
+
+
+def _indices_compostos(conexao: Connection):
+    """Índices compostos (dono, updated_at) em chats e (chat_id, created_at) em mensagens."""
+    _criar_indices_faltantes(conexao, Chat.__table__)
+    _criar_indices_faltantes(conexao, Mensagem.__table__)
+
+
+def _resumo_dos_chats(conexao: Connection):
+    """Colunas resumo e resumo_ate em chats (resumo contínuo das conversas)."""
+    existentes = {coluna['name'] for coluna in inspect(conexao).get_columns('chats')}
+    if 'resumo' not in existentes:
+        conexao.execute(text("ALTER TABLE chats ADD COLUMN resumo TEXT NULL"))
+    if 'resumo_ate' not in existentes:
+        conexao.execute(text("ALTER TABLE chats ADD COLUMN resumo_ate INTEGER NULL"))
+
+
+MIGRACOES: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, 'tabelas iniciais', _tabelas_iniciais),
+    (2, 'índices compostos de chats e mensagens', _indices_compostos),
+    (3, 'resumo das conversas em chats', _resumo_dos_chats),
+]
+
+VERSAO_ATUAL = MIGRACOES[-1][0]
+
+
+def aplicar_migracoes() -> int:
+    """Aplica as migrações pendentes e retorna a versão do schema.
+
+    Deve ser chamada dentro de um app_context. No MySQL usa GET_LOCK para que
+    só um worker do gunicorn migre por vez; os demais esperam e encontram as
+    migrações já registradas.
+    """
+    with db.engine.connect() as conexao:
+        mysql = conexao.dialect.name == 'mysql'
+        if mysql:
+            conexao.execute(text("SELECT GET_LOCK(:nome, 60)"), {'nome': _LOCK_MIGRACAO})
+        try:
+            _metadata.create_all(conexao)
+            conexao.commit()
+            aplicadas = set(conexao.execute(select(schema_version.c.versao)).scalars())
+            for versao, descricao, migracao in MIGRACOES:
+                if versao in aplicadas:
+                    continue
+                migracao(conexao)
+                conexao.execute(schema_version.insert().values(
+                    versao=versao, descricao=descricao, aplicada_em=datetime.utcnow()
+                ))
+                conexao.commit()
+                aplicadas.add(versao)
+                print(f"Migração {versao} aplicada: {descricao}")
+            return max(aplicadas) if aplicadas else 0
+        except Exception:
+            conexao.rollback()
+            raise
+        finally:
+            if mysql:
+                conexao.execute(text("SELECT RELEASE_LOCK(:nome)"), {'nome': _LOCK_MIGRACAO})
+                conexao.commit()
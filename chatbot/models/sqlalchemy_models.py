@@ -27,6 +27,11 @@ class Usuario(db.Model):
 
 class Chat(db.Model):
     __tablename__ = 'chats'
+    # Lista de chats e check-updates filtram por dono e ordenam por updated_at
+    __table_args__ = (
+        db.Index('idx_chats_user_updated', 'user_id', 'updated_at'),
+        db.Index('idx_chats_session_updated', 'session_id', 'updated_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     chat_id = db.Column(db.String(100), nullable=False, unique=True)
     user_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=True)  # Permite NULL para usuários anônimos
@@ -34,6 +39,9 @@ class Chat(db.Model):
     title = db.Column(db.String(255), nullable=False, default='Nova Conversa')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Resumo das mensagens antigas (utils/chat_summarizer.py) e id da última mensagem resumida
+    resumo = db.Column(db.Text, nullable=True)
+    resumo_ate = db.Column(db.Integer, nullable=True)
 
     # Relacionamento com mensagens
     mensagens = db.relationship('Mensagem', backref='chat', lazy=True, cascade='all, delete-orphan', order_by='Mensagem.created_at')
@@ -44,6 +52,10 @@ class Chat(db.Model):
 
 class Mensagem(db.Model):
     __tablename__ = 'mensagens'
+    # Histórico e última mensagem: filtram por chat e ordenam por created_at
+    __table_args__ = (
+        db.Index('idx_mensagens_chat_created', 'chat_id', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     chat_id = db.Column(db.Integer, db.ForeignKey('chats.id'), nullable=False)
     text = db.Column(db.Text, nullable=False)
@@ -0,0 +1,110 @@
+"""
+Micro-benchmark da montagem do prompt por turno
+
+Mede o tempo de _contexto_para_prompt + _montar_prompt_inteligente (o que o
+chat faz antes de cada chamada ao LM Studio) em dois cenários:
+
+- frio: a base é invalidada antes de cada turno, então todos os blocos do
+  InfoManager são formatados de novo e o índice de busca é refeito (como era
+  antes da memorização, quando cada turno formatava os blocos);
+- quente: blocos e índice já prontos; o turno só busca e concatena.
+
+Também mostra o tamanho dos blocos memorizados e do prompt de cada pergunta,
+e quanto do início do prompt se repete de um turno para o outro numa conversa
+simulada (o prefixo que o LM Studio pode reaproveitar do cache KV).
+
+Uso (a partir da pasta chatbot/):
+    python scripts/benchmark_prompt.py [repeticoes]
+"""
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from info.info_manager import info_manager  # noqa: E402
+from info.retrieval import estimar_tokens  # noqa: E402
+from utils.chat_manager import _contexto_para_prompt, _montar_prompt_inteligente  # noqa: E402
+from utils.prefix_cache import MonitorPrefixo  # noqa: E402
+
+PERGUNTAS = [
+    'quais cursos técnicos vocês oferecem?',
+    'como faço para me inscrever no processo seletivo?',
+    'o que tem na biblioteca?',
+    'quais empresas são parceiras do senai?',
+    'tem bolsa de estudos para o curso de eletroeletrônica?',
+    'quais eventos acontecem durante o ano?',
+    'qual o telefone da secretaria?',
+    'oi, tudo bem?',
+]
+
+HISTORICO = [
+    {'sender': 'user', 'text': 'oi'},
+    {'sender': 'bot', 'text': 'Olá! Sou o Cadu, assistente virtual do SENAI São Carlos. Como posso ajudar?'},
+]
+
+
+def _turno(pergunta: str, historico=HISTORICO) -> List[Dict[str, str]]:
+    return _montar_prompt_inteligente(pergunta, historico, _contexto_para_prompt(pergunta))
+
+
+def _conversa() -> None:
+    """Faz as perguntas em sequência na mesma conversa e mede o prefixo repetido."""
+    monitor = MonitorPrefixo()
+    historico: List[Dict] = []
+    with redirect_stdout(io.StringIO()):
+        turnos = []
+        for pergunta in PERGUNTAS:
+            historico.append({'sender': 'user', 'text': pergunta})
+            turnos.append((pergunta, monitor.registrar('servidor', 1, _turno(pergunta, historico))))
+            historico.append({'sender': 'bot', 'text': f'Resposta sobre: {pergunta}'})
+    for pergunta, (reaproveitados, total) in turnos:
+        print(f"  {reaproveitados:>6}/{total:<6} tokens ({reaproveitados / total:>4.0%})  {pergunta}")
+
+
+def _medir(repeticoes: int, frio: bool) -> float:
+    """Tempo médio (µs) por turno."""
+    total = 0.0
+    # Sem os logs de cada prompt montado durante a medição
+    with redirect_stdout(io.StringIO()):
+        for _ in range(repeticoes):
+            for pergunta in PERGUNTAS:
+                if frio:
+                    info_manager.invalidar()
+                inicio = time.perf_counter()
+                _turno(pergunta)
+                total += time.perf_counter() - inicio
+    return total / (repeticoes * len(PERGUNTAS)) * 1e6
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    frio = _medir(max(1, repeticoes // 10), frio=True)
+    quente = _medir(repeticoes, frio=False)
+
+    print(f"{'cenário':<10}{'µs/turno':>12}")
+    print(f"{'frio':<10}{frio:>12.0f}")
+    print(f"{'quente':<10}{quente:>12.0f}   ({frio / quente:.0f}x mais rápido)")
+
+    print(f"\nBlocos memorizados (versão {info_manager.versao}):")
+    for nome, bloco in info_manager.estatisticas()['blocos'].items():
+        print(f"  {nome:<16}{bloco['caracteres']:>7} caracteres{bloco['tokens']:>7} tokens")
+
+    print("\nPrompt por pergunta:")
+    with redirect_stdout(io.StringIO()):
+        prompts = [(pergunta, _turno(pergunta)) for pergunta in PERGUNTAS]
+    for pergunta, mensagens in prompts:
+        caracteres = sum(len(m['content']) for m in mensagens)
+        tokens = sum(estimar_tokens(m['content']) for m in mensagens)
+        print(f"  {caracteres:>6} caracteres{tokens:>6} tokens  {pergunta}")
+
+    print("\nPrefixo reaproveitado em uma conversa (tokens iguais ao início do prompt anterior):")
+    _conversa()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,514 @@
+"""
+Micro-benchmark do roteamento de intenções
+
+Compara as funções de detecção antigas (cadeia de varreduras por palavra-chave,
+copiadas abaixo como referência) com o roteador compilado de
+utils/intent_router.py: mostra divergências de classificação e o tempo médio
+por mensagem.
+
+Uso (a partir da pasta chatbot/):
+    python scripts/benchmark_roteamento.py [repeticoes]
+"""
+import os
+import re
+import sys
+import time
+import unicodedata
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzywuzzy import fuzz  # noqa: E402
+
+from utils.intent_router import roteador  # noqa: E402
+
+MENSAGENS = [
+    'oi', 'olá, tudo bem?', 'bom dia!', 'obrigado', 'valeu pela ajuda', 'tchau', 'qual seu nome?',
+    'beleza', 'ok', 'a', 'b', 'asdfgh', 'kkkkkkk', 'xyzwq', 'zzzz',
+    'onde fica a biblioteca?', 'como chego na secretaria', 'banheiro masculino', 'area dois',
+    'área 2', 'onde fica o setor de apoio', '204', 'sala 215', 'onde esta o refeitorio',
+    'localização do laboratório 10', 'o que tem na biblioteca?', 'bibliotca', 'banhero',
+    'quem da aula na sala 215 hoje?', 'a sala 312 está ocupada agora?', 'horário da turma 2IDS SC A',
+    'onde está o professor Paulo?', 'qual o horário do prof wesley', 'fabiana tem aula hoje?',
+    'quem tem aula na sala 215 de manhã', 'qual o horário de funcionamento da secretaria?',
+    'que horas abre o senai', 'horário da biblioteca', 'qual o telefone do senai?',
+    'me fale sobre o contato da secretaria', 'qual o email?', 'quais cursos vocês oferecem?',
+    'quanto custa o curso de mecânica?', 'me fale sobre o SENAI São Carlos',
+    'quais são os cursos técnicos e onde fica a secretaria?', 'tem estacionamento?',
+    'como faço para me inscrever no processo seletivo?', 'qual a diferença entre técnico e aprendizagem?',
+    'existe bolsa de estudos para o curso de eletroeletrônica no período noturno?',
+]
+
+
+def _remover_acentos(texto: str) -> str:
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+
+
+# --- Implementação anterior (referência) ---
+
+def _e_small_talk(mensagem_lower: str) -> bool:
+    """Detecta cumprimentos, agradecimentos, confirmações e despedidas simples."""
+    mensagem_limpa = mensagem_lower.strip()
+    mensagem_sem_acentos = _remover_acentos(mensagem_limpa)
+    
+    # NÃO tratar como small talk se for apenas "a" ou "b" (pode ser resposta de desambiguação)
+    if mensagem_limpa in ['a', 'b', 'A', 'B']:
+        return False
+    
+    # NÃO tratar como small talk se menciona locais específicos (ex: "area dois", "sala 315")
+    palavras_locais = ['area', 'área', 'sala', 'banheiro', 'biblioteca', 'secretaria', 'refeitorio', 'setor de apoio', 'setor apoio', 'apoio', 'qualidade de vida']
+    if any(palavra in mensagem_limpa for palavra in palavras_locais):
+        return False
+    
+    # Verificar cumprimentos (exatos ou como início da mensagem)
+    cumprimentos = ['olá', 'ola', 'oi', 'bom dia', 'boa tarde', 'boa noite']
+    for cumprimento in cumprimentos:
+        cumprimento_sem_acentos = _remover_acentos(cumprimento)
+        # Verificar exato
+        if mensagem_limpa == cumprimento or mensagem_sem_acentos == cumprimento_sem_acentos:
+            return True
+        # Verificar como início
+        if (mensagem_limpa.startswith(cumprimento + ' ') or 
+            mensagem_sem_acentos.startswith(cumprimento_sem_acentos + ' ') or
+            mensagem_limpa.startswith(cumprimento + '!') or 
+            mensagem_sem_acentos.startswith(cumprimento_sem_acentos + '!')):
+            return True
+        # Verificar se contém (para casos como "olá, tudo bem?")
+        if cumprimento in mensagem_limpa or cumprimento_sem_acentos in mensagem_sem_acentos:
+            return True
+    
+    # Verificar outras palavras-chave
+    palavras_chave = [
+        # Agradecimentos
+        'obrigado', 'obrigada', 'valeu', 'agradeço', 'agradeco',
+        # Despedidas
+        'tchau', 'até mais', 'ate mais', 'flw', 'falou', 'até logo', 'ate logo',
+        # Nome do bot
+        'qual seu nome', 'como você se chama', 'quem é você',
+        # Confirmações simples
+        'beleza', 'blz', 'tá bom', 'ta bom', 'ok', 'show'
+    ]
+    
+    # Verificar com e sem acentos
+    for palavra in palavras_chave:
+        palavra_sem_acentos = _remover_acentos(palavra)
+        if palavra in mensagem_limpa or palavra_sem_acentos in mensagem_sem_acentos:
+            return True
+    
+    return False
+
+
+def _eh_pergunta_sobre_horarios(mensagem: str) -> bool:
+    """Detecta se a pergunta é sobre horários/aulas/professores/turmas (NÃO horário de funcionamento)"""
+    mensagem_normalizada = _remover_acentos((mensagem or '').lower())
+    mensagem_compacta = re.sub(r'\s+', ' ', mensagem_normalizada).strip()
+    mensagem_sem_espacos = mensagem_compacta.replace(' ', '')
+    
+    # IMPORTANTE: NÃO tratar como horário escolar se for pergunta sobre horário de funcionamento
+    # (secretaria, biblioteca, instituição em geral)
+    horario_funcionamento_keywords = [
+        'horario de funcionamento', 'horário de funcionamento', 'funcionamento do senai',
+        'horario do senai', 'horário do senai', 'horario da secretaria', 'horário da secretaria',
+        'horario da biblioteca', 'horário da biblioteca', 'abre', 'fecha', 'que horas abre',
+        'que horas fecha', 'quando abre', 'quando fecha'
+    ]
+    # Se menciona horário de funcionamento sem mencionar sala/professor/turma específica
+    if any(keyword in mensagem_compacta for keyword in horario_funcionamento_keywords):
+        # Verificar se NÃO menciona sala/professor/turma (se mencionar, pode ser ambos)
+        if not (re.search(r'\b(sala\s*)?(\d{2,3})\b', mensagem_compacta) or 
+                'professor' in mensagem_compacta or 
+                'turma' in mensagem_compacta or
+                'aula' in mensagem_compacta):
+            return False  # É horário de funcionamento, NÃO horário escolar
+    
+    # Verificar se menciona número de sala (3 dígitos) - com ou sem espaço
+    # IMPORTANTE: Se a mensagem é APENAS um número (sem outras palavras), tratar como localização, não horário
+    if mensagem_compacta.isdigit():
+        # Número sozinho = pergunta de localização, não horário
+        return False
+    
+    if re.search(r'\b(sala\s*)?(\d{3})\b', mensagem_compacta) or re.search(r'sala\d{3}', mensagem_sem_espacos) or re.search(r'\b\d{2,3}\b', mensagem_compacta):
+        # Se menciona número de sala (mesmo sem palavra "aula", pode ser pergunta sobre horário)
+        # Verificar se não é pergunta de localização
+        if not any(palavra in mensagem_compacta for palavra in ['onde fica', 'como chegar', 'localização', 'localizacao']):
+            # Verificar se há contexto de horário/aula/professor (se não houver, pode ser localização)
+            tem_contexto_horario = any(palavra in mensagem_compacta for palavra in [
+                'horario', 'horário', 'aula', 'professor', 'turma', 'quem', 'tem aula',
+                'vai ter', 'ocupada', 'livre', 'disponivel', 'em uso', 'hoje', 'agora'
+            ])
+            # Se menciona número de sala E tem contexto de horário, é sobre horário
+            if tem_contexto_horario:
+                return True
+            # Se menciona número mas NÃO tem contexto de horário, pode ser localização (não tratar como horário)
+            return False
+    
+    # Verificar se menciona professores conhecidos (antes de verificar padrões gerais)
+    from info.horarios import carregar_horarios_professores
+    professores_disponiveis = list(carregar_horarios_professores().keys())
+    for prof_nome in professores_disponiveis:
+        prof_lower = _remover_acentos(prof_nome.lower())
+        if prof_lower in mensagem_compacta:
+            # Se menciona professor E tem palavras relacionadas a horário/localização de aula
+            if any(palavra in mensagem_compacta for palavra in [
+                'onde', 'esta', 'está', 'horario', 'horário', 'aula', 'dando', 'tem'
+            ]):
+                return True
+    
+    # Verificar fuzzy matching para professores (erros de digitação)
+    try:
+        from fuzzywuzzy import fuzz
+        for prof_nome in professores_disponiveis:
+            prof_lower = _remover_acentos(prof_nome.lower())
+            # Verificar se há similaridade suficiente
+            if fuzz.ratio(mensagem_compacta, prof_lower) >= 60 or fuzz.partial_ratio(mensagem_compacta, prof_lower) >= 70:
+                # Se menciona professor (com similaridade) E tem palavras relacionadas
+                if any(palavra in mensagem_compacta for palavra in [
+                    'onde', 'esta', 'está', 'horario', 'horário', 'aula', 'dando', 'tem', 'professor', 'prof'
+                ]):
+                    return True
+    except ImportError:
+        pass
+    
+    # Verificar se menciona turmas conhecidas
+    from info.horarios import carregar_horarios_turmas
+    turmas_disponiveis = list(carregar_horarios_turmas().keys())
+    for turma_nome in turmas_disponiveis:
+        # Normalizar nome da turma para busca
+        turma_normalizada = _remover_acentos(turma_nome.lower().replace('_', ' ').replace('-', ' '))
+        turma_sem_espacos = turma_normalizada.replace(' ', '')
+        mensagem_sem_espacos_turma = mensagem_compacta.replace(' ', '').replace('-', '').replace('_', '')
+        
+        # Verificar se menciona turma (com ou sem espaços/hífens)
+        if (turma_normalizada in mensagem_compacta or 
+            turma_sem_espacos in mensagem_sem_espacos_turma or
+            _remover_acentos(turma_nome.lower()) in mensagem_sem_espacos_turma):
+            # Se menciona turma, é pergunta sobre horário
+            return True
+    
+    # Verificar se menciona período do dia (manhã, tarde, noite) combinado com sala/aula
+    periodos_dia = ['manha', 'manhã', 'tarde', 'noite', 'manha', 'manhã']
+    tem_periodo = any(periodo in mensagem_compacta for periodo in periodos_dia)
+    # Se menciona sala + período OU quem dá aula + período, é sobre horário escolar
+    if (re.search(r'\b(sala\s*)?(\d{2,3})\b', mensagem_compacta) or 'sala' in mensagem_compacta) and tem_periodo:
+        return True
+    if ('quem' in mensagem_compacta and 'aula' in mensagem_compacta) and tem_periodo:
+        return True
+    
+    perguntas_horario = [
+        # Padrões diretos de horário
+        'qual professor', 'qual turma', 'onde está o professor', 'onde esta o professor', 
+        'professor está', 'professor esta', 'turma está', 'turma esta', 'que dia', 
+        'que período', 'que periodo', 'horário', 'horario', 'horarios', 'horários',
+        # Padrões sobre quem dá aula
+        'quem vai dar aula', 'quem vai dar', 'quem dá aula', 'quem da aula',
+        'quem está dando aula', 'quem esta dando aula', 'quem vai estar',
+        'quem está na sala', 'quem esta na sala', 'quem tem aula',
+        'quem vai estar na sala', 'quem esta na sala', 'quem da aula na',
+        'quem dá aula na', 'quem da aula em', 'quem dá aula em',
+        # Padrões sobre aulas
+        'tem aula', 'vai ter aula', 'tem professor', 'tem turma',
+        'está ocupada', 'esta ocupada', 'está livre', 'esta livre',
+        'está em uso', 'esta em uso', 'está sendo usada', 'esta sendo usada',
+        'quem usa', 'quem está usando', 'quem esta usando',
+        # Padrões sobre hoje/agora
+        'hoje', 'agora', 'neste momento', 'neste horário', 'neste horario',
+        'nesta hora', 'agora mesmo',
+        # Padrões sobre ocupação
+        'ocupada', 'livre', 'disponível', 'disponivel', 'em uso',
+        'sendo usada', 'sendo utilizada'
+    ]
+    
+    return any(pergunta in mensagem_compacta for pergunta in perguntas_horario)
+
+
+def _deve_usar_lm_studio(mensagem: str, historico_chat: List[Dict]) -> bool:
+    """
+    Usa o LM Studio para TODAS as perguntas EXCETO:
+    - Perguntas de localização (onde fica, como chegar, etc.)
+    - Small talk (cumprimentos, despedidas, agradecimentos)
+    - Perguntas sobre horários ESCOLARES (aulas, professores, turmas) - para não pesar no LM Studio
+    - Perguntas sobre horário de funcionamento da secretaria/biblioteca (fallback responde)
+    """
+    mensagem_lower = mensagem.lower()
+    mensagem_normalizada = _remover_acentos(mensagem_lower)
+    
+    # NÃO usar LM Studio para perguntas de localização
+    if _eh_pergunta_localizacao(mensagem):
+        return False
+    
+    # NÃO usar LM Studio para small talk (cumprimentos, despedidas, agradecimentos)
+    if _e_small_talk(mensagem_lower):
+        return False
+    
+    # NÃO usar LM Studio para perguntas sobre horários ESCOLARES (aulas, professores, turmas)
+    if _eh_pergunta_sobre_horarios(mensagem):
+        return False
+    
+    # NÃO usar LM Studio para perguntas sobre horário de funcionamento da secretaria/biblioteca
+    # (fallback já tem essa informação)
+    horario_funcionamento_keywords = [
+        'horario de funcionamento', 'horário de funcionamento', 'funcionamento do senai',
+        'horario do senai', 'horário do senai', 'horario da secretaria', 'horário da secretaria',
+        'horario da biblioteca', 'horário da biblioteca', 'abre', 'fecha', 'que horas abre',
+        'que horas fecha', 'quando abre', 'quando fecha'
+    ]
+    
+    # NÃO usar LM Studio para perguntas simples sobre contato/telefone/número
+    # (fallback já tem essas informações)
+    contato_keywords = [
+        'telefone', 'fone', 'contato', 'ligar', 'numero da secretaria', 'número da secretaria',
+        'qual o numero', 'qual o número', 'numero do senai', 'número do senai'
+    ]
+    if any(keyword in mensagem_normalizada for keyword in contato_keywords):
+        # Verificar se é uma pergunta simples (não complexa)
+        palavras_complexas = ['me fale', 'quais são', 'quais sao', 'conte sobre', 'fale sobre', 
+                              'explique', 'detalhe', 'informe sobre', 'me informe']
+        e_pergunta_simples = not any(palavra in mensagem_normalizada for palavra in palavras_complexas)
+        if e_pergunta_simples:
+            return False
+    if any(keyword in mensagem_normalizada for keyword in horario_funcionamento_keywords):
+        # Verificar se NÃO menciona sala/professor/turma específica
+        if not (re.search(r'\b(sala\s*)?(\d{2,3})\b', mensagem_normalizada) or 
+                'professor' in mensagem_normalizada or 
+                'turma' in mensagem_normalizada or
+                'aula' in mensagem_normalizada):
+            return False  # É horário de funcionamento, usar fallback
+    
+    # Todo o resto vai para LM Studio (incluindo perguntas gerais sobre cursos, diferenciais, etc.)
+    return True
+
+
+def _eh_pergunta_localizacao(mensagem: str) -> bool:
+    """Detecta perguntas explicitamente sobre localização/direções."""
+    mensagem_normalizada = _remover_acentos((mensagem or '').lower())
+    mensagem_compacta = re.sub(r'\s+', ' ', mensagem_normalizada).strip()
+    tokens = mensagem_compacta.split()
+
+    if not mensagem_compacta:
+        return False
+
+    # Somente números (ex: "214") devem ser tratados como pedido de localização
+    if mensagem_compacta.isdigit():
+        return True
+
+    # NÃO tratar como localização se for pergunta sobre horários/aulas/professores
+    perguntas_horario = [
+        # Padrões diretos de horário
+        'qual professor', 'qual turma', 'onde está o professor', 'onde esta o professor', 
+        'professor está', 'professor esta', 'turma está', 'turma esta', 'que dia', 
+        'que período', 'que periodo', 'horário', 'horario', 'horarios', 'horários',
+        # Padrões sobre quem dá aula
+        'quem vai dar aula', 'quem vai dar', 'quem dá aula', 'quem da aula',
+        'quem está dando aula', 'quem esta dando aula', 'quem vai estar',
+        'quem está na sala', 'quem esta na sala', 'quem tem aula',
+        'quem vai estar na sala', 'quem esta na sala',
+        # Padrões sobre aulas
+        'tem aula', 'vai ter aula', 'tem professor', 'tem turma',
+        'está ocupada', 'esta ocupada', 'está livre', 'esta livre',
+        'está em uso', 'esta em uso', 'está sendo usada', 'esta sendo usada',
+        'quem usa', 'quem está usando', 'quem esta usando',
+        # Padrões sobre hoje/agora
+        'hoje', 'agora', 'neste momento', 'neste horário', 'neste horario',
+        'nesta hora', 'agora mesmo',
+        # Padrões sobre ocupação
+        'ocupada', 'livre', 'disponível', 'disponivel', 'em uso',
+        'sendo usada', 'sendo utilizada'
+    ]
+    if any(pergunta in mensagem_compacta for pergunta in perguntas_horario):
+        return False
+
+    # Perguntas que claramente falam de conteúdo devem ser tratadas pelo LM Studio
+    gatilhos_conteudo = ['o que tem', 'que tem', 'que existe', 'o que ha', 'que coisas tem']
+    if any(gatilho in mensagem_compacta for gatilho in gatilhos_conteudo):
+        return False
+
+    frases_localizacao = [
+        'onde fica', 'onde esta', 'onde está', 'fica onde', 'como chegar', 'como chego',
+        'onde encontro', 'como encontro', 'sabe chegar', 'sabe encontrar', 'pode indicar o caminho'
+    ]
+
+    termos_localizacao = ['localizacao', 'localiza', 'localidade']
+
+    # Verificação especial para "setor de apoio" e outras localizações específicas
+    locais_especificos = ['setor de apoio', 'setor apoio', 'apoio', 'qualidade de vida', 
+                          'sala 204', '204', 'biblioteca', 'secretaria', 'refeitorio', 
+                          'banheiro', 'coordenacao', 'coordenação']
+    
+    # Se a mensagem contém uma frase de localização E um local específico, é definitivamente localização
+    for frase in frases_localizacao:
+        if frase in mensagem_compacta:
+            # Verificar se menciona algum local específico
+            tem_local_especifico = any(local in mensagem_compacta for local in locais_especificos)
+            if tem_local_especifico:
+                return True
+            
+            # Verificar se é pergunta composta (tem tanto localização quanto conteúdo)
+            tem_contexto_extra = any(token in ['curso', 'cursos', 'valor', 'valores', 'quanto', 'horario', 'capacidade'] for token in tokens)
+            # Verificar se há perguntas sobre conteúdo (ex: "quais são os cursos")
+            tem_pergunta_conteudo = any(palavra in mensagem_compacta for palavra in ['quais são', 'quais sao', 'me fale sobre', 'conte sobre', 'fale sobre'])
+            # Se for pergunta composta com conteúdo, deixar para LM Studio
+            if tem_pergunta_conteudo or (tem_contexto_extra and len(tokens) > 5):
+                return False
+            return True
+
+    # Detectar sinônimos aproximados (erros de digitação leves)
+    palavras_chave_locais = [
+        'banheiro', 'sanitario', 'sala', 'biblioteca', 'secretaria',
+        'refeitorio', 'laboratorio', 'hidrante', 'extintor', 'coordenacao', 'auditorio',
+        'area', 'área', 'area dois', 'área dois', 'area 2', 'área 2',
+        'setor de apoio', 'setor apoio', 'apoio', 'qualidade de vida', 'analise de qualidade de vida',
+        'análise de qualidade de vida', 'sala 204', '204'
+    ]
+
+    numero_presente = bool(re.search(r'\b\d{2,3}\b', mensagem_compacta))
+
+    def possui_palavra_chave(chave: str) -> bool:
+        if chave in mensagem_compacta:
+            return True
+        for token in tokens:
+            if fuzz.ratio(token, chave) >= 85:
+                return True
+        return False
+
+    # Verificar se tem palavra-chave local
+    tem_palavra_local = any(possui_palavra_chave(chave) for chave in palavras_chave_locais)
+    
+    # Verificar se menciona "area dois" especificamente (caso especial)
+    area_dois_keywords = ['area dois', 'área dois', 'area 2', 'área 2', 'area ii', 'área ii']
+    tem_area_dois = any(keyword in mensagem_compacta for keyword in area_dois_keywords)
+    
+    # Se tem palavra-chave local E não é pergunta sobre conteúdo/horário, tratar como localização
+    if tem_palavra_local or tem_area_dois:
+        # Verificar se NÃO é pergunta sobre conteúdo (ex: "o que tem no banheiro")
+        nao_e_conteudo = not any(palavra in mensagem_compacta for palavra in [
+            'o que tem', 'que tem', 'que existe', 'o que ha', 'que coisas tem',
+            'conteudo', 'conteúdo', 'tem o que', 'tem que'
+        ])
+        # Verificar se NÃO é pergunta sobre horário
+        nao_e_horario = not any(palavra in mensagem_compacta for palavra in [
+            'horario', 'horário', 'que horas', 'quando', 'periodo', 'período'
+        ])
+        # Se tem número OU é uma pergunta simples sobre local (ex: "banheiro masculino", "area dois")
+        # OU menciona especificamente "area dois"
+        if tem_area_dois or (numero_presente or len(tokens) <= 3) and nao_e_conteudo and nao_e_horario:
+            return True
+
+    if any(termo in mensagem_compacta for termo in termos_localizacao) and tem_palavra_local:
+        return True
+
+    if numero_presente and tem_palavra_local:
+        return True
+
+    return False
+
+
+def _eh_mensagem_sem_sentido(mensagem: str) -> bool:
+    """
+    Detecta se a mensagem não faz sentido (gibberish, caracteres aleatórios, etc.)
+    Retorna True se a mensagem parece ser sem sentido
+    """
+    if not mensagem or len(mensagem.strip()) < 2:
+        return False
+    
+    mensagem_limpa = mensagem.strip().lower()
+    
+    # Remover espaços e pontuação para análise
+    mensagem_sem_espacos = re.sub(r'[^\w]', '', mensagem_limpa)
+    
+    if len(mensagem_sem_espacos) < 2:
+        return False
+    
+    # Verificar se contém apenas caracteres repetidos (ex: "aaaa", "1111")
+    if len(set(mensagem_sem_espacos)) <= 2 and len(mensagem_sem_espacos) > 3:
+        return True
+    
+    # Verificar padrões de caracteres aleatórios sem vogais suficientes
+    vogais = sum(1 for c in mensagem_sem_espacos if c in 'aeiouáéíóúâêîôûàèìòùãõ')
+    total_caracteres = len(mensagem_sem_espacos)
+    
+    # Se tem menos de 20% de vogais e mais de 4 caracteres, provavelmente é sem sentido
+    if total_caracteres > 4 and vogais / total_caracteres < 0.2:
+        return True
+    
+    # Verificar se não contém palavras comuns do português ou relacionadas ao SENAI
+    palavras_comuns = [
+        'senai', 'curso', 'aula', 'professor', 'sala', 'biblioteca', 'secretaria',
+        'o', 'a', 'de', 'que', 'e', 'do', 'da', 'em', 'um', 'para', 'com', 'na',
+        'qual', 'onde', 'como', 'quando', 'quem', 'porque', 'sobre', 'sobre',
+        'informacao', 'informação', 'preciso', 'quero', 'gostaria', 'pode',
+        'me', 'você', 'voce', 'eu', 'ele', 'ela', 'nos', 'eles', 'elas'
+    ]
+    
+    # Verificar se contém alguma palavra comum
+    tem_palavra_comum = any(palavra in mensagem_limpa for palavra in palavras_comuns)
+    
+    # Se não tem palavras comuns e tem mais de 3 caracteres, pode ser sem sentido
+    if not tem_palavra_comum and len(mensagem_sem_espacos) > 3:
+        # Verificar se tem muitas consoantes consecutivas (padrão de gibberish)
+        consoantes_consecutivas = re.findall(r'[bcdfghjklmnpqrstvwxyz]{4,}', mensagem_sem_espacos)
+        if consoantes_consecutivas:
+            return True
+    
+    # Verificar padrões de teclado (ex: "asdf", "qwerty", "zxcv")
+    padroes_teclado = ['asdf', 'qwerty', 'zxcv', 'hjkl', 'fghj', 'dfgh']
+    if any(padrao in mensagem_sem_espacos for padrao in padroes_teclado):
+        return True
+    
+    return False
+
+
+def _legado(mensagem: str) -> Dict[str, bool]:
+    mensagem_lower = mensagem.lower()
+    return {
+        'sem_sentido': _eh_mensagem_sem_sentido(mensagem),
+        'small_talk': _e_small_talk(mensagem_lower),
+        'horario_escolar': _eh_pergunta_sobre_horarios(mensagem),
+        'localizacao': _eh_pergunta_localizacao(mensagem),
+        'usar_lm': _deve_usar_lm_studio(mensagem, []),
+    }
+
+
+def _compilado(mensagem: str) -> Dict[str, bool]:
+    # Sem memorização: mede o custo real de classificar uma mensagem nova
+    r = roteador._classificar(mensagem)
+    return {
+        'sem_sentido': r.sem_sentido,
+        'small_talk': r.small_talk,
+        'horario_escolar': r.horario_escolar,
+        'localizacao': r.localizacao,
+        'usar_lm': r.usar_lm,
+    }
+
+
+def _medir(fn, mensagens: List[str], repeticoes: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for mensagem in mensagens:
+            fn(mensagem)
+    return (time.perf_counter() - inicio) / (repeticoes * len(mensagens))
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    roteador.classificar('')  # compila o automato (inclui nomes de professores)
+
+    divergencias = 0
+    for mensagem in MENSAGENS:
+        antes, depois = _legado(mensagem), _compilado(mensagem)
+        diferencas = [k for k in antes if antes[k] != depois[k]]
+        if diferencas:
+            divergencias += 1
+            detalhes = ', '.join(f"{k}: {antes[k]} -> {depois[k]}" for k in diferencas)
+            print(f"DIVERGÊNCIA {mensagem!r}: {detalhes}")
+    print(f"{len(MENSAGENS)} mensagens, {divergencias} com classificação diferente")
+
+    t_legado = _medir(_legado, MENSAGENS, repeticoes)
+    t_compilado = _medir(_compilado, MENSAGENS, repeticoes)
+    t_memo = _medir(roteador.classificar, MENSAGENS, repeticoes)
+    print(f"Anterior:            {t_legado * 1e6:9.1f} µs/mensagem")
+    print(f"Compilado:           {t_compilado * 1e6:9.1f} µs/mensagem ({t_legado / t_compilado:.1f}x)")
+    print(f"Compilado (memo):    {t_memo * 1e6:9.1f} µs/mensagem")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark do pool de servidores de inferência com stubs locais
+
+Sobe 1, 2, ... N stubs (scripts/stub_lm_studio.py), cada um atendendo uma
+requisição por vez com latência fixa, e mede quantas respostas por segundo o
+LMStudioClient consegue com cada quantidade de servidores. No fim derruba um
+dos servidores no meio da carga para conferir o failover.
+
+Uso (a partir da pasta chatbot/):
+    python scripts/benchmark_servidores.py [servidores] [requisicoes] [--latencia 0.2]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.stub_lm_studio import iniciar_stubs  # noqa: E402
+from utils.lm_client import LMStudioClient  # noqa: E402
+
+PORTA_INICIAL = 18234
+
+
+def _carga(cliente: LMStudioClient, requisicoes: int, threads: int):
+    """Dispara as requisições em paralelo; retorna (respostas/s, falhas)."""
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        resultados = list(executor.map(lambda i: cliente.completar(f'pergunta {i}', orcamento=30), range(requisicoes)))
+    duracao = time.perf_counter() - inicio
+    return requisicoes / duracao, sum(1 for r in resultados if not r)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vazão do pool de servidores de inferência')
+    parser.add_argument('servidores', type=int, nargs='?', default=4)
+    parser.add_argument('requisicoes', type=int, nargs='?', default=40)
+    parser.add_argument('--latencia', type=float, default=0.2)
+    args = parser.parse_args()
+
+    portas = [PORTA_INICIAL + i for i in range(args.servidores)]
+    stubs = iniciar_stubs(portas, latencia=args.latencia, paralelo=1)
+    urls = [f'http://127.0.0.1:{porta}' for porta in portas]
+
+    print(f"{'servidores':<12}{'resp/s':>10}{'falhas':>8}")
+    base = None
+    for n in range(1, args.servidores + 1):
+        cliente = LMStudioClient(urls=urls[:n], vagas_por_servidor=1, max_tentativas=1, delay_tentativa=0)
+        vazao, falhas = _carga(cliente, args.requisicoes, threads=n * 2)
+        base = base or vazao
+        print(f"{n:<12}{vazao:>10.1f}{falhas:>8}   ({vazao / base:.1f}x)")
+
+    if args.servidores > 1:
+        cliente = LMStudioClient(urls=urls, vagas_por_servidor=1, max_tentativas=1, delay_tentativa=0)
+        threading.Timer(args.latencia * 2, stubs[0].shutdown).start()
+        threading.Timer(args.latencia * 2, stubs[0].server_close).start()
+        vazao, falhas = _carga(cliente, args.requisicoes, threads=args.servidores * 2)
+        print(f"\nFailover (servidor {stubs[0].server_address[1]} derrubado no meio): "
+              f"{vazao:.1f} resp/s, {falhas} falhas")
+        for servidor in cliente.estatisticas()['servidores']:
+            print(f"  {servidor['servidor']}: {servidor['atendidas']} atendidas, {servidor['falhas']} falhas, "
+                  f"disjuntor {servidor['disjuntor']['estado']}")
+
+    for stub in stubs[1:]:
+        stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Servidor falso (stub) compatível com a API do LM Studio
+
+Responde a /v1/models, /v1/chat/completions e /v1/completions (com e sem
+stream) depois de uma latência fixa, atendendo no máximo N requisições ao
+mesmo tempo, como um servidor de inferência em CPU. Serve para testar o pool
+de servidores de utils/lm_client.py sem subir modelos de verdade.
+
+Uso (a partir da pasta chatbot/):
+    python scripts/stub_lm_studio.py [--portas 1234 1235 ...] [--latencia 0.5]
+                                     [--paralelo 1] [--falhas 0.0]
+
+Depois aponte o chatbot para eles:
+    LM_STUDIO_URLS=http://localhost:1234,http://localhost:1235
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+RESPOSTA_PADRAO = 'Resposta do servidor de teste.'
+
+
+class StubLMStudio(ThreadingHTTPServer):
+    """Servidor HTTP com latência e capacidade (requisições simultâneas) configuráveis."""
+
+    daemon_threads = True
+
+    def __init__(self, porta: int, latencia: float = 0.5, paralelo: int = 1, taxa_falha: float = 0.0):
+        super().__init__(('127.0.0.1', porta), _Handler)
+        self.latencia = latencia
+        self.taxa_falha = taxa_falha
+        self.capacidade = threading.Semaphore(max(1, paralelo))
+        self.atendidas = 0
+        self._lock = threading.Lock()
+
+    def contar(self) -> None:
+        with self._lock:
+            self.atendidas += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _json(self, status: int, dados) -> None:
+        corpo = json.dumps(dados).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        if self.path == '/v1/models':
+            self._json(200, {'data': [{'id': 'stub'}]})
+        else:
+            self._json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(tamanho) or b'{}')
+        except ValueError:
+            payload = {}
+        if self.path not in ('/v1/chat/completions', '/v1/completions'):
+            self._json(404, {'error': 'not found'})
+            return
+
+        servidor: StubLMStudio = self.server
+        with servidor.capacidade:
+            time.sleep(servidor.latencia)
+        if random.random() < servidor.taxa_falha:
+            self._json(500, {'error': 'falha simulada'})
+            return
+        servidor.contar()
+
+        chat = self.path == '/v1/chat/completions'
+        if not payload.get('stream'):
+            escolha = {'message': {'role': 'assistant', 'content': RESPOSTA_PADRAO}} if chat else {'text': RESPOSTA_PADRAO}
+            self._json(200, {'choices': [escolha]})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for palavra in RESPOSTA_PADRAO.split(' '):
+            pedaco = palavra + ' '
+            escolha = {'delta': {'content': pedaco}} if chat else {'text': pedaco}
+            self.wfile.write(f"data: {json.dumps({'choices': [escolha]})}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def iniciar_stubs(portas: List[int], latencia: float = 0.5, paralelo: int = 1,
+                  taxa_falha: float = 0.0) -> List[StubLMStudio]:
+    """Sobe um stub por porta, cada um em uma thread daemon."""
+    servidores = []
+    for porta in portas:
+        servidor = StubLMStudio(porta, latencia, paralelo, taxa_falha)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        servidores.append(servidor)
+    return servidores
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub da API do LM Studio para testes')
+    parser.add_argument('--portas', type=int, nargs='+', default=[1234])
+    parser.add_argument('--latencia', type=float, default=0.5, help='segundos por resposta')
+    parser.add_argument('--paralelo', type=int, default=1, help='requisições atendidas ao mesmo tempo por servidor')
+    parser.add_argument('--falhas', type=float, default=0.0, help='fração de respostas com erro 500')
+    args = parser.parse_args()
+
+    servidores = iniciar_stubs(args.portas, args.latencia, args.paralelo, args.falhas)
+    urls = ','.join(f'http://localhost:{porta}' for porta in args.portas)
+    print(f"Stubs no ar. Use LM_STUDIO_URLS={urls}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for servidor in servidores:
+            servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
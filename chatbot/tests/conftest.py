@@ -0,0 +1,42 @@
+"""
+Configuração dos testes (a partir da pasta chatbot/: python -m pytest)
+
+Os testes usam cache em memória e SQLite em memória no lugar do MySQL; as
+variáveis precisam estar definidas antes do primeiro import de config.
+"""
+import os
+import sys
+
+os.environ.setdefault('CACHE_BACKEND', 'memory')
+os.environ.setdefault('CHAT_SUMMARY_ENABLED', 'False')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _agendador_sem_limite_por_cliente(monkeypatch):
+    """Todos os testes chamam como o mesmo cliente: sem o balde de fichas, um não esgota o outro."""
+    from utils.inference_scheduler import inference_scheduler
+    monkeypatch.setattr(inference_scheduler, 'rajada', 0)
+
+
+@pytest.fixture(scope='session')
+def modulo_app(tmp_path_factory):
+    """O app.py completo, com um SQLite temporário no lugar do MySQL."""
+    import config
+    config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path_factory.mktemp('banco') / 'chat.db'}"
+    import app as modulo
+    modulo.app.config['TESTING'] = True
+    return modulo
+
+
+@pytest.fixture
+def cliente(modulo_app):
+    """Cliente de teste com uma sessão anônima nova (chats não se misturam entre testes)."""
+    import uuid
+    cliente = modulo_app.app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao['session_id'] = uuid.uuid4().hex
+    return cliente
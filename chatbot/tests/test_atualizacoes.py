@@ -0,0 +1,56 @@
+"""Estado de atualizações por canal (/api/check-updates, /api/events) com limite de memória."""
+import uuid
+from datetime import datetime, timedelta
+
+from models.sqlalchemy_models import db, Chat
+
+
+def test_estado_de_atualizacoes_limitado(modulo_app, monkeypatch):
+    monkeypatch.setattr(modulo_app, '_ESTADO_ATUALIZACOES_MAX_CANAIS', 3)
+    modulo_app._estado_atualizacoes_cache.clear()
+    sessoes = [uuid.uuid4().hex for _ in range(5)]
+    with modulo_app.app.app_context():
+        for sessao in sessoes:
+            modulo_app._estado_atualizacoes(None, sessao)
+
+    assert len(modulo_app._estado_atualizacoes_cache) == 3
+    assert list(modulo_app._estado_atualizacoes_cache) == [modulo_app.canal_dono(None, s) for s in sessoes[2:]]
+
+
+def test_estado_de_atualizacoes_vencido_sai_do_cache(modulo_app, monkeypatch):
+    modulo_app._estado_atualizacoes_cache.clear()
+    with modulo_app.app.app_context():
+        modulo_app._estado_atualizacoes(None, uuid.uuid4().hex)
+        monkeypatch.setattr(modulo_app, '_ESTADO_ATUALIZACOES_MAX_IDADE', 0)
+        modulo_app._estado_atualizacoes(None, uuid.uuid4().hex)
+
+    # Com idade máxima 0 nada fica guardado, nem o canal lido antes
+    assert len(modulo_app._estado_atualizacoes_cache) == 0
+
+
+def test_stream_avisa_mudanca_feita_por_outro_worker(cliente, modulo_app, monkeypatch):
+    monkeypatch.setattr(modulo_app, 'EVENTS_SYNC_INTERVAL', 1.0)
+    monkeypatch.setattr(modulo_app, 'EVENTS_STREAM_TTL', 5.0)
+    chat_id = uuid.uuid4().hex
+    cliente.post('/chat/save', json={'chat_id': chat_id, 'title': 'Teste', 'messages': [{'text': 'oi', 'sender': 'user'}]})
+
+    resposta = cliente.get('/api/events', buffered=False)
+    partes = iter(resposta.response)
+    recebido = ''
+    while 'event: hello' not in recebido:
+        recebido += _texto(next(partes))
+
+    # Escrita por outro processo: muda o banco sem passar pelo barramento deste
+    with modulo_app.app.app_context():
+        chat = Chat.query.filter_by(chat_id=chat_id).first()
+        chat.updated_at = datetime.utcnow() + timedelta(minutes=1)
+        db.session.commit()
+
+    while 'event: chats' not in recebido:
+        recebido += _texto(next(partes))
+    resposta.close()
+    assert '"sincronizado"' in recebido
+
+
+def _texto(parte):
+    return parte.decode() if isinstance(parte, bytes) else parte
@@ -0,0 +1,89 @@
+"""Resumo das conversas: lotes das mensagens mais antigas e controle de resumo_ate."""
+import uuid
+
+import pytest
+
+from models.sqlalchemy_models import db, Chat, Mensagem
+from utils.chat_summarizer import ResumidorChats
+from utils.inference_scheduler import inference_scheduler
+
+
+@pytest.fixture
+def conversa(modulo_app):
+    """Chat com 7 mensagens (m0..m6); devolve (id interno, ids das mensagens)."""
+    chat_id, sessao = uuid.uuid4().hex, uuid.uuid4().hex
+    mensagens = [{'text': f'm{i}', 'sender': 'user' if i % 2 == 0 else 'ai'} for i in range(7)]
+    with modulo_app.app.app_context():
+        modulo_app.session_manager.save_chat(chat_id, 'Teste', mensagens, session_id=sessao)
+        chat_pk = Chat.query.filter_by(chat_id=chat_id).first().id
+        ids = [m.id for m in Mensagem.query.filter_by(chat_id=chat_pk).order_by(Mensagem.id).all()]
+    return chat_pk, ids
+
+
+def _resumidor(modulo_app, monkeypatch, respostas=None):
+    """Resumidor com lotes de 2 mensagens e 2 mantidas; o modelo é trocado por uma lista de pedidos."""
+    resumidor = ResumidorChats(ativo=True, a_cada=1, manter=2)
+    resumidor.init_app(modulo_app.app)
+    pedidos = []
+
+    def gerar(resumo_anterior, conversa):
+        pedidos.append((resumo_anterior, [texto for _, texto in conversa]))
+        if respostas is not None:
+            return respostas.pop(0) if respostas else None
+        return f"resumo {len(pedidos)}"
+
+    monkeypatch.setattr(resumidor, '_gerar', gerar)
+    return resumidor, pedidos
+
+
+def _estado(modulo_app, chat_pk):
+    with modulo_app.app.app_context():
+        chat = db.session.get(Chat, chat_pk)
+        return chat.resumo, chat.resumo_ate
+
+
+def test_resume_do_mais_antigo_ate_caber_na_janela(modulo_app, monkeypatch, conversa):
+    chat_pk, ids = conversa
+    resumidor, pedidos = _resumidor(modulo_app, monkeypatch)
+
+    resumidor._executar(chat_pk)
+
+    assert pedidos == [(None, ['m0', 'm1']), ('resumo 1', ['m2', 'm3'])]
+    assert _estado(modulo_app, chat_pk) == ('resumo 2', ids[3])
+    assert resumidor.estatisticas()['resumidos'] == 2
+
+
+def test_resumo_adiado_continua_de_onde_parou(modulo_app, monkeypatch, conversa):
+    chat_pk, ids = conversa
+    resumidor, pedidos = _resumidor(modulo_app, monkeypatch)
+
+    monkeypatch.setattr(inference_scheduler, 'ocioso', lambda: False)
+    resumidor._executar(chat_pk)
+    assert pedidos == [] and resumidor.estatisticas()['adiados'] == 1
+    assert _estado(modulo_app, chat_pk) == (None, None)
+
+    monkeypatch.setattr(inference_scheduler, 'ocioso', lambda: True)
+    resumidor._executar(chat_pk)
+    assert [textos for _, textos in pedidos] == [['m0', 'm1'], ['m2', 'm3']]
+
+
+def test_falha_do_modelo_nao_avanca_resumo_ate(modulo_app, monkeypatch, conversa):
+    chat_pk, ids = conversa
+    resumidor, pedidos = _resumidor(modulo_app, monkeypatch, respostas=['resumo 1'])
+
+    resumidor._executar(chat_pk)
+    # O primeiro lote foi resumido; o segundo falhou e fica para a próxima vez
+    assert [textos for _, textos in pedidos] == [['m0', 'm1'], ['m2', 'm3']]
+    assert _estado(modulo_app, chat_pk) == ('resumo 1', ids[1])
+    assert resumidor.estatisticas()['falhas'] == 1
+
+
+def test_poucas_mensagens_nao_resumem(modulo_app, monkeypatch, conversa):
+    chat_pk, _ = conversa
+    resumidor, pedidos = _resumidor(modulo_app, monkeypatch)
+    resumidor.manter = 6
+
+    resumidor._executar(chat_pk)
+
+    assert pedidos == []
+    assert _estado(modulo_app, chat_pk) == (None, None)
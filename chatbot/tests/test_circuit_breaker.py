@@ -0,0 +1,114 @@
+"""Disjuntor: abre com a taxa de erro e volta a sondar se a chamada de teste falhar."""
+import time
+
+import pytest
+
+import utils.circuit_breaker as circuit_breaker
+from utils.circuit_breaker import CircuitBreaker, ABERTO, FECHADO, MEIO_ABERTO
+from utils.lm_client import LMStudioClient
+
+
+def _esperar_estado(disjuntor: CircuitBreaker, estado: str, limite: float = 3.0) -> None:
+    prazo = time.monotonic() + limite
+    while disjuntor.estado != estado:
+        assert time.monotonic() < prazo, f"disjuntor ficou '{disjuntor.estado}', esperado '{estado}'"
+        time.sleep(0.01)
+
+
+def _abrir(disjuntor: CircuitBreaker) -> None:
+    for _ in range(disjuntor.min_chamadas):
+        disjuntor.registrar(False)
+    assert disjuntor.estado == ABERTO
+
+
+def _disjuntor() -> CircuitBreaker:
+    return CircuitBreaker('teste', sonda=lambda: True, janela=30, min_chamadas=2,
+                          taxa_erro=0.5, chamada_lenta=0, intervalo_sonda=0.5)
+
+
+def test_abre_e_fecha_com_a_chamada_de_teste():
+    disjuntor = _disjuntor()
+    _abrir(disjuntor)
+    assert not disjuntor.permitir()
+
+    _esperar_estado(disjuntor, MEIO_ABERTO)
+    assert disjuntor.permitir()
+    assert not disjuntor.permitir()  # uma chamada de teste por vez
+    disjuntor.registrar(True)
+    assert disjuntor.estado == FECHADO
+
+
+def test_sonda_termina_junto_com_a_passagem_a_meio_aberto(monkeypatch):
+    disjuntor = _disjuntor()
+    ativa_ao_passar = []
+
+    def registrar_print(texto):
+        if 'meio-aberto' in texto:
+            ativa_ao_passar.append(disjuntor._sonda_ativa)
+
+    monkeypatch.setattr(circuit_breaker, 'print', registrar_print, raising=False)
+    _abrir(disjuntor)
+    _esperar_estado(disjuntor, MEIO_ABERTO)
+    assert ativa_ao_passar == [False]
+
+
+def test_teste_falho_volta_a_sondar():
+    disjuntor = _disjuntor()
+    _abrir(disjuntor)
+    _esperar_estado(disjuntor, MEIO_ABERTO)
+
+    assert disjuntor.permitir()
+    disjuntor.registrar(False)
+    assert disjuntor.estado == ABERTO
+    # Nova sonda: o disjuntor não fica aberto para sempre
+    _esperar_estado(disjuntor, MEIO_ABERTO)
+
+
+class _RespostaIndisponivel:
+    """Resposta imediata do LM Studio com o modelo carregando ou travado."""
+
+    status_code = 503
+    text = 'Model is loading'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class _SessaoIndisponivel:
+    def __init__(self):
+        self.requisicoes = 0
+
+    def post(self, url, **kwargs):
+        self.requisicoes += 1
+        return _RespostaIndisponivel()
+
+
+def _cliente_indisponivel():
+    cliente = LMStudioClient(['http://lm-teste:1234'], max_tentativas=1, delay_tentativa=0)
+    sessao = _SessaoIndisponivel()
+    cliente._sessao = lambda: sessao
+    backend = cliente.backends[0]
+    backend.disjuntor = CircuitBreaker('teste', sonda=lambda: False, janela=30, min_chamadas=2,
+                                       taxa_erro=0.5, chamada_lenta=0, intervalo_sonda=60)
+    return cliente, backend, sessao
+
+
+@pytest.mark.parametrize('modo', ['completar', 'stream'])
+def test_resposta_503_abre_o_disjuntor(modo):
+    cliente, backend, sessao = _cliente_indisponivel()
+
+    for _ in range(2):
+        if modo == 'completar':
+            assert cliente.completar('oi') is None
+        else:
+            assert list(cliente.stream('oi')) == []
+
+    assert backend.disjuntor.estado == ABERTO
+    # 5xx é falha do servidor: o outro endpoint dele não é tentado
+    assert sessao.requisicoes == 2
+    # Aberto, o servidor não recebe mais requisições: vai direto ao fallback
+    assert cliente.completar('oi') is None
+    assert sessao.requisicoes == 2
@@ -0,0 +1,54 @@
+"""Respostas de fallback dadas no lugar do modelo não vão para o cache de todos."""
+import pytest
+
+import utils.chat_manager as chat_manager
+from utils.response_cache import response_cache
+
+PERGUNTA = "como funciona o estágio no senai?"
+
+
+def _sem_modelo(*args, **kwargs):
+    raise AssertionError('o modelo não deveria ter sido chamado')
+
+
+def _processar(stream: bool) -> str:
+    if stream:
+        return list(chat_manager.processar_mensagem_stream(PERGUNTA, []))[-1]['resposta']
+    return chat_manager.processar_mensagem(PERGUNTA, [])
+
+
+@pytest.fixture(autouse=True)
+def _cache_vazio():
+    response_cache.clear()
+    yield
+    response_cache.clear()
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_cliente_recusado_pelo_agendador_nao_fixa_o_fallback(monkeypatch, stream):
+    monkeypatch.setattr(chat_manager.inference_scheduler, 'entrar', lambda: False)
+    monkeypatch.setattr(chat_manager.lm_client, 'completar', _sem_modelo)
+    monkeypatch.setattr(chat_manager.lm_client, 'stream', _sem_modelo)
+
+    assert _processar(stream)
+    assert response_cache.get(PERGUNTA) is None
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_disjuntor_aberto_nao_fixa_o_fallback(monkeypatch, stream):
+    # Com todos os disjuntores abertos o cliente responde None / stream vazio na hora
+    monkeypatch.setattr(chat_manager.lm_client, 'completar', lambda *a, **k: None)
+    monkeypatch.setattr(chat_manager.lm_client, 'stream', lambda *a, **k: iter(()))
+
+    assert _processar(stream)
+    assert response_cache.get(PERGUNTA) is None
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_resposta_do_modelo_vai_para_o_cache(monkeypatch, stream):
+    texto = "O estágio no SENAI São Carlos é acompanhado pela coordenação do curso."
+    monkeypatch.setattr(chat_manager.lm_client, 'completar', lambda *a, **k: texto)
+    monkeypatch.setattr(chat_manager.lm_client, 'stream', lambda *a, **k: iter([texto]))
+
+    assert texto in _processar(stream)
+    assert response_cache.get(PERGUNTA) is not None
@@ -0,0 +1,8 @@
+"""/api/health: contadores de cada subsistema no payload."""
+
+
+def test_health_traz_os_contadores_dos_subsistemas(cliente):
+    dados = cliente.get('/api/health').get_json()
+
+    assert {'recargas', 'ultima_carga', 'versao'} <= set(dados['horarios'])
+    assert {'hits', 'misses', 'evictions', 'taxa_acerto'} <= set(dados['cache'])
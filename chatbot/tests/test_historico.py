@@ -0,0 +1,133 @@
+"""Histórico e lista de chats: paginação por cursor, ETag/304, compressão e consultas."""
+import gzip
+import uuid
+
+from utils.contador_consultas import contar_consultas
+
+
+def _salvar(cliente, chat_id, quantidade, inicio=0):
+    mensagens = [
+        {'text': f"mensagem {i} " + 'x' * 80, 'sender': 'user' if i % 2 == 0 else 'ai', 'seq': i}
+        for i in range(inicio, inicio + quantidade)
+    ]
+    resposta = cliente.post('/chat/save', json={'chat_id': chat_id, 'title': 'Teste', 'messages': mensagens})
+    assert resposta.status_code == 200
+
+
+def test_historico_paginado_por_cursor(cliente):
+    chat_id = uuid.uuid4().hex
+    _salvar(cliente, chat_id, 7)
+
+    paginas, cursor = [], None
+    while True:
+        url = f'/api/chat/history?chat_id={chat_id}&limit=3&keys=en'
+        dados = cliente.get(url + (f'&before={cursor}' if cursor else '')).get_json()
+        paginas.append(dados)
+        cursor = dados['next_cursor']
+        if not cursor:
+            break
+
+    assert [p['first_seq'] for p in paginas] == [4, 1, 0]
+    mensagens = [m for pagina in reversed(paginas) for m in pagina['history']]
+    assert [m['seq'] for m in mensagens] == list(range(7))
+    assert [m['text'].split()[1] for m in mensagens] == [str(i) for i in range(7)]
+    assert 'historico' not in paginas[0]
+
+
+def test_historico_responde_304_ate_mudar(cliente):
+    chat_id = uuid.uuid4().hex
+    _salvar(cliente, chat_id, 2)
+    url = f'/api/chat/history?chat_id={chat_id}'
+
+    primeira = cliente.get(url)
+    etag = primeira.headers['ETag']
+    assert cliente.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    _salvar(cliente, chat_id, 1, inicio=2)
+    depois = cliente.get(url, headers={'If-None-Match': etag})
+    assert depois.status_code == 200
+    assert depois.headers['ETag'] != etag
+    assert len(depois.get_json()['history']) == 3
+
+
+def test_historico_comprimido_com_gzip(cliente):
+    chat_id = uuid.uuid4().hex
+    _salvar(cliente, chat_id, 30)
+
+    resposta = cliente.get(f'/api/chat/history?chat_id={chat_id}', headers={'Accept-Encoding': 'gzip'})
+
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+    assert b'"history"' in gzip.decompress(resposta.get_data())
+
+
+def test_historico_de_outra_sessao_fica_vazio(cliente, modulo_app):
+    chat_id = uuid.uuid4().hex
+    _salvar(cliente, chat_id, 2)
+    outro = modulo_app.app.test_client()
+    with outro.session_transaction() as sessao:
+        sessao['session_id'] = uuid.uuid4().hex
+
+    assert outro.get(f'/api/chat/history?chat_id={chat_id}').get_json()['history'] == []
+
+
+def test_lista_de_chats_paginada_por_cursor(cliente):
+    chat_ids = [uuid.uuid4().hex for _ in range(5)]
+    for chat_id in chat_ids:
+        _salvar(cliente, chat_id, 1)
+
+    vistos, cursor = [], None
+    while True:
+        dados = cliente.get('/api/chat/list?limit=2' + (f'&cursor={cursor}' if cursor else '')).get_json()
+        vistos.extend(chat['id'] for chat in dados['chats'])
+        cursor = dados['next_cursor']
+        if not cursor:
+            break
+
+    assert sorted(vistos) == sorted(chat_ids)
+    assert len(vistos) == len(set(vistos))
+
+
+def test_lista_e_versao_do_historico_em_uma_consulta(cliente, modulo_app):
+    sessao = uuid.uuid4().hex
+    session_manager = modulo_app.session_manager
+    with modulo_app.app.app_context():
+        for _ in range(4):
+            session_manager.save_chat(uuid.uuid4().hex, 'Teste', [{'text': 'oi', 'sender': 'user'}], session_id=sessao)
+        chat_id = uuid.uuid4().hex
+        session_manager.save_chat(chat_id, 'Teste', [{'text': 'oi', 'sender': 'user'}], session_id=sessao)
+
+        with contar_consultas() as lista:
+            chats, _ = session_manager.list_chats_page(session_id=sessao, limit=10)
+        with contar_consultas() as versao:
+            assinatura = session_manager.history_signature(chat_id, session_id=sessao)
+
+    assert len(chats) == 5 and all(chat['lastMessage'] == 'oi' for chat in chats)
+    assert all('messageCount' not in chat for chat in chats)
+    assert lista.comandos == ['SELECT']
+    assert versao.comandos == ['SELECT']
+    assert assinatura[1:] != (0, 0)
+
+
+def test_salvar_ignora_mensagens_apos_lacuna(cliente):
+    chat_id = uuid.uuid4().hex
+    _salvar(cliente, chat_id, 2)
+
+    lacuna = cliente.post('/chat/save', json={'chat_id': chat_id, 'messages': [{'text': 'depois', 'sender': 'user', 'seq': 3}]})
+    assert lacuna.get_json()['next_seq'] == 2
+
+    reenvio = cliente.post('/chat/save', json={'chat_id': chat_id, 'messages': [
+        {'text': f'nova {i}', 'sender': 'user', 'seq': i} for i in range(4)
+    ]})
+    assert reenvio.get_json()['next_seq'] == 4
+    textos = [m['text'] for m in cliente.get(f'/api/chat/history?chat_id={chat_id}').get_json()['history']]
+    assert textos[2:] == ['nova 2', 'nova 3']
+
+
+def test_salvar_so_titulo_nao_mexe_nas_mensagens(cliente):
+    chat_id = uuid.uuid4().hex
+    _salvar(cliente, chat_id, 3)
+
+    resposta = cliente.post('/chat/save', json={'chat_id': chat_id, 'title': 'Outro título', 'messages': []})
+
+    assert resposta.status_code == 200
+    assert len(cliente.get(f'/api/chat/history?chat_id={chat_id}').get_json()['history']) == 3
@@ -0,0 +1,68 @@
+"""Agendador: fichas por cliente, prazo na fila e rodízio entre clientes."""
+import threading
+import time
+
+from utils.inference_scheduler import InferenceScheduler, cliente_inferencia
+
+
+def _esperar(condicao, limite: float = 3.0) -> None:
+    prazo = time.monotonic() + limite
+    while not condicao():
+        assert time.monotonic() < prazo, 'condição não atingida a tempo'
+        time.sleep(0.01)
+
+
+def test_balde_de_fichas_por_cliente():
+    agendador = InferenceScheduler(max_em_voo=4, rajada=2, por_minuto=0)
+    with cliente_inferencia('a'):
+        assert agendador.executar(lambda: 'ok') == 'ok'
+        assert agendador.executar(lambda: 'ok') == 'ok'
+        assert agendador.executar(lambda: 'ok') is None  # sem fichas: fallback
+    with cliente_inferencia('b'):
+        assert agendador.executar(lambda: 'ok') == 'ok'
+    assert agendador.estatisticas()['limitadas'] == 1
+
+
+def test_prazo_de_espera_na_fila():
+    agendador = InferenceScheduler(max_em_voo=1, rajada=0, prazo_fila=0.2)
+    assert agendador.entrar()
+    resultado = []
+    thread = threading.Thread(target=lambda: resultado.append(agendador.entrar()))
+    thread.start()
+    thread.join(2)
+    agendador.sair()
+
+    assert resultado == [False]
+    estatisticas = agendador.estatisticas()
+    assert estatisticas['expiradas'] == 1 and estatisticas['fila'] == 0 and estatisticas['em_voo'] == 0
+
+
+def test_rodizio_entre_clientes():
+    agendador = InferenceScheduler(max_em_voo=1, rajada=0, prazo_fila=5)
+    assert agendador.entrar()
+    admitidos = []
+    liberar = [threading.Event() for _ in range(4)]
+
+    def chamar(cliente, indice):
+        with cliente_inferencia(cliente):
+            assert agendador.entrar()
+        admitidos.append((cliente, indice))
+        liberar[indice].wait(3)
+        agendador.sair()
+
+    threads = []
+    # O cliente 'a' enfileira três chamadas antes de 'b' chegar
+    for indice, cliente in enumerate(['a', 'a', 'a', 'b']):
+        thread = threading.Thread(target=chamar, args=(cliente, indice))
+        thread.start()
+        threads.append(thread)
+        _esperar(lambda: agendador.estatisticas()['fila'] == indice + 1)
+
+    agendador.sair()
+    for vez in range(4):
+        _esperar(lambda: len(admitidos) == vez + 1)
+        liberar[admitidos[-1][1]].set()
+    for thread in threads:
+        thread.join(2)
+
+    assert [cliente for cliente, _ in admitidos] == ['a', 'b', 'a', 'a']
@@ -0,0 +1,105 @@
+"""Streams do LM Studio: resposta cortada não conta como completa nem vai para o cache."""
+import json
+
+import pytest
+
+import utils.chat_manager as chat_manager
+from info import RESPOSTAS_PADRAO
+from utils.lm_client import LMStudioClient, StreamInterrompido
+from utils.response_cache import response_cache
+
+PERGUNTA = "como funciona o estágio no senai?"
+TEXTO = "O estágio no SENAI São Carlos é acompanhado pela coordenação do curso"
+
+
+def _linha(dados) -> str:
+    return f"data: {json.dumps(dados)}"
+
+
+class _RespostaFalsa:
+    status_code = 200
+    text = ''
+
+    def __init__(self, linhas):
+        self.linhas = linhas
+        self.encoding = None
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.linhas)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class _SessaoFalsa:
+    def __init__(self, linhas):
+        self.linhas = linhas
+
+    def post(self, url, **kwargs):
+        return _RespostaFalsa(self.linhas)
+
+
+def _cliente(linhas) -> LMStudioClient:
+    cliente = LMStudioClient(['http://lm-teste:1234'])
+    cliente._sessao = lambda: _SessaoFalsa(linhas)
+    return cliente
+
+
+def _pedaco(texto, fim=None):
+    return _linha({'choices': [{'delta': {'content': texto}, 'finish_reason': fim}]})
+
+
+def test_stream_com_done_termina_normalmente():
+    cliente = _cliente([_pedaco('Olá, '), _pedaco('tudo bem?'), 'data: [DONE]'])
+    assert ''.join(cliente.stream('oi')) == 'Olá, tudo bem?'
+
+
+def test_stream_com_finish_reason_termina_normalmente():
+    cliente = _cliente([_pedaco('Olá'), _pedaco('', fim='stop')])
+    assert ''.join(cliente.stream('oi')) == 'Olá'
+
+
+def test_stream_cortado_levanta_interrompido():
+    cliente = _cliente([_pedaco('Olá, '), _pedaco('tudo')])
+    recebidos = []
+    with pytest.raises(StreamInterrompido):
+        for pedaco in cliente.stream('oi'):
+            recebidos.append(pedaco)
+    assert recebidos == ['Olá, ', 'tudo']
+    assert cliente.backends[0].falhas == 1
+
+
+def test_resposta_interrompida_nao_vai_para_cache(monkeypatch):
+    chamadas = []
+
+    def stream_cortado(*args, **kwargs):
+        chamadas.append(args)
+        yield TEXTO
+        raise StreamInterrompido('conexão caiu')
+
+    monkeypatch.setattr(chat_manager.lm_client, 'stream', stream_cortado)
+    response_cache.clear()
+
+    eventos = list(chat_manager.processar_mensagem_stream(PERGUNTA, []))
+
+    assert chamadas, 'a pergunta deveria ter ido ao modelo'
+    resposta = eventos[-1]['resposta']
+    assert resposta.startswith(TEXTO)
+    assert RESPOSTAS_PADRAO['resposta_interrompida'] in resposta
+    assert response_cache.get(PERGUNTA) is None
+
+
+def test_resposta_completa_vai_para_cache(monkeypatch):
+    def stream_completo(*args, **kwargs):
+        yield TEXTO
+
+    monkeypatch.setattr(chat_manager.lm_client, 'stream', stream_completo)
+    response_cache.clear()
+
+    eventos = list(chat_manager.processar_mensagem_stream(PERGUNTA, []))
+
+    assert RESPOSTAS_PADRAO['resposta_interrompida'] not in eventos[-1]['resposta']
+    assert response_cache.get(PERGUNTA) is not None
@@ -0,0 +1,50 @@
+"""Montagem do prompt: resumo no bloco de sistema e alternância de papéis."""
+from utils.prompt_builder import PromptBuilder
+
+
+def _msg(sender, text):
+    return {'sender': sender, 'text': text}
+
+
+def _papeis(mensagens):
+    return [mensagem['role'] for mensagem in mensagens]
+
+
+def test_resumo_vai_no_sistema_sem_quebrar_a_alternancia():
+    historico = [_msg('ai', 'resposta antiga'), _msg('user', 'pergunta 1'), _msg('ai', 'resposta 1')]
+
+    montado = PromptBuilder().montar('INSTRUÇÕES', 'conhecimento', historico, 'pergunta 2', resumo='falaram de cursos')
+
+    assert montado.mensagens[0]['content'].startswith('INSTRUÇÕES\n\n')
+    assert 'falaram de cursos' in montado.mensagens[0]['content']
+    assert _papeis(montado.mensagens) == ['system', 'user', 'assistant', 'user']
+    assert montado.mensagens_historico == 2
+    assert 'resposta antiga' not in ''.join(m['content'] for m in montado.mensagens)
+
+
+def test_pergunta_sem_resposta_e_juntada():
+    historico = [_msg('user', 'pergunta 1'), _msg('ai', 'resposta 1'), _msg('user', 'pergunta sem resposta')]
+
+    montado = PromptBuilder().montar('INSTRUÇÕES', 'conhecimento', historico, 'pergunta 2')
+
+    assert _papeis(montado.mensagens) == ['system', 'user', 'assistant', 'user']
+    assert montado.mensagens[-1]['content'].startswith('pergunta sem resposta\n\n')
+    assert montado.mensagens[-1]['content'].endswith('pergunta 2')
+
+
+def test_mensagens_seguidas_do_mesmo_papel_no_historico():
+    historico = [_msg('user', 'a'), _msg('user', 'b'), _msg('ai', 'c'), _msg('ai', 'd')]
+
+    montado = PromptBuilder().montar('INSTRUÇÕES', '', historico, 'e')
+
+    assert _papeis(montado.mensagens) == ['system', 'user', 'assistant', 'user']
+    assert montado.mensagens[1]['content'] == 'a\n\nb'
+    assert montado.mensagens[2]['content'] == 'c\n\nd'
+
+
+def test_sistema_igual_sem_resumo():
+    builder = PromptBuilder()
+    primeiro = builder.montar('INSTRUÇÕES', 'x', [], 'p1')
+    segundo = builder.montar('INSTRUÇÕES', 'y', [_msg('user', 'p1'), _msg('ai', 'r1')], 'p2')
+
+    assert primeiro.mensagens[0] == segundo.mensagens[0] == {'role': 'system', 'content': 'INSTRUÇÕES'}
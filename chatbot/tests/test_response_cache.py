@@ -0,0 +1,33 @@
+"""Chaves do cache de respostas: paráfrases iguais, perguntas diferentes separadas."""
+import pytest
+
+from utils.response_cache import MemoryCacheBackend, ResponseCache, normalizar_chave
+
+
+def test_parafrases_geram_a_mesma_chave():
+    assert normalizar_chave("Onde fica a biblioteca?") == normalizar_chave("onde fica biblioteca ?")
+
+
+@pytest.mark.parametrize('generica, da_turma', [
+    ("horario turma 2ids sc", "horario turma 2ids-sc-a"),
+    ("qual o horário da turma 2ids", "qual o horário da turma 2ids a"),
+    ("horario turma 2ids sc", "horario turma 2ids-sc-b"),
+])
+def test_letra_da_turma_fica_na_chave(generica, da_turma):
+    assert normalizar_chave(generica) != normalizar_chave(da_turma)
+
+
+def test_turmas_a_e_b_tem_chaves_diferentes():
+    assert normalizar_chave("horario turma 2ids-sc-a") != normalizar_chave("horario turma 2ids-sc-b")
+    assert normalizar_chave("turma 2ids a") != normalizar_chave("turma 2ids b")
+
+
+@pytest.mark.parametrize('fuzzy', [False, True])
+def test_pergunta_da_turma_nao_recebe_resposta_generica(fuzzy):
+    cache = ResponseCache(backend=MemoryCacheBackend(), fuzzy=fuzzy, limiar_fuzzy=0.5)
+    cache.set("horario turma 2ids sc", "Qual turma? 2IDS-SC-A ou 2IDS-SC-B?")
+    cache.set("horario turma 2ids-sc-b", "Horário da turma B")
+
+    assert cache.get("horario turma 2ids-sc-a") is None
+    assert cache.get("qual o horário da turma 2ids a") is None
+    assert cache.get("horario turma 2ids-sc-b") == "Horário da turma B"
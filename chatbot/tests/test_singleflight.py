@@ -0,0 +1,97 @@
+"""Single-flight: seguidoras não recebem como completa a resposta de um líder que parou."""
+import threading
+import time
+
+import pytest
+
+from utils.chat_manager import _chave_coalescencia
+from utils.singleflight import SingleFlight, VooInterrompido
+
+
+def _esperar_seguidora(voos: SingleFlight, quantas: int = 1) -> None:
+    prazo = time.monotonic() + 2
+    while voos.estatisticas()['coalescidas'] < quantas:
+        assert time.monotonic() < prazo, 'a seguidora não entrou no voo'
+        time.sleep(0.01)
+
+
+def _seguir(voos: SingleFlight, recebidos: list, erros: list) -> threading.Thread:
+    def seguir():
+        try:
+            for pedaco in voos.transmitir('chave', lambda: iter(['outro'])):
+                recebidos.append(pedaco)
+        except VooInterrompido as e:
+            erros.append(e)
+    thread = threading.Thread(target=seguir)
+    thread.start()
+    return thread
+
+
+@pytest.mark.parametrize('abortar', [False, True])
+def test_seguidora_acompanha_o_lider(abortar):
+    voos = SingleFlight(espera_max=5)
+    lider = voos.transmitir('chave', lambda: iter(['a', 'b', 'c']))
+    assert next(lider) == 'a'
+
+    recebidos, erros = [], []
+    thread = _seguir(voos, recebidos, erros)
+    _esperar_seguidora(voos)
+    if abortar:
+        lider.close()  # cliente do líder desconectou (GeneratorExit)
+    else:
+        assert list(lider) == ['b', 'c']
+    thread.join(2)
+
+    if abortar:
+        assert recebidos == ['a']
+        assert len(erros) == 1
+    else:
+        assert recebidos == ['a', 'b', 'c']
+        assert not erros
+
+
+def test_seguidora_recebe_none_se_o_lider_falhar():
+    voos = SingleFlight(espera_max=5)
+    liberar = threading.Event()
+    resultados = []
+
+    def falhar():
+        liberar.wait(2)
+        raise RuntimeError('LM Studio fora do ar')
+
+    def liderar():
+        with pytest.raises(RuntimeError):
+            voos.fazer('chave', falhar)
+
+    thread_lider = threading.Thread(target=liderar)
+    thread_lider.start()
+    prazo = time.monotonic() + 2
+    while not voos.estatisticas()['em_andamento']:
+        assert time.monotonic() < prazo
+        time.sleep(0.01)
+    thread_seguidora = threading.Thread(target=lambda: resultados.append(voos.fazer('chave', lambda: 'outro')))
+    thread_seguidora.start()
+    _esperar_seguidora(voos)
+    liberar.set()
+    thread_lider.join(2)
+    thread_seguidora.join(2)
+    assert resultados == [None]
+
+
+def _prompt(*historico):
+    mensagens = [{'role': 'system', 'content': 'instruções'}]
+    mensagens.extend({'role': papel, 'content': texto} for papel, texto in historico)
+    mensagens.append({'role': 'user', 'content': 'conhecimento\n\n[PERGUNTA ATUAL]\nme fale mais'})
+    return mensagens
+
+
+def test_chave_de_coalescencia_depende_da_conversa():
+    cursos = _prompt(('user', 'quais cursos técnicos?'), ('assistant', 'Temos Administração e Gestão.'))
+    biblioteca = _prompt(('user', 'o que tem na biblioteca?'), ('assistant', 'Livros e computadores.'))
+
+    assert _chave_coalescencia('Me fale mais!', 'conhecimento', cursos) == \
+        _chave_coalescencia('me fale mais', 'conhecimento', cursos)
+    assert _chave_coalescencia('me fale mais', 'conhecimento', cursos) != \
+        _chave_coalescencia('me fale mais', 'conhecimento', biblioteca)
+    assert _chave_coalescencia('me fale mais', 'conhecimento', _prompt()) != \
+        _chave_coalescencia('me fale mais', 'conhecimento', cursos)
@@ -0,0 +1,122 @@
+"""Turno do chat: a pergunta é sempre gravada, com a resposta que o usuário recebeu."""
+import time
+import uuid
+
+import pytest
+
+import utils.chat_manager as chat_manager
+from info import RESPOSTAS_PADRAO
+from models.sqlalchemy_models import Chat, Mensagem
+from utils.session_manager import SessionManager
+
+PERGUNTA = "como funciona o estágio no senai?"
+
+
+def _mensagens(modulo_app, chat_id):
+    with modulo_app.app.app_context():
+        chat = Chat.query.filter_by(chat_id=chat_id).first()
+        if chat is None:
+            return []
+        mensagens = Mensagem.query.filter_by(chat_id=chat.id).order_by(Mensagem.id).all()
+        return [(m.sender, m.text) for m in mensagens]
+
+
+def _pergunta_unica() -> str:
+    # O cache de respostas não pode responder antes do modelo
+    return f"{PERGUNTA} {uuid.uuid4().hex[:8]}"
+
+
+def test_turno_gravado_com_a_resposta(modulo_app, cliente, monkeypatch):
+    monkeypatch.setattr(chat_manager.lm_client, 'completar',
+                        lambda *a, **k: "O estágio é acompanhado pela coordenação do curso.")
+    chat_id = uuid.uuid4().hex
+    pergunta = _pergunta_unica()
+
+    resposta = cliente.post('/chat', json={'message': pergunta, 'chat_id': chat_id}).get_json()
+
+    assert _mensagens(modulo_app, chat_id) == [('user', pergunta), ('ai', resposta['reply'])]
+
+
+def test_pergunta_gravada_quando_a_inferencia_falha(modulo_app, cliente, monkeypatch):
+    def estourar(*args, **kwargs):
+        raise TimeoutError('tempo de espera da inferência esgotado')
+
+    monkeypatch.setattr(modulo_app.inference_executor, 'executar', estourar)
+    chat_id = uuid.uuid4().hex
+    pergunta = _pergunta_unica()
+
+    resposta = cliente.post('/chat', json={'message': pergunta, 'chat_id': chat_id}).get_json()
+
+    assert resposta['reply'] == RESPOSTAS_PADRAO['erro_geral']
+    assert _mensagens(modulo_app, chat_id) == [('user', pergunta), ('ai', RESPOSTAS_PADRAO['erro_geral'])]
+
+
+def test_stream_desconectado_grava_pergunta_e_parcial(modulo_app, cliente, monkeypatch):
+    def stream_lento(*args, **kwargs):
+        for i in range(20):
+            yield f"Trecho {i} da resposta sobre o estágio no SENAI. "
+            time.sleep(0.05)
+
+    monkeypatch.setattr(chat_manager.lm_client, 'stream', stream_lento)
+    chat_id = uuid.uuid4().hex
+    pergunta = _pergunta_unica()
+
+    resposta = cliente.post('/api/chat/stream', json={'message': pergunta, 'chat_id': chat_id}, buffered=False)
+    corpo = iter(resposta.response)
+    assert b'event: delta' in next(corpo)
+    resposta.close()  # o navegador fechou a aba no meio da resposta
+
+    mensagens = _mensagens(modulo_app, chat_id)
+    assert mensagens[0] == ('user', pergunta)
+    assert len(mensagens) == 2 and mensagens[1][0] == 'ai'
+    assert mensagens[1][1].startswith('Trecho 0')
+    assert mensagens[1][1].endswith(RESPOSTAS_PADRAO['resposta_interrompida'])
+
+
+def test_chat_criado_durante_a_inferencia(modulo_app):
+    gerenciador = SessionManager()
+    sessao, chat_id = uuid.uuid4().hex, uuid.uuid4().hex
+    with modulo_app.app.app_context():
+        turno = gerenciador.iniciar_turno(chat_id, 'oi', session_id=sessao)
+        assert turno.chat_pk is None
+        # /chat/save cria o mesmo chat enquanto o modelo responde
+        gerenciador.save_chat(chat_id, 'Nova Conversa', [], session_id=sessao)
+        gerenciador.registrar_turno(turno, 'Olá! Como posso ajudar?')
+
+    assert _mensagens(modulo_app, chat_id) == [('user', 'oi'), ('ai', 'Olá! Como posso ajudar?')]
+
+
+def test_chat_de_outra_sessao_nao_recebe_o_turno(modulo_app):
+    gerenciador = SessionManager()
+    chat_id = uuid.uuid4().hex
+    with modulo_app.app.app_context():
+        turno = gerenciador.iniciar_turno(chat_id, 'oi', session_id=uuid.uuid4().hex)
+        gerenciador.save_chat(chat_id, 'Nova Conversa', [], session_id=uuid.uuid4().hex)
+        gerenciador.registrar_turno(turno, 'Olá!')
+
+    assert _mensagens(modulo_app, chat_id) == []
+
+
+@pytest.mark.parametrize('existente', [False, True])
+def test_consultas_por_turno(modulo_app, existente):
+    from utils.contador_consultas import contar_consultas
+
+    gerenciador = SessionManager()
+    sessao, chat_id = uuid.uuid4().hex, uuid.uuid4().hex
+    with modulo_app.app.app_context():
+        if existente:
+            gerenciador.save_chat(chat_id, 'Nova Conversa', [{'text': 'oi', 'sender': 'user'}], session_id=sessao)
+        with contar_consultas() as inicio:
+            turno = gerenciador.iniciar_turno(chat_id, 'qual o horário da secretaria?', session_id=sessao)
+        with contar_consultas() as registro:
+            gerenciador.registrar_turno(turno, 'A secretaria atende das 8h às 20h.')
+
+    # Chat + janela do histórico (a janela só existe se o chat já existe)
+    assert inicio.comandos == (['SELECT', 'SELECT'] if existente else ['SELECT'])
+    # Um INSERT em lote para pergunta e resposta; chat novo: savepoint + INSERT do chat;
+    # chat existente: UPDATE do updated_at
+    if existente:
+        assert registro.comandos == ['INSERT', 'UPDATE']
+    else:
+        assert registro.comandos.count('INSERT') == 2 and 'UPDATE' not in registro.comandos
+        assert registro.total <= 4
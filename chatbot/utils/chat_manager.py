@@ -1,11 +1,9 @@
-import requests
-from typing import List, Dict, Optional
-import time
+from typing import Iterator, List, Dict, Optional
+import hashlib
+import json
 import re
-from urllib.parse import urlparse, urlunparse
 import unicodedata
 from fuzzywuzzy import fuzz
-from config import URL_LM_STUDIO, NOME_MODELO, TIMEOUT_REQUISICAO, MAX_TENTATIVAS, DELAY_TENTATIVA
 from info import RESPOSTAS_PADRAO
 from info.search import obter_informacao_especifica
 from info import formatar_info_sao_carlos
@@ -13,8 +11,16 @@ from info.base_info import INFO_SENAI_SAO_CARLOS
 from info.info_manager import (
     get_senai_context_for_lm,
     get_complete_senai_info,
-    format_senai_info_for_prompt
+    format_senai_info_for_prompt,
+    REGRAS_PROMPT
 )
+from utils.contexto_mensagem import ContextoMensagem, criar_contexto
+from utils.intent_router import classificar_mensagem
+from utils.lm_client import lm_client, Prompt, StreamInterrompido
+from utils.singleflight import lm_singleflight, VooInterrompido
+from utils.inference_scheduler import inference_scheduler
+from utils.prompt_builder import prompt_builder
+from config import LM_MAX_RESPONSE_TOKENS
 
 # Prompts do sistema (sempre usando as informações oficiais do projeto)
 _ENDERECO = INFO_SENAI_SAO_CARLOS.get('endereco', '')
@@ -41,131 +47,20 @@ Características da unidade:
 
 Responda de forma cordial e objetiva. Se não souber algo específico, indique o contato oficial acima."""
 
-PROMPT_SISTEMA = f"{PROMPT_SISTEMA_BASE}\n\nHistórico da conversa:\n{{historico}}\n\nUsuário: {{mensagem}}\n\nSistema:"
-
 DISCLAIMER = ("\n\n(As informações deste chat são baseadas no site oficial "
              "https://sp.senai.br/unidade/saocarlos/ e na equipe gestora. "
              "Para mais informações, consulte os canais oficiais.)")
 
-def _ajustar_url_endpoint(base_url: str, target: str) -> str:
-    """Monta URL para endpoint alvo preservando esquema/host/porta da base."""
-    try:
-        parsed = urlparse(base_url)
-        return urlunparse((parsed.scheme or 'http', parsed.netloc, target, '', '', ''))
-    except Exception:
-        base = base_url[:-1] if base_url.endswith('/') else base_url
-        return base + target
+def _chamar_lm_studio(prompt: Prompt, stop: Optional[List[str]] = None, temperature: float = 0.7,
+                      max_tokens: int = LM_MAX_RESPONSE_TOKENS) -> Optional[str]:
+    """Chama o LM Studio pelo cliente compartilhado (pool de conexões e orçamento de latência).
 
-def _chamar_lm_studio(prompt: str, stop: Optional[List[str]] = None, temperature: float = 0.7, max_tokens: int = 500) -> Optional[str]:
-    """Tenta chamar LM Studio por chat e text completions com retentativas melhoradas.
-
-    Retorna texto da resposta ou None em falha.
+    Passa pelo agendador (limite de chamadas, fichas por cliente e fila justa).
+    Retorna texto da resposta ou None em falha ou sem admissão.
     """
-    # URLs corretas baseadas no exemplo do curl
-    base_url = "http://localhost:1234"
-    chat_url = f"{base_url}/v1/chat/completions"
-    text_url = f"{base_url}/v1/completions"
-
-    attempts = max(1, int(MAX_TENTATIVAS))
-    delay_s = max(0, int(DELAY_TENTATIVA))
-
-    for attempt in range(attempts):
-        # Tentar chat completion primeiro (recomendado)
-        try:
-            payload_chat = {
-                "model": NOME_MODELO,
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": temperature,
-                "max_tokens": max_tokens if max_tokens > 0 else -1,  # -1 para sem limite
-                "stream": False
-            }
-            if stop:
-                payload_chat["stop"] = stop
-            
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            r = requests.post(chat_url, json=payload_chat, headers=headers, timeout=TIMEOUT_REQUISICAO)
-            
-            # Verificar se a resposta é válida
-            if r.status_code == 200:
-                try:
-                    data = r.json() or {}
-                    choices = data.get('choices') or []
-                    if choices and len(choices) > 0:
-                        choice = choices[0]
-                        if isinstance(choice, dict):
-                            message = choice.get('message', {})
-                            if isinstance(message, dict):
-                                content = message.get('content', '')
-                                if content and content.strip():
-                                    return content.strip()
-                except (ValueError, KeyError, TypeError) as e:
-                    # Erro ao processar JSON da resposta
-                    pass
-            else:
-                # Log do erro para debug
-                print(f"LM Studio Chat Error: {r.status_code} - {r.text[:200]}")
-                
-        except requests.exceptions.Timeout:
-            print("LM Studio Chat Timeout")
-        except requests.exceptions.ConnectionError:
-            print("LM Studio Chat Connection Error")
-        except requests.exceptions.RequestException as e:
-            print(f"LM Studio Chat Request Error: {e}")
-        except Exception as e:
-            print(f"LM Studio Chat Unexpected Error: {e}")
-        
-        # Tentar text completion como fallback
-        try:
-            payload_text = {
-                "model": NOME_MODELO,
-                "prompt": prompt,
-                "temperature": temperature,
-                "max_tokens": max_tokens if max_tokens > 0 else -1,  # -1 para sem limite
-                "stream": False
-            }
-            if stop:
-                payload_text["stop"] = stop
-            
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            r = requests.post(text_url, json=payload_text, headers=headers, timeout=TIMEOUT_REQUISICAO)
-            
-            if r.status_code == 200:
-                try:
-                    data = r.json() or {}
-                    choices = data.get('choices', [])
-                    if choices and len(choices) > 0:
-                        choice = choices[0]
-                        if isinstance(choice, dict):
-                            text = choice.get('text', '')
-                            if text and text.strip():
-                                return text.strip()
-                except (ValueError, KeyError, TypeError) as e:
-                    # Erro ao processar JSON da resposta
-                    pass
-            else:
-                # Log do erro para debug
-                print(f"LM Studio Text Error: {r.status_code} - {r.text[:200]}")
-                
-        except requests.exceptions.Timeout:
-            print("LM Studio Text Timeout")
-        except requests.exceptions.ConnectionError:
-            print("LM Studio Text Connection Error")
-        except requests.exceptions.RequestException as e:
-            print(f"LM Studio Text Request Error: {e}")
-        except Exception as e:
-            print(f"LM Studio Text Unexpected Error: {e}")
-        
-        # Aguardar antes da próxima tentativa
-        if attempt < attempts - 1 and delay_s:
-            time.sleep(delay_s)
-    
-    return None
+    return inference_scheduler.executar(
+        lambda: lm_client.completar(prompt, stop=stop, temperature=temperature, max_tokens=max_tokens)
+    )
 
 def limpar_resposta(texto: str) -> str:
     """Remove caracteres desnecessários da resposta e melhora formatação"""
@@ -214,54 +109,7 @@ def limpar_resposta(texto: str) -> str:
 
 def _e_small_talk(mensagem_lower: str) -> bool:
     """Detecta cumprimentos, agradecimentos, confirmações e despedidas simples."""
-    mensagem_limpa = mensagem_lower.strip()
-    mensagem_sem_acentos = _remover_acentos(mensagem_limpa)
-    
-    # NÃO tratar como small talk se for apenas "a" ou "b" (pode ser resposta de desambiguação)
-    if mensagem_limpa in ['a', 'b', 'A', 'B']:
-        return False
-    
-    # NÃO tratar como small talk se menciona locais específicos (ex: "area dois", "sala 315")
-    palavras_locais = ['area', 'área', 'sala', 'banheiro', 'biblioteca', 'secretaria', 'refeitorio', 'setor de apoio', 'setor apoio', 'apoio', 'qualidade de vida']
-    if any(palavra in mensagem_limpa for palavra in palavras_locais):
-        return False
-    
-    # Verificar cumprimentos (exatos ou como início da mensagem)
-    cumprimentos = ['olá', 'ola', 'oi', 'bom dia', 'boa tarde', 'boa noite']
-    for cumprimento in cumprimentos:
-        cumprimento_sem_acentos = _remover_acentos(cumprimento)
-        # Verificar exato
-        if mensagem_limpa == cumprimento or mensagem_sem_acentos == cumprimento_sem_acentos:
-            return True
-        # Verificar como início
-        if (mensagem_limpa.startswith(cumprimento + ' ') or 
-            mensagem_sem_acentos.startswith(cumprimento_sem_acentos + ' ') or
-            mensagem_limpa.startswith(cumprimento + '!') or 
-            mensagem_sem_acentos.startswith(cumprimento_sem_acentos + '!')):
-            return True
-        # Verificar se contém (para casos como "olá, tudo bem?")
-        if cumprimento in mensagem_limpa or cumprimento_sem_acentos in mensagem_sem_acentos:
-            return True
-    
-    # Verificar outras palavras-chave
-    palavras_chave = [
-        # Agradecimentos
-        'obrigado', 'obrigada', 'valeu', 'agradeço', 'agradeco',
-        # Despedidas
-        'tchau', 'até mais', 'ate mais', 'flw', 'falou', 'até logo', 'ate logo',
-        # Nome do bot
-        'qual seu nome', 'como você se chama', 'quem é você',
-        # Confirmações simples
-        'beleza', 'blz', 'tá bom', 'ta bom', 'ok', 'show'
-    ]
-    
-    # Verificar com e sem acentos
-    for palavra in palavras_chave:
-        palavra_sem_acentos = _remover_acentos(palavra)
-        if palavra in mensagem_limpa or palavra_sem_acentos in mensagem_sem_acentos:
-            return True
-    
-    return False
+    return classificar_mensagem(mensagem_lower).small_talk
 
 def tratar_nome_usuario(resposta: str, nome_usuario: str) -> str:
     """Personaliza a resposta com o apelido do usuário e assina como Cadu."""
@@ -414,8 +262,10 @@ def formatar_historico_chat_para_prompt(historico_chat: List[Dict]) -> str:
     historico_formatado = ""
     # Pegar mais mensagens para melhor contexto (últimas 8 mensagens)
     for msg in historico_chat[-8:]:
-        remetente = "Usuário" if msg.get('remetente') == 'usuario' else "Assistente SENAI"
-        texto = msg.get('texto', '')
+        # Suporta ambos formatos: ('remetente'/'texto') e ('sender'/'text')
+        eh_usuario = msg.get('remetente') == 'usuario' or msg.get('sender') == 'user'
+        remetente = "Usuário" if eh_usuario else "Assistente SENAI"
+        texto = msg.get('texto') or msg.get('text') or ''
         # Limitar tamanho de cada mensagem para evitar prompt muito longo
         if len(texto) > 200:
             texto = texto[:200] + "..."
@@ -433,42 +283,6 @@ def _compactar(texto: str, limite: int = 1800) -> str:
     metade = max(0, (limite - 20) // 2)
     return texto[:metade] + "\n...\n" + texto[-metade:]
 
-def _montar_prompt_confiavel(mensagem: str, historico_formatado: str) -> str:
-    """Monta um prompt que força o modelo a se basear na base oficial de info/."""
-    # Usar informações contextuais mais concisas
-    base_confiavel = format_senai_info_for_prompt(mensagem, include_all=False)
-    
-    # Limitar o tamanho do prompt para evitar overflow de contexto
-    max_prompt_length = 2500  # Reduzido para dar mais espaço ao contexto
-    
-    # Instruções mais específicas para garantir uso das informações
-    instrucoes = (
-        "Você é o Cadu, assistente virtual do SenAI, ferramenta de auxilio para o SENAI São Carlos. "
-        "IMPORTANTE: Use APENAS as informações fornecidas abaixo. "
-        "Responda de forma cordial, objetiva e profissional. "
-        "Mantenha continuidade com a conversa anterior. "
-        "Se não souber algo específico, oriente a entrar em contato com os canais oficiais."
-    )
-    
-    # Montar prompt base
-    prompt_base = f"{instrucoes}\n\n{base_confiavel}"
-    
-    # Se o prompt base for muito longo, truncar
-    if len(prompt_base) > max_prompt_length:
-        prompt_base = prompt_base[:max_prompt_length] + "..."
-    
-    # Adicionar histórico mais completo para manter continuidade
-    historico_limpo = historico_formatado[-300:] if len(historico_formatado) > 300 else historico_formatado
-    
-    prompt = (
-        f"{prompt_base}\n\n"
-        f"[CONTEXTO DA CONVERSA]\n{historico_limpo}\n\n"
-        f"[PERGUNTA ATUAL]\nUsuário: {mensagem}\n\n"
-        f"[RESPOSTA]\nAssistente SENAI:"
-    )
-    
-    return prompt
-
 def _substituir_placeholders(texto: str) -> str:
     """Substitui tokens {endereco}, {telefone}, {email} por valores oficiais."""
     try:
@@ -533,125 +347,7 @@ def _corrigir_informacoes_banheiro(resposta: str) -> str:
 
 def _eh_pergunta_sobre_horarios(mensagem: str) -> bool:
     """Detecta se a pergunta é sobre horários/aulas/professores/turmas (NÃO horário de funcionamento)"""
-    mensagem_normalizada = _remover_acentos((mensagem or '').lower())
-    mensagem_compacta = re.sub(r'\s+', ' ', mensagem_normalizada).strip()
-    mensagem_sem_espacos = mensagem_compacta.replace(' ', '')
-    
-    # IMPORTANTE: NÃO tratar como horário escolar se for pergunta sobre horário de funcionamento
-    # (secretaria, biblioteca, instituição em geral)
-    horario_funcionamento_keywords = [
-        'horario de funcionamento', 'horário de funcionamento', 'funcionamento do senai',
-        'horario do senai', 'horário do senai', 'horario da secretaria', 'horário da secretaria',
-        'horario da biblioteca', 'horário da biblioteca', 'abre', 'fecha', 'que horas abre',
-        'que horas fecha', 'quando abre', 'quando fecha'
-    ]
-    # Se menciona horário de funcionamento sem mencionar sala/professor/turma específica
-    if any(keyword in mensagem_compacta for keyword in horario_funcionamento_keywords):
-        # Verificar se NÃO menciona sala/professor/turma (se mencionar, pode ser ambos)
-        if not (re.search(r'\b(sala\s*)?(\d{2,3})\b', mensagem_compacta) or 
-                'professor' in mensagem_compacta or 
-                'turma' in mensagem_compacta or
-                'aula' in mensagem_compacta):
-            return False  # É horário de funcionamento, NÃO horário escolar
-    
-    # Verificar se menciona número de sala (3 dígitos) - com ou sem espaço
-    # IMPORTANTE: Se a mensagem é APENAS um número (sem outras palavras), tratar como localização, não horário
-    if mensagem_compacta.isdigit():
-        # Número sozinho = pergunta de localização, não horário
-        return False
-    
-    if re.search(r'\b(sala\s*)?(\d{3})\b', mensagem_compacta) or re.search(r'sala\d{3}', mensagem_sem_espacos) or re.search(r'\b\d{2,3}\b', mensagem_compacta):
-        # Se menciona número de sala (mesmo sem palavra "aula", pode ser pergunta sobre horário)
-        # Verificar se não é pergunta de localização
-        if not any(palavra in mensagem_compacta for palavra in ['onde fica', 'como chegar', 'localização', 'localizacao']):
-            # Verificar se há contexto de horário/aula/professor (se não houver, pode ser localização)
-            tem_contexto_horario = any(palavra in mensagem_compacta for palavra in [
-                'horario', 'horário', 'aula', 'professor', 'turma', 'quem', 'tem aula',
-                'vai ter', 'ocupada', 'livre', 'disponivel', 'em uso', 'hoje', 'agora'
-            ])
-            # Se menciona número de sala E tem contexto de horário, é sobre horário
-            if tem_contexto_horario:
-                return True
-            # Se menciona número mas NÃO tem contexto de horário, pode ser localização (não tratar como horário)
-            return False
-    
-    # Verificar se menciona professores conhecidos (antes de verificar padrões gerais)
-    from info.horarios import carregar_horarios_professores
-    professores_disponiveis = list(carregar_horarios_professores().keys())
-    for prof_nome in professores_disponiveis:
-        prof_lower = _remover_acentos(prof_nome.lower())
-        if prof_lower in mensagem_compacta:
-            # Se menciona professor E tem palavras relacionadas a horário/localização de aula
-            if any(palavra in mensagem_compacta for palavra in [
-                'onde', 'esta', 'está', 'horario', 'horário', 'aula', 'dando', 'tem'
-            ]):
-                return True
-    
-    # Verificar fuzzy matching para professores (erros de digitação)
-    try:
-        from fuzzywuzzy import fuzz
-        for prof_nome in professores_disponiveis:
-            prof_lower = _remover_acentos(prof_nome.lower())
-            # Verificar se há similaridade suficiente
-            if fuzz.ratio(mensagem_compacta, prof_lower) >= 60 or fuzz.partial_ratio(mensagem_compacta, prof_lower) >= 70:
-                # Se menciona professor (com similaridade) E tem palavras relacionadas
-                if any(palavra in mensagem_compacta for palavra in [
-                    'onde', 'esta', 'está', 'horario', 'horário', 'aula', 'dando', 'tem', 'professor', 'prof'
-                ]):
-                    return True
-    except ImportError:
-        pass
-    
-    # Verificar se menciona turmas conhecidas
-    from info.horarios import carregar_horarios_turmas
-    turmas_disponiveis = list(carregar_horarios_turmas().keys())
-    for turma_nome in turmas_disponiveis:
-        # Normalizar nome da turma para busca
-        turma_normalizada = _remover_acentos(turma_nome.lower().replace('_', ' ').replace('-', ' '))
-        turma_sem_espacos = turma_normalizada.replace(' ', '')
-        mensagem_sem_espacos_turma = mensagem_compacta.replace(' ', '').replace('-', '').replace('_', '')
-        
-        # Verificar se menciona turma (com ou sem espaços/hífens)
-        if (turma_normalizada in mensagem_compacta or 
-            turma_sem_espacos in mensagem_sem_espacos_turma or
-            _remover_acentos(turma_nome.lower()) in mensagem_sem_espacos_turma):
-            # Se menciona turma, é pergunta sobre horário
-            return True
-    
-    # Verificar se menciona período do dia (manhã, tarde, noite) combinado com sala/aula
-    periodos_dia = ['manha', 'manhã', 'tarde', 'noite', 'manha', 'manhã']
-    tem_periodo = any(periodo in mensagem_compacta for periodo in periodos_dia)
-    # Se menciona sala + período OU quem dá aula + período, é sobre horário escolar
-    if (re.search(r'\b(sala\s*)?(\d{2,3})\b', mensagem_compacta) or 'sala' in mensagem_compacta) and tem_periodo:
-        return True
-    if ('quem' in mensagem_compacta and 'aula' in mensagem_compacta) and tem_periodo:
-        return True
-    
-    perguntas_horario = [
-        # Padrões diretos de horário
-        'qual professor', 'qual turma', 'onde está o professor', 'onde esta o professor', 
-        'professor está', 'professor esta', 'turma está', 'turma esta', 'que dia', 
-        'que período', 'que periodo', 'horário', 'horario', 'horarios', 'horários',
-        # Padrões sobre quem dá aula
-        'quem vai dar aula', 'quem vai dar', 'quem dá aula', 'quem da aula',
-        'quem está dando aula', 'quem esta dando aula', 'quem vai estar',
-        'quem está na sala', 'quem esta na sala', 'quem tem aula',
-        'quem vai estar na sala', 'quem esta na sala', 'quem da aula na',
-        'quem dá aula na', 'quem da aula em', 'quem dá aula em',
-        # Padrões sobre aulas
-        'tem aula', 'vai ter aula', 'tem professor', 'tem turma',
-        'está ocupada', 'esta ocupada', 'está livre', 'esta livre',
-        'está em uso', 'esta em uso', 'está sendo usada', 'esta sendo usada',
-        'quem usa', 'quem está usando', 'quem esta usando',
-        # Padrões sobre hoje/agora
-        'hoje', 'agora', 'neste momento', 'neste horário', 'neste horario',
-        'nesta hora', 'agora mesmo',
-        # Padrões sobre ocupação
-        'ocupada', 'livre', 'disponível', 'disponivel', 'em uso',
-        'sendo usada', 'sendo utilizada'
-    ]
-    
-    return any(pergunta in mensagem_compacta for pergunta in perguntas_horario)
+    return classificar_mensagem(mensagem).horario_escolar
 
 def _deve_usar_lm_studio(mensagem: str, historico_chat: List[Dict]) -> bool:
     """
@@ -659,55 +355,10 @@ def _deve_usar_lm_studio(mensagem: str, historico_chat: List[Dict]) -> bool:
     - Perguntas de localização (onde fica, como chegar, etc.)
     - Small talk (cumprimentos, despedidas, agradecimentos)
     - Perguntas sobre horários ESCOLARES (aulas, professores, turmas) - para não pesar no LM Studio
+    - Perguntas simples sobre contato/telefone (fallback responde)
     - Perguntas sobre horário de funcionamento da secretaria/biblioteca (fallback responde)
     """
-    mensagem_lower = mensagem.lower()
-    mensagem_normalizada = _remover_acentos(mensagem_lower)
-    
-    # NÃO usar LM Studio para perguntas de localização
-    if _eh_pergunta_localizacao(mensagem):
-        return False
-    
-    # NÃO usar LM Studio para small talk (cumprimentos, despedidas, agradecimentos)
-    if _e_small_talk(mensagem_lower):
-        return False
-    
-    # NÃO usar LM Studio para perguntas sobre horários ESCOLARES (aulas, professores, turmas)
-    if _eh_pergunta_sobre_horarios(mensagem):
-        return False
-    
-    # NÃO usar LM Studio para perguntas sobre horário de funcionamento da secretaria/biblioteca
-    # (fallback já tem essa informação)
-    horario_funcionamento_keywords = [
-        'horario de funcionamento', 'horário de funcionamento', 'funcionamento do senai',
-        'horario do senai', 'horário do senai', 'horario da secretaria', 'horário da secretaria',
-        'horario da biblioteca', 'horário da biblioteca', 'abre', 'fecha', 'que horas abre',
-        'que horas fecha', 'quando abre', 'quando fecha'
-    ]
-    
-    # NÃO usar LM Studio para perguntas simples sobre contato/telefone/número
-    # (fallback já tem essas informações)
-    contato_keywords = [
-        'telefone', 'fone', 'contato', 'ligar', 'numero da secretaria', 'número da secretaria',
-        'qual o numero', 'qual o número', 'numero do senai', 'número do senai'
-    ]
-    if any(keyword in mensagem_normalizada for keyword in contato_keywords):
-        # Verificar se é uma pergunta simples (não complexa)
-        palavras_complexas = ['me fale', 'quais são', 'quais sao', 'conte sobre', 'fale sobre', 
-                              'explique', 'detalhe', 'informe sobre', 'me informe']
-        e_pergunta_simples = not any(palavra in mensagem_normalizada for palavra in palavras_complexas)
-        if e_pergunta_simples:
-            return False
-    if any(keyword in mensagem_normalizada for keyword in horario_funcionamento_keywords):
-        # Verificar se NÃO menciona sala/professor/turma específica
-        if not (re.search(r'\b(sala\s*)?(\d{2,3})\b', mensagem_normalizada) or 
-                'professor' in mensagem_normalizada or 
-                'turma' in mensagem_normalizada or
-                'aula' in mensagem_normalizada):
-            return False  # É horário de funcionamento, usar fallback
-    
-    # Todo o resto vai para LM Studio (incluindo perguntas gerais sobre cursos, diferenciais, etc.)
-    return True
+    return classificar_mensagem(mensagem).usar_lm
 
 def _eh_pergunta_sobre_senai_geral(mensagem: str) -> bool:
     """
@@ -758,127 +409,7 @@ def _eh_pergunta_sobre_senai_geral(mensagem: str) -> bool:
 
 def _eh_pergunta_localizacao(mensagem: str) -> bool:
     """Detecta perguntas explicitamente sobre localização/direções."""
-    mensagem_normalizada = _remover_acentos((mensagem or '').lower())
-    mensagem_compacta = re.sub(r'\s+', ' ', mensagem_normalizada).strip()
-    tokens = mensagem_compacta.split()
-
-    if not mensagem_compacta:
-        return False
-
-    # Somente números (ex: "214") devem ser tratados como pedido de localização
-    if mensagem_compacta.isdigit():
-        return True
-
-    # NÃO tratar como localização se for pergunta sobre horários/aulas/professores
-    perguntas_horario = [
-        # Padrões diretos de horário
-        'qual professor', 'qual turma', 'onde está o professor', 'onde esta o professor', 
-        'professor está', 'professor esta', 'turma está', 'turma esta', 'que dia', 
-        'que período', 'que periodo', 'horário', 'horario', 'horarios', 'horários',
-        # Padrões sobre quem dá aula
-        'quem vai dar aula', 'quem vai dar', 'quem dá aula', 'quem da aula',
-        'quem está dando aula', 'quem esta dando aula', 'quem vai estar',
-        'quem está na sala', 'quem esta na sala', 'quem tem aula',
-        'quem vai estar na sala', 'quem esta na sala',
-        # Padrões sobre aulas
-        'tem aula', 'vai ter aula', 'tem professor', 'tem turma',
-        'está ocupada', 'esta ocupada', 'está livre', 'esta livre',
-        'está em uso', 'esta em uso', 'está sendo usada', 'esta sendo usada',
-        'quem usa', 'quem está usando', 'quem esta usando',
-        # Padrões sobre hoje/agora
-        'hoje', 'agora', 'neste momento', 'neste horário', 'neste horario',
-        'nesta hora', 'agora mesmo',
-        # Padrões sobre ocupação
-        'ocupada', 'livre', 'disponível', 'disponivel', 'em uso',
-        'sendo usada', 'sendo utilizada'
-    ]
-    if any(pergunta in mensagem_compacta for pergunta in perguntas_horario):
-        return False
-
-    # Perguntas que claramente falam de conteúdo devem ser tratadas pelo LM Studio
-    gatilhos_conteudo = ['o que tem', 'que tem', 'que existe', 'o que ha', 'que coisas tem']
-    if any(gatilho in mensagem_compacta for gatilho in gatilhos_conteudo):
-        return False
-
-    frases_localizacao = [
-        'onde fica', 'onde esta', 'onde está', 'fica onde', 'como chegar', 'como chego',
-        'onde encontro', 'como encontro', 'sabe chegar', 'sabe encontrar', 'pode indicar o caminho'
-    ]
-
-    termos_localizacao = ['localizacao', 'localiza', 'localidade']
-
-    # Verificação especial para "setor de apoio" e outras localizações específicas
-    locais_especificos = ['setor de apoio', 'setor apoio', 'apoio', 'qualidade de vida', 
-                          'sala 204', '204', 'biblioteca', 'secretaria', 'refeitorio', 
-                          'banheiro', 'coordenacao', 'coordenação']
-    
-    # Se a mensagem contém uma frase de localização E um local específico, é definitivamente localização
-    for frase in frases_localizacao:
-        if frase in mensagem_compacta:
-            # Verificar se menciona algum local específico
-            tem_local_especifico = any(local in mensagem_compacta for local in locais_especificos)
-            if tem_local_especifico:
-                return True
-            
-            # Verificar se é pergunta composta (tem tanto localização quanto conteúdo)
-            tem_contexto_extra = any(token in ['curso', 'cursos', 'valor', 'valores', 'quanto', 'horario', 'capacidade'] for token in tokens)
-            # Verificar se há perguntas sobre conteúdo (ex: "quais são os cursos")
-            tem_pergunta_conteudo = any(palavra in mensagem_compacta for palavra in ['quais são', 'quais sao', 'me fale sobre', 'conte sobre', 'fale sobre'])
-            # Se for pergunta composta com conteúdo, deixar para LM Studio
-            if tem_pergunta_conteudo or (tem_contexto_extra and len(tokens) > 5):
-                return False
-            return True
-
-    # Detectar sinônimos aproximados (erros de digitação leves)
-    palavras_chave_locais = [
-        'banheiro', 'sanitario', 'sala', 'biblioteca', 'secretaria',
-        'refeitorio', 'laboratorio', 'hidrante', 'extintor', 'coordenacao', 'auditorio',
-        'area', 'área', 'area dois', 'área dois', 'area 2', 'área 2',
-        'setor de apoio', 'setor apoio', 'apoio', 'qualidade de vida', 'analise de qualidade de vida',
-        'análise de qualidade de vida', 'sala 204', '204'
-    ]
-
-    numero_presente = bool(re.search(r'\b\d{2,3}\b', mensagem_compacta))
-
-    def possui_palavra_chave(chave: str) -> bool:
-        if chave in mensagem_compacta:
-            return True
-        for token in tokens:
-            if fuzz.ratio(token, chave) >= 85:
-                return True
-        return False
-
-    # Verificar se tem palavra-chave local
-    tem_palavra_local = any(possui_palavra_chave(chave) for chave in palavras_chave_locais)
-    
-    # Verificar se menciona "area dois" especificamente (caso especial)
-    area_dois_keywords = ['area dois', 'área dois', 'area 2', 'área 2', 'area ii', 'área ii']
-    tem_area_dois = any(keyword in mensagem_compacta for keyword in area_dois_keywords)
-    
-    # Se tem palavra-chave local E não é pergunta sobre conteúdo/horário, tratar como localização
-    if tem_palavra_local or tem_area_dois:
-        # Verificar se NÃO é pergunta sobre conteúdo (ex: "o que tem no banheiro")
-        nao_e_conteudo = not any(palavra in mensagem_compacta for palavra in [
-            'o que tem', 'que tem', 'que existe', 'o que ha', 'que coisas tem',
-            'conteudo', 'conteúdo', 'tem o que', 'tem que'
-        ])
-        # Verificar se NÃO é pergunta sobre horário
-        nao_e_horario = not any(palavra in mensagem_compacta for palavra in [
-            'horario', 'horário', 'que horas', 'quando', 'periodo', 'período'
-        ])
-        # Se tem número OU é uma pergunta simples sobre local (ex: "banheiro masculino", "area dois")
-        # OU menciona especificamente "area dois"
-        if tem_area_dois or (numero_presente or len(tokens) <= 3) and nao_e_conteudo and nao_e_horario:
-            return True
-
-    if any(termo in mensagem_compacta for termo in termos_localizacao) and tem_palavra_local:
-        return True
-
-    if numero_presente and tem_palavra_local:
-        return True
-
-    return False
-
+    return classificar_mensagem(mensagem).localizacao
 
 def _gerar_resposta_rica_sobre_senai(mensagem: str) -> str:
     """
@@ -984,11 +515,70 @@ A Escola SENAI São Carlos – "Antonio A. Lobbe" pertence à rede SENAI São Pa
 
 Posso te ajudar com informações sobre cursos específicos? 😊"""
 
-def obter_resposta_fallback(mensagem: str, historico_chat: List[Dict] = None) -> str:
+def _responder_ocupacao_agora(contexto: ContextoMensagem, telefone: str, email: str) -> Optional[str]:
+    """Responde "quem está na sala X agora", "onde está o professor Y agora" e "quais salas estão livres"
+    usando o índice de horários (consulta direta por dia/período atual)."""
+    from info.horarios import obter_indice_horarios, dia_periodo_atual
+
+    texto = contexto.normalizada
+    pergunta_agora = contexto.intencao.tem('tempo_real')
+    pergunta_salas_livres = 'sala' in texto and any(p in texto for p in ['livre', 'livres', 'disponivel', 'disponiveis', 'vazia', 'vazias'])
+    if not pergunta_agora and not (pergunta_salas_livres and not contexto.numeros_sala):
+        return None
+
+    indice = obter_indice_horarios()
+    dia, periodo = dia_periodo_atual()
+    rodape = (
+        "\n\nPara consultar horarios atualizados e substituicoes, acesse:\n"
+        '<a href="https://senaisaocarlos.edupage.org/timetable/" style="color: red; text-decoration: underline;" target="_blank" rel="noopener noreferrer">https://senaisaocarlos.edupage.org/timetable/</a>\n\n'
+        f"Telefone: {telefone}\n"
+        f"Email: {email}"
+    )
+    if dia is None:
+        return "Hoje é domingo, não há aulas no SENAI São Carlos." + rodape
+    momento = f"{dia.title()}, {periodo}"
+
+    def descrever(aula, mostrar_sala: bool = True) -> str:
+        partes = [aula.disciplina or 'Aula']
+        if aula.professor:
+            partes.append(f"Professor: {aula.professor}")
+        if aula.turma:
+            partes.append(f"Turma: {aula.turma}")
+        if aula.sala and mostrar_sala:
+            partes.append(f"Sala: {aula.sala}")
+        return "- " + " | ".join(partes)
+
+    if contexto.numeros_sala:
+        sala = contexto.numeros_sala[0]
+        if sala not in indice.salas and sala not in indice.por_sala:
+            return None
+        aulas = indice.aulas_sala(sala, dia, periodo)
+        if not aulas:
+            return f"A sala {sala} está livre agora ({momento})." + rodape
+        return f"Sala {sala} agora ({momento}):\n" + "\n".join(descrever(a, False) for a in aulas) + rodape
+
+    if contexto.professores and pergunta_agora:
+        professor = contexto.professores[0]
+        aulas = indice.aulas_professor(professor, dia, periodo)
+        if not aulas:
+            return f"O professor {professor} não tem aula agora ({momento})." + rodape
+        return f"Professor {professor} agora ({momento}):\n" + "\n".join(descrever(a) for a in aulas) + rodape
+
+    if pergunta_salas_livres:
+        livres = indice.salas_livres(dia, periodo)
+        if not livres:
+            return f"Nenhuma das salas com horário cadastrado está livre agora ({momento})." + rodape
+        return f"Salas livres agora ({momento}): " + ", ".join(livres) + "." + rodape
+
+    return None
+
+def obter_resposta_fallback(mensagem: str, historico_chat: List[Dict] = None,
+                            contexto: Optional[ContextoMensagem] = None) -> str:
     """Sistema de fallback melhorado com respostas mais completas"""
     if historico_chat is None:
         historico_chat = []
-    mensagem_lower = mensagem.lower()
+    contexto = criar_contexto(mensagem, contexto)
+    mensagem_lower = contexto.lower
     
     # PRIMEIRO: Verificar se há pergunta de desambiguação pendente (ANTES de qualquer outra coisa)
     # Isso garante que respostas simples como "a" ou "b" sejam processadas imediatamente
@@ -1128,7 +718,7 @@ def obter_resposta_fallback(mensagem: str, historico_chat: List[Dict] = None) ->
     horario = INFO_SENAI_SAO_CARLOS.get('horario_funcionamento', '')
 
     # Respostas sobre horários (fallback para não pesar no LM Studio)
-    if _eh_pergunta_sobre_horarios(mensagem):
+    if contexto.intencao.horario_escolar:
         import re
         from info.horarios import (
             buscar_horario_sala, formatar_horario_sala_para_resposta,
@@ -1137,18 +727,13 @@ def obter_resposta_fallback(mensagem: str, historico_chat: List[Dict] = None) ->
             carregar_horarios_professores, carregar_horarios_turmas
         )
         
-        # 1) Tentar extrair número da sala da pergunta (com ou sem espaço após "sala")
-        numero_sala = None
-        # Primeiro, tentar padrão com espaço (ex: "sala 315")
-        numeros_sala = re.findall(r'\b(sala\s*)?(\d{3})\b', mensagem)
-        if numeros_sala:
-            # Extrair o número da tupla retornada
-            numero_sala = numeros_sala[0][1] if isinstance(numeros_sala[0], tuple) else numeros_sala[0]
-        else:
-            # Tentar sem espaço (ex: "sala315")
-            numeros_sala = re.findall(r'sala(\d{3})', mensagem.lower())
-            if numeros_sala:
-                numero_sala = numeros_sala[0]
+        # 0) Perguntas sobre o momento atual ("agora") ou salas livres: consulta direta ao índice
+        resposta_agora = _responder_ocupacao_agora(contexto, telefone, email)
+        if resposta_agora:
+            return resposta_agora
+        
+        # 1) Número da sala da pergunta (com ou sem espaço após "sala"), já extraído no contexto
+        numero_sala = contexto.numeros_sala[0] if contexto.numeros_sala else None
         
         if numero_sala:
             horarios_sala = buscar_horario_sala(numero_sala)
@@ -1164,32 +749,22 @@ def obter_resposta_fallback(mensagem: str, historico_chat: List[Dict] = None) ->
                 return resposta
         
         # 2) Tentar extrair nome do professor da pergunta
-        mensagem_lower = mensagem.lower()
-        mensagem_normalizada = _remover_acentos(mensagem_lower)
         # Padrões comuns: "onde está o professor X", "professor X", "horário do professor X"
         professores_disponiveis = list(carregar_horarios_professores().keys())
         
-        # Primeiro, tentar busca exata
-        for prof_nome in professores_disponiveis:
-            prof_lower = prof_nome.lower()
-            prof_normalizado = _remover_acentos(prof_lower)
-            # Verificar se o nome do professor está na mensagem (case-insensitive e sem acentos)
-            if (prof_lower in mensagem_lower or 
-                prof_normalizado in mensagem_normalizada or
-                any(palavra in mensagem_lower for palavra in [
-                    f'professor {prof_lower}', f'prof {prof_lower}', f'prof. {prof_lower}'
-                ])):
-                horarios_prof = buscar_horario_professor(prof_nome)
-                if horarios_prof:
-                    horarios_formatados = formatar_horario_professor_para_resposta(prof_nome, horarios_prof)
-                    resposta = (
-                        f"{horarios_formatados}\n"
-                        "Para consultar horarios atualizados e substituicoes, acesse:\n"
-                        '<a href="https://senaisaocarlos.edupage.org/timetable/" style="color: red; text-decoration: underline;" target="_blank" rel="noopener noreferrer">https://senaisaocarlos.edupage.org/timetable/</a>\n\n'
-                        f"Telefone: {telefone}\n"
-                        f"Email: {email}"
-                    )
-                    return resposta
+        # Primeiro, tentar busca exata (nomes citados já detectados no contexto, sem acentos)
+        for prof_nome in contexto.professores:
+            horarios_prof = buscar_horario_professor(prof_nome)
+            if horarios_prof:
+                horarios_formatados = formatar_horario_professor_para_resposta(prof_nome, horarios_prof)
+                resposta = (
+                    f"{horarios_formatados}\n"
+                    "Para consultar horarios atualizados e substituicoes, acesse:\n"
+                    '<a href="https://senaisaocarlos.edupage.org/timetable/" style="color: red; text-decoration: underline;" target="_blank" rel="noopener noreferrer">https://senaisaocarlos.edupage.org/timetable/</a>\n\n'
+                    f"Telefone: {telefone}\n"
+                    f"Email: {email}"
+                )
+                return resposta
         
         # Se não encontrou com busca exata, tentar fuzzy matching
         try:
@@ -1331,13 +906,13 @@ def obter_resposta_fallback(mensagem: str, historico_chat: List[Dict] = None) ->
         
         # 4) Tentar extrair nome da turma da pergunta
         turmas_disponiveis = list(carregar_horarios_turmas().keys())
+        # Mensagem sem espaços, hífens e underscores (com e sem acentos)
+        mensagem_sem_espacos = mensagem_lower.replace(' ', '').replace('-', '').replace('_', '')
+        mensagem_normalizada_turma = contexto.sem_espacos
         for turma_nome in turmas_disponiveis:
             # Normalizar nome da turma para busca (remover caracteres especiais)
             turma_normalizada = turma_nome.lower().replace('_', ' ').replace('-', ' ')
             turma_sem_espacos = turma_normalizada.replace(' ', '').replace('-', '').replace('_', '')
-            # Normalizar mensagem também (remover espaços, hífens, underscores)
-            mensagem_sem_espacos = mensagem_lower.replace(' ', '').replace('-', '').replace('_', '')
-            mensagem_normalizada_turma = _remover_acentos(mensagem_sem_espacos)
             turma_normalizada_sem_espacos = _remover_acentos(turma_sem_espacos)
             
             # Verificar se o nome da turma está na mensagem (com ou sem espaços/hífens/underscores)
@@ -1432,7 +1007,7 @@ Posso te ajudar com mais alguma informação sobre os cursos? 😊"""
     elif any(palavra in mensagem_lower for palavra in ['horário', 'horario', 'abre', 'fecha', 'funciona']):
         # NÃO retornar se for pergunta sobre horários de aulas/professores/turmas
         # (essas perguntas já foram tratadas acima na seção de horários)
-        if _eh_pergunta_sobre_horarios(mensagem):
+        if contexto.intencao.horario_escolar:
             # Já foi tratado acima, não fazer nada aqui
             pass
         else:
@@ -1540,110 +1115,100 @@ def _eh_mensagem_sem_sentido(mensagem: str) -> bool:
     Detecta se a mensagem não faz sentido (gibberish, caracteres aleatórios, etc.)
     Retorna True se a mensagem parece ser sem sentido
     """
-    if not mensagem or len(mensagem.strip()) < 2:
-        return False
-    
-    mensagem_limpa = mensagem.strip().lower()
-    
-    # Remover espaços e pontuação para análise
-    mensagem_sem_espacos = re.sub(r'[^\w]', '', mensagem_limpa)
-    
-    if len(mensagem_sem_espacos) < 2:
-        return False
-    
-    # Verificar se contém apenas caracteres repetidos (ex: "aaaa", "1111")
-    if len(set(mensagem_sem_espacos)) <= 2 and len(mensagem_sem_espacos) > 3:
-        return True
-    
-    # Verificar padrões de caracteres aleatórios sem vogais suficientes
-    vogais = sum(1 for c in mensagem_sem_espacos if c in 'aeiouáéíóúâêîôûàèìòùãõ')
-    total_caracteres = len(mensagem_sem_espacos)
-    
-    # Se tem menos de 20% de vogais e mais de 4 caracteres, provavelmente é sem sentido
-    if total_caracteres > 4 and vogais / total_caracteres < 0.2:
-        return True
-    
-    # Verificar se não contém palavras comuns do português ou relacionadas ao SENAI
-    palavras_comuns = [
-        'senai', 'curso', 'aula', 'professor', 'sala', 'biblioteca', 'secretaria',
-        'o', 'a', 'de', 'que', 'e', 'do', 'da', 'em', 'um', 'para', 'com', 'na',
-        'qual', 'onde', 'como', 'quando', 'quem', 'porque', 'sobre', 'sobre',
-        'informacao', 'informação', 'preciso', 'quero', 'gostaria', 'pode',
-        'me', 'você', 'voce', 'eu', 'ele', 'ela', 'nos', 'eles', 'elas'
-    ]
-    
-    # Verificar se contém alguma palavra comum
-    tem_palavra_comum = any(palavra in mensagem_limpa for palavra in palavras_comuns)
-    
-    # Se não tem palavras comuns e tem mais de 3 caracteres, pode ser sem sentido
-    if not tem_palavra_comum and len(mensagem_sem_espacos) > 3:
-        # Verificar se tem muitas consoantes consecutivas (padrão de gibberish)
-        consoantes_consecutivas = re.findall(r'[bcdfghjklmnpqrstvwxyz]{4,}', mensagem_sem_espacos)
-        if consoantes_consecutivas:
-            return True
-    
-    # Verificar padrões de teclado (ex: "asdf", "qwerty", "zxcv")
-    padroes_teclado = ['asdf', 'qwerty', 'zxcv', 'hjkl', 'fghj', 'dfgh']
-    if any(padrao in mensagem_sem_espacos for padrao in padroes_teclado):
-        return True
+    return classificar_mensagem(mensagem).sem_sentido
+
+def _responder_rotas_rapidas(mensagem: str, historico_chat: List[Dict], nome_usuario_ctx: str,
+                             contexto: Optional[ContextoMensagem] = None) -> Optional[str]:
+    """Rotas que não dependem do LM Studio (cache, small talk, horários, contato, localização).
+
+    Retorna a resposta final já personalizada ou None quando a mensagem deve seguir para o LM Studio.
+    """
+    contexto = criar_contexto(mensagem, contexto)
+    intencao = contexto.intencao
+    mensagem_lower = (mensagem or '').lower()
     
-    return False
+    # 0.5) Verificar se a mensagem não faz sentido ANTES de qualquer processamento
+    if intencao.sem_sentido:
+        resposta_especifica = (
+            "Olá! Sou o Cadu, assistente virtual do SenAI, ferramenta de auxílio para o SENAI São Carlos. "
+            "Posso ajudar apenas com informações sobre o SENAI São Carlos, como:\n\n"
+            "• Cursos oferecidos\n"
+            "• Localização de salas e instalações\n"
+            "• Horários de funcionamento\n"
+            "• Processos de inscrição\n"
+            "• Informações sobre professores e turmas\n"
+            "• E outras informações relacionadas à unidade\n\n"
+            "Se você tiver alguma dúvida sobre o SENAI São Carlos, fique à vontade para perguntar!"
+        )
+        return tratar_nome_usuario(resposta_especifica, nome_usuario_ctx)
 
-def processar_mensagem(mensagem: str, historico_chat: List[Dict]) -> str:
-    """Processa a mensagem e retorna uma resposta com arquitetura inteligente"""
-    try:
-        mensagem_lower = (mensagem or '').lower()
-        nome_usuario_ctx = _extrair_nome_do_historico(historico_chat)
+    # 0) Verificar PRIMEIRO se há pergunta de desambiguação pendente (ANTES de qualquer outra coisa)
+    # Isso garante que respostas simples como "a" ou "b" sejam processadas imediatamente
+    mensagem_limpa = mensagem_lower.strip()
+    e_resposta_simples = mensagem_limpa in ['a', 'b', 'A', 'B']
+    
+    if historico_chat and len(historico_chat) > 0:
+        # Verificar as últimas mensagens do sistema para encontrar pergunta de desambiguação
+        tem_pergunta_pendente = False
+        for msg in reversed(historico_chat[-5:]):  # Verificar últimas 5 mensagens para garantir
+            # Verificar diferentes formatos possíveis do histórico
+            remetente = str(msg.get('remetente', msg.get('sender', ''))).lower()
+            remetente_alt = str(msg.get('role', '')).lower()  # Pode estar como 'role'
+            
+            # Verificar se é mensagem do sistema (pode ser 'sistema', 'Cadu', 'assistant', 'ai', etc.)
+            if remetente in ['sistema', 'cadu', 'assistente', 'assistant', 'bot', 'ai'] or remetente_alt in ['assistant', 'system']:
+                # Verificar diferentes campos possíveis para o texto
+                ultima_resposta = str(msg.get('texto', msg.get('text', msg.get('content', '')))).lower()
+                # Verificar se foi uma pergunta de desambiguação sobre 2IDS
+                if ('qual turma' in ultima_resposta or 
+                    'me informe qual turma' in ultima_resposta or
+                    '2ids-sc-a' in ultima_resposta or
+                    '2ids-sc-b' in ultima_resposta or
+                    'encontrei referência à turma 2ids' in ultima_resposta or
+                    'encontrei referencia à turma 2ids' in ultima_resposta or
+                    'encontrei referencia a turma 2ids' in ultima_resposta or
+                    'por favor, me informe qual turma' in ultima_resposta or
+                    'por favor me informe qual turma' in ultima_resposta):
+                    tem_pergunta_pendente = True
+                    break
         
-        # 0.5) Verificar se a mensagem não faz sentido ANTES de qualquer processamento
-        if _eh_mensagem_sem_sentido(mensagem):
-            resposta_especifica = (
-                "Olá! Sou o Cadu, assistente virtual do SenAI, ferramenta de auxílio para o SENAI São Carlos. "
-                "Posso ajudar apenas com informações sobre o SENAI São Carlos, como:\n\n"
-                "• Cursos oferecidos\n"
-                "• Localização de salas e instalações\n"
-                "• Horários de funcionamento\n"
-                "• Processos de inscrição\n"
-                "• Informações sobre professores e turmas\n"
-                "• E outras informações relacionadas à unidade\n\n"
-                "Se você tiver alguma dúvida sobre o SENAI São Carlos, fique à vontade para perguntar!"
+        # Se há pergunta pendente E a mensagem é uma resposta simples (a, b), processar imediatamente
+        if tem_pergunta_pendente and e_resposta_simples:
+            # Processar resposta de desambiguação imediatamente - SEM passar por outras verificações
+            resposta_desambigua = obter_resposta_fallback(mensagem, historico_chat, contexto)
+            # Verificar se retornou um horário (não outra pergunta de desambiguação)
+            resposta_lower = resposta_desambigua.lower()
+            # Se não retornou uma nova pergunta de desambiguação, usar a resposta
+            e_nova_pergunta_desambigua = (
+                'encontrei referência' in resposta_lower or
+                'qual turma' in resposta_lower or
+                'me informe qual turma' in resposta_lower
             )
-            return tratar_nome_usuario(resposta_especifica, nome_usuario_ctx)
-
-        # 0) Verificar PRIMEIRO se há pergunta de desambiguação pendente (ANTES de qualquer outra coisa)
-        # Isso garante que respostas simples como "a" ou "b" sejam processadas imediatamente
-        mensagem_limpa = mensagem_lower.strip()
-        e_resposta_simples = mensagem_limpa in ['a', 'b', 'A', 'B']
+            
+            # Se retornou um horário válido (não é nova pergunta), usar essa resposta
+            if not e_nova_pergunta_desambigua:
+                try:
+                    from utils.response_cache import cache_response
+                    cache_response(mensagem, resposta_desambigua)
+                except:
+                    pass  # Se não conseguir cachear, continua mesmo assim
+                return tratar_nome_usuario(resposta_desambigua, nome_usuario_ctx)
+            # Se retornou nova pergunta, continuar o fluxo normal (não deve acontecer, mas por segurança)
         
-        if historico_chat and len(historico_chat) > 0:
-            # Verificar as últimas mensagens do sistema para encontrar pergunta de desambiguação
-            tem_pergunta_pendente = False
-            for msg in reversed(historico_chat[-5:]):  # Verificar últimas 5 mensagens para garantir
-                # Verificar diferentes formatos possíveis do histórico
-                remetente = str(msg.get('remetente', msg.get('sender', ''))).lower()
-                remetente_alt = str(msg.get('role', '')).lower()  # Pode estar como 'role'
-                
-                # Verificar se é mensagem do sistema (pode ser 'sistema', 'Cadu', 'assistant', 'ai', etc.)
-                if remetente in ['sistema', 'cadu', 'assistente', 'assistant', 'bot', 'ai'] or remetente_alt in ['assistant', 'system']:
-                    # Verificar diferentes campos possíveis para o texto
-                    ultima_resposta = str(msg.get('texto', msg.get('text', msg.get('content', '')))).lower()
-                    # Verificar se foi uma pergunta de desambiguação sobre 2IDS
-                    if ('qual turma' in ultima_resposta or 
-                        'me informe qual turma' in ultima_resposta or
-                        '2ids-sc-a' in ultima_resposta or
-                        '2ids-sc-b' in ultima_resposta or
-                        'encontrei referência à turma 2ids' in ultima_resposta or
-                        'encontrei referencia à turma 2ids' in ultima_resposta or
-                        'encontrei referencia a turma 2ids' in ultima_resposta or
-                        'por favor, me informe qual turma' in ultima_resposta or
-                        'por favor me informe qual turma' in ultima_resposta):
-                        tem_pergunta_pendente = True
-                        break
+        # Se há pergunta pendente mas não é resposta simples, verificar outras variações
+        if tem_pergunta_pendente and not e_resposta_simples:
+            # Verificar se é uma resposta de desambiguação (turma a, classe b, etc.)
+            e_resposta_desambigua = (
+                mensagem_limpa.startswith('a ') or mensagem_limpa.startswith('b ') or
+                mensagem_limpa == 'turma a' or mensagem_limpa == 'turma b' or
+                mensagem_limpa == 'classe a' or mensagem_limpa == 'classe b' or
+                'turma a' in mensagem_limpa or 'turma b' in mensagem_limpa or
+                'classe a' in mensagem_limpa or 'classe b' in mensagem_limpa
+            )
             
-            # Se há pergunta pendente E a mensagem é uma resposta simples (a, b), processar imediatamente
-            if tem_pergunta_pendente and e_resposta_simples:
-                # Processar resposta de desambiguação imediatamente - SEM passar por outras verificações
-                resposta_desambigua = obter_resposta_fallback(mensagem, historico_chat)
+            if e_resposta_desambigua:
+                # Processar resposta de desambiguação imediatamente
+                resposta_desambigua = obter_resposta_fallback(mensagem, historico_chat, contexto)
                 # Verificar se retornou um horário (não outra pergunta de desambiguação)
                 resposta_lower = resposta_desambigua.lower()
                 # Se não retornou uma nova pergunta de desambiguação, usar a resposta
@@ -1653,215 +1218,343 @@ def processar_mensagem(mensagem: str, historico_chat: List[Dict]) -> str:
                     'me informe qual turma' in resposta_lower
                 )
                 
-                # Se retornou um horário válido (não é nova pergunta), usar essa resposta
                 if not e_nova_pergunta_desambigua:
+                    # Se retornou um horário válido, usar essa resposta
                     try:
                         from utils.response_cache import cache_response
                         cache_response(mensagem, resposta_desambigua)
                     except:
                         pass  # Se não conseguir cachear, continua mesmo assim
                     return tratar_nome_usuario(resposta_desambigua, nome_usuario_ctx)
-                # Se retornou nova pergunta, continuar o fluxo normal (não deve acontecer, mas por segurança)
-            
-            # Se há pergunta pendente mas não é resposta simples, verificar outras variações
-            if tem_pergunta_pendente and not e_resposta_simples:
-                # Verificar se é uma resposta de desambiguação (turma a, classe b, etc.)
-                e_resposta_desambigua = (
-                    mensagem_limpa.startswith('a ') or mensagem_limpa.startswith('b ') or
-                    mensagem_limpa == 'turma a' or mensagem_limpa == 'turma b' or
-                    mensagem_limpa == 'classe a' or mensagem_limpa == 'classe b' or
-                    'turma a' in mensagem_limpa or 'turma b' in mensagem_limpa or
-                    'classe a' in mensagem_limpa or 'classe b' in mensagem_limpa
-                )
-                
-                if e_resposta_desambigua:
-                    # Processar resposta de desambiguação imediatamente
-                    resposta_desambigua = obter_resposta_fallback(mensagem, historico_chat)
-                    # Verificar se retornou um horário (não outra pergunta de desambiguação)
-                    resposta_lower = resposta_desambigua.lower()
-                    # Se não retornou uma nova pergunta de desambiguação, usar a resposta
-                    e_nova_pergunta_desambigua = (
-                        'encontrei referência' in resposta_lower or
-                        'qual turma' in resposta_lower or
-                        'me informe qual turma' in resposta_lower
-                    )
-                    
-                    if not e_nova_pergunta_desambigua:
-                        # Se retornou um horário válido, usar essa resposta
-                        try:
-                            from utils.response_cache import cache_response
-                            cache_response(mensagem, resposta_desambigua)
-                        except:
-                            pass  # Se não conseguir cachear, continua mesmo assim
-                        return tratar_nome_usuario(resposta_desambigua, nome_usuario_ctx)
-        
-        # 0) Verificar cache primeiro (antes de qualquer processamento)
-        from utils.response_cache import get_cached_response, cache_response
-        from info.horarios import carregar_horarios_professores
-        
-        # NÃO usar cache para perguntas sobre professores/horários (sempre buscar informações atualizadas)
-        area_dois_keywords = ['área dois', 'area dois', 'área 2', 'area 2', 'área ii', 'area ii']
-        professores_disponiveis = [p.lower() for p in carregar_horarios_professores().keys()]
-        tem_professor_na_mensagem = any(prof.lower() in mensagem_lower for prof in professores_disponiveis)
-        eh_pergunta_horario = _eh_pergunta_sobre_horarios(mensagem)
-        
-        # Pular cache se for pergunta sobre área dois, professores ou horários
-        if any(k in mensagem_lower for k in area_dois_keywords) or (tem_professor_na_mensagem and eh_pergunta_horario):
-            cached_response = None
-        else:
-            cached_response = get_cached_response(mensagem)
-        if cached_response:
-            # Sempre tratar o nome do usuário ao recuperar do cache
-            # (o cache não deve conter nomes de usuários)
-            return tratar_nome_usuario(cached_response, nome_usuario_ctx)
-
-        # 1) Small-talk: tratar imediatamente com fallback (cumprimentos, despedidas, agradecimentos)
-        if _e_small_talk(mensagem_lower):
-            # Cumprimentos
-            if any(p in mensagem_lower for p in ['olá', 'ola', 'oi', 'bom dia', 'boa tarde', 'boa noite']):
-                resposta_base = RESPOSTAS_PADRAO["saudacao"]
-                cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
-                resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
-                return resposta
-            # Agradecimentos
-            if any(p in mensagem_lower for p in ['obrigado', 'obrigada', 'valeu', 'agradeco', 'agradeço', 'perfeito', 'show', 'ok']):
-                resposta_base = RESPOSTAS_PADRAO["agradecimento"]
-                cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
-                resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
-                return resposta
-            # Despedidas
-            if any(p in mensagem_lower for p in ['tchau', 'até', 'ate', 'flw', 'falou', 'até logo', 'ate logo']):
-                resposta_base = RESPOSTAS_PADRAO["despedida"]
-                cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
-                resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
-                return resposta
-            # Nome do bot
-            if any(p in mensagem_lower for p in ['qual seu nome', 'como você se chama', 'quem é você', 'quem é vc', 'quem e voce', 'quem e vc']):
-                resposta_base = RESPOSTAS_PADRAO["nome"]
-                cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
-                resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
-                return resposta
-            # Confirmações simples
-            if any(p in mensagem_lower for p in ['beleza', 'blz', 'tá bom', 'ta bom']):
-                resposta_base = RESPOSTAS_PADRAO["confirmacao"]
-                cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
-                resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
-                return resposta
-            # Default fallback para outros casos de small talk
-            resposta_base = obter_resposta_fallback(mensagem, historico_chat)
+    
+    # 0) Verificar cache primeiro (antes de qualquer processamento)
+    from utils.response_cache import get_cached_response, cache_response
+    
+    # NÃO usar cache para perguntas sobre professores/horários (sempre buscar informações atualizadas)
+    # Pular cache se for pergunta sobre área dois, professores, horários ou o momento atual ("agora")
+    if (intencao.tem('area_dois') or (intencao.professor_mencionado and intencao.horario_escolar)
+            or (intencao.tem('tempo_real') and intencao.horario_escolar)):
+        cached_response = None
+    else:
+        cached_response = get_cached_response(mensagem, contexto)
+    if cached_response:
+        # Sempre tratar o nome do usuário ao recuperar do cache
+        # (o cache não deve conter nomes de usuários)
+        return tratar_nome_usuario(cached_response, nome_usuario_ctx)
+
+    # 1) Small-talk: tratar imediatamente com fallback (cumprimentos, despedidas, agradecimentos)
+    if intencao.small_talk:
+        # Cumprimentos
+        if intencao.tem('cumprimento'):
+            resposta_base = RESPOSTAS_PADRAO["saudacao"]
             cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
             resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
             return resposta
-
-        # 2) Perguntas sobre horários: usar fallback (para não pesar no LM Studio)
-        # Verificar primeiro se é pergunta específica sobre horários da biblioteca
-        if any(p in mensagem_lower for p in ['horário', 'horario', 'horários', 'horarios']) and any(p in mensagem_lower for p in ['biblioteca', 'bibliote']):
-            informacao_especifica = obter_informacao_especifica(mensagem)
-            if informacao_especifica:
-                resposta_final = _adicionar_informacoes_contato(_substituir_placeholders(informacao_especifica))
-                cache_response(mensagem, resposta_final)  # Salvar sem nome do usuário
-                resposta_tratada = tratar_nome_usuario(resposta_final, nome_usuario_ctx)
-                return resposta_tratada
-        
-        if _eh_pergunta_sobre_horarios(mensagem):
-            resposta_base = obter_resposta_fallback(mensagem, historico_chat)
+        # Agradecimentos
+        if intencao.tem('agradecimento'):
+            resposta_base = RESPOSTAS_PADRAO["agradecimento"]
             cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
             resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
             return resposta
-
-        # 2.5) Perguntas sobre contato (email, telefone): verificar informações específicas primeiro
-        if any(palavra in mensagem_lower for palavra in ['email', 'e-mail', 'correio eletronico', 'correio eletrônico', 
-                                                          'telefone', 'fone', 'whatsapp', 'contato']):
-            informacao_especifica = obter_informacao_especifica(mensagem)
-            if informacao_especifica:
-                resposta_final = _adicionar_informacoes_contato(_substituir_placeholders(informacao_especifica))
-                cache_response(mensagem, resposta_final)  # Salvar sem nome do usuário
-                resposta_tratada = tratar_nome_usuario(resposta_final, nome_usuario_ctx)
-                return resposta_tratada
-
-        # 3) Perguntas de localização: usar fallback (onde fica, como chegar, etc.)
-        if _eh_pergunta_localizacao(mensagem):
-            informacao_especifica = obter_informacao_especifica(mensagem)
-            if informacao_especifica:
-                resposta_final = _adicionar_informacoes_contato(_substituir_placeholders(informacao_especifica))
-                cache_response(mensagem, resposta_final)  # Salvar sem nome do usuário
-                resposta_tratada = tratar_nome_usuario(resposta_final, nome_usuario_ctx)
-                return resposta_tratada
-            # Caso nenhuma informação específica seja encontrada, usa fallback padrão
-            resposta_base = RESPOSTAS_PADRAO.get("local_nao_encontrado", obter_resposta_fallback(mensagem, historico_chat))
+        # Despedidas
+        if intencao.tem('despedida'):
+            resposta_base = RESPOSTAS_PADRAO["despedida"]
             cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
             resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
             return resposta
+        # Nome do bot
+        if intencao.tem('nome_bot'):
+            resposta_base = RESPOSTAS_PADRAO["nome"]
+            cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
+            resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
+            return resposta
+        # Confirmações simples
+        if intencao.tem('confirmacao'):
+            resposta_base = RESPOSTAS_PADRAO["confirmacao"]
+            cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
+            resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
+            return resposta
+        # Default fallback para outros casos de small talk
+        resposta_base = obter_resposta_fallback(mensagem, historico_chat, contexto)
+        cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
+        resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
+        return resposta
+
+    # 2) Perguntas sobre horários: usar fallback (para não pesar no LM Studio)
+    # Verificar primeiro se é pergunta específica sobre horários da biblioteca
+    if intencao.tem('horario') and intencao.tem('biblioteca'):
+        informacao_especifica = obter_informacao_especifica(mensagem, contexto)
+        if informacao_especifica:
+            resposta_final = _adicionar_informacoes_contato(_substituir_placeholders(informacao_especifica))
+            cache_response(mensagem, resposta_final)  # Salvar sem nome do usuário
+            resposta_tratada = tratar_nome_usuario(resposta_final, nome_usuario_ctx)
+            return resposta_tratada
+    
+    if intencao.horario_escolar:
+        resposta_base = obter_resposta_fallback(mensagem, historico_chat, contexto)
+        if not intencao.tem('tempo_real'):  # respostas sobre "agora" mudam com o horário
+            cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
+        resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
+        return resposta
+
+    # 2.5) Perguntas sobre contato (email, telefone): verificar informações específicas primeiro
+    if intencao.tem('contato_rapido'):
+        informacao_especifica = obter_informacao_especifica(mensagem, contexto)
+        if informacao_especifica:
+            resposta_final = _adicionar_informacoes_contato(_substituir_placeholders(informacao_especifica))
+            cache_response(mensagem, resposta_final)  # Salvar sem nome do usuário
+            resposta_tratada = tratar_nome_usuario(resposta_final, nome_usuario_ctx)
+            return resposta_tratada
+
+    # 3) Perguntas de localização: usar fallback (onde fica, como chegar, etc.)
+    if intencao.localizacao:
+        informacao_especifica = obter_informacao_especifica(mensagem, contexto)
+        if informacao_especifica:
+            resposta_final = _adicionar_informacoes_contato(_substituir_placeholders(informacao_especifica))
+            cache_response(mensagem, resposta_final)  # Salvar sem nome do usuário
+            resposta_tratada = tratar_nome_usuario(resposta_final, nome_usuario_ctx)
+            return resposta_tratada
+        # Caso nenhuma informação específica seja encontrada, usa fallback padrão
+        resposta_base = RESPOSTAS_PADRAO.get("local_nao_encontrado", obter_resposta_fallback(mensagem, historico_chat, contexto))
+        cache_response(mensagem, resposta_base)  # Salvar sem nome do usuário
+        resposta = tratar_nome_usuario(resposta_base, nome_usuario_ctx)
+        return resposta
+
+    return None
+
+# Marcadores que encerram a geração do modelo (evita que ele "continue" a conversa)
+STOP_LM_STUDIO = ["Usuário:", "Sistema:", "Assistente SENAI:"]
+
+def _contexto_para_prompt(mensagem: str) -> str:
+    """Bloco de informações do módulo info/ usado no prompt do LM Studio.
+
+    Só os trechos da base relevantes para a pergunta (busca BM25 em
+    info/retrieval.py), dentro do orçamento de tokens. As regras fixas não
+    entram aqui: ficam no prefixo de sistema (PREFIXO_SISTEMA_LM).
+    """
+    return format_senai_info_for_prompt(mensagem, incluir_regras=False)
+
+def _chave_coalescencia(mensagem: str, base_completa: str, prompt: List[Dict[str, str]]) -> str:
+    """Chave do single-flight: pergunta normalizada + hash do contexto do prompt.
+
+    O hash cobre o bloco de informações e as mensagens antes da pergunta
+    (sistema, resumo e histórico): "me fale mais" em conversas diferentes
+    não compartilha a resposta.
+    """
+    pergunta = _remover_acentos((mensagem or '').lower())
+    pergunta = ' '.join(re.sub(r'[^\w\s]', ' ', pergunta).split())
+    assinatura = hashlib.sha1(base_completa.encode('utf-8'))
+    assinatura.update(json.dumps(prompt[:-1], ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    return f"{pergunta}|{assinatura.hexdigest()[:16]}"
+
+# Instruções fixas do prompt do LM Studio
+INSTRUCOES_PROMPT_LM = (
+    "IMPORTANTE: Use EXCLUSIVAMENTE as informações estruturadas do módulo info/ fornecidas abaixo. "
+    "Responda de forma cordial, objetiva e profissional. "
+    "Seja detalhado e informativo, mas mantenha o tom amigável. "
+    "Mantenha continuidade com a conversa anterior. "
+    "Baseie suas respostas nas informações oficiais do SENAI São Carlos.\n\n"
+    "INSTRUÇÕES ESPECIAIS:\n"
+    "- Se a pergunta for sobre o CONTEÚDO de uma sala/banheiro/instalação (ex: 'o que tem no banheiro', 'o que tem na biblioteca', 'quais laboratórios existem?'), "
+    "use as informações de INFRAESTRUTURA E INSTALAÇÕES fornecidas abaixo para descrever o que existe naquele local.\n"
+    "- Se a pergunta for sobre LOCALIZAÇÃO ESPECÍFICA (ex: 'onde fica o banheiro', 'onde fica a sala 315'), essas perguntas são tratadas pelo sistema de fallback. "
+    "Se você receber uma pergunta sobre localização, oriente o usuário a reformular ou use as informações básicas fornecidas.\n"
+    "- IMPORTANTE: Perguntas sobre HORÁRIOS de aulas/professores/turmas (ex: 'qual professor está na sala 315?', 'qual turma está na sala 322?') "
+    "são tratadas pelo sistema de fallback e não devem ser respondidas aqui. Se receber uma pergunta sobre horários, oriente que essas informações são consultadas diretamente no sistema.\n"
+    "- Se as informações sobre conteúdo não estiverem disponíveis, seja honesto e informe que não tem essa informação específica e oriente a entrar em contato."
+)
+
+# Mensagem de sistema de todo prompt do chat: persona, dados oficiais e regras.
+# Não muda entre requisições (nada por pergunta ou por usuário aqui), para que o
+# LM Studio reaproveite o cache KV desse prefixo em vez de processá-lo a cada turno
+PREFIXO_SISTEMA_LM = f"{PROMPT_SISTEMA_BASE}\n\n{INSTRUCOES_PROMPT_LM}\n\n{REGRAS_PROMPT}"
+
+def _montar_prompt_inteligente(mensagem: str, historico_chat: List[Dict], base_completa: str,
+                               resumo: Optional[str] = None) -> List[Dict[str, str]]:
+    """Monta as mensagens enviadas ao LM Studio: prefixo de sistema fixo (seguido do resumo
+    da conversa, se houver), histórico, e por último as informações do módulo info/ com a pergunta.
+
+    As partes são encaixadas no orçamento de tokens do modelo (utils/prompt_builder.py).
+    """
+    # O histórico do turno já termina com a pergunta atual, que entra por último
+    if historico_chat and (historico_chat[-1].get('text') or historico_chat[-1].get('texto')) == mensagem:
+        historico_chat = historico_chat[:-1]
+    return prompt_builder.montar(PREFIXO_SISTEMA_LM, base_completa, historico_chat, mensagem, resumo).mensagens
+
+def _finalizar_resposta_lm(mensagem: str, texto: Optional[str], nome_usuario_ctx: str,
+                           completa: bool = True) -> Optional[str]:
+    """Aplica os pós-processamentos ao texto do LM Studio, salva no cache e personaliza.
+
+    Se o modelo não retornou algo útil, usa a resposta rica baseada em info_manager.
+    Retorna None quando nenhuma das duas estiver disponível. Só a resposta
+    completa do modelo vai para o cache: um texto cortado (completa=False,
+    stream interrompido) recebe o aviso de resposta interrompida, e a resposta
+    rica (modelo recusado pelo agendador, disjuntor aberto, falha) vale só para
+    esta mensagem, para que um cliente sem fichas não fixe a resposta degradada
+    no cache de todos.
+    """
+    from utils.response_cache import cache_response
+
+    if texto:
+        resposta_limpa = limpar_resposta(texto)
+        if resposta_limpa.strip() and len(resposta_limpa.strip()) > 20:
+            resposta_final = _adicionar_informacoes_contato(_substituir_placeholders(resposta_limpa))
+            resposta_final = _corrigir_informacoes_banheiro(resposta_final)
+            if completa:
+                cache_response(mensagem, resposta_final)  # Salvar sem nome do usuário
+            else:
+                resposta_final = f"{resposta_final}\n\n{RESPOSTAS_PADRAO['resposta_interrompida']}"
+            return tratar_nome_usuario(resposta_final, nome_usuario_ctx)
+    # LM Studio não retornou algo útil: usar resposta rica baseada em info_manager
+    resposta_rica = _gerar_resposta_rica_sobre_senai(mensagem)
+    if resposta_rica:
+        resposta_rica = _adicionar_informacoes_contato(_substituir_placeholders(resposta_rica))
+        resposta_rica = _corrigir_informacoes_banheiro(resposta_rica)
+        return tratar_nome_usuario(resposta_rica, nome_usuario_ctx)
+    return None
+
+def _responder_fallback_final(mensagem: str, historico_chat: List[Dict], nome_usuario_ctx: str,
+                              contexto: Optional[ContextoMensagem] = None, armazenar: bool = True) -> str:
+    """Resposta genérica usada quando nenhuma outra rota respondeu.
+
+    armazenar=False quando a mensagem deveria ter sido respondida pelo modelo:
+    o fallback só substitui a resposta dele e não vai para o cache.
+    """
+    from utils.response_cache import cache_response
+
+    resposta_fallback_base = obter_resposta_fallback(mensagem, historico_chat, contexto)
+    if armazenar:
+        cache_response(mensagem, resposta_fallback_base)  # Salvar sem nome do usuário
+    return tratar_nome_usuario(resposta_fallback_base, nome_usuario_ctx)
+
+def processar_mensagem(mensagem: str, historico_chat: List[Dict], resumo: Optional[str] = None) -> str:
+    """Processa a mensagem e retorna uma resposta com arquitetura inteligente
+
+    `resumo` é o resumo das mensagens anteriores ao histórico (utils/chat_summarizer.py).
+    """
+    try:
+        nome_usuario_ctx = _extrair_nome_do_historico(historico_chat)
+
+        # Formas normalizadas e intenção calculadas uma vez, reutilizadas por todas as etapas
+        contexto = criar_contexto(mensagem)
+        resposta = _responder_rotas_rapidas(mensagem, historico_chat, nome_usuario_ctx, contexto)
+        if resposta is not None:
+            return resposta
 
         # 3) TODO O RESTO: usar LM Studio para responder
-        if _deve_usar_lm_studio(mensagem, historico_chat):
+        if contexto.intencao.usar_lm:
             try:
-                historico_formatado = formatar_historico_chat_para_prompt(historico_chat)
-                # Para perguntas sobre eventos, usar informações contextuais para destacar eventos
-                # Para outras perguntas, usar informações completas
-                mensagem_lower = mensagem.lower()
-                e_pergunta_eventos = any(word in mensagem_lower for word in [
-                    'evento', 'eventos', 'feira', 'feiras', 'hackathon', 'semana', 'atividade', 
-                    'atividades', 'fórum', 'forum', 'palestra', 'palestras', 'workshop', 'workshops',
-                    'exposição', 'exposicao', 'exposições', 'exposicoes'
-                ])
-                # Usar informações contextuais para eventos (mais focadas) ou completas para outras perguntas
-                base_completa = format_senai_info_for_prompt(mensagem, include_all=not e_pergunta_eventos)
-                prompt_inteligente = (
-                    "Você é o Cadu, assistente virtual do SenAI, ferramenta de auxilio para o SENAI São Carlos. "
-                    "IMPORTANTE: Use EXCLUSIVAMENTE as informações estruturadas do módulo info/ fornecidas abaixo. "
-                    "Responda de forma cordial, objetiva e profissional. "
-                    "Seja detalhado e informativo, mas mantenha o tom amigável. "
-                    "Mantenha continuidade com a conversa anterior. "
-                    "Baseie suas respostas nas informações oficiais do SENAI São Carlos.\n\n"
-                    "INSTRUÇÕES ESPECIAIS:\n"
-                    "- Se a pergunta for sobre o CONTEÚDO de uma sala/banheiro/instalação (ex: 'o que tem no banheiro', 'o que tem na biblioteca', 'quais laboratórios existem?'), "
-                    "use as informações de INFRAESTRUTURA E INSTALAÇÕES fornecidas abaixo para descrever o que existe naquele local.\n"
-                    "- Se a pergunta for sobre LOCALIZAÇÃO ESPECÍFICA (ex: 'onde fica o banheiro', 'onde fica a sala 315'), essas perguntas são tratadas pelo sistema de fallback. "
-                    "Se você receber uma pergunta sobre localização, oriente o usuário a reformular ou use as informações básicas fornecidas.\n"
-                    "- IMPORTANTE: Perguntas sobre HORÁRIOS de aulas/professores/turmas (ex: 'qual professor está na sala 315?', 'qual turma está na sala 322?') "
-                    "são tratadas pelo sistema de fallback e não devem ser respondidas aqui. Se receber uma pergunta sobre horários, oriente que essas informações são consultadas diretamente no sistema.\n"
-                    "- Se as informações sobre conteúdo não estiverem disponíveis, seja honesto e informe que não tem essa informação específica e oriente a entrar em contato.\n\n"
-                    f"{base_completa}\n\n"
-                    f"Histórico da conversa:\n{historico_formatado}\n\n"
-                    f"Usuário: {mensagem}\n\n"
-                    f"Assistente SENAI:"
+                base_completa = _contexto_para_prompt(mensagem)
+                prompt_inteligente = _montar_prompt_inteligente(mensagem, historico_chat, base_completa, resumo)
+                # Perguntas idênticas simultâneas compartilham a mesma chamada ao modelo
+                texto = lm_singleflight.fazer(
+                    _chave_coalescencia(mensagem, base_completa, prompt_inteligente),
+                    lambda: _chamar_lm_studio(prompt_inteligente, stop=STOP_LM_STUDIO)
                 )
-                texto = _chamar_lm_studio(prompt_inteligente, stop=["Usuário:", "Sistema:", "Assistente SENAI:"])
-                if texto:
-                    resposta_limpa = limpar_resposta(texto)
-                    if resposta_limpa.strip() and len(resposta_limpa.strip()) > 20:
-                        resposta_final = _adicionar_informacoes_contato(_substituir_placeholders(resposta_limpa))
-                        resposta_final = _corrigir_informacoes_banheiro(resposta_final)
-                        cache_response(mensagem, resposta_final)  # Salvar sem nome do usuário
-                        resposta_tratada = tratar_nome_usuario(resposta_final, nome_usuario_ctx)
-                        return resposta_tratada
-                # LM Studio não retornou algo útil: usar resposta rica baseada em info_manager
-                resposta_rica = _gerar_resposta_rica_sobre_senai(mensagem)
-                if resposta_rica:
-                    resposta_rica = _adicionar_informacoes_contato(_substituir_placeholders(resposta_rica))
-                    resposta_rica = _corrigir_informacoes_banheiro(resposta_rica)
-                    cache_response(mensagem, resposta_rica)  # Salvar sem nome do usuário
-                    resposta_tratada = tratar_nome_usuario(resposta_rica, nome_usuario_ctx)
-                    return resposta_tratada
+                resposta = _finalizar_resposta_lm(mensagem, texto, nome_usuario_ctx)
+                if resposta:
+                    return resposta
             except Exception as e:
                 # Se LM Studio falhar, usar fallback genérico
                 print(f"Erro ao chamar LM Studio: {e}")
-                pass
         
         # FALLBACK FINAL: Se LM Studio não funcionou, usar resposta genérica
-        resposta_fallback_base = obter_resposta_fallback(mensagem, historico_chat)
-        cache_response(mensagem, resposta_fallback_base)  # Salvar sem nome do usuário
-        resposta_fallback = tratar_nome_usuario(resposta_fallback_base, nome_usuario_ctx)
-        return resposta_fallback
+        return _responder_fallback_final(mensagem, historico_chat, nome_usuario_ctx, contexto,
+                                         armazenar=not contexto.intencao.usar_lm)
 
     except Exception as e:
         # Fallback final para qualquer erro não tratado
         nome_usuario_fallback = _extrair_nome_do_historico(historico_chat)
-        resposta_fallback_base = obter_resposta_fallback(mensagem, historico_chat)
-        cache_response(mensagem, resposta_fallback_base)  # Salvar sem nome do usuário
-        resposta_fallback = tratar_nome_usuario(resposta_fallback_base, nome_usuario_fallback)
-        return resposta_fallback
+        return _responder_fallback_final(mensagem, historico_chat, nome_usuario_fallback, armazenar=False)
+
+class _LimpezaIncremental:
+    """Aplica limpar_resposta/_substituir_placeholders a um texto que chega em pedaços.
+
+    Só emite a parte que já não pode mais mudar: segura o início até ser possível
+    remover prefixos ("Sistema:", "Assistente SENAI:" ...), espaços no fim (podem
+    virar quebra de linha) e placeholders ainda abertos ("{tele").
+    """
+
+    _TAMANHO_MAX_PREFIXO = 24
+
+    def __init__(self):
+        self.bruto = ''
+        self.enviado = ''
+
+    def _estavel(self) -> str:
+        texto = self.bruto
+        abre = texto.rfind('{')
+        if abre != -1 and '}' not in texto[abre:] and len(texto) - abre <= 12:
+            texto = texto[:abre]
+        return texto
+
+    def alimentar(self, pedaco: str) -> str:
+        """Recebe um pedaço bruto do modelo e retorna o trecho limpo que pode ser enviado."""
+        self.bruto += pedaco
+        if len(self.bruto.lstrip()) < self._TAMANHO_MAX_PREFIXO:
+            return ''
+        limpo = _substituir_placeholders(limpar_resposta(self._estavel()))
+        if not limpo.startswith(self.enviado):
+            # A limpeza reescreveu algo já enviado; o texto final corrige no evento de término
+            return ''
+        trecho = limpo[len(self.enviado):]
+        self.enviado = limpo
+        return trecho
+
+def processar_mensagem_stream(mensagem: str, historico_chat: List[Dict], resumo: Optional[str] = None) -> Iterator[Dict]:
+    """Versão em streaming de processar_mensagem.
+
+    Gera eventos {'tipo': 'delta', 'texto': ...} enquanto o LM Studio produz tokens
+    e termina sempre com {'tipo': 'fim', 'resposta': ...}, contendo o texto final
+    (pós-processado, igual ao que processar_mensagem retornaria) para ser salvo
+    e exibido no lugar dos pedaços.
+    """
+    nome_usuario_ctx = _extrair_nome_do_historico(historico_chat)
+    contexto = None
+    # O fallback só vai para o cache quando é a resposta prevista (sem modelo e sem erro)
+    armazenar_fallback = False
+    try:
+        contexto = criar_contexto(mensagem)
+        resposta = _responder_rotas_rapidas(mensagem, historico_chat, nome_usuario_ctx, contexto)
+        usar_lm = resposta is None and contexto.intencao.usar_lm
+        armazenar_fallback = not contexto.intencao.usar_lm
+    except Exception as e:
+        print(f"Erro ao processar mensagem: {e}")
+        resposta, usar_lm = None, False
+
+    if usar_lm:
+        partes = []
+        completa = True
+        limpeza = _LimpezaIncremental()
+        try:
+            base_completa = _contexto_para_prompt(mensagem)
+            prompt_inteligente = _montar_prompt_inteligente(mensagem, historico_chat, base_completa, resumo)
+            pedacos = lm_singleflight.transmitir(
+                _chave_coalescencia(mensagem, base_completa, prompt_inteligente),
+                lambda: inference_scheduler.transmitir(
+                    lambda: lm_client.stream(prompt_inteligente, stop=STOP_LM_STUDIO, max_tokens=LM_MAX_RESPONSE_TOKENS)
+                )
+            )
+            for pedaco in pedacos:
+                partes.append(pedaco)
+                trecho = limpeza.alimentar(pedaco)
+                if trecho:
+                    yield {'tipo': 'delta', 'texto': trecho}
+        except (StreamInterrompido, VooInterrompido) as e:
+            print(f"Resposta do LM Studio interrompida: {e}")
+            completa = False
+        except Exception as e:
+            print(f"Erro ao chamar LM Studio (stream): {e}")
+            completa = False
+        try:
+            resposta = _finalizar_resposta_lm(mensagem, ''.join(partes), nome_usuario_ctx, completa)
+        except Exception as e:
+            print(f"Erro ao finalizar resposta do LM Studio: {e}")
+
+    if resposta is None:
+        resposta = _responder_fallback_final(mensagem, historico_chat, nome_usuario_ctx, contexto,
+                                             armazenar=armazenar_fallback)
+    yield {'tipo': 'fim', 'resposta': resposta}
 
 def _extrair_nome_do_historico(historico_chat: List[Dict]) -> str:
     """Tenta extrair o nome do usuário do histórico (campo nome_usuario)."""
@@ -0,0 +1,186 @@
+"""
+Resumo contínuo das conversas longas (opcional, CHAT_SUMMARY_ENABLED)
+
+Sem resumo, o prompt leva só a janela de mensagens recentes: conversas longas
+perdem o contexto do começo, e a janela inteira custa prefill a cada turno.
+Com o resumo ligado, quando a conversa acumula CHAT_SUMMARY_EVERY turnos além
+das CHAT_SUMMARY_KEEP mensagens mais recentes, uma tarefa em segundo plano
+condensa essas mensagens antigas (junto com o resumo anterior) em um resumo
+curto, guardado em Chat.resumo; Chat.resumo_ate marca a última mensagem
+incluída. O turno seguinte carrega o resumo e só as mensagens depois dele
+(utils/session_manager.py), e o prompt fica com tamanho estável.
+
+Os lotes andam das mensagens mais antigas ainda não resumidas para as mais
+novas, sem pular nenhuma: numa conversa com muitas mensagens pendentes (resumo
+adiado, falha do modelo, resumo ligado numa conversa já longa) a tarefa resume
+um lote atrás do outro até restarem menos de CHAT_SUMMARY_KEEP + um lote.
+
+A tarefa tem prioridade baixa: roda em uma thread própria, uma conversa por
+vez, só chama o modelo quando o agendador está sem fila e entra nele como o
+cliente 'resumo' (o balde de fichas limita quantos resumos por minuto
+disputam o modelo com os usuários). Se não der agora, a conversa é tentada de
+novo no próximo turno, do ponto em que parou.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import func
+
+from config import CHAT_SUMMARY_ENABLED, CHAT_SUMMARY_EVERY, CHAT_SUMMARY_KEEP, CHAT_SUMMARY_MAX_TOKENS
+from models.sqlalchemy_models import db, Chat, Mensagem
+from utils.inference_scheduler import inference_scheduler, cliente_inferencia
+from utils.lm_client import lm_client
+
+CLIENTE_RESUMO = 'resumo'
+
+# Caracteres de cada mensagem enviados ao modelo para resumir
+TAMANHO_MENSAGEM_RESUMO = 500
+
+INSTRUCOES_RESUMO = (
+    "Você resume conversas entre um usuário e o Cadu, assistente virtual do SENAI São Carlos. "
+    "Escreva em português, em terceira pessoa e em poucas frases, o que o usuário perguntou, "
+    "o que já foi respondido e qualquer dado pessoal ou preferência que ele informou (como o nome). "
+    "Não invente nada que não esteja na conversa. Responda só com o resumo."
+)
+
+
+class ResumidorChats:
+    """Fila de conversas a resumir, processada em segundo plano uma por vez."""
+
+    def __init__(self, ativo: bool = CHAT_SUMMARY_ENABLED, a_cada: int = CHAT_SUMMARY_EVERY,
+                 manter: int = CHAT_SUMMARY_KEEP, max_tokens: int = CHAT_SUMMARY_MAX_TOKENS):
+        self.ativo = ativo
+        # Mensagens resumidas por vez (pares pergunta/resposta)
+        self.lote = max(1, int(a_cada)) * 2
+        self.manter = max(0, int(manter))
+        self.max_tokens = max(16, int(max_tokens))
+        self._app = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pendentes: Set[int] = set()
+        self._lock = threading.Lock()
+        self._resumidos = 0
+        self._adiados = 0
+        self._falhas = 0
+
+    def init_app(self, app) -> None:
+        """Guarda o app Flask (a tarefa precisa de app_context para usar o banco)."""
+        self._app = app
+
+    def agendar(self, chat_pk: Optional[int]) -> None:
+        """Pede o resumo da conversa, se estiver ligado; ignora se ela já está na fila."""
+        if not self.ativo or self._app is None or chat_pk is None:
+            return
+        with self._lock:
+            if chat_pk in self._pendentes:
+                return
+            self._pendentes.add(chat_pk)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='resumo')
+        self._executor.submit(self._executar, chat_pk)
+
+    def _executar(self, chat_pk: int) -> None:
+        try:
+            with self._app.app_context():
+                # Um lote por vez até o que falta resumir caber na janela
+                while self._resumir(chat_pk):
+                    pass
+        except Exception as e:
+            print(f"Erro ao resumir conversa {chat_pk}: {e}")
+            with self._lock:
+                self._falhas += 1
+        finally:
+            with self._lock:
+                self._pendentes.discard(chat_pk)
+
+    def _resumir(self, chat_pk: int) -> bool:
+        """Resume o lote mais antigo ainda não resumido; True se gravou um resumo novo."""
+        chat = db.session.query(Chat.resumo, Chat.resumo_ate).filter(Chat.id == chat_pk).first()
+        if not chat:
+            return False
+        filtro = [Mensagem.chat_id == chat_pk]
+        if chat.resumo_ate is not None:
+            filtro.append(Mensagem.id > chat.resumo_ate)
+        pendentes = db.session.query(func.count(Mensagem.id)).filter(*filtro).scalar() or 0
+        if pendentes < self.manter + self.lote:
+            db.session.rollback()
+            return False
+        if not inference_scheduler.ocioso():
+            db.session.rollback()
+            with self._lock:
+                self._adiados += 1
+            return False
+
+        # As 'lote' mensagens não resumidas mais antigas: como há pelo menos
+        # manter + lote pendentes, as 'manter' mais recentes ficam inteiras
+        mensagens: List[Mensagem] = (
+            Mensagem.query.filter(*filtro)
+            .order_by(Mensagem.id.asc())
+            .limit(self.lote)
+            .all()
+        )
+        conversa = [(msg.sender, msg.text) for msg in mensagens]
+        ultima = mensagens[-1].id
+        # Só leitura até aqui: devolve a conexão ao pool durante a chamada ao modelo
+        db.session.rollback()
+
+        resumo = self._gerar(chat.resumo, conversa)
+        if not resumo:
+            with self._lock:
+                self._falhas += 1
+            return False
+
+        # Só grava se outro processo não resumiu a conversa enquanto isso; updated_at
+        # fica como está (o resumo não muda a ordem da lista de chats)
+        condicao = Chat.resumo_ate.is_(None) if chat.resumo_ate is None else Chat.resumo_ate == chat.resumo_ate
+        gravados = db.session.query(Chat).filter(Chat.id == chat_pk, condicao).update(
+            {Chat.resumo: resumo, Chat.resumo_ate: ultima, Chat.updated_at: Chat.updated_at},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if not gravados:
+            return False
+        with self._lock:
+            self._resumidos += 1
+        print(f"Resumo da conversa {chat_pk} atualizado ({len(conversa)} mensagens, {len(resumo)} caracteres)")
+        return True
+
+    def _gerar(self, resumo_anterior: Optional[str], conversa: List) -> Optional[str]:
+        """Chama o modelo (pelo agendador, como cliente 'resumo') para o resumo atualizado."""
+        linhas = []
+        for remetente, texto in conversa:
+            rotulo = 'Usuário' if remetente == 'user' else 'Assistente'
+            texto = texto or ''
+            if len(texto) > TAMANHO_MENSAGEM_RESUMO:
+                texto = texto[:TAMANHO_MENSAGEM_RESUMO] + '...'
+            linhas.append(f"{rotulo}: {texto}")
+        pedido = ''
+        if resumo_anterior:
+            pedido += f"Resumo anterior da conversa:\n{resumo_anterior}\n\n"
+        pedido += "Mensagens seguintes:\n" + '\n'.join(linhas) + "\n\nEscreva o resumo atualizado da conversa."
+        mensagens = [
+            {'role': 'system', 'content': INSTRUCOES_RESUMO},
+            {'role': 'user', 'content': pedido},
+        ]
+        with cliente_inferencia(CLIENTE_RESUMO):
+            texto = inference_scheduler.executar(
+                lambda: lm_client.completar(mensagens, temperature=0.2, max_tokens=self.max_tokens)
+            )
+        texto = (texto or '').strip()
+        # Margem para o limite de tokens não cortar um resumo de tamanho normal
+        return texto[:self.max_tokens * 6] or None
+
+    def estatisticas(self) -> Dict:
+        """Resumos feitos, adiados (modelo ocupado) e com falha."""
+        with self._lock:
+            return {
+                'ativo': self.ativo,
+                'na_fila': len(self._pendentes),
+                'resumidos': self._resumidos,
+                'adiados': self._adiados,
+                'falhas': self._falhas,
+            }
+
+
+# Instância global compartilhada pelo processo
+resumidor_chats = ResumidorChats()
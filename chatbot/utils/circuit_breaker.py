@@ -0,0 +1,164 @@
+"""
+Disjuntor (circuit breaker) das chamadas ao LM Studio
+
+Estados:
+- fechado: as chamadas passam normalmente; o resultado de cada uma (erro ou
+  sucesso, e a latência) entra em uma janela deslizante;
+- aberto: taxa de erro (ou de chamadas lentas) da janela passou do limite.
+  Nenhuma chamada passa: o chatbot vai direto ao fallback, em milissegundos.
+  Uma sonda em segundo plano verifica periodicamente se o servidor voltou;
+- meio-aberto: a sonda respondeu. Passa uma chamada de teste por vez; se ela
+  der certo o disjuntor fecha, se falhar volta a abrir.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from config import (
+    LM_BREAKER_WINDOW, LM_BREAKER_MIN_CALLS, LM_BREAKER_ERROR_RATE,
+    LM_BREAKER_SLOW_CALL, LM_BREAKER_PROBE_INTERVAL
+)
+
+FECHADO = 'fechado'
+ABERTO = 'aberto'
+MEIO_ABERTO = 'meio_aberto'
+
+
+class CircuitBreaker:
+    """Disjuntor com janela deslizante de resultados e sonda de recuperação."""
+
+    def __init__(self, nome: str, sonda: Optional[Callable[[], bool]] = None,
+                 janela: float = LM_BREAKER_WINDOW, min_chamadas: int = LM_BREAKER_MIN_CALLS,
+                 taxa_erro: float = LM_BREAKER_ERROR_RATE, chamada_lenta: float = LM_BREAKER_SLOW_CALL,
+                 intervalo_sonda: float = LM_BREAKER_PROBE_INTERVAL):
+        self.nome = nome
+        self.sonda = sonda
+        self.janela = max(1.0, float(janela))
+        self.min_chamadas = max(1, int(min_chamadas))
+        self.taxa_erro = min(1.0, max(0.0, float(taxa_erro)))
+        # Chamadas mais lentas que isso (s) contam como falha; 0 desliga
+        self.chamada_lenta = max(0.0, float(chamada_lenta))
+        self.intervalo_sonda = max(0.5, float(intervalo_sonda))
+        self._lock = threading.Lock()
+        self._estado = FECHADO
+        # (instante, falhou)
+        self._resultados: Deque[Tuple[float, bool]] = deque()
+        self._teste_em_andamento = False
+        self._aberto_em: Optional[float] = None
+        self._sonda_ativa = False
+        self._aberturas = 0
+        self._recusadas = 0
+
+    @property
+    def estado(self) -> str:
+        return self._estado
+
+    def _descartar_antigos(self, agora: float) -> None:
+        limite = agora - self.janela
+        while self._resultados and self._resultados[0][0] < limite:
+            self._resultados.popleft()
+
+    def permitir(self) -> bool:
+        """True se a chamada pode ir ao servidor; False para ir direto ao fallback."""
+        with self._lock:
+            if self._estado == FECHADO:
+                return True
+            if self._estado == MEIO_ABERTO and not self._teste_em_andamento:
+                self._teste_em_andamento = True
+                return True
+            self._recusadas += 1
+            return False
+
+    def desistir(self) -> None:
+        """A chamada liberada por permitir() não chegou a ser feita (ex.: prazo esgotado)."""
+        with self._lock:
+            if self._estado == MEIO_ABERTO:
+                self._teste_em_andamento = False
+
+    def registrar(self, sucesso: bool, latencia: float = 0.0) -> None:
+        """Registra o resultado de uma chamada que passou por permitir()."""
+        falhou = (not sucesso) or (self.chamada_lenta > 0 and latencia > self.chamada_lenta)
+        iniciar_sonda = False
+        with self._lock:
+            if self._estado == MEIO_ABERTO:
+                self._teste_em_andamento = False
+                if falhou:
+                    iniciar_sonda = self._abrir()
+                else:
+                    self._fechar()
+            elif self._estado == FECHADO:
+                agora = time.monotonic()
+                self._resultados.append((agora, falhou))
+                self._descartar_antigos(agora)
+                total = len(self._resultados)
+                if falhou and total >= self.min_chamadas:
+                    falhas = sum(1 for _, f in self._resultados if f)
+                    if falhas / total >= self.taxa_erro:
+                        iniciar_sonda = self._abrir()
+        if iniciar_sonda:
+            threading.Thread(target=self._sondar, name=f'sonda-{self.nome}', daemon=True).start()
+
+    def _abrir(self) -> bool:
+        """Abre o disjuntor (com o lock). Retorna True se a sonda precisa ser iniciada."""
+        self._estado = ABERTO
+        self._aberto_em = time.monotonic()
+        self._aberturas += 1
+        self._resultados.clear()
+        print(f"Disjuntor '{self.nome}': aberto (indo direto ao fallback)")
+        if self._sonda_ativa:
+            return False
+        self._sonda_ativa = True
+        return True
+
+    def _fechar(self) -> None:
+        self._estado = FECHADO
+        self._aberto_em = None
+        self._resultados.clear()
+        print(f"Disjuntor '{self.nome}': fechado")
+
+    def _sondar(self) -> None:
+        """Sonda em segundo plano: quando o servidor responde, passa a meio-aberto.
+
+        A sonda se dá por encerrada (_sonda_ativa) na mesma seção crítica que
+        muda o estado: se a chamada de teste falhar logo em seguida, _abrir()
+        já inicia outra sonda, em vez de deixar o disjuntor aberto para sempre.
+        """
+        ativa = True
+        try:
+            while True:
+                time.sleep(self.intervalo_sonda)
+                with self._lock:
+                    if self._estado != ABERTO:
+                        self._sonda_ativa = ativa = False
+                        return
+                try:
+                    ok = self.sonda() if self.sonda else True
+                except Exception:
+                    ok = False
+                if ok:
+                    with self._lock:
+                        self._sonda_ativa = ativa = False
+                        if self._estado == ABERTO:
+                            self._estado = MEIO_ABERTO
+                            self._teste_em_andamento = False
+                            print(f"Disjuntor '{self.nome}': meio-aberto (servidor respondeu à sonda)")
+                    return
+        finally:
+            if ativa:
+                with self._lock:
+                    self._sonda_ativa = False
+
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            self._descartar_antigos(time.monotonic())
+            total = len(self._resultados)
+            falhas = sum(1 for _, f in self._resultados if f)
+            return {
+                'estado': self._estado,
+                'chamadas_na_janela': total,
+                'taxa_erro': round(falhas / total, 3) if total else 0.0,
+                'aberto_ha': round(time.monotonic() - self._aberto_em, 1) if self._aberto_em else None,
+                'aberturas': self._aberturas,
+                'recusadas': self._recusadas,
+            }
@@ -0,0 +1,70 @@
+"""
+Contagem de consultas SQL (instrumentação)
+
+Um listener do SQLAlchemy conta cada comando enviado ao banco. Use
+contar_consultas() em volta de um trecho para saber quantas consultas ele fez
+(útil para pegar regressões do tipo N+1):
+
+    with contar_consultas() as contador:
+        session_manager.iniciar_turno(...)
+    print(contador.total, contador.comandos)
+
+A contagem é por thread; trechos aninhados contam nos dois contadores.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = threading.local()
+_lock = threading.Lock()
+_total_processo = 0
+
+
+class ContadorConsultas:
+    """Consultas executadas dentro de um bloco contar_consultas()."""
+
+    __slots__ = ('total', 'comandos')
+
+    def __init__(self):
+        self.total = 0
+        # Primeira palavra de cada comando (SELECT, INSERT, UPDATE...)
+        self.comandos: List[str] = []
+
+    def __repr__(self) -> str:
+        return f"ContadorConsultas(total={self.total}, comandos={self.comandos})"
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _ao_executar(conn, cursor, statement, parameters, context, executemany):
+    global _total_processo
+    with _lock:
+        _total_processo += 1
+    ativos = getattr(_local, 'ativos', None)
+    if not ativos:
+        return
+    comando = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    for contador in ativos:
+        contador.total += 1
+        contador.comandos.append(comando)
+
+
+@contextmanager
+def contar_consultas() -> Iterator[ContadorConsultas]:
+    """Conta as consultas feitas pela thread atual dentro do bloco."""
+    contador = ContadorConsultas()
+    ativos = getattr(_local, 'ativos', None)
+    if ativos is None:
+        ativos = _local.ativos = []
+    ativos.append(contador)
+    try:
+        yield contador
+    finally:
+        ativos.remove(contador)
+
+
+def total_consultas() -> int:
+    """Total de consultas executadas pelo processo desde o início."""
+    return _total_processo
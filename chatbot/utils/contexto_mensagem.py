@@ -0,0 +1,52 @@
+"""
+Contexto normalizado da mensagem
+
+As formas derivadas da mensagem (minúsculas, sem acentos, sem espaços, tokens,
+números de sala, professores/turmas citados e intenção) são calculadas uma
+única vez por turno e repassadas às etapas do pipeline (processar_mensagem,
+obter_resposta_fallback, obter_informacao_especifica, cache).
+"""
+import re
+from typing import Optional, Tuple
+
+from utils.intent_router import ResultadoIntencao, classificar_mensagem
+
+_RE_ESPACOS = re.compile(r'\s+')
+_RE_NUMERO_SALA = re.compile(r'\b(?:sala\s*)?(\d{3})\b')
+_RE_SALA_COLADA = re.compile(r'sala(\d{3})')
+
+
+class ContextoMensagem:
+    """Formas pré-calculadas de uma mensagem do usuário."""
+
+    __slots__ = (
+        'original', 'limpa', 'lower', 'normalizada', 'sem_espacos', 'tokens',
+        'numeros_sala', 'professores', 'turmas', 'intencao'
+    )
+
+    def __init__(self, mensagem: str):
+        self.original: str = mensagem or ''
+        # Sem espaços nas pontas (mantém maiúsculas e acentos)
+        self.limpa: str = self.original.strip()
+        # Minúsculas com espaços compactados (mantém acentos)
+        self.lower: str = _RE_ESPACOS.sub(' ', self.limpa.lower())
+        self.intencao: ResultadoIntencao = classificar_mensagem(self.original)
+        # Minúsculas, sem acentos e com espaços compactados
+        self.normalizada: str = self.intencao.compacta
+        # Sem espaços, hífens e underscores (nomes de turma/sala escritos juntos)
+        self.sem_espacos: str = self.normalizada.replace(' ', '').replace('-', '').replace('_', '')
+        self.tokens = self.intencao.tokens
+        numeros = _RE_NUMERO_SALA.findall(self.lower) or _RE_SALA_COLADA.findall(self.lower.replace(' ', ''))
+        self.numeros_sala: Tuple[str, ...] = tuple(numeros)
+        self.professores: Tuple[str, ...] = self.intencao.professores
+        self.turmas: Tuple[str, ...] = self.intencao.turmas
+
+    def __repr__(self) -> str:
+        return f"ContextoMensagem({self.original!r})"
+
+
+def criar_contexto(mensagem: str, contexto: Optional[ContextoMensagem] = None) -> ContextoMensagem:
+    """Reaproveita o contexto recebido se for da mesma mensagem; senão cria um novo."""
+    if contexto is not None and contexto.original == (mensagem or ''):
+        return contexto
+    return ContextoMensagem(mensagem)
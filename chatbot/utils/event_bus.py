@@ -0,0 +1,123 @@
+"""
+Barramento de eventos em processo (notificações de mudança)
+
+As escritas (SessionManager, perfil e avatar) publicam eventos no canal do
+dono (usuário logado ou sessão anônima) e a rota /api/events os repassa às
+abas abertas por Server-Sent Events. Assim as abas ociosas não consultam o
+banco: só acordam quando algo muda.
+
+Cada canal tem uma versão (contador) e guarda os últimos eventos, para quem
+reconectar com Last-Event-ID não perder o que aconteceu no intervalo. O
+barramento é por processo: uma escrita atendida por outro worker do gunicorn
+não chega aqui. Para isso cada stream relê o estado no banco a cada
+EVENTS_SYNC_INTERVAL (rota /api/events), e o atraso entre workers fica nesse
+intervalo.
+
+Cada stream aberto prende uma thread do worker gthread durante todo o
+EVENTS_STREAM_TTL; por isso há um limite por processo (EVENTS_MAX_STREAMS),
+que deve ficar bem abaixo de GUNICORN_THREADS para sobrar thread para as
+outras rotas. Acima dele o cliente consulta /api/check-updates no mesmo
+intervalo de EVENTS_SYNC_INTERVAL.
+"""
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from config import EVENTS_MAX_STREAMS
+
+
+def canal_dono(user_id: Optional[str] = None, session_id: Optional[str] = None) -> Optional[str]:
+    """Nome do canal de eventos do usuário logado ou da sessão anônima."""
+    if user_id:
+        return f"usuario:{user_id}"
+    if session_id:
+        return f"sessao:{session_id}"
+    return None
+
+
+class EventBus:
+    """Canais com versão, histórico curto e espera bloqueante por novos eventos."""
+
+    def __init__(self, historico_max: int = 50, max_streams: int = EVENTS_MAX_STREAMS):
+        self._lock = threading.Lock()
+        self._conds: Dict[str, threading.Condition] = {}
+        self._versoes: Dict[str, int] = {}
+        self._eventos: Dict[str, Deque[Dict]] = {}
+        self._historico_max = historico_max
+        self._max_streams = max_streams
+        self._streams = 0
+        self._publicados = 0
+
+    def _cond(self, canal: str) -> threading.Condition:
+        cond = self._conds.get(canal)
+        if cond is None:
+            cond = self._conds[canal] = threading.Condition(self._lock)
+        return cond
+
+    def publicar(self, canal: Optional[str], tipo: str, dados: Optional[Dict] = None) -> int:
+        """Publica um evento no canal e acorda quem está esperando. Retorna a nova versão."""
+        if not canal:
+            return 0
+        with self._lock:
+            versao = self._versoes.get(canal, 0) + 1
+            self._versoes[canal] = versao
+            eventos = self._eventos.get(canal)
+            if eventos is None:
+                eventos = self._eventos[canal] = deque(maxlen=self._historico_max)
+            eventos.append({'versao': versao, 'tipo': tipo, 'dados': dados or {}, 'em': time.time()})
+            self._publicados += 1
+            cond = self._conds.get(canal)
+            if cond is not None:
+                cond.notify_all()
+            return versao
+
+    def versao(self, canal: str) -> int:
+        with self._lock:
+            return self._versoes.get(canal, 0)
+
+    def aguardar(self, canal: str, desde: int, timeout: float) -> List[Dict]:
+        """Eventos do canal com versão > `desde`; espera até `timeout` se ainda não houver."""
+        prazo = time.monotonic() + timeout
+        with self._lock:
+            cond = self._cond(canal)
+            while self._versoes.get(canal, 0) <= desde:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    return []
+                cond.wait(restante)
+            return [evento for evento in self._eventos.get(canal, ()) if evento['versao'] > desde]
+
+    def reservar_stream(self) -> bool:
+        """Reserva uma conexão de streaming; False se o limite do processo foi atingido.
+
+        Cada stream ocupa uma thread do worker, por isso o limite: acima dele o
+        cliente usa a verificação periódica (/api/check-updates com ETag).
+        """
+        with self._lock:
+            if self._streams >= self._max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def liberar_stream(self) -> None:
+        with self._lock:
+            self._streams = max(0, self._streams - 1)
+
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            return {
+                'canais': len(self._versoes),
+                'streams': self._streams,
+                'max_streams': self._max_streams,
+                'publicados': self._publicados,
+            }
+
+
+# Instância global do barramento
+event_bus = EventBus()
+
+
+def notificar(user_id: Optional[str], session_id: Optional[str], tipo: str, **dados) -> None:
+    """Publica um evento no canal do dono (atalho para as rotinas de escrita)."""
+    event_bus.publicar(canal_dono(user_id, session_id), tipo, dados)
@@ -0,0 +1,125 @@
+"""
+Executor de inferência com controle de admissão
+
+O processamento das mensagens (que pode esperar o LM Studio por dezenas de
+segundos) roda em um pool de threads limitado, separado das threads que
+atendem o Flask. Quando o pool e a fila de espera estão cheios, novas
+mensagens são recusadas imediatamente com InferenceBusyError (o app responde
+503 "ocupado"), em vez de prender mais threads e atrasar rotas baratas como
+/api/chat/list.
+"""
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator
+
+from config import INFERENCE_WORKERS, INFERENCE_QUEUE_MAX, INFERENCE_WAIT_TIMEOUT
+
+
+class InferenceBusyError(Exception):
+    """Levantada quando não há vaga no executor de inferência."""
+
+
+class InferenceExecutor:
+    """Pool limitado de threads para inferência, com fila máxima e recusa rápida."""
+
+    def __init__(self, workers: int = INFERENCE_WORKERS, fila_max: int = INFERENCE_QUEUE_MAX,
+                 espera_max: float = INFERENCE_WAIT_TIMEOUT):
+        self.workers = max(1, int(workers))
+        self.fila_max = max(0, int(fila_max))
+        self.espera_max = max(1.0, float(espera_max))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inferencia')
+        # Vagas = em execução + aguardando na fila
+        self._vagas = threading.BoundedSemaphore(self.workers + self.fila_max)
+        self._lock = threading.Lock()
+        self._em_andamento = 0
+        self._recusadas = 0
+        self._concluidas = 0
+
+    def _liberar(self, _future: Future) -> None:
+        with self._lock:
+            self._em_andamento -= 1
+            self._concluidas += 1
+        self._vagas.release()
+
+    def submeter(self, fn: Callable, *args, **kwargs) -> Future:
+        """Agenda fn no pool; levanta InferenceBusyError se não houver vaga."""
+        if not self._vagas.acquire(blocking=False):
+            with self._lock:
+                self._recusadas += 1
+            raise InferenceBusyError("Executor de inferência saturado")
+        with self._lock:
+            self._em_andamento += 1
+        try:
+            # Propaga variáveis de contexto (contextvars) da requisição para a thread do pool
+            contexto = contextvars.copy_context()
+            future = self._executor.submit(contexto.run, fn, *args, **kwargs)
+        except Exception:
+            self._liberar(None)
+            raise
+        future.add_done_callback(self._liberar)
+        return future
+
+    def executar(self, fn: Callable, *args, **kwargs):
+        """Executa fn no pool e espera o resultado (no máximo espera_max segundos)."""
+        return self.submeter(fn, *args, **kwargs).result(timeout=self.espera_max)
+
+    def iterar(self, fn: Callable, *args, **kwargs) -> Iterator:
+        """Executa um gerador no pool e repassa seus itens para quem chamou.
+
+        A vaga é reservada já na chamada (InferenceBusyError sai daqui, antes de
+        qualquer item). Se o consumidor desistir (cliente desconectou), o
+        gerador é encerrado no próximo item.
+        """
+        fila: "queue.Queue" = queue.Queue()
+        cancelado = threading.Event()
+        fim = object()
+
+        def produzir():
+            gerador = fn(*args, **kwargs)
+            try:
+                for item in gerador:
+                    if cancelado.is_set():
+                        break
+                    fila.put((item, None))
+            except Exception as e:
+                fila.put((fim, e))
+                return
+            finally:
+                gerador.close()
+            fila.put((fim, None))
+
+        self.submeter(produzir)
+
+        def consumir():
+            try:
+                while True:
+                    try:
+                        item, erro = fila.get(timeout=self.espera_max)
+                    except queue.Empty:
+                        raise TimeoutError("Tempo de espera da inferência esgotado")
+                    if item is fim:
+                        if erro is not None:
+                            raise erro
+                        return
+                    yield item
+            finally:
+                cancelado.set()
+
+        return consumir()
+
+    def estatisticas(self) -> Dict:
+        """Retorna contadores de uso do executor."""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'fila_max': self.fila_max,
+                'em_andamento': self._em_andamento,
+                'concluidas': self._concluidas,
+                'recusadas': self._recusadas,
+            }
+
+
+# Instância global compartilhada pelo processo
+inference_executor = InferenceExecutor()
@@ -0,0 +1,206 @@
+"""
+Agendador das chamadas ao modelo (controle de admissão e fila justa)
+
+Fica na frente do LM Studio, depois do cache e das rotas rápidas: só as
+mensagens que realmente vão ao modelo passam por aqui.
+
+- limite global de chamadas simultâneas ao modelo (LM_MAX_IN_FLIGHT);
+- balde de fichas (token bucket) por cliente (usuário, sessão ou IP): cada
+  chamada gasta uma ficha; sem ficha, a mensagem vai direto ao fallback;
+- fila justa: com o limite atingido, as chamadas esperam em filas por
+  cliente, atendidas em rodízio (round-robin), para que quem manda muitas
+  mensagens não passe na frente dos outros;
+- prazo de espera na fila (LM_QUEUE_DEADLINE): passou do prazo, a chamada
+  desiste e o chatbot responde pelo fallback, sem o modelo.
+
+O cliente da chamada vem de cliente_inferencia(...), definido pela rota; a
+variável de contexto acompanha o processamento até a thread do executor.
+"""
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, Optional, TypeVar
+
+from config import LM_MAX_IN_FLIGHT, LM_SESSION_BURST, LM_SESSION_RATE, LM_QUEUE_DEADLINE
+
+T = TypeVar('T')
+
+CLIENTE_PADRAO = 'anonimo'
+
+_cliente_atual: contextvars.ContextVar = contextvars.ContextVar('cliente_inferencia', default=CLIENTE_PADRAO)
+
+
+@contextmanager
+def cliente_inferencia(chave: Optional[str]) -> Iterator[None]:
+    """Define o cliente (para o balde de fichas e a fila justa) dentro do bloco."""
+    token = _cliente_atual.set(chave or CLIENTE_PADRAO)
+    try:
+        yield
+    finally:
+        _cliente_atual.reset(token)
+
+
+class _Balde:
+    """Balde de fichas de um cliente."""
+
+    __slots__ = ('fichas', 'atualizado')
+
+    def __init__(self, fichas: float, agora: float):
+        self.fichas = fichas
+        self.atualizado = agora
+
+
+class _Espera:
+    """Uma chamada aguardando vaga na fila do seu cliente."""
+
+    __slots__ = ('concedida', 'desde')
+
+    def __init__(self, agora: float):
+        self.concedida = False
+        self.desde = agora
+
+
+class InferenceScheduler:
+    """Limite global de chamadas ao modelo, fichas por cliente e fila justa com prazo."""
+
+    def __init__(self, max_em_voo: int = LM_MAX_IN_FLIGHT, rajada: int = LM_SESSION_BURST,
+                 por_minuto: float = LM_SESSION_RATE, prazo_fila: float = LM_QUEUE_DEADLINE,
+                 max_clientes: int = 10000):
+        self.max_em_voo = max(1, int(max_em_voo))
+        # Fichas no balde cheio (rajada) e reposição por segundo; rajada 0 desliga o limite por cliente
+        self.rajada = max(0, int(rajada))
+        self.reposicao = max(0.0, float(por_minuto)) / 60.0
+        self.prazo_fila = max(0.0, float(prazo_fila))
+        self.max_clientes = max(1, int(max_clientes))
+        self._cond = threading.Condition()
+        self._em_voo = 0
+        # Fila de cada cliente; a ordem do dicionário é a ordem do rodízio
+        self._filas: "OrderedDict[str, Deque[_Espera]]" = OrderedDict()
+        self._baldes: "OrderedDict[str, _Balde]" = OrderedDict()
+        self._esperas_recentes: Deque[float] = deque(maxlen=500)
+        self._admitidas = 0
+        self._limitadas = 0
+        self._expiradas = 0
+
+    def _gastar_ficha(self, cliente: str, agora: float) -> bool:
+        """Tira uma ficha do balde do cliente (com o lock); False se estiver vazio."""
+        if not self.rajada:
+            return True
+        balde = self._baldes.get(cliente)
+        if balde is None:
+            balde = self._baldes[cliente] = _Balde(float(self.rajada), agora)
+            if len(self._baldes) > self.max_clientes:
+                self._baldes.popitem(last=False)
+        else:
+            balde.fichas = min(float(self.rajada), balde.fichas + (agora - balde.atualizado) * self.reposicao)
+            balde.atualizado = agora
+            self._baldes.move_to_end(cliente)
+        if balde.fichas < 1.0:
+            return False
+        balde.fichas -= 1.0
+        return True
+
+    def _despachar(self) -> None:
+        """Entrega as vagas livres às filas, um cliente por vez em rodízio (com o lock)."""
+        entregou = False
+        while self._em_voo < self.max_em_voo and self._filas:
+            cliente, fila = next(iter(self._filas.items()))
+            espera = fila.popleft()
+            if fila:
+                self._filas.move_to_end(cliente)
+            else:
+                del self._filas[cliente]
+            espera.concedida = True
+            self._em_voo += 1
+            entregou = True
+        if entregou:
+            self._cond.notify_all()
+
+    def entrar(self) -> bool:
+        """Reserva uma vaga para chamar o modelo; False se a chamada deve ir ao fallback."""
+        cliente = _cliente_atual.get()
+        agora = time.monotonic()
+        with self._cond:
+            if not self._gastar_ficha(cliente, agora):
+                self._limitadas += 1
+                print(f"Agendador: cliente '{cliente}' sem fichas, usando fallback")
+                return False
+            if self._em_voo < self.max_em_voo and not self._filas:
+                self._em_voo += 1
+                self._admitidas += 1
+                self._esperas_recentes.append(0.0)
+                return True
+
+            espera = _Espera(agora)
+            self._filas.setdefault(cliente, deque()).append(espera)
+            prazo = agora + self.prazo_fila
+            while not espera.concedida:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                self._cond.wait(restante)
+            esperou = time.monotonic() - espera.desde
+            if not espera.concedida:
+                fila = self._filas.get(cliente)
+                if fila is not None:
+                    fila.remove(espera)
+                    if not fila:
+                        del self._filas[cliente]
+                self._expiradas += 1
+                print(f"Agendador: prazo de espera esgotado ({esperou:.1f}s), usando fallback")
+                return False
+            self._admitidas += 1
+            self._esperas_recentes.append(esperou)
+            return True
+
+    def ocioso(self) -> bool:
+        """True se há vaga livre e ninguém na fila (para tarefas de baixa prioridade)."""
+        with self._cond:
+            return self._em_voo < self.max_em_voo and not self._filas
+
+    def sair(self) -> None:
+        """Devolve a vaga reservada por entrar() e chama o próximo da fila."""
+        with self._cond:
+            self._em_voo -= 1
+            self._despachar()
+
+    def executar(self, fn: Callable[[], Optional[T]]) -> Optional[T]:
+        """Chama fn com uma vaga reservada; None (fallback) se não houver admissão."""
+        if not self.entrar():
+            return None
+        try:
+            return fn()
+        finally:
+            self.sair()
+
+    def transmitir(self, fn: Callable[[], Iterator[T]]) -> Iterator[T]:
+        """Como executar(), para geradores: a vaga fica reservada até o fim do stream."""
+        if not self.entrar():
+            return
+        try:
+            yield from fn()
+        finally:
+            self.sair()
+
+    def estatisticas(self) -> Dict:
+        """Profundidade da fila, chamadas em andamento e tempos de espera recentes."""
+        with self._cond:
+            esperas = sorted(self._esperas_recentes)
+            fila = sum(len(f) for f in self._filas.values())
+            return {
+                'max_em_voo': self.max_em_voo,
+                'em_voo': self._em_voo,
+                'fila': fila,
+                'clientes_na_fila': len(self._filas),
+                'admitidas': self._admitidas,
+                'limitadas': self._limitadas,
+                'expiradas': self._expiradas,
+                'espera_media': round(sum(esperas) / len(esperas), 3) if esperas else 0.0,
+                'espera_p95': round(esperas[min(len(esperas) - 1, int(len(esperas) * 0.95))], 3) if esperas else 0.0,
+            }
+
+
+# Instância global compartilhada pelo processo
+inference_scheduler = InferenceScheduler()
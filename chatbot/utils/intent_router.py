@@ -0,0 +1,387 @@
+"""
+Roteador de intenções compilado
+
+Classifica a mensagem em uma única passada: normaliza o texto uma vez
+(minúsculas, sem acentos, espaços compactados) e encontra todas as
+palavras-chave de todas as famílias com uma só expressão regular, montada em
+forma de trie (cada posição do texto é testada em tempo proporcional ao
+tamanho do literal, não ao número de literais). O resultado
+(ResultadoIntencao) é memorizado por mensagem e reutilizado pelas etapas do
+pipeline (cache, small talk, horários, localização, decisão de usar o LM Studio).
+"""
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List
+
+from fuzzywuzzy import fuzz
+
+from info.horarios import carregar_horarios_professores, carregar_horarios_turmas
+
+
+def _remover_acentos(texto: str) -> str:
+    """Remove acentos de uma string."""
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+
+
+# Famílias de palavras-chave (sem acentos; a mensagem também é comparada sem acentos).
+# Uma família com um único literal ('aula', 'sala', ...) serve como teste de presença.
+FAMILIAS: Dict[str, List[str]] = {
+    # Horário de funcionamento (secretaria, biblioteca, unidade) - respondido pelo fallback
+    'horario_funcionamento': [
+        'horario de funcionamento', 'funcionamento do senai', 'horario do senai',
+        'horario da secretaria', 'horario da biblioteca', 'abre', 'fecha',
+        'que horas abre', 'que horas fecha', 'quando abre', 'quando fecha'
+    ],
+    # Perguntas sobre horários de aulas/professores/turmas
+    'pergunta_horario': [
+        'qual professor', 'qual turma', 'onde esta o professor', 'professor esta', 'turma esta',
+        'que dia', 'que periodo', 'horario', 'horarios',
+        'quem vai dar aula', 'quem vai dar', 'quem da aula', 'quem esta dando aula', 'quem vai estar',
+        'quem esta na sala', 'quem tem aula', 'quem vai estar na sala', 'quem da aula na', 'quem da aula em',
+        'tem aula', 'vai ter aula', 'tem professor', 'tem turma', 'esta ocupada', 'esta livre',
+        'esta em uso', 'esta sendo usada', 'quem usa', 'quem esta usando',
+        'hoje', 'agora', 'neste momento', 'neste horario', 'nesta hora', 'agora mesmo',
+        'ocupada', 'livre', 'disponivel', 'em uso', 'sendo usada', 'sendo utilizada'
+    ],
+    'contexto_horario_sala': [
+        'horario', 'aula', 'professor', 'turma', 'quem', 'tem aula', 'vai ter', 'ocupada',
+        'livre', 'disponivel', 'em uso', 'hoje', 'agora'
+    ],
+    'localizacao_simples': ['onde fica', 'como chegar', 'localizacao'],
+    'contexto_professor': ['onde', 'esta', 'horario', 'aula', 'dando', 'tem'],
+    'contexto_professor_amplo': ['onde', 'esta', 'horario', 'aula', 'dando', 'tem', 'professor', 'prof'],
+    'periodo_dia': ['manha', 'tarde', 'noite'],
+    # Perguntas cuja resposta depende do momento (não vão para o cache)
+    'tempo_real': ['agora', 'neste momento', 'nesse momento', 'livres', 'vazias', 'disponiveis'],
+    'horario': ['horario'],
+    'aula': ['aula'],
+    'sala': ['sala'],
+    'quem': ['quem'],
+    'professor': ['professor'],
+    'turma': ['turma'],
+    # Contato
+    'contato': [
+        'telefone', 'fone', 'contato', 'ligar', 'numero da secretaria', 'qual o numero', 'numero do senai'
+    ],
+    'contato_rapido': ['email', 'e-mail', 'correio eletronico', 'telefone', 'fone', 'whatsapp', 'contato'],
+    'pergunta_complexa': [
+        'me fale', 'quais sao', 'conte sobre', 'fale sobre', 'explique', 'detalhe', 'informe sobre', 'me informe'
+    ],
+    # Localização
+    'conteudo_local': ['o que tem', 'que tem', 'que existe', 'o que ha', 'que coisas tem'],
+    'conteudo_local_amplo': [
+        'o que tem', 'que tem', 'que existe', 'o que ha', 'que coisas tem', 'conteudo', 'tem o que', 'tem que'
+    ],
+    'frase_localizacao': [
+        'onde fica', 'onde esta', 'fica onde', 'como chegar', 'como chego', 'onde encontro',
+        'como encontro', 'sabe chegar', 'sabe encontrar', 'pode indicar o caminho'
+    ],
+    'termo_localizacao': ['localizacao', 'localiza', 'localidade'],
+    'local_especifico': [
+        'setor de apoio', 'setor apoio', 'apoio', 'qualidade de vida', 'sala 204', '204',
+        'biblioteca', 'secretaria', 'refeitorio', 'banheiro', 'coordenacao'
+    ],
+    'pergunta_conteudo': ['quais sao', 'me fale sobre', 'conte sobre', 'fale sobre'],
+    'palavra_local': [
+        'banheiro', 'sanitario', 'sala', 'biblioteca', 'secretaria', 'refeitorio', 'laboratorio',
+        'hidrante', 'extintor', 'coordenacao', 'auditorio', 'area', 'area dois', 'area 2',
+        'setor de apoio', 'setor apoio', 'apoio', 'qualidade de vida', 'analise de qualidade de vida',
+        'sala 204', '204'
+    ],
+    'area_dois': ['area dois', 'area 2', 'area ii'],
+    'horario_local': ['horario', 'que horas', 'quando', 'periodo'],
+    # Small talk
+    'small_talk_local': [
+        'area', 'sala', 'banheiro', 'biblioteca', 'secretaria', 'refeitorio',
+        'setor de apoio', 'setor apoio', 'apoio', 'qualidade de vida'
+    ],
+    'cumprimento': ['ola', 'oi', 'bom dia', 'boa tarde', 'boa noite'],
+    'small_talk': [
+        'obrigado', 'obrigada', 'valeu', 'agradeco', 'tchau', 'ate mais', 'flw', 'falou', 'ate logo',
+        'qual seu nome', 'como voce se chama', 'quem e voce', 'beleza', 'blz', 'ta bom', 'ok', 'show'
+    ],
+    'agradecimento': ['obrigado', 'obrigada', 'valeu', 'agradeco', 'perfeito', 'show', 'ok'],
+    'despedida': ['tchau', 'ate', 'flw', 'falou', 'ate logo'],
+    'nome_bot': ['qual seu nome', 'como voce se chama', 'quem e voce', 'quem e vc'],
+    'confirmacao': ['beleza', 'blz', 'ta bom'],
+    'biblioteca': ['bibliote'],
+    # Palavras comuns (detecção de mensagens sem sentido); as de uma letra são testadas à parte
+    'palavra_comum': [
+        'senai', 'curso', 'aula', 'professor', 'sala', 'biblioteca', 'secretaria',
+        'de', 'que', 'do', 'da', 'em', 'um', 'para', 'com', 'na',
+        'qual', 'onde', 'como', 'quando', 'quem', 'porque', 'sobre',
+        'informacao', 'preciso', 'quero', 'gostaria', 'pode',
+        'me', 'voce', 'eu', 'ele', 'ela', 'nos', 'eles', 'elas'
+    ],
+}
+
+# Palavras que, ao lado de uma frase de localização, indicam pergunta composta (LM Studio)
+TOKENS_CONTEXTO_EXTRA = frozenset(['curso', 'cursos', 'valor', 'valores', 'quanto', 'horario', 'capacidade'])
+# Palavras-chave de locais para a comparação aproximada (erros de digitação)
+PALAVRAS_LOCAIS_FUZZY = tuple(dict.fromkeys(FAMILIAS['palavra_local']))
+PADROES_TECLADO = ('asdf', 'qwerty', 'zxcv', 'hjkl', 'fghj', 'dfgh')
+VOGAIS = set('aeiouáéíóúâêîôûàèìòùãõ')
+
+_RE_ESPACOS = re.compile(r'\s+')
+_RE_SALA_NUMERO = re.compile(r'\b(sala\s*)?(\d{2,3})\b')
+_RE_SALA_3_DIGITOS = re.compile(r'\b(sala\s*)?(\d{3})\b')
+_RE_SALA_COLADA = re.compile(r'sala\d{3}')
+_RE_NUMERO = re.compile(r'\b\d{2,3}\b')
+_RE_NAO_PALAVRA = re.compile(r'[^\w]')
+_RE_CONSOANTES = re.compile(r'[bcdfghjklmnpqrstvwxyz]{4,}')
+
+
+def _padrao_trie(literais: Iterable[str]) -> str:
+    """Monta uma regex em forma de trie que casa o literal mais longo em cada posição."""
+    trie: Dict = {}
+    for literal in literais:
+        no = trie
+        for ch in literal:
+            no = no.setdefault(ch, {})
+        no[''] = True
+
+    def gerar(no: Dict) -> str:
+        fim = '' in no
+        ramos = [re.escape(ch) + gerar(filho) for ch, filho in sorted(no.items()) if ch != '']
+        if not ramos:
+            return ''
+        corpo = ramos[0] if len(ramos) == 1 else '(?:' + '|'.join(ramos) + ')'
+        # Sufixo opcional guloso: tenta primeiro o literal mais longo
+        return '(?:' + corpo + ')?' if fim else corpo
+
+    return gerar(trie)
+
+
+class _Automato:
+    """Regex combinada de todas as famílias + mapa literal -> famílias (com prefixos)."""
+
+    def __init__(self, familias: Dict[str, List[str]]):
+        por_literal: Dict[str, set] = {}
+        for nome, literais in familias.items():
+            for literal in literais:
+                if len(literal) > 1:
+                    por_literal.setdefault(literal, set()).add(nome)
+        # A regex devolve só o literal mais longo em cada posição; os literais que são
+        # prefixo dele também estão presentes naquela posição e herdam as famílias.
+        self.familias_por_literal: Dict[str, FrozenSet[str]] = {}
+        for literal in por_literal:
+            nomes = set()
+            for outro, familias_outro in por_literal.items():
+                if literal.startswith(outro):
+                    nomes |= familias_outro
+            self.familias_por_literal[literal] = frozenset(nomes)
+        self.regex = re.compile('(?=(' + _padrao_trie(por_literal) + '))')
+
+    def familias(self, texto: str) -> FrozenSet[str]:
+        encontradas = set()
+        for m in self.regex.finditer(texto):
+            encontradas |= self.familias_por_literal[m.group(1)]
+        return frozenset(encontradas)
+
+
+class ResultadoIntencao:
+    """Resultado da classificação de uma mensagem (imutável na prática)."""
+
+    __slots__ = (
+        'mensagem', 'compacta', 'tokens', 'familias', 'numero_sala', 'professor_mencionado',
+        'professores', 'turmas',
+        'sem_sentido', 'small_talk', 'horario_escolar', 'localizacao',
+        'horario_funcionamento', 'contato_simples', 'usar_lm'
+    )
+
+    def tem(self, familia: str) -> bool:
+        return familia in self.familias
+
+    def __repr__(self) -> str:
+        flags = [nome for nome in ('sem_sentido', 'small_talk', 'horario_escolar', 'localizacao',
+                                   'horario_funcionamento', 'contato_simples', 'usar_lm')
+                 if getattr(self, nome)]
+        return f"ResultadoIntencao({self.mensagem!r}, {flags})"
+
+
+class RoteadorIntencoes:
+    """Compila as famílias (incluindo nomes de professores) e classifica mensagens."""
+
+    def __init__(self, familias: Dict[str, List[str]] = FAMILIAS, memo: int = 2048):
+        self._familias_base = familias
+        self._lock = threading.Lock()
+        self._fonte_professores = None
+        self._fonte_turmas = None
+        self._automato = None
+        self._professores: List[tuple] = []
+        self._turmas: List[tuple] = []
+        self._classificar_memo = lru_cache(maxsize=memo)(self._classificar)
+
+    def _garantir_atualizado(self):
+        """Recompila quando os horários (professores/turmas) são recarregados."""
+        professores = carregar_horarios_professores()
+        turmas = carregar_horarios_turmas()
+        if professores is self._fonte_professores and turmas is self._fonte_turmas and self._automato:
+            return
+        with self._lock:
+            if professores is self._fonte_professores and turmas is self._fonte_turmas and self._automato:
+                return
+            self._professores = [(_remover_acentos(p.lower()), p) for p in professores.keys()]
+            familias = dict(self._familias_base)
+            familias['professor_nome'] = [n for n, _ in self._professores if n]
+            self._turmas = []
+            for turma_nome in turmas.keys():
+                normalizada = _remover_acentos(turma_nome.lower().replace('_', ' ').replace('-', ' '))
+                self._turmas.append((normalizada, normalizada.replace(' ', ''),
+                                     _remover_acentos(turma_nome.lower()), turma_nome))
+            self._automato = _Automato(familias)
+            self._fonte_professores = professores
+            self._fonte_turmas = turmas
+            self._classificar_memo.cache_clear()
+
+    def classificar(self, mensagem: str) -> ResultadoIntencao:
+        self._garantir_atualizado()
+        return self._classificar_memo(mensagem or '')
+
+    def limpar_cache(self):
+        self._classificar_memo.cache_clear()
+
+    # --- Regras (mesma semântica das funções originais de chat_manager) ---
+
+    def _classificar(self, mensagem: str) -> ResultadoIntencao:
+        r = ResultadoIntencao()
+        r.mensagem = mensagem
+        compacta = _RE_ESPACOS.sub(' ', _remover_acentos(mensagem.lower())).strip()
+        r.compacta = compacta
+        r.tokens = compacta.split()
+        r.familias = self._automato.familias(compacta)
+        r.numero_sala = bool(_RE_SALA_NUMERO.search(compacta))
+        r.professor_mencionado = r.tem('professor_nome')
+        r.professores = tuple(original for nome, original in self._professores
+                              if r.professor_mencionado and nome and nome in compacta)
+        sem_espacos_turma = compacta.replace(' ', '').replace('-', '').replace('_', '')
+        r.turmas = tuple(original for normalizada, sem_espacos, minuscula, original in self._turmas
+                         if normalizada in compacta or sem_espacos in sem_espacos_turma
+                         or minuscula in sem_espacos_turma)
+
+        r.sem_sentido = self._sem_sentido(mensagem, r)
+        r.small_talk = self._small_talk(r)
+        r.localizacao = self._localizacao(r)
+        r.horario_escolar = self._horario_escolar(r)
+        r.horario_funcionamento = r.tem('horario_funcionamento') and not (
+            r.numero_sala or r.tem('professor') or r.tem('turma') or r.tem('aula'))
+        r.contato_simples = r.tem('contato') and not r.tem('pergunta_complexa')
+        r.usar_lm = not (r.localizacao or r.small_talk or r.horario_escolar
+                         or r.contato_simples or r.horario_funcionamento)
+        return r
+
+    @staticmethod
+    def _sem_sentido(mensagem: str, r: ResultadoIntencao) -> bool:
+        if not mensagem or len(mensagem.strip()) < 2:
+            return False
+        mensagem_limpa = mensagem.strip().lower()
+        mensagem_sem_espacos = _RE_NAO_PALAVRA.sub('', mensagem_limpa)
+        if len(mensagem_sem_espacos) < 2:
+            return False
+        # Apenas caracteres repetidos (ex: "aaaa", "1111")
+        if len(set(mensagem_sem_espacos)) <= 2 and len(mensagem_sem_espacos) > 3:
+            return True
+        # Menos de 20% de vogais
+        vogais = sum(1 for c in mensagem_sem_espacos if c in VOGAIS)
+        total_caracteres = len(mensagem_sem_espacos)
+        if total_caracteres > 4 and vogais / total_caracteres < 0.2:
+            return True
+        tem_palavra_comum = r.tem('palavra_comum') or any(letra in mensagem_limpa for letra in 'oae')
+        if not tem_palavra_comum and len(mensagem_sem_espacos) > 3:
+            if _RE_CONSOANTES.search(mensagem_sem_espacos):
+                return True
+        return any(padrao in mensagem_sem_espacos for padrao in PADROES_TECLADO)
+
+    @staticmethod
+    def _small_talk(r: ResultadoIntencao) -> bool:
+        # "a"/"b" podem ser resposta de desambiguação
+        if r.compacta in ('a', 'b'):
+            return False
+        if r.tem('small_talk_local'):
+            return False
+        return r.tem('cumprimento') or r.tem('small_talk')
+
+    def _horario_escolar(self, r: ResultadoIntencao) -> bool:
+        compacta = r.compacta
+        # Horário de funcionamento sem sala/professor/turma/aula não é horário escolar
+        if r.tem('horario_funcionamento') and not (
+                r.numero_sala or r.tem('professor') or r.tem('turma') or r.tem('aula')):
+            return False
+        # Número sozinho = pergunta de localização
+        if compacta.isdigit():
+            return False
+        if (_RE_SALA_3_DIGITOS.search(compacta) or _RE_SALA_COLADA.search(compacta.replace(' ', ''))
+                or _RE_NUMERO.search(compacta)):
+            if not r.tem('localizacao_simples'):
+                return r.tem('contexto_horario_sala')
+        # Professores conhecidos (nome exato ou aproximado)
+        if r.professor_mencionado and r.tem('contexto_professor'):
+            return True
+        if r.tem('contexto_professor_amplo'):
+            for prof_lower, _ in self._professores:
+                if fuzz.ratio(compacta, prof_lower) >= 60 or fuzz.partial_ratio(compacta, prof_lower) >= 70:
+                    return True
+        # Turmas conhecidas (com ou sem espaços/hífens)
+        if r.turmas:
+            return True
+        # Sala/aula + período do dia
+        if r.tem('periodo_dia'):
+            if r.numero_sala or r.tem('sala'):
+                return True
+            if r.tem('quem') and r.tem('aula'):
+                return True
+        return r.tem('pergunta_horario')
+
+    @staticmethod
+    def _local_aproximado(tokens: List[str]) -> bool:
+        """Algum token parecido (erro de digitação) com uma palavra-chave de local."""
+        for token in tokens:
+            for chave in PALAVRAS_LOCAIS_FUZZY:
+                # fuzz.ratio <= 2*min/(soma dos tamanhos): descarta cedo comparações impossíveis
+                if 2 * min(len(token), len(chave)) < 0.84 * (len(token) + len(chave)):
+                    continue
+                if fuzz.ratio(token, chave) >= 85:
+                    return True
+        return False
+
+    def _localizacao(self, r: ResultadoIntencao) -> bool:
+        compacta, tokens = r.compacta, r.tokens
+        if not compacta:
+            return False
+        if compacta.isdigit():
+            return True
+        if r.tem('pergunta_horario'):
+            return False
+        # Perguntas sobre o conteúdo de um local vão para o LM Studio
+        if r.tem('conteudo_local'):
+            return False
+        if r.tem('frase_localizacao'):
+            if r.tem('local_especifico'):
+                return True
+            tem_contexto_extra = any(token in TOKENS_CONTEXTO_EXTRA for token in tokens)
+            if r.tem('pergunta_conteudo') or (tem_contexto_extra and len(tokens) > 5):
+                return False
+            return True
+
+        numero_presente = bool(_RE_NUMERO.search(compacta))
+        tem_palavra_local = r.tem('palavra_local') or self._local_aproximado(tokens)
+        tem_area_dois = r.tem('area_dois')
+        if tem_palavra_local or tem_area_dois:
+            nao_e_conteudo = not r.tem('conteudo_local_amplo')
+            nao_e_horario = not r.tem('horario_local')
+            if tem_area_dois or (numero_presente or len(tokens) <= 3) and nao_e_conteudo and nao_e_horario:
+                return True
+        if r.tem('termo_localizacao') and tem_palavra_local:
+            return True
+        return numero_presente and tem_palavra_local
+
+
+# Instância global
+roteador = RoteadorIntencoes()
+
+
+def classificar_mensagem(mensagem: str) -> ResultadoIntencao:
+    """Classifica a mensagem (resultado memorizado por texto)."""
+    return roteador.classificar(mensagem)
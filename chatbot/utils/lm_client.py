@@ -0,0 +1,489 @@
+"""
+Cliente compartilhado de inferência para o LM Studio
+
+Mantém conexões HTTP persistentes (keep-alive) em pool, respeita um orçamento
+total de latência por requisição e lembra qual endpoint (chat ou text
+completions) cada servidor está respondendo, para não testar o que falha a
+cada chamada.
+
+Pode usar vários servidores (LM_STUDIO_URLS): cada um tem um número de vagas
+(requisições simultâneas), um disjuntor (utils/circuit_breaker.py) e recebe a
+requisição quem tiver menos requisições em andamento. Se um servidor falhar,
+a requisição passa para outro. Com todos os disjuntores abertos o chamador
+recebe None na hora e usa o fallback.
+
+Um stream que para depois do primeiro token sem o fim da resposta ('[DONE]'
+ou finish_reason) levanta StreamInterrompido: o texto recebido está cortado
+e o chamador não deve tratá-lo como resposta completa (nem guardá-lo no cache).
+
+O prompt pode ser um texto ou uma lista de mensagens de chat; no endpoint de
+text completions as mensagens são convertidas em texto na mesma ordem. As
+requisições pedem cache_prompt (reuso do cache KV do prefixo no llama.cpp) e
+cada prompt é registrado em utils/prefix_cache.py para medir esse reuso.
+"""
+import itertools
+import json
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+from urllib.parse import urlparse, urlunparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.circuit_breaker import CircuitBreaker, ABERTO, FECHADO
+from utils.prefix_cache import monitor_prefixo
+from config import (
+    LM_STUDIO_URLS, NOME_MODELO, TIMEOUT_REQUISICAO, MAX_TENTATIVAS, DELAY_TENTATIVA,
+    LM_CONNECT_TIMEOUT, LM_LATENCY_BUDGET, LM_POOL_CONNECTIONS, LM_POOL_MAXSIZE, LM_BACKEND_SLOTS,
+    LM_CACHE_PROMPT
+)
+
+# Texto ou mensagens de chat ({'role': ..., 'content': ...})
+Prompt = Union[str, List[Dict[str, str]]]
+
+ENDPOINTS = {
+    'chat': '/v1/chat/completions',
+    'texto': '/v1/completions',
+}
+
+# Endpoint leve usado pela sonda do disjuntor para saber se o servidor voltou
+ENDPOINT_SONDA = '/v1/models'
+
+# Tipos de falha que indicam problema no servidor (e não no endpoint escolhido):
+# nesses casos não adianta tentar o outro endpoint no mesmo servidor, a
+# requisição passa para outro servidor, e são elas que contam como erro para
+# o disjuntor. 'servidor' é uma resposta 5xx (ex.: LM Studio carregando o
+# modelo ou com o modelo travado), que chega rápido mas não serve.
+_FALHAS_DO_SERVIDOR = ('timeout', 'conexao', 'servidor')
+
+# Rótulos das mensagens no endpoint de text completions (os mesmos do STOP do chat)
+ROTULOS_TEXTO = {'user': 'Usuário', 'assistant': 'Assistente SENAI'}
+
+
+class StreamInterrompido(Exception):
+    """Levantada quando o stream para depois de emitir pedaços, sem o fim da resposta."""
+
+
+def _mensagens(prompt: Prompt) -> List[Dict[str, str]]:
+    if isinstance(prompt, str):
+        return [{'role': 'user', 'content': prompt}]
+    return prompt
+
+
+def _mensagens_para_texto(mensagens: List[Dict[str, str]]) -> str:
+    """Mensagens de chat como um prompt de texto, mantendo a ordem (e o prefixo)."""
+    partes = []
+    for mensagem in mensagens:
+        rotulo = ROTULOS_TEXTO.get(mensagem['role'])
+        partes.append(f"{rotulo}: {mensagem['content']}" if rotulo else mensagem['content'])
+    return '\n\n'.join(partes) + f"\n\n{ROTULOS_TEXTO['assistant']}:"
+
+
+def _ajustar_url_endpoint(base_url: str, target: str) -> str:
+    """Monta URL para endpoint alvo preservando esquema/host/porta da base."""
+    try:
+        parsed = urlparse(base_url)
+        if not parsed.netloc:
+            raise ValueError(base_url)
+        return urlunparse((parsed.scheme or 'http', parsed.netloc, target, '', '', ''))
+    except Exception:
+        base = base_url[:-1] if base_url.endswith('/') else base_url
+        return base + target
+
+
+class Backend:
+    """Um servidor de inferência: endpoints, vagas, requisições em andamento e disjuntor."""
+
+    __slots__ = ('nome', 'urls', 'url_sonda', 'vagas', 'em_andamento', 'modo_preferido',
+                 'disjuntor', 'atendidas', 'falhas')
+
+    def __init__(self, url: str, vagas: int, sonda):
+        parsed = urlparse(url)
+        self.nome = parsed.netloc or url
+        # Apenas esquema/host/porta da URL são usados; os caminhos são fixos
+        self.urls: Dict[str, str] = {
+            modo: _ajustar_url_endpoint(url, caminho) for modo, caminho in ENDPOINTS.items()
+        }
+        self.url_sonda = _ajustar_url_endpoint(url, ENDPOINT_SONDA)
+        self.vagas = max(1, int(vagas))
+        self.em_andamento = 0
+        # Chat completions é o recomendado; muda se o servidor só responder ao outro
+        self.modo_preferido = 'chat'
+        self.disjuntor = CircuitBreaker(f'lm_studio@{self.nome}', sonda=lambda: sonda(self))
+        self.atendidas = 0
+        self.falhas = 0
+
+    def ordem_modos(self) -> List[str]:
+        """Modo preferido primeiro; o outro só é testado se o preferido falhar."""
+        preferido = self.modo_preferido
+        return [preferido] + [m for m in ENDPOINTS if m != preferido]
+
+
+class LMStudioClient:
+    """Cliente HTTP do LM Studio com pool de servidores, conexões e orçamento de latência."""
+
+    def __init__(self, urls: Sequence[str] = LM_STUDIO_URLS, modelo: str = NOME_MODELO,
+                 timeout: float = TIMEOUT_REQUISICAO, max_tentativas: int = MAX_TENTATIVAS,
+                 delay_tentativa: float = DELAY_TENTATIVA, orcamento_latencia: float = LM_LATENCY_BUDGET,
+                 timeout_conexao: float = LM_CONNECT_TIMEOUT, pool_conexoes: int = LM_POOL_CONNECTIONS,
+                 pool_max: int = LM_POOL_MAXSIZE, vagas_por_servidor: int = LM_BACKEND_SLOTS):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.modelo = modelo
+        self.timeout = max(1.0, float(timeout))
+        self.timeout_conexao = max(0.5, float(timeout_conexao))
+        self.max_tentativas = max(1, int(max_tentativas))
+        self.delay_tentativa = max(0.0, float(delay_tentativa))
+        self.orcamento_latencia = max(1.0, float(orcamento_latencia))
+        self.pool_conexoes = max(1, int(pool_conexoes))
+        self.pool_max = max(1, int(pool_max))
+        self.backends: List[Backend] = [Backend(url, vagas_por_servidor, self._sondar) for url in urls]
+        if not self.backends:
+            raise ValueError('Nenhum servidor de inferência configurado (LM_STUDIO_URLS)')
+        # Protege as vagas; avisa quem espera quando uma vaga é liberada
+        self._vagas = threading.Condition()
+        # Desempate entre servidores com a mesma carga
+        self._rodizio = itertools.count()
+        self._local = threading.local()
+
+    def _sessao(self) -> requests.Session:
+        """Retorna a sessão HTTP (com pool keep-alive) da thread atual."""
+        sessao = getattr(self._local, 'sessao', None)
+        if sessao is None:
+            sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=self.pool_conexoes,
+                                    pool_maxsize=self.pool_max, max_retries=0)
+            sessao.mount('http://', adaptador)
+            sessao.mount('https://', adaptador)
+            sessao.headers.update({"Content-Type": "application/json"})
+            self._local.sessao = sessao
+        return sessao
+
+    def _sondar(self, backend: Backend) -> bool:
+        """Sonda do disjuntor: o servidor está aceitando requisições?"""
+        try:
+            r = self._sessao().get(backend.url_sonda, timeout=(self.timeout_conexao, self.timeout_conexao))
+            return r.status_code < 500
+        except requests.exceptions.RequestException:
+            return False
+
+    def disponivel(self) -> bool:
+        """False se todos os servidores estão com o disjuntor aberto."""
+        return any(backend.disjuntor.estado != ABERTO for backend in self.backends)
+
+    def _reservar(self, prazo: float, evitar: Set[str]) -> Optional[Backend]:
+        """Reserva uma vaga no servidor com menos requisições em andamento.
+
+        Servidores em `evitar` (que já falharam nesta requisição) só são usados
+        se todos os outros estiverem fora. Sem vaga livre, espera até o prazo;
+        retorna None se o prazo acabar ou se todos os disjuntores estiverem abertos.
+        """
+        with self._vagas:
+            while True:
+                vivos = [(i, b) for i, b in enumerate(self.backends) if b.disjuntor.estado != ABERTO]
+                if not vivos:
+                    return None
+                candidatos = [(i, b) for i, b in vivos if b.nome not in evitar] or vivos
+                desempate = next(self._rodizio)
+                total = len(self.backends)
+                candidatos.sort(key=lambda item: (item[1].em_andamento / item[1].vagas,
+                                                  (item[0] + desempate) % total))
+                for _, backend in candidatos:
+                    if backend.em_andamento < backend.vagas and backend.disjuntor.permitir():
+                        backend.em_andamento += 1
+                        return backend
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    return None
+                self._vagas.wait(restante)
+
+    def _liberar(self, backend: Backend, atendida: Optional[bool]) -> None:
+        """Devolve a vaga; `atendida` None quando o chamador desistiu no meio (não conta)."""
+        with self._vagas:
+            backend.em_andamento -= 1
+            if atendida:
+                backend.atendidas += 1
+            elif atendida is not None:
+                backend.falhas += 1
+            self._vagas.notify()
+
+    def _lembrar_modo(self, backend: Backend, modo: str) -> None:
+        if modo != backend.modo_preferido:
+            backend.modo_preferido = modo
+            print(f"LM Studio ({backend.nome}): usando endpoint '{modo}' como preferido")
+
+    def _montar_payload(self, modo: str, prompt: Prompt, stop: Optional[List[str]],
+                        temperature: float, max_tokens: int) -> Dict:
+        payload = {
+            "model": self.modelo,
+            "temperature": temperature,
+            "max_tokens": max_tokens if max_tokens > 0 else -1,  # -1 para sem limite
+            "stream": False
+        }
+        if LM_CACHE_PROMPT:
+            payload["cache_prompt"] = True
+        if modo == 'chat':
+            payload["messages"] = _mensagens(prompt)
+        else:
+            payload["prompt"] = prompt if isinstance(prompt, str) else _mensagens_para_texto(prompt)
+        if stop:
+            payload["stop"] = stop
+        return payload
+
+    @staticmethod
+    def _extrair_texto(modo: str, dados: Dict) -> Optional[str]:
+        choices = (dados or {}).get('choices') or []
+        if not choices or not isinstance(choices[0], dict):
+            return None
+        if modo == 'chat':
+            message = choices[0].get('message') or {}
+            texto = message.get('content', '') if isinstance(message, dict) else ''
+        else:
+            texto = choices[0].get('text', '')
+        texto = (texto or '').strip()
+        return texto or None
+
+    def _requisitar(self, backend: Backend, modo: str, payload: Dict,
+                    restante: float) -> Tuple[Optional[str], Optional[str]]:
+        """Faz uma requisição ao servidor e registra o resultado no disjuntor dele."""
+        inicio = time.monotonic()
+        texto, falha = self._requisitar_http(backend, modo, payload, restante)
+        backend.disjuntor.registrar(falha not in _FALHAS_DO_SERVIDOR, time.monotonic() - inicio)
+        return texto, falha
+
+    def _requisitar_http(self, backend: Backend, modo: str, payload: Dict,
+                         restante: float) -> Tuple[Optional[str], Optional[str]]:
+        """Retorna (texto, tipo_de_falha)."""
+        rotulo = 'Chat' if modo == 'chat' else 'Text'
+        timeout = (min(self.timeout_conexao, restante), min(self.timeout, restante))
+        try:
+            r = self._sessao().post(backend.urls[modo], json=payload, timeout=timeout)
+            if r.status_code != 200:
+                print(f"LM Studio {rotulo} Error ({backend.nome}): {r.status_code} - {r.text[:200]}")
+                return None, ('servidor' if r.status_code >= 500 else 'http')
+            try:
+                dados = r.json()
+                monitor_prefixo.registrar_resposta(dados)
+                texto = self._extrair_texto(modo, dados)
+            except (ValueError, KeyError, TypeError):
+                texto = None
+            return texto, (None if texto else 'resposta')
+        except requests.exceptions.Timeout:
+            print(f"LM Studio {rotulo} Timeout ({backend.nome})")
+            return None, 'timeout'
+        except requests.exceptions.ConnectionError:
+            print(f"LM Studio {rotulo} Connection Error ({backend.nome})")
+            return None, 'conexao'
+        except requests.exceptions.RequestException as e:
+            print(f"LM Studio {rotulo} Request Error ({backend.nome}): {e}")
+            return None, 'http'
+        except Exception as e:
+            print(f"LM Studio {rotulo} Unexpected Error ({backend.nome}): {e}")
+            return None, 'resposta'
+
+    def _tentar_backend(self, backend: Backend, prazo: float, prompt: Prompt, stop: Optional[List[str]],
+                        temperature: float, max_tokens: int) -> Tuple[Optional[str], Optional[str]]:
+        """Uma tentativa em um servidor (com a vaga já reservada): modo preferido e, se preciso, o outro."""
+        falha = None
+        monitor_prefixo.registrar(backend.nome, backend.vagas, _mensagens(prompt))
+        for modo in backend.ordem_modos():
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            payload = self._montar_payload(modo, prompt, stop, temperature, max_tokens)
+            texto, falha = self._requisitar(backend, modo, payload, restante)
+            if texto:
+                self._lembrar_modo(backend, modo)
+                return texto, None
+            if falha in _FALHAS_DO_SERVIDOR:
+                break
+        else:
+            return None, falha
+        if falha is None:
+            # Prazo esgotado antes de qualquer requisição: devolve a vaga de teste do disjuntor
+            backend.disjuntor.desistir()
+        return None, falha
+
+    def completar(self, prompt: Prompt, stop: Optional[List[str]] = None, temperature: float = 0.7,
+                  max_tokens: int = 500, orcamento: Optional[float] = None) -> Optional[str]:
+        """Gera uma resposta dentro do orçamento de latência.
+
+        Cada servidor a mais dá direito a uma tentativa extra, para que a
+        requisição possa passar por todos antes de desistir. A espera entre
+        tentativas só acontece ao repetir um servidor que já falhou.
+
+        Retorna texto da resposta ou None em falha.
+        """
+        prazo = time.monotonic() + (orcamento or self.orcamento_latencia)
+        tentativas = self.max_tentativas + len(self.backends) - 1
+        falharam: Set[str] = set()
+
+        for tentativa in range(tentativas):
+            backend = self._reservar(prazo, falharam)
+            if backend is None:
+                return None
+            texto = None
+            try:
+                texto, _ = self._tentar_backend(backend, prazo, prompt, stop, temperature, max_tokens)
+            finally:
+                self._liberar(backend, bool(texto))
+            if texto:
+                return texto
+            falharam.add(backend.nome)
+
+            # Aguardar antes de repetir um servidor, sem estourar o orçamento
+            todos_falharam = len(falharam) >= len(self.backends)
+            if tentativa < tentativas - 1 and self.delay_tentativa and todos_falharam:
+                if prazo - time.monotonic() <= self.delay_tentativa:
+                    return None
+                time.sleep(self.delay_tentativa)
+
+        return None
+
+    @staticmethod
+    def _extrair_delta(modo: str, dados: Dict) -> str:
+        choices = (dados or {}).get('choices') or []
+        if not choices or not isinstance(choices[0], dict):
+            return ''
+        if modo == 'chat':
+            delta = choices[0].get('delta') or {}
+            return (delta.get('content') if isinstance(delta, dict) else '') or ''
+        return choices[0].get('text') or ''
+
+    @staticmethod
+    def _finalizado(dados: Dict) -> bool:
+        """True se o pedaço traz o motivo do fim da geração (finish_reason)."""
+        choices = (dados or {}).get('choices') or []
+        return bool(choices) and isinstance(choices[0], dict) and bool(choices[0].get('finish_reason'))
+
+    def stream(self, prompt: Prompt, stop: Optional[List[str]] = None, temperature: float = 0.7,
+               max_tokens: int = 500, orcamento: Optional[float] = None) -> Iterator[str]:
+        """Gera a resposta em pedaços (SSE do LM Studio), à medida que os tokens chegam.
+
+        Troca de servidor ou de endpoint só é possível antes do primeiro token;
+        depois disso, uma falha (erro de rede ou orçamento de latência esgotado)
+        levanta StreamInterrompido e o chamador decide o que fazer com o texto
+        parcial. A vaga no servidor fica reservada até o fim do stream.
+        """
+        prazo = time.monotonic() + (orcamento or self.orcamento_latencia)
+        falharam: Set[str] = set()
+
+        for _ in range(len(self.backends)):
+            backend = self._reservar(prazo, falharam)
+            if backend is None:
+                return
+            emitiu = None
+            try:
+                emitiu = yield from self._stream_backend(backend, prazo, prompt, stop, temperature, max_tokens)
+            except StreamInterrompido:
+                emitiu = False
+                raise
+            finally:
+                self._liberar(backend, emitiu)
+            if emitiu:
+                return
+            falharam.add(backend.nome)
+
+    def _stream_backend(self, backend: Backend, prazo: float, prompt: Prompt, stop: Optional[List[str]],
+                        temperature: float, max_tokens: int):
+        """Stream em um servidor (com a vaga reservada). Retorna True se emitiu a resposta inteira.
+
+        Se emitiu pedaços mas a resposta não terminou, levanta StreamInterrompido.
+        """
+        requisitou = False
+        reaproveitados, total = monitor_prefixo.registrar(backend.nome, backend.vagas, _mensagens(prompt))
+        try:
+            for modo in backend.ordem_modos():
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    return False
+                payload = self._montar_payload(modo, prompt, stop, temperature, max_tokens)
+                payload["stream"] = True
+                rotulo = 'Chat' if modo == 'chat' else 'Text'
+                timeout = (min(self.timeout_conexao, restante), min(self.timeout, restante))
+                inicio = time.monotonic()
+                requisitou = True
+                try:
+                    r = self._sessao().post(backend.urls[modo], json=payload, timeout=timeout, stream=True)
+                except requests.exceptions.Timeout:
+                    print(f"LM Studio {rotulo} Stream Timeout ({backend.nome})")
+                    backend.disjuntor.registrar(False, time.monotonic() - inicio)
+                    return False
+                except requests.exceptions.RequestException as e:
+                    print(f"LM Studio {rotulo} Stream Connection Error ({backend.nome}): {e}")
+                    backend.disjuntor.registrar(False, time.monotonic() - inicio)
+                    return False
+                with r:
+                    if r.status_code != 200:
+                        print(f"LM Studio {rotulo} Stream Error ({backend.nome}): {r.status_code} - {r.text[:200]}")
+                        backend.disjuntor.registrar(False, time.monotonic() - inicio)
+                        if r.status_code >= 500:
+                            # Erro do servidor: o outro endpoint dele também não vai responder
+                            return False
+                        continue
+                    # O servidor aceitou o stream: a latência até os cabeçalhos é a que conta
+                    backend.disjuntor.registrar(True, time.monotonic() - inicio)
+                    r.encoding = 'utf-8'
+                    emitiu = False
+                    completo = False
+                    try:
+                        for linha in r.iter_lines(decode_unicode=True):
+                            if time.monotonic() > prazo:
+                                print(f"LM Studio {rotulo} Stream: orçamento de latência esgotado")
+                                break
+                            if not linha or not linha.startswith('data:'):
+                                continue
+                            conteudo = linha[5:].strip()
+                            if conteudo == '[DONE]':
+                                completo = True
+                                break
+                            try:
+                                dados = json.loads(conteudo)
+                                pedaco = self._extrair_delta(modo, dados)
+                            except (ValueError, TypeError):
+                                continue
+                            if 'timings' in dados or 'usage' in dados:
+                                monitor_prefixo.registrar_resposta(dados)
+                            if self._finalizado(dados):
+                                completo = True
+                            if pedaco:
+                                if not emitiu:
+                                    # Tempo até o primeiro token: quase todo é o prefill do prompt
+                                    monitor_prefixo.registrar_primeiro_token(reaproveitados, total,
+                                                                             time.monotonic() - inicio)
+                                    self._lembrar_modo(backend, modo)
+                                    emitiu = True
+                                yield pedaco
+                    except requests.exceptions.RequestException as e:
+                        print(f"LM Studio {rotulo} Stream interrompido ({backend.nome}): {e}")
+                        backend.disjuntor.registrar(False)
+                    if emitiu and not completo:
+                        raise StreamInterrompido(f"stream de {backend.nome} terminou sem o fim da resposta")
+                    if emitiu:
+                        return True
+            return False
+        finally:
+            if not requisitou:
+                backend.disjuntor.desistir()
+
+    def estatisticas(self) -> Dict:
+        """Estado de cada servidor (disjuntor, vagas e contadores)."""
+        with self._vagas:
+            servidores = [
+                {
+                    'servidor': backend.nome,
+                    'vagas': backend.vagas,
+                    'em_andamento': backend.em_andamento,
+                    'atendidas': backend.atendidas,
+                    'falhas': backend.falhas,
+                    'disjuntor': backend.disjuntor.estatisticas(),
+                }
+                for backend in self.backends
+            ]
+        disponiveis = sum(1 for s in servidores if s['disjuntor']['estado'] == FECHADO)
+        return {'servidores': servidores, 'disponiveis': disponiveis, 'total': len(servidores)}
+
+
+# Instância global compartilhada pelo processo
+lm_client = LMStudioClient()
@@ -0,0 +1,123 @@
+"""
+Medição do reaproveitamento do prefixo do prompt (cache KV do LM Studio)
+
+O llama.cpp (usado pelo LM Studio) guarda o cache KV do último prompt de cada
+vaga (slot) e, quando o próximo prompt começa igual, só processa o que mudou.
+Este monitor lembra as mensagens dos últimos prompts enviados a cada servidor
+(tantos quantos forem as vagas dele) e, para cada prompt novo, estima quantos
+tokens do início já estavam lá (mensagens inteiras iguais, na mesma ordem):
+é o prefill que o servidor pode pular.
+
+O tempo economizado vem das respostas em stream: o tempo até o primeiro token,
+dividido pelos tokens que o servidor precisou processar, dá o custo de prefill
+por token; vezes os tokens reaproveitados, a economia estimada por turno.
+Quando o servidor informa os tokens que vieram do cache ('timings' do
+llama.cpp ou 'usage.prompt_tokens_details' da API da OpenAI), eles também
+são somados.
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from info.retrieval import estimar_tokens
+from utils.prompt_builder import TOKENS_POR_MENSAGEM
+
+# Medições de tempo até o primeiro token com poucos tokens novos são dominadas
+# pela latência fixa (rede, agendamento) e não entram no custo por token
+MIN_TOKENS_MEDICAO = 64
+
+
+def _chave(mensagem: Dict[str, str]) -> Tuple[str, str]:
+    return mensagem.get('role', ''), mensagem.get('content', '')
+
+
+class MonitorPrefixo:
+    """Estimativa de tokens do prefixo reaproveitados por servidor e do prefill economizado."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Servidor -> últimos prompts enviados (como tuplas de mensagens)
+        self._recentes: Dict[str, Deque[Tuple[Tuple[str, str], ...]]] = {}
+        self._prompts = 0
+        self._tokens_prompt = 0
+        self._tokens_reaproveitados = 0
+        self._medicoes = 0
+        self._segundos_prefill = 0.0
+        self._tokens_prefill = 0
+        self._tokens_cache_servidor = 0
+
+    def registrar(self, servidor: str, vagas: int, mensagens: List[Dict[str, str]]) -> Tuple[int, int]:
+        """Registra um prompt enviado ao servidor; retorna (tokens reaproveitados, tokens do prompt)."""
+        chaves = tuple(_chave(m) for m in mensagens)
+        tokens = [estimar_tokens(conteudo) + TOKENS_POR_MENSAGEM for _, conteudo in chaves]
+        with self._lock:
+            recentes = self._recentes.get(servidor)
+            if recentes is None or recentes.maxlen != max(1, vagas):
+                recentes = self._recentes[servidor] = deque(recentes or (), maxlen=max(1, vagas))
+            iguais = 0
+            for anterior in recentes:
+                n = 0
+                for a, b in zip(anterior, chaves):
+                    if a != b:
+                        break
+                    n += 1
+                iguais = max(iguais, n)
+            recentes.append(chaves)
+            reaproveitados, total = sum(tokens[:iguais]), sum(tokens)
+            self._prompts += 1
+            self._tokens_prompt += total
+            self._tokens_reaproveitados += reaproveitados
+        return reaproveitados, total
+
+    def registrar_primeiro_token(self, reaproveitados: int, total: int, segundos: float) -> None:
+        """Tempo até o primeiro token de um stream: mede o custo de prefill por token."""
+        novos = total - reaproveitados
+        if novos < MIN_TOKENS_MEDICAO or segundos <= 0:
+            return
+        with self._lock:
+            self._medicoes += 1
+            self._segundos_prefill += segundos
+            self._tokens_prefill += novos
+
+    def registrar_resposta(self, dados: Dict) -> None:
+        """Soma os tokens em cache informados pelo servidor, se a resposta trouxer esse dado."""
+        if not isinstance(dados, dict):
+            return
+        em_cache = None
+        timings = dados.get('timings')
+        if isinstance(timings, dict):
+            em_cache = timings.get('cache_n')
+        usage = dados.get('usage')
+        if em_cache is None and isinstance(usage, dict):
+            detalhes = usage.get('prompt_tokens_details')
+            if isinstance(detalhes, dict):
+                em_cache = detalhes.get('cached_tokens')
+        if isinstance(em_cache, int) and em_cache > 0:
+            with self._lock:
+                self._tokens_cache_servidor += em_cache
+
+    def estatisticas(self) -> Dict:
+        """Reaproveitamento estimado do prefixo e prefill economizado por turno."""
+        with self._lock:
+            prompts = self._prompts
+            ms_por_token: Optional[float] = (
+                self._segundos_prefill * 1000 / self._tokens_prefill if self._tokens_prefill else None
+            )
+            reaproveitados_por_turno = self._tokens_reaproveitados / prompts if prompts else 0.0
+            return {
+                'prompts': prompts,
+                'tokens_prompt': self._tokens_prompt,
+                'tokens_reaproveitados': self._tokens_reaproveitados,
+                'taxa_reaproveitamento': round(self._tokens_reaproveitados / self._tokens_prompt, 3)
+                if self._tokens_prompt else 0.0,
+                'reaproveitados_por_turno': round(reaproveitados_por_turno),
+                'medicoes_prefill': self._medicoes,
+                'prefill_ms_por_token': round(ms_por_token, 2) if ms_por_token is not None else None,
+                'economia_ms_por_turno': round(reaproveitados_por_turno * ms_por_token)
+                if ms_por_token is not None else None,
+                'tokens_cache_servidor': self._tokens_cache_servidor,
+            }
+
+
+# Instância global compartilhada pelo processo
+monitor_prefixo = MonitorPrefixo()
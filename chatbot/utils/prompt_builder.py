@@ -0,0 +1,260 @@
+"""
+Montagem do prompt do LM Studio dentro de um orçamento de tokens
+
+O prompt vai como mensagens de chat, na ordem que deixa o início igual de um
+turno para o outro (o LM Studio/llama.cpp reaproveita o cache KV do prefixo
+repetido e só processa o que mudou):
+
+1. sistema: instruções fixas, idênticas byte a byte em todas as requisições,
+   seguidas do resumo da conversa anterior, se houver (utils/chat_summarizer.py),
+   que só muda quando a conversa é resumida de novo;
+2. histórico da conversa (mensagens de usuário/assistente), que cresce no fim
+   enquanto a conversa couber na janela de mensagens;
+3. usuário: conhecimento da pergunta (trechos da base info/) e a pergunta atual.
+
+Os papéis se alternam como os modelos de chat esperam (vários recusam ou
+confundem dois turnos seguidos do mesmo papel): o histórico começa em uma
+mensagem do usuário e mensagens seguidas do mesmo papel (ex.: uma pergunta
+que ficou sem resposta) são juntadas em uma só.
+
+O orçamento é a janela de contexto do modelo (LM_CONTEXT_WINDOW) menos os
+tokens reservados para a resposta (LM_MAX_RESPONSE_TOKENS) e uma folga para o
+erro da estimativa (PROMPT_SAFETY_MARGIN). Os tokens são estimados com
+info.retrieval.estimar_tokens.
+
+Quando não cabe tudo, corta por prioridade:
+- instruções: sempre inteiras;
+- pergunta: inteira até PROMPT_QUESTION_SHARE do orçamento (mensagens enormes são cortadas);
+- resumo: até PROMPT_HISTORY_SHARE do espaço livre;
+- conhecimento: o que sobra, menos a parte garantida ao histórico; corta por parágrafos;
+- histórico: até PROMPT_HISTORY_SHARE do espaço livre (mais, se o conhecimento não usar
+  tudo), das mensagens mais recentes para as mais antigas.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    LM_CONTEXT_WINDOW, LM_MAX_RESPONSE_TOKENS, PROMPT_SAFETY_MARGIN,
+    PROMPT_HISTORY_SHARE, PROMPT_QUESTION_SHARE
+)
+from info.retrieval import estimar_tokens
+
+# Orçamento mínimo do prompt, mesmo com uma janela mal configurada
+ORCAMENTO_MINIMO = 256
+
+# Tokens do modelo de chat em volta de cada mensagem (cabeçalho do papel e fim de turno)
+TOKENS_POR_MENSAGEM = 5
+
+MODELO_PERGUNTA = "{conhecimento}\n\n[PERGUNTA ATUAL]\n{pergunta}"
+
+MODELO_RESUMO = "[RESUMO DA CONVERSA ANTERIOR]\n{resumo}"
+
+
+def _cortar_texto(texto: str, limite: int) -> str:
+    """Corta o texto (no último espaço) para caber em 'limite' tokens."""
+    if limite <= 0:
+        return ''
+    while texto and estimar_tokens(texto) > limite:
+        # Proporção de caracteres que cabe, com uma pequena folga para convergir rápido
+        caracteres = int(len(texto) * limite / estimar_tokens(texto) * 0.95)
+        corte = texto.rfind(' ', 0, caracteres)
+        texto = texto[:corte if corte > 0 else caracteres].rstrip()
+    return texto + '...' if texto else ''
+
+
+def _juntar_papeis(mensagens: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Junta mensagens seguidas do mesmo papel, para que usuário e assistente se alternem."""
+    juntas: List[Dict[str, str]] = []
+    for mensagem in mensagens:
+        if juntas and juntas[-1]['role'] == mensagem['role']:
+            juntas[-1] = {'role': mensagem['role'], 'content': f"{juntas[-1]['content']}\n\n{mensagem['content']}"}
+        else:
+            juntas.append(dict(mensagem))
+    return juntas
+
+
+def _cortar_paragrafos(texto: str, limite: int) -> str:
+    """Mantém os parágrafos (na ordem) que cabem em 'limite' tokens."""
+    escolhidos: List[str] = []
+    usados = 0
+    for paragrafo in texto.split('\n\n'):
+        tokens = estimar_tokens(paragrafo)
+        if usados + tokens > limite:
+            # Um parágrafo grande não impede os menores seguintes (ex.: instruções no fim)
+            continue
+        escolhidos.append(paragrafo)
+        usados += tokens
+    if not escolhidos:
+        return _cortar_texto(texto, limite)
+    return '\n\n'.join(escolhidos)
+
+
+class PromptMontado:
+    """Mensagens prontas e o uso do orçamento: tokens (usados, originais) de cada parte."""
+
+    __slots__ = ('mensagens', 'tokens', 'limite', 'partes', 'mensagens_historico')
+
+    def __init__(self, mensagens: List[Dict[str, str]], tokens: int, limite: int,
+                 partes: Dict[str, Tuple[int, int]], mensagens_historico: int):
+        self.mensagens = mensagens
+        self.tokens = tokens
+        self.limite = limite
+        self.partes = partes
+        self.mensagens_historico = mensagens_historico
+
+    @property
+    def cortado(self) -> bool:
+        return any(usados < originais for usados, originais in self.partes.values())
+
+    @property
+    def caracteres(self) -> int:
+        return sum(len(mensagem['content']) for mensagem in self.mensagens)
+
+    def resumo(self) -> str:
+        sistema, conhecimento, historico, pergunta = (
+            self.partes[nome] for nome in ('sistema', 'conhecimento', 'historico', 'pergunta')
+        )
+        resumo = self.partes.get('resumo')
+        return (f"Prompt: {self.tokens}/{self.limite} tokens (instruções {sistema[0]}, "
+                f"conhecimento {conhecimento[0]}/{conhecimento[1]}, "
+                + (f"resumo {resumo[0]}/{resumo[1]}, " if resumo else '')
+                + f"histórico {historico[0]}/{historico[1]} em {self.mensagens_historico} mensagens, "
+                f"pergunta {pergunta[0]}/{pergunta[1]})")
+
+
+class PromptBuilder:
+    """Monta as mensagens do prompt dividindo o orçamento de tokens entre as partes."""
+
+    def __init__(self, janela: int = LM_CONTEXT_WINDOW, resposta: int = LM_MAX_RESPONSE_TOKENS,
+                 margem: float = PROMPT_SAFETY_MARGIN, fracao_historico: float = PROMPT_HISTORY_SHARE,
+                 fracao_pergunta: float = PROMPT_QUESTION_SHARE, max_mensagens: int = 8,
+                 max_caracteres_mensagem: int = 200):
+        self.janela = int(janela)
+        self.resposta = max(0, int(resposta))
+        self.limite = max(ORCAMENTO_MINIMO, int(self.janela * (1 - margem)) - self.resposta)
+        self.fracao_historico = min(1.0, max(0.0, fracao_historico))
+        self.fracao_pergunta = min(1.0, max(0.0, fracao_pergunta))
+        self.max_mensagens = max(1, max_mensagens)
+        self.max_caracteres_mensagem = max_caracteres_mensagem
+        self._tokens_moldura = estimar_tokens(MODELO_PERGUNTA.format(conhecimento='', pergunta=''))
+        self._tokens_moldura_resumo = estimar_tokens('\n\n' + MODELO_RESUMO.format(resumo=''))
+        self._lock = threading.Lock()
+        self._montados = 0
+        self._cortados = 0
+        self._tokens_total = 0
+        self._maior = 0
+
+    def _mensagens_historico(self, historico: Optional[List[Dict]]) -> List[Dict[str, str]]:
+        """Últimas mensagens como mensagens de chat, cada uma limitada em caracteres e com os papéis alternados."""
+        mensagens = []
+        for msg in (historico or [])[-self.max_mensagens:]:
+            # Suporta ambos formatos: ('remetente'/'texto') e ('sender'/'text')
+            eh_usuario = msg.get('remetente') == 'usuario' or msg.get('sender') == 'user'
+            texto = msg.get('texto') or msg.get('text') or ''
+            if len(texto) > self.max_caracteres_mensagem:
+                texto = texto[:self.max_caracteres_mensagem] + "..."
+            mensagens.append({'role': 'user' if eh_usuario else 'assistant', 'content': texto})
+        return _juntar_papeis(mensagens)
+
+    def montar(self, sistema: str, conhecimento: str, historico: Optional[List[Dict]], pergunta: str,
+               resumo: Optional[str] = None) -> PromptMontado:
+        """Monta as mensagens; o histórico vem como lista de mensagens (a mais recente no fim).
+
+        O resumo (opcional) cobre as mensagens anteriores ao histórico e vai no
+        fim da mensagem de sistema, depois das instruções fixas.
+        """
+        tokens_sistema = estimar_tokens(sistema) + TOKENS_POR_MENSAGEM
+        tokens_pergunta_original = estimar_tokens(pergunta)
+        limite_pergunta = int(self.limite * self.fracao_pergunta)
+        if tokens_pergunta_original > limite_pergunta:
+            pergunta = _cortar_texto(pergunta, limite_pergunta)
+        tokens_pergunta = estimar_tokens(pergunta)
+
+        livre = max(0, self.limite - tokens_sistema - tokens_pergunta - self._tokens_moldura - TOKENS_POR_MENSAGEM)
+
+        sistema_completo = sistema
+        tokens_resumo = tokens_resumo_original = 0
+        resumo = (resumo or '').strip()
+        if resumo:
+            tokens_resumo_original = estimar_tokens(resumo) + self._tokens_moldura_resumo
+            limite_resumo = int(livre * self.fracao_historico)
+            if tokens_resumo_original > limite_resumo:
+                resumo = _cortar_texto(resumo, limite_resumo - self._tokens_moldura_resumo)
+            if resumo:
+                sistema_completo = f"{sistema}\n\n{MODELO_RESUMO.format(resumo=resumo)}"
+                tokens_resumo = estimar_tokens(resumo) + self._tokens_moldura_resumo
+                livre = max(0, livre - tokens_resumo)
+
+        do_historico = self._mensagens_historico(historico)
+        tokens_historico_lista = [estimar_tokens(m['content']) + TOKENS_POR_MENSAGEM for m in do_historico]
+        tokens_historico_original = sum(tokens_historico_lista)
+        reserva_historico = min(tokens_historico_original, int(livre * self.fracao_historico))
+
+        conhecimento = (conhecimento or '').strip()
+        tokens_conhecimento_original = estimar_tokens(conhecimento)
+        limite_conhecimento = livre - reserva_historico
+        if tokens_conhecimento_original > limite_conhecimento:
+            conhecimento = _cortar_paragrafos(conhecimento, limite_conhecimento)
+        tokens_conhecimento = estimar_tokens(conhecimento)
+
+        # O histórico fica com o resto, das mensagens mais recentes para as mais antigas
+        limite_historico = livre - tokens_conhecimento
+        inicio = len(do_historico)
+        tokens_historico = 0
+        while inicio > 0 and tokens_historico + tokens_historico_lista[inicio - 1] <= limite_historico:
+            inicio -= 1
+            tokens_historico += tokens_historico_lista[inicio]
+        # Depois do sistema vem o usuário: uma resposta do assistente que ficou sem a
+        # pergunta (cortada pelo orçamento ou pela janela de mensagens) sai também
+        while inicio < len(do_historico) and do_historico[inicio]['role'] != 'user':
+            tokens_historico -= tokens_historico_lista[inicio]
+            inicio += 1
+        do_historico = do_historico[inicio:]
+        mensagens_historico = len(do_historico)
+
+        partes = {
+            'sistema': (tokens_sistema, tokens_sistema),
+            'conhecimento': (tokens_conhecimento, tokens_conhecimento_original),
+            'historico': (tokens_historico, tokens_historico_original),
+            'pergunta': (tokens_pergunta, tokens_pergunta_original),
+        }
+        if tokens_resumo_original:
+            partes['resumo'] = (tokens_resumo, tokens_resumo_original)
+
+        mensagens = [{'role': 'system', 'content': sistema_completo}]
+        mensagens.extend(do_historico)
+        mensagens.append({'role': 'user', 'content': MODELO_PERGUNTA.format(conhecimento=conhecimento, pergunta=pergunta)})
+        # Pergunta anterior sem resposta no fim do histórico: vai junto com a atual
+        mensagens = _juntar_papeis(mensagens)
+        montado = PromptMontado(
+            mensagens,
+            tokens_sistema + tokens_resumo + tokens_historico + tokens_conhecimento + tokens_pergunta
+            + self._tokens_moldura + TOKENS_POR_MENSAGEM * (len(mensagens) - 1 - mensagens_historico),
+            self.limite,
+            partes,
+            mensagens_historico,
+        )
+        with self._lock:
+            self._montados += 1
+            self._cortados += 1 if montado.cortado else 0
+            self._tokens_total += montado.tokens
+            self._maior = max(self._maior, montado.tokens)
+        print(montado.resumo())
+        return montado
+
+    def estatisticas(self) -> Dict:
+        """Orçamento configurado e uso médio/máximo dos prompts montados."""
+        with self._lock:
+            return {
+                'janela': self.janela,
+                'resposta': self.resposta,
+                'limite': self.limite,
+                'montados': self._montados,
+                'cortados': self._cortados,
+                'tokens_medio': round(self._tokens_total / self._montados) if self._montados else 0,
+                'tokens_maximo': self._maior,
+            }
+
+
+# Instância global compartilhada pelo processo
+prompt_builder = PromptBuilder()
@@ -4,53 +4,411 @@
 Sistema de cache para respostas frequentes
 """
 
-import json
 import os
-import hashlib
-from typing import Dict, Optional
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Set
+
+from config import (
+    CACHE_BACKEND, CACHE_FILE, CACHE_MAX_ENTRIES, CACHE_TIMEOUT,
+    CACHE_FUZZY_ENABLED, CACHE_FUZZY_THRESHOLD
+)
+from info.horarios import registrar_ao_recarregar, versao_horarios
+
+# Palavras sem conteúdo para a chave do cache (artigos, preposições e afins).
+# Interrogativos ("onde", "quando", "qual", "que") são mantidos: mudam o sentido.
+STOPWORDS_CACHE = {
+    'a', 'o', 'as', 'os', 'um', 'uma', 'uns', 'umas',
+    'de', 'da', 'do', 'das', 'dos', 'em', 'na', 'no', 'nas', 'nos',
+    'ao', 'aos', 'pra', 'pro', 'para', 'por', 'pelo', 'pela', 'e',
+    'me', 'voce', 'vc', 'vcs', 'favor', 'ai', 'la', 'entao', 'eh'
+}
+
+
+def _remover_acentos(texto: str) -> str:
+    """Remove acentos de uma string."""
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+
+
+# Tokens depois dos quais uma letra solta é a letra da turma ("turma a", "2ids-sc-a")
+PRECEDENTES_TURMA = {'turma', 'sc'}
+
+
+def _letra_de_turma(tokens: List[str], i: int) -> bool:
+    """True se tokens[i] é uma letra logo após 'turma', 'sc' ou um código com números (2ids)."""
+    if len(tokens[i]) != 1 or not tokens[i].isalpha() or i == 0:
+        return False
+    anterior = tokens[i - 1]
+    return anterior in PRECEDENTES_TURMA or any(c.isdigit() for c in anterior)
+
+
+def _identificador(token: str) -> bool:
+    """Números e letras de turma: precisam coincidir exatamente entre paráfrases."""
+    return token.isdigit() or (len(token) == 1 and token.isalpha())
+
+
+def normalizar_chave(texto: str) -> str:
+    """Forma canônica da pergunta para o cache.
+
+    Minúsculas, sem acentos, sem pontuação, sem stopwords e com os tokens em
+    ordem alfabética: "Onde fica a biblioteca?" e "onde fica biblioteca ?"
+    geram a mesma chave. A letra da turma ("turma 2ids a", "2ids-sc-a") fica
+    na chave mesmo sendo stopword. Se sobrar só stopword (ex.: "a", resposta
+    de desambiguação), mantém os tokens originais.
+    """
+    base = _remover_acentos((texto or '').strip().lower())
+    tokens = re.sub(r'[^\w\s]', ' ', base).split()
+    relevantes = [t for i, t in enumerate(tokens) if t not in STOPWORDS_CACHE or _letra_de_turma(tokens, i)]
+    return ' '.join(sorted(set(relevantes))) if relevantes else ' '.join(tokens)
+
+
+class IndiceTokens:
+    """Índice invertido token -> chaves, para achar paráfrases de perguntas já em cache.
+
+    Similaridade de Jaccard entre os conjuntos de tokens das chaves canônicas;
+    números (salas) e letras de turma precisam coincidir exatamente.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._tamanhos: Dict[str, int] = {}
+
+    def adicionar(self, chave: str):
+        if chave in self._tamanhos:
+            return
+        tokens = chave.split()
+        self._tamanhos[chave] = len(tokens)
+        for token in tokens:
+            self._postings[token].add(chave)
+
+    def remover(self, chave: str):
+        if self._tamanhos.pop(chave, None) is None:
+            return
+        for token in chave.split():
+            chaves = self._postings.get(token)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._postings[token]
+
+    def mais_parecida(self, chave: str, limiar: float) -> Optional[str]:
+        """Chave indexada mais parecida (Jaccard >= limiar), ou None."""
+        tokens = set(chave.split())
+        if not tokens:
+            return None
+        numeros = {t for t in tokens if _identificador(t)}
+        intersecoes: Dict[str, int] = defaultdict(int)
+        for token in tokens:
+            for candidata in self._postings.get(token, ()):
+                intersecoes[candidata] += 1
+        melhor, melhor_score = None, limiar
+        for candidata, comuns in intersecoes.items():
+            score = comuns / (len(tokens) + self._tamanhos[candidata] - comuns)
+            if score < melhor_score:
+                continue
+            if numeros != {t for t in candidata.split() if _identificador(t)}:
+                continue
+            melhor, melhor_score = candidata, score
+        return melhor
+
+    def __len__(self) -> int:
+        return len(self._tamanhos)
+
+
+class MemoryCacheBackend:
+    """Cache em memória do processo: LRU limitado por número de entradas, com TTL."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TIMEOUT):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self._dados: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._dados.get(key)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em and expira_em <= time.time():
+                del self._dados[key]
+                self.expired += 1
+                return None
+            self._dados.move_to_end(key)
+            return valor
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expira_em = time.time() + ttl if ttl > 0 else 0
+        with self._lock:
+            self._dados[key] = (expira_em, value)
+            self._dados.move_to_end(key)
+            while len(self._dados) > self.max_entries:
+                self._dados.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._dados.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._dados.clear()
+
+    def keys(self) -> List[str]:
+        """Chaves ainda válidas (não expiradas)."""
+        agora = time.time()
+        with self._lock:
+            return [k for k, (expira_em, _) in self._dados.items() if not expira_em or expira_em > agora]
+
+    def __len__(self) -> int:
+        return len(self._dados)
+
+
+class SQLiteCacheBackend:
+    """Cache compartilhado entre processos (workers do gunicorn) em um arquivo SQLite.
+
+    Cada inserção é uma única escrita (modo WAL), sem reescrever o arquivo todo.
+    Entradas expiradas e o excesso acima de max_entries (menos acessadas
+    recentemente primeiro) são removidos em lote a cada `poda_a_cada` inserções.
+    """
+
+    def __init__(self, path: str = CACHE_FILE, max_entries: int = CACHE_MAX_ENTRIES,
+                 ttl: float = CACHE_TIMEOUT, poda_a_cada: int = 50):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self.poda_a_cada = max(1, int(poda_a_cada))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._insercoes = 0
+        self.evictions = 0
+        self.expired = 0
+        with self._conexao() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " chave TEXT PRIMARY KEY,"
+                " valor TEXT NOT NULL,"
+                " expira_em REAL NOT NULL,"
+                " acessado_em REAL NOT NULL)"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS idx_cache_acessado_em ON cache (acessado_em)")
+
+    def _conexao(self) -> sqlite3.Connection:
+        """Conexão da thread atual (sqlite3 não compartilha conexões entre threads)."""
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            diretorio = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(diretorio, exist_ok=True)
+            con = sqlite3.connect(self.path, timeout=5)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def get(self, key: str) -> Optional[str]:
+        agora = time.time()
+        con = self._conexao()
+        linha = con.execute("SELECT valor, expira_em FROM cache WHERE chave = ?", (key,)).fetchone()
+        if linha is None:
+            return None
+        valor, expira_em = linha
+        if expira_em and expira_em <= agora:
+            with con:
+                con.execute("DELETE FROM cache WHERE chave = ?", (key,))
+            self.expired += 1
+            return None
+        with con:
+            con.execute("UPDATE cache SET acessado_em = ? WHERE chave = ?", (agora, key))
+        return valor
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        agora = time.time()
+        expira_em = agora + ttl if ttl > 0 else 0
+        con = self._conexao()
+        with con:
+            con.execute(
+                "INSERT OR REPLACE INTO cache (chave, valor, expira_em, acessado_em) VALUES (?, ?, ?, ?)",
+                (key, value, expira_em, agora)
+            )
+        with self._lock:
+            self._insercoes += 1
+            podar = self._insercoes % self.poda_a_cada == 0
+        if podar:
+            self.podar()
+
+    def podar(self):
+        """Remove entradas expiradas e o excesso acima do limite."""
+        con = self._conexao()
+        with con:
+            expiradas = con.execute(
+                "DELETE FROM cache WHERE expira_em > 0 AND expira_em <= ?", (time.time(),)
+            ).rowcount
+            excesso = con.execute(
+                "DELETE FROM cache WHERE chave IN ("
+                " SELECT chave FROM cache ORDER BY acessado_em DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+        self.expired += max(0, expiradas)
+        self.evictions += max(0, excesso)
+
+    def delete(self, key: str):
+        con = self._conexao()
+        with con:
+            con.execute("DELETE FROM cache WHERE chave = ?", (key,))
+
+    def clear(self):
+        con = self._conexao()
+        with con:
+            con.execute("DELETE FROM cache")
+
+    def keys(self) -> List[str]:
+        """Chaves ainda válidas (não expiradas)."""
+        linhas = self._conexao().execute(
+            "SELECT chave FROM cache WHERE expira_em = 0 OR expira_em > ?", (time.time(),)
+        ).fetchall()
+        return [linha[0] for linha in linhas]
+
+    def __len__(self) -> int:
+        return self._conexao().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+def criar_backend(nome: str = CACHE_BACKEND):
+    """Cria o backend configurado em CACHE_BACKEND ('memory' ou 'sqlite')."""
+    if (nome or '').lower() == 'memory':
+        return MemoryCacheBackend()
+    try:
+        return SQLiteCacheBackend()
+    except sqlite3.Error as e:
+        print(f"Erro ao abrir cache SQLite ({CACHE_FILE}): {e}. Usando cache em memória.")
+        return MemoryCacheBackend()
+
 
 class ResponseCache:
-    def __init__(self, cache_file: str = "sistema_de_cache.json"):
-        self.cache_file = cache_file
-        self.cache: Dict[str, str] = {}
-        self.load_cache()
-    
-    def load_cache(self):
-        """Carrega o cache do arquivo"""
-        try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    self.cache = json.load(f)
-        except Exception:
-            self.cache = {}
-    
-    def save_cache(self):
-        """Salva o cache no arquivo"""
+    # Intervalo (s) para recarregar o índice de paráfrases a partir do backend,
+    # que pode ter sido alterado por outros workers ou ter expirado entradas
+    INTERVALO_INDICE = 30
+
+    def __init__(self, backend=None, fuzzy: bool = CACHE_FUZZY_ENABLED,
+                 limiar_fuzzy: float = CACHE_FUZZY_THRESHOLD):
+        self.backend = backend if backend is not None else criar_backend()
+        self.fuzzy = fuzzy
+        self.limiar_fuzzy = limiar_fuzzy
+        self._indice = IndiceTokens()
+        self._indice_atualizado_em = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.sets = 0
+
+    def get_cache_key(self, query: str, namespace: str = '') -> str:
+        """Gera uma chave canônica para a consulta (ver normalizar_chave).
+
+        namespace separa respostas que dependem de dados versionados
+        (ex.: 'horarios@<versão>'); a chave fica '<namespace>|<chave canônica>'.
+        """
+        chave = normalizar_chave(query)
+        return f"{namespace}|{chave}" if namespace else chave
+
+    def _atualizar_indice(self):
+        agora = time.time()
+        if agora - self._indice_atualizado_em < self.INTERVALO_INDICE:
+            return
+        indice = IndiceTokens()
+        for chave in self.backend.keys():
+            if '|' not in chave:  # chaves com namespace não participam da busca aproximada
+                indice.adicionar(chave)
+        self._indice = indice
+        self._indice_atualizado_em = agora
+
+    def _buscar_parecida(self, key: str) -> Optional[str]:
+        with self._lock:
+            self._atualizar_indice()
+            parecida = self._indice.mais_parecida(key, self.limiar_fuzzy)
+        if parecida is None or parecida == key:
+            return None
+        valor = self.backend.get(parecida)
+        if valor is None:
+            with self._lock:
+                self._indice.remover(parecida)
+        return valor
+
+    def get(self, query: str, namespace: str = '') -> Optional[str]:
+        """Obtém resposta do cache (exata pela chave canônica e, se ativo, por paráfrase)."""
+        key = self.get_cache_key(query, namespace)
+        aproximada = False
         try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
-    
-    def get_cache_key(self, query: str) -> str:
-        """Gera uma chave normalizada para a consulta (texto em minúsculas)."""
-        return (query or "").strip().lower()
-    
-    def get(self, query: str) -> Optional[str]:
-        """Obtém resposta do cache"""
-        key = self.get_cache_key(query)
-        return self.cache.get(key)
-    
-    def set(self, query: str, response: str):
+            valor = self.backend.get(key)
+            if valor is None and self.fuzzy and not namespace:
+                valor = self._buscar_parecida(key)
+                aproximada = valor is not None
+        except Exception as e:
+            print(f"Erro ao ler cache: {e}")
+            valor = None
+        with self._lock:
+            if valor is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                if aproximada:
+                    self.fuzzy_hits += 1
+        return valor
+
+    def set(self, query: str, response: str, namespace: str = ''):
         """Armazena resposta no cache"""
-        key = self.get_cache_key(query)
-        self.cache[key] = response
-        self.save_cache()
-    
+        key = self.get_cache_key(query, namespace)
+        try:
+            self.backend.set(key, response)
+        except Exception as e:
+            print(f"Erro ao gravar cache: {e}")
+            return
+        with self._lock:
+            self.sets += 1
+            if self.fuzzy and not namespace:
+                self._indice.adicionar(key)
+
+    def invalidar_namespace(self, nome: str, atual: str = '') -> int:
+        """Remove as entradas do namespace 'nome@...' que não sejam da versão atual."""
+        removidas = 0
+        try:
+            for chave in self.backend.keys():
+                namespace = chave.split('|', 1)[0] if '|' in chave else ''
+                if namespace.startswith(nome + '@') and namespace != atual:
+                    self.backend.delete(chave)
+                    removidas += 1
+        except Exception as e:
+            print(f"Erro ao invalidar cache: {e}")
+        return removidas
+
     def clear(self):
         """Limpa o cache"""
-        self.cache = {}
-        self.save_cache()
+        self.backend.clear()
+        with self._lock:
+            self._indice = IndiceTokens()
+
+    def stats(self) -> Dict:
+        """Contadores de uso do cache (por processo)."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'entradas': len(self.backend),
+                'hits': self.hits,
+                'fuzzy_hits': self.fuzzy_hits,
+                'misses': self.misses,
+                'taxa_acerto': round(self.hits / total, 3) if total else 0.0,
+                'sets': self.sets,
+                'evictions': self.backend.evictions,
+                'expiradas': self.backend.expired,
+            }
 
 # Instância global do cache
 response_cache = ResponseCache()
@@ -83,23 +441,28 @@ SENSITIVE_CACHE_KEYWORDS = [
     "moreira"
 ]
 
-def get_cached_response(query: str) -> Optional[str]:
-    """Obtém resposta do cache ou respostas pré-definidas"""
+def get_cached_response(query: str, contexto=None) -> Optional[str]:
+    """Obtém resposta do cache ou respostas pré-definidas
+
+    contexto: ContextoMensagem já calculado para a mensagem (evita reclassificar).
+    """
     query_lower = query.lower().strip()
     
     if any(keyword in query_lower for keyword in SENSITIVE_CACHE_KEYWORDS):
         return None
     
+    from utils.contexto_mensagem import criar_contexto
+    intencao = criar_contexto(query, contexto).intencao
+    
     # NÃO usar respostas pré-definidas se for pergunta sobre horários de aulas/professores/turmas
     # (essas perguntas devem ser tratadas pelo sistema de horários)
-    from utils.chat_manager import _eh_pergunta_sobre_horarios, _deve_usar_lm_studio
-    if _eh_pergunta_sobre_horarios(query):
-        # Verificar apenas cache, não respostas pré-definidas
-        return response_cache.get(query)
+    if intencao.horario_escolar:
+        # Verificar apenas cache (da versão atual dos horários), não respostas pré-definidas
+        return response_cache.get(query, _namespace_horarios())
     
     # NÃO usar respostas pré-definidas se a pergunta deveria usar LM Studio
     # (perguntas complexas devem passar pelo LM para respostas mais detalhadas)
-    if _deve_usar_lm_studio(query, []):
+    if intencao.usar_lm:
         # Verificar apenas cache, não respostas pré-definidas
         return response_cache.get(query)
     
@@ -111,9 +474,7 @@ def get_cached_response(query: str) -> Optional[str]:
     
     # Verificar respostas pré-definidas (busca por substring) - APENAS para perguntas simples
     # Não usar para perguntas complexas que contêm palavras como "me fale", "quais são", etc.
-    palavras_complexas = ['me fale', 'quais são', 'quais sao', 'conte sobre', 'fale sobre', 
-                          'explique', 'detalhe', 'informe sobre', 'me informe']
-    e_pergunta_simples = not any(palavra in query_lower for palavra in palavras_complexas)
+    e_pergunta_simples = not intencao.tem('pergunta_complexa')
     
     # Casos especiais: perguntas sobre número da secretaria devem usar resposta de telefone
     if 'numero' in query_lower and 'secretaria' in query_lower:
@@ -133,9 +494,28 @@ def get_cached_response(query: str) -> Optional[str]:
     # Verificar cache
     return response_cache.get(query)
 
+def _namespace_horarios() -> str:
+    """Respostas sobre horários ficam atreladas à versão dos arquivos de horário."""
+    return 'horarios@' + versao_horarios()
+
+
+def _ao_recarregar_horarios(tipo: str, versao: str):
+    """Descarta respostas de horários geradas com arquivos anteriores."""
+    removidas = response_cache.invalidar_namespace('horarios', 'horarios@' + versao)
+    if removidas:
+        print(f"Cache: {removidas} resposta(s) de horários invalidada(s) após recarga de {tipo}")
+
+
+registrar_ao_recarregar(_ao_recarregar_horarios)
+
+
 def cache_response(query: str, response: str):
     """Armazena resposta no cache"""
     query_lower = (query or "").lower()
     if any(keyword in query_lower for keyword in SENSITIVE_CACHE_KEYWORDS):
         return
-    response_cache.set(query, response)
+    from utils.intent_router import classificar_mensagem
+    if classificar_mensagem(query).horario_escolar:
+        response_cache.set(query, response, _namespace_horarios())
+    else:
+        response_cache.set(query, response)
@@ -0,0 +1,76 @@
+"""
+Respostas HTTP condicionais e comprimidas
+
+- etag_para(...): ETag fraca a partir das partes que identificam o conteúdo;
+- nao_modificado(etag): resposta 304 se o cliente já tem essa versão
+  (If-None-Match);
+- @comprimir: comprime a resposta com br (se o pacote brotli estiver
+  instalado) ou gzip, conforme o Accept-Encoding do cliente.
+"""
+import gzip
+import hashlib
+from functools import wraps
+from typing import Optional
+
+from flask import Response, make_response, request
+
+try:
+    import brotli  # opcional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Abaixo disso a compressão não compensa o custo
+TAMANHO_MINIMO_COMPRESSAO = 1024
+
+
+def etag_para(*partes) -> str:
+    """ETag estável para a combinação das partes (versão do conteúdo + parâmetros)."""
+    return hashlib.sha1('|'.join(str(parte) for parte in partes).encode('utf-8')).hexdigest()[:32]
+
+
+def nao_modificado(etag: str) -> Optional[Response]:
+    """Resposta 304 se o If-None-Match do cliente já contém a ETag; senão None."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    resposta = Response(status=304)
+    resposta.set_etag(etag, weak=True)
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+
+def _codificacao_aceita() -> Optional[str]:
+    aceitas = request.accept_encodings
+    if brotli is not None and aceitas['br']:
+        return 'br'
+    if aceitas['gzip']:
+        return 'gzip'
+    return None
+
+
+def comprimir_resposta(resposta: Response) -> Response:
+    """Comprime o corpo da resposta se o cliente aceitar e valer a pena."""
+    resposta.vary.add('Accept-Encoding')
+    if (resposta.status_code != 200 or resposta.direct_passthrough
+            or 'Content-Encoding' in resposta.headers):
+        return resposta
+    corpo = resposta.get_data()
+    if len(corpo) < TAMANHO_MINIMO_COMPRESSAO:
+        return resposta
+    codificacao = _codificacao_aceita()
+    if codificacao == 'br':
+        corpo = brotli.compress(corpo, quality=5)
+    elif codificacao == 'gzip':
+        corpo = gzip.compress(corpo, compresslevel=6)
+    else:
+        return resposta
+    resposta.set_data(corpo)
+    resposta.headers['Content-Encoding'] = codificacao
+    return resposta
+
+
+def comprimir(view):
+    """Decorator de rota: aplica comprimir_resposta ao retorno da view."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return comprimir_resposta(make_response(view(*args, **kwargs)))
+    return wrapper
@@ -1,9 +1,94 @@
 """
 Gerenciador de sessão e histórico de chat usando MySQL
 """
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+from sqlalchemy import and_, func, insert, or_
+from sqlalchemy.exc import IntegrityError
+from config import CHAT_HISTORY_WINDOW, CHAT_SUMMARY_ENABLED
 from models.sqlalchemy_models import db, Chat, Mensagem
+from utils.chat_summarizer import resumidor_chats
+from utils.event_bus import notificar
+
+# Caracteres da última mensagem mostrados na lista de chats
+TAMANHO_PREVIA = 50
+
+
+def _codificar_cursor(momento: Optional[datetime], pk: int, *extras: int) -> Optional[str]:
+    """Cursor opaco de paginação: posição (momento, id) do último item da página.
+
+    `extras` são inteiros a mais guardados no cursor (ex.: seq da mensagem).
+    """
+    if not momento:
+        return None
+    return '|'.join([momento.isoformat(), str(pk)] + [str(extra) for extra in extras])
+
+
+def _decodificar_cursor(cursor: Optional[str], extras: int = 0) -> Optional[Tuple]:
+    """Interpreta o cursor de _codificar_cursor; cursor inválido equivale à primeira página."""
+    if not cursor:
+        return None
+    try:
+        partes = cursor.split('|')
+        if len(partes) != 2 + extras:
+            raise ValueError(cursor)
+        return (datetime.fromisoformat(partes[0]),) + tuple(int(parte) for parte in partes[1:])
+    except (ValueError, TypeError):
+        print(f"Cursor de paginação inválido: {cursor!r}")
+        return None
+
+
+def _mensagens_recentes(chat_pk: int, limite: int, apos: Optional[int] = None) -> List[Mensagem]:
+    """Últimas `limite` mensagens do chat, em ordem cronológica (ORDER BY ... DESC LIMIT N).
+
+    Com `apos`, só as mensagens de id maior (as que o resumo do chat ainda não cobre).
+    """
+    query = Mensagem.query.filter_by(chat_id=chat_pk)
+    if apos is not None:
+        query = query.filter(Mensagem.id > apos)
+    recentes = (
+        query
+        .order_by(Mensagem.created_at.desc(), Mensagem.id.desc())
+        .limit(limite)
+        .all()
+    )
+    recentes.reverse()
+    return recentes
+
+
+def _mensagem_para_dict(msg: Mensagem) -> Dict:
+    """Formato de uma mensagem no histórico (o mesmo de get_chat_history)."""
+    return {
+        "text": msg.text,
+        "sender": msg.sender,
+        "timestamp": msg.created_at.isoformat() if msg.created_at else datetime.now().isoformat(),
+        "nome_usuario": msg.nome_usuario
+    }
+
+
+class TurnoChat:
+    """Unidade de trabalho de um turno do chat (pergunta do usuário + resposta).
+
+    Criado por SessionManager.iniciar_turno e gravado por
+    SessionManager.registrar_turno. Guarda apenas valores simples (nada de
+    objetos ORM), então pode atravessar a inferência sem segurar conexão.
+    """
+
+    __slots__ = ('chat_id', 'chat_pk', 'user_id', 'session_id', 'autorizado', 'historico', 'mensagem_usuario',
+                 'resumo')
+
+    def __init__(self, chat_id: str, user_id: Optional[str], session_id: Optional[str]):
+        self.chat_id = chat_id
+        self.chat_pk: Optional[int] = None  # None: chat ainda não existe no banco
+        self.user_id = user_id
+        self.session_id = session_id
+        self.autorizado = False
+        # Janela recente do histórico, já incluindo a pergunta atual
+        self.historico: List[Dict] = []
+        # Pergunta a gravar em registrar_turno (None se repetida)
+        self.mensagem_usuario: Optional[Dict] = None
+        # Resumo das mensagens anteriores ao histórico (só com CHAT_SUMMARY_ENABLED)
+        self.resumo: Optional[str] = None
 
 
 class SessionManager:
@@ -29,26 +114,254 @@ class SessionManager:
                 # Sem user_id nem session_id, não retornar nada
                 return []
             
-            mensagens = Mensagem.query.filter_by(chat_id=chat.id).order_by(Mensagem.created_at).all()
-            
-            history = []
-            for msg in mensagens:
-                history.append({
-                    "text": msg.text,
-                    "sender": msg.sender,
-                    "timestamp": msg.created_at.isoformat() if msg.created_at else datetime.now().isoformat(),
-                    "nome_usuario": msg.nome_usuario
-                })
+            mensagens = Mensagem.query.filter_by(chat_id=chat.id).order_by(Mensagem.created_at, Mensagem.id).all()
             
-            return history
+            return [_mensagem_para_dict(msg) for msg in mensagens]
         except Exception as e:
             print(f"Erro ao recuperar histórico: {e}")
             return []
     
-    def save_chat(self, chat_id: str, title: str, messages: List[Dict], user_id: Optional[str] = None, session_id: Optional[str] = None) -> None:
-        """Salva ou atualiza um chat (por usuário ou sessão anônima)."""
+    def _chat_autorizado(self, chat_id: str, user_id: Optional[str], session_id: Optional[str]) -> Optional[int]:
+        """id interno do chat se ele pertence ao usuário ou sessão; senão None."""
+        if not user_id and not session_id:
+            return None
+        chat = db.session.query(Chat.id, Chat.user_id, Chat.session_id).filter(Chat.chat_id == chat_id).first()
+        if not chat:
+            return None
+        if user_id:
+            return chat.id if str(chat.user_id) == str(user_id) else None
+        return chat.id if str(chat.session_id) == str(session_id) else None
+
+    def _criar_chat(self, chat_id: str, user_id: Optional[str], session_id: Optional[str],
+                    title: str = 'Nova Conversa') -> Tuple[Optional[int], bool]:
+        """Cria o chat na transação atual; retorna (id interno, criado).
+
+        Se outra requisição (ex.: /chat/save) criou o mesmo chat_id enquanto
+        isso, o INSERT falha só no savepoint e o chat existente é usado, desde
+        que pertença ao mesmo usuário ou sessão (senão o id volta None).
+        """
+        chat = Chat(
+            chat_id=chat_id,
+            user_id=int(user_id) if user_id else None,
+            session_id=session_id if not user_id else None,
+            title=title
+        )
+        try:
+            with db.session.begin_nested():
+                db.session.add(chat)
+            return chat.id, True
+        except IntegrityError:
+            return self._chat_autorizado(chat_id, user_id, session_id), False
+
+    def history_signature(self, chat_id: str, user_id: Optional[str] = None,
+                          session_id: Optional[str] = None) -> Optional[Tuple[int, int, int]]:
+        """Versão do histórico em uma consulta: (id do chat, total de mensagens, id da última).
+
+        Como as mensagens só são acrescentadas (save_chat/registrar_turno), o
+        par (total, última) muda sempre que o histórico muda. None se o chat
+        não existe ou não pertence ao usuário/sessão.
+        """
         if not user_id and not session_id:
+            return None
+        try:
+            linha = (
+                db.session.query(Chat.id, Chat.user_id, Chat.session_id, func.count(Mensagem.id), func.max(Mensagem.id))
+                .outerjoin(Mensagem, Mensagem.chat_id == Chat.id)
+                .filter(Chat.chat_id == chat_id)
+                .group_by(Chat.id, Chat.user_id, Chat.session_id)
+                .first()
+            )
+            if not linha:
+                return None
+            chat_pk, dono, sessao, total, ultima = linha
+            if user_id:
+                if str(dono) != str(user_id):
+                    return None
+            elif str(sessao) != str(session_id):
+                return None
+            return chat_pk, total or 0, ultima or 0
+        except Exception as e:
+            print(f"Erro ao verificar versão do histórico: {e}")
+            return None
+
+    def get_chat_history_page(self, chat_id: str, limit: int, cursor: Optional[str] = None,
+                              user_id: Optional[str] = None, session_id: Optional[str] = None,
+                              signature: Optional[Tuple[int, int, int]] = None) -> Tuple[List[Dict], Optional[str], int]:
+        """Recupera uma página do histórico, das mensagens mais novas para as mais antigas.
+
+        Sem `cursor` devolve as últimas `limit` mensagens; com o `next_cursor`
+        da página anterior, as `limit` anteriores a ela. Cada página vem em
+        ordem cronológica e cada mensagem traz `seq` (posição no chat, a mesma
+        usada por save_chat). Retorna (mensagens, next_cursor, seq da primeira).
+        `signature` (de history_signature) evita resolver o chat e contar de novo.
+        """
+        try:
+            if signature is not None:
+                chat_pk, total, _ = signature
+            else:
+                chat_pk, total = self._chat_autorizado(chat_id, user_id, session_id), None
+            if chat_pk is None:
+                return [], None, 0
+
+            query = Mensagem.query.filter_by(chat_id=chat_pk)
+            posicao = _decodificar_cursor(cursor, extras=1)
+            if posicao:
+                criado_em, msg_pk, seq_fim = posicao
+                query = query.filter(or_(
+                    Mensagem.created_at < criado_em,
+                    and_(Mensagem.created_at == criado_em, Mensagem.id < msg_pk)
+                ))
+            elif total is not None:
+                seq_fim = total
+            else:
+                seq_fim = db.session.query(func.count(Mensagem.id)).filter(Mensagem.chat_id == chat_pk).scalar() or 0
+
+            # Um registro a mais indica se existem mensagens mais antigas
+            linhas = query.order_by(Mensagem.created_at.desc(), Mensagem.id.desc()).limit(limit + 1).all()
+            mais_antigas = len(linhas) > limit
+            pagina = list(reversed(linhas[:limit]))
+            primeiro_seq = max(seq_fim - len(pagina), 0)
+
+            history = []
+            for seq, msg in enumerate(pagina, start=primeiro_seq):
+                item = _mensagem_para_dict(msg)
+                item['seq'] = seq
+                history.append(item)
+
+            next_cursor = None
+            if mais_antigas and pagina:
+                next_cursor = _codificar_cursor(pagina[0].created_at, pagina[0].id, primeiro_seq)
+            return history, next_cursor, primeiro_seq
+        except Exception as e:
+            print(f"Erro ao recuperar histórico: {e}")
+            return [], None, 0
+
+    def iniciar_turno(self, chat_id: str, mensagem: str, user_id: Optional[str] = None,
+                      session_id: Optional[str] = None, nome_usuario: Optional[str] = None,
+                      janela: int = CHAT_HISTORY_WINDOW) -> TurnoChat:
+        """Resolve e autoriza o chat uma vez e carrega só a janela recente do histórico.
+
+        Faz no máximo duas consultas (chat e últimas mensagens) e encerra a
+        transação antes de devolver, para a conexão voltar ao pool durante a
+        inferência. A pergunta entra no histórico do turno, mas só é gravada em
+        registrar_turno, junto com a resposta.
+        """
+        turno = TurnoChat(chat_id, user_id, session_id)
+        if not user_id and not session_id:
+            return turno
+
+        try:
+            chat = (
+                db.session.query(Chat.id, Chat.user_id, Chat.session_id, Chat.resumo, Chat.resumo_ate)
+                .filter(Chat.chat_id == chat_id).first()
+            )
+            if chat:
+                # Verificar se o chat pertence ao usuário ou sessão
+                if user_id:
+                    if str(chat.user_id) != str(user_id):
+                        return turno
+                elif str(chat.session_id) != str(session_id):
+                    return turno
+                turno.chat_pk = chat.id
+                # Com resumo, o histórico começa depois da última mensagem resumida
+                apos = None
+                if CHAT_SUMMARY_ENABLED and chat.resumo:
+                    turno.resumo = chat.resumo
+                    apos = chat.resumo_ate
+                # A pergunta atual completa a janela
+                turno.historico = [
+                    _mensagem_para_dict(msg) for msg in _mensagens_recentes(chat.id, max(janela - 1, 1), apos)
+                ]
+            turno.autorizado = True
+
+            # Evitar duplicação (reenvio da mesma pergunta)
+            ultima = turno.historico[-1] if turno.historico else None
+            if not (ultima and ultima['text'] == mensagem and ultima['sender'] == 'user'):
+                turno.mensagem_usuario = {
+                    "text": mensagem,
+                    "sender": "user",
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "nome_usuario": nome_usuario
+                }
+                turno.historico.append(turno.mensagem_usuario)
+            return turno
+        except Exception as e:
+            print(f"Erro ao iniciar turno do chat: {e}")
+            return turno
+        finally:
+            # Só leitura: encerra a transação e devolve a conexão ao pool
+            db.session.rollback()
+
+    def registrar_turno(self, turno: TurnoChat, resposta: Optional[str]) -> None:
+        """Grava a pergunta e a resposta do turno em uma única transação.
+
+        Cria o chat se ainda não existir (ou usa o que outra requisição criou
+        durante a inferência). Com resposta None, grava só a pergunta (ex.:
+        servidor ocupado).
+        """
+        if not turno.autorizado or (turno.mensagem_usuario is None and not resposta):
             return
+
+        try:
+            agora = datetime.utcnow()
+            criado = False
+            if turno.chat_pk is None:
+                turno.chat_pk, criado = self._criar_chat(turno.chat_id, turno.user_id, turno.session_id)
+                if turno.chat_pk is None:
+                    print(f"Chat {turno.chat_id} pertence a outro usuário ou sessão; turno não registrado")
+                    db.session.rollback()
+                    return
+
+            # Inseridas no mesmo lote, na ordem: o id desempata created_at iguais
+            linhas = []
+            if turno.mensagem_usuario is not None:
+                linhas.append({
+                    'chat_id': turno.chat_pk,
+                    'text': turno.mensagem_usuario['text'],
+                    'sender': 'user',
+                    'nome_usuario': turno.mensagem_usuario['nome_usuario'],
+                    'created_at': datetime.fromisoformat(turno.mensagem_usuario['timestamp'])
+                })
+            if resposta:
+                linhas.append({
+                    'chat_id': turno.chat_pk,
+                    'text': resposta,
+                    'sender': 'ai',
+                    'nome_usuario': None,
+                    'created_at': agora
+                })
+
+            db.session.execute(insert(Mensagem.__table__), linhas)
+            # Atualizar timestamp do chat (o recém-criado já nasce com updated_at)
+            if not criado:
+                db.session.query(Chat).filter(Chat.id == turno.chat_pk).update(
+                    {Chat.updated_at: agora}, synchronize_session=False
+                )
+            db.session.commit()
+            notificar(turno.user_id, turno.session_id, 'chats', chat_id=turno.chat_id, acao='mensagem')
+            turno.mensagem_usuario = None
+            if resposta:
+                # Em segundo plano: resume as mensagens antigas quando a conversa acumular turnos
+                resumidor_chats.agendar(turno.chat_pk)
+        except Exception as e:
+            print(f"Erro ao registrar turno do chat: {e}")
+            db.session.rollback()
+
+    def save_chat(self, chat_id: str, title: str, messages: List[Dict], user_id: Optional[str] = None, session_id: Optional[str] = None) -> Optional[int]:
+        """Salva ou atualiza um chat (por usuário ou sessão anônima).
+
+        Os turnos do chat são gravados pelo servidor (iniciar_turno /
+        registrar_turno); a página só manda o título. Mensagens aqui servem
+        para importar uma conversa e a gravação é incremental (só acrescenta):
+        cada mensagem traz `seq`, sua posição no chat (0, 1, 2...); sem `seq`,
+        vale a posição na lista recebida. Mensagens com `seq` abaixo do total
+        já gravado são ignoradas; as novas precisam continuar a sequência sem
+        lacunas (a partir da primeira lacuna nada é gravado, para não mudar a
+        posição de mensagens) e entram em um único INSERT em lote. Retorna o
+        total de mensagens do chat (próximo `seq`), ou None se nada foi salvo.
+        """
+        if not user_id and not session_id:
+            return None
         
         try:
             # Buscar ou criar chat
@@ -64,44 +377,65 @@ class SessionManager:
                 )
                 db.session.add(chat)
                 db.session.flush()  # Para obter o ID do chat
+                existentes = 0
             else:
                 # Verificar se o chat pertence ao usuário ou sessão
                 if user_id:
                     if str(chat.user_id) != str(user_id):
-                        return
+                        return None
                 elif session_id:
                     if str(chat.session_id) != str(session_id):
-                        return
+                        return None
                 # Atualizar título se fornecido
                 if title:
                     chat.title = title
                     chat.updated_at = datetime.utcnow()
+                existentes = (
+                    db.session.query(func.count(Mensagem.id)).filter(Mensagem.chat_id == chat.id).scalar() or 0
+                ) if messages else 0
+            
+            # Só as mensagens que o servidor ainda não tem (seq >= total gravado)
+            recebidas = {}
+            for posicao, msg_data in enumerate(messages or []):
+                seq = msg_data.get('seq')
+                seq = seq if isinstance(seq, int) and not isinstance(seq, bool) else posicao
+                if seq >= existentes and seq not in recebidas:
+                    recebidas[seq] = msg_data
+            # Sequência contínua a partir do total gravado; o que vem depois de uma lacuna fica de fora
+            novas = []
+            while existentes + len(novas) in recebidas:
+                novas.append(recebidas[existentes + len(novas)])
+            if len(novas) < len(recebidas):
+                print(f"Chat {chat_id}: {len(recebidas) - len(novas)} mensagem(ns) após lacuna na sequência ignorada(s)")
             
-            # Se há mensagens para salvar, substituir todas as mensagens existentes
-            if messages:
-                # Deletar mensagens antigas
-                Mensagem.query.filter_by(chat_id=chat.id).delete()
-                
-                # Adicionar novas mensagens
-                for msg_data in messages:
-                    msg = Mensagem(
-                        chat_id=chat.id,
-                        text=msg_data.get('text', '') or msg_data.get('texto', ''),
-                        sender=msg_data.get('sender', '') or msg_data.get('remetente', ''),
-                        nome_usuario=msg_data.get('nome_usuario')
-                    )
+            if novas:
+                linhas = []
+                for msg_data in novas:
+                    linha = {
+                        'chat_id': chat.id,
+                        'text': msg_data.get('text', '') or msg_data.get('texto', '') or '',
+                        'sender': msg_data.get('sender', '') or msg_data.get('remetente', '') or '',
+                        'nome_usuario': msg_data.get('nome_usuario'),
+                        'created_at': datetime.utcnow()
+                    }
                     # Se há timestamp, usar; senão usar agora
-                    if 'timestamp' in msg_data:
+                    if msg_data.get('timestamp'):
                         try:
-                            msg.created_at = datetime.fromisoformat(msg_data['timestamp'].replace('Z', '+00:00'))
-                        except:
+                            linha['created_at'] = datetime.fromisoformat(msg_data['timestamp'].replace('Z', '+00:00'))
+                        except (ValueError, TypeError, AttributeError):
                             pass
-                    db.session.add(msg)
+                    linhas.append(linha)
+                # executemany: um único INSERT para o lote
+                db.session.execute(insert(Mensagem.__table__), linhas)
+                chat.updated_at = datetime.utcnow()
             
             db.session.commit()
+            notificar(user_id, session_id, 'chats', chat_id=chat_id, acao='salvo')
+            return existentes + len(novas)
         except Exception as e:
             print(f"Erro ao salvar chat: {e}")
             db.session.rollback()
+            return None
     
     def delete_chat(self, chat_id: str, user_id: Optional[str] = None, session_id: Optional[str] = None) -> bool:
         """Deleta um chat (por usuário ou sessão anônima)."""
@@ -124,6 +458,7 @@ class SessionManager:
             # Deletar chat (mensagens serão deletadas automaticamente por CASCADE)
             db.session.delete(chat)
             db.session.commit()
+            notificar(user_id, session_id, 'chats', chat_id=chat_id, acao='excluido')
             return True
         except Exception as e:
             print(f"Erro ao deletar chat: {e}")
@@ -132,37 +467,77 @@ class SessionManager:
     
     def list_chats(self, user_id: Optional[str] = None, session_id: Optional[str] = None) -> List[Dict]:
         """Lista todos os chats do usuário logado ou sessão anônima."""
+        chats, _ = self.list_chats_page(user_id=user_id, session_id=session_id)
+        return chats
+
+    def list_chats_page(self, user_id: Optional[str] = None, session_id: Optional[str] = None,
+                        limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Lista uma página de chats (mais recentes primeiro) em uma única consulta.
+
+        A prévia da última mensagem vem de uma subconsulta correlacionada no
+        mesmo SELECT, que lê uma linha pelo índice (chat_id, created_at), sem
+        uma consulta extra por chat. A lista não traz a contagem de mensagens:
+        contar custaria uma varredura das mensagens de cada chat listado, e o
+        custo cresceria com o histórico. A paginação é por cursor em (updated_at, id): `cursor` é o `next_cursor`
+        devolvido pela página anterior; sem `limit`, retorna todos os chats.
+        """
         if not user_id and not session_id:
-            return []
-        
+            return [], None
+
         try:
+            ultima = (
+                db.session.query(func.substr(Mensagem.text, 1, TAMANHO_PREVIA + 1))
+                .filter(Mensagem.chat_id == Chat.id)
+                .order_by(Mensagem.created_at.desc(), Mensagem.id.desc())
+                .limit(1)
+                .correlate(Chat)
+                .scalar_subquery()
+            )
+            query = db.session.query(Chat.id, Chat.chat_id, Chat.title, Chat.updated_at, ultima)
             if user_id:
-                chats = Chat.query.filter_by(user_id=int(user_id)).order_by(Chat.updated_at.desc()).all()
+                query = query.filter(Chat.user_id == int(user_id))
             else:
-                chats = Chat.query.filter_by(session_id=session_id).order_by(Chat.updated_at.desc()).all()
-            
+                query = query.filter(Chat.session_id == session_id)
+
+            posicao = _decodificar_cursor(cursor)
+            if posicao:
+                atualizado_em, chat_pk = posicao
+                query = query.filter(or_(
+                    Chat.updated_at < atualizado_em,
+                    and_(Chat.updated_at == atualizado_em, Chat.id < chat_pk)
+                ))
+
+            query = query.order_by(Chat.updated_at.desc(), Chat.id.desc())
+            if limit:
+                # Um registro a mais indica se existe próxima página
+                query = query.limit(limit + 1)
+            linhas = query.all()
+
+            next_cursor = None
+            if limit and len(linhas) > limit:
+                linhas = linhas[:limit]
+                next_cursor = _codificar_cursor(linhas[-1].updated_at, linhas[-1].id)
+
             result = []
-            for chat in chats:
-                # Buscar última mensagem
-                last_msg = Mensagem.query.filter_by(chat_id=chat.id).order_by(Mensagem.created_at.desc()).first()
+            for chat_pk, chat_id, title, updated_at, texto in linhas:
                 last_message = ""
-                if last_msg:
-                    last_message = last_msg.text[:50]
-                    if len(last_msg.text) > 50:
+                if texto:
+                    last_message = texto[:TAMANHO_PREVIA]
+                    if len(texto) > TAMANHO_PREVIA:
                         last_message += "..."
-                
+
                 result.append({
-                    'id': chat.chat_id,
-                    'title': chat.title,
+                    'id': chat_id,
+                    'title': title,
                     'lastMessage': last_message,
-                    'timestamp': chat.updated_at.isoformat() if chat.updated_at else datetime.now().isoformat()
+                    'timestamp': updated_at.isoformat() if updated_at else datetime.now().isoformat()
                 })
-            
-            return result
+
+            return result, next_cursor
         except Exception as e:
             print(f"Erro ao listar chats: {e}")
-            return []
-    
+            return [], None
+
     def add_message(self, chat_id: str, text: str, sender: str, user_id: Optional[str] = None, session_id: Optional[str] = None, nome_usuario: Optional[str] = None) -> None:
         """Adiciona uma mensagem ao histórico do chat (por usuário ou sessão anônima)."""
         if not user_id and not session_id:
@@ -209,6 +584,7 @@ class SessionManager:
             chat.updated_at = datetime.utcnow()
             
             db.session.commit()
+            notificar(user_id, session_id, 'chats', chat_id=chat_id, acao='mensagem')
         except Exception as e:
             print(f"Erro ao adicionar mensagem: {e}")
             db.session.rollback()
@@ -254,6 +630,7 @@ class SessionManager:
             chat.title = title
             chat.updated_at = datetime.utcnow()
             db.session.commit()
+            notificar(user_id, session_id, 'chats', chat_id=chat_id, acao='titulo')
         except Exception as e:
             print(f"Erro ao atualizar título: {e}")
             db.session.rollback()
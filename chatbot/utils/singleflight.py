@@ -0,0 +1,153 @@
+"""
+Coalescência de chamadas idênticas em andamento (single-flight)
+
+Quando várias pessoas fazem a mesma pergunta ao mesmo tempo, apenas a
+primeira chamada (líder) vai ao LM Studio; as demais (seguidoras) aguardam e
+recebem o mesmo texto. Nas respostas em streaming as seguidoras recebem os
+mesmos pedaços, à medida que o líder os produz.
+
+Se o líder para antes do fim (erro, ou o cliente dele desconectou no meio do
+stream), o voo é marcado como falho: as seguidoras recebem VooInterrompido
+em vez de tratar o texto parcial como resposta completa.
+"""
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from config import LM_LATENCY_BUDGET
+
+
+class VooInterrompido(Exception):
+    """Levantada para as seguidoras quando o líder não chegou ao fim (texto parcial)."""
+
+
+class _Voo:
+    """Estado de uma chamada em andamento, compartilhado entre líder e seguidoras."""
+
+    __slots__ = ('pedacos', 'terminado', 'falhou', 'cond', 'seguidores')
+
+    def __init__(self):
+        self.pedacos = []
+        self.terminado = False
+        self.falhou = False
+        self.cond = threading.Condition()
+        self.seguidores = 0
+
+    def publicar(self, pedaco: str) -> None:
+        with self.cond:
+            self.pedacos.append(pedaco)
+            self.cond.notify_all()
+
+    def encerrar(self, falhou: bool = False) -> None:
+        with self.cond:
+            self.terminado = True
+            self.falhou = falhou
+            self.cond.notify_all()
+
+    def acompanhar(self, espera_max: float) -> Iterator[str]:
+        """Entrega os pedaços publicados (desde o início) até o líder encerrar.
+
+        Levanta VooInterrompido se o líder falhou ou se a espera passou de espera_max.
+        """
+        prazo = time.monotonic() + espera_max
+        indice = 0
+        while True:
+            with self.cond:
+                while indice >= len(self.pedacos) and not self.terminado:
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        raise VooInterrompido("tempo de espera pelo líder esgotado")
+                    self.cond.wait(restante)
+                novos = self.pedacos[indice:]
+                terminado, falhou = self.terminado, self.falhou
+            indice += len(novos)
+            for pedaco in novos:
+                yield pedaco
+            if terminado and indice >= len(self.pedacos):
+                if falhou:
+                    raise VooInterrompido("o líder parou antes do fim da resposta")
+                return
+
+
+class SingleFlight:
+    """Agrupa chamadas com a mesma chave enquanto a primeira ainda está em andamento."""
+
+    def __init__(self, espera_max: float = LM_LATENCY_BUDGET + 10):
+        self.espera_max = espera_max
+        self._lock = threading.Lock()
+        self._voos: Dict[str, _Voo] = {}
+        self._lideres = 0
+        self._seguidores = 0
+
+    def _entrar(self, chave: str) -> Tuple[_Voo, bool]:
+        with self._lock:
+            voo = self._voos.get(chave)
+            if voo is not None:
+                voo.seguidores += 1
+                self._seguidores += 1
+                return voo, False
+            voo = _Voo()
+            self._voos[chave] = voo
+            self._lideres += 1
+            return voo, True
+
+    def _sair(self, chave: str, voo: _Voo, falhou: bool) -> None:
+        with self._lock:
+            if self._voos.get(chave) is voo:
+                del self._voos[chave]
+        voo.encerrar(falhou)
+
+    def fazer(self, chave: str, fn: Callable[[], Optional[str]]) -> Optional[str]:
+        """Executa fn uma única vez por chave em andamento e devolve o texto a todos.
+
+        Seguidoras recebem None se o líder falhar (cada uma usa seu próprio fallback).
+        """
+        voo, lider = self._entrar(chave)
+        if not lider:
+            try:
+                texto = ''.join(voo.acompanhar(self.espera_max))
+            except VooInterrompido:
+                return None
+            return texto or None
+        completo = False
+        try:
+            texto = fn()
+            if texto:
+                voo.publicar(texto)
+            completo = True
+            return texto
+        finally:
+            self._sair(chave, voo, falhou=not completo)
+
+    def transmitir(self, chave: str, gerador_fn: Callable[[], Iterable[str]]) -> Iterator[str]:
+        """Versão em streaming de fazer(): todos recebem os mesmos pedaços.
+
+        Se o líder parar antes do fim (exceção ou GeneratorExit quando o cliente
+        desconecta), as seguidoras recebem VooInterrompido depois dos pedaços já
+        publicados.
+        """
+        voo, lider = self._entrar(chave)
+        if not lider:
+            yield from voo.acompanhar(self.espera_max)
+            return
+        completo = False
+        try:
+            for pedaco in gerador_fn():
+                voo.publicar(pedaco)
+                yield pedaco
+            completo = True
+        finally:
+            self._sair(chave, voo, falhou=not completo)
+
+    def estatisticas(self) -> Dict:
+        """Retorna contadores de chamadas líderes e coalescidas."""
+        with self._lock:
+            return {
+                'em_andamento': len(self._voos),
+                'lideres': self._lideres,
+                'coalescidas': self._seguidores,
+            }
+
+
+# Instância usada para as chamadas ao LM Studio
+lm_singleflight = SingleFlight()